@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# Non-interactive mutiny_prep.py: applies a profile of answers to the
+# usual prep questions to a whole directory of captures and writes a
+# manifest of the .fuzzer files generated
+#
+#------------------------------------------------------------------
+
+import ConfigParser
+import glob
+import json
+import multiprocessing
+import os
+import os.path
+
+from backend.fuzzer_types import Message
+from backend.menu_functions import validateNumberRange
+from backend.flows import FlowFuzzerSettings, flowToFuzzerData, iterCaptureFlows
+from backend.tcp_reassembly import TcpStreamReassembler
+
+# Answers to everything mutiny_prep.py would otherwise prompt for
+#
+# Read from an INI file with a [prep] section, or YAML (optionally under
+# a top level "prep" key) if PyYAML is installed, e.g.
+#
+#   [prep]
+#   proto = tcp
+#   server_port = 8080
+#   combine_packets = yes
+#   fuzz_messages = each
+#   receive_timeout = 0.5
+#   processor_dir = ./my_processors
+class PrepProfile(FlowFuzzerSettings):
+    PROTO_ANY = "any"
+    # How to decide which end of a flow is the server, besides giving the port outright
+    SERVER_PORT_AUTO = "auto"
+    SERVER_PORT_LOWER = "lower"
+    # Fuzz just the first client message, or write a .fuzzer per client message
+    FUZZ_FIRST = "first"
+    FUZZ_EACH = "each"
+    SPLIT_FLOW = "flow"
+    SPLIT_SHAPE = "shape"
+
+    def __init__(self):
+        FlowFuzzerSettings.__init__(self)
+        # Only take flows of this protocol, tcp/udp/any
+        self.proto = PrepProfile.PROTO_ANY
+        # auto (SYN, else the lower port), lower, or a port number
+        # With a port number, flows not using that port are skipped
+        self.serverPort = PrepProfile.SERVER_PORT_AUTO
+        self.combinePackets = True
+        # first, each, or message numbers as accepted by validateNumberRange()
+        self.fuzzMessages = PrepProfile.FUZZ_FIRST
+        # Every flow, or only one flow per conversation shape in each capture
+        self.split = PrepProfile.SPLIT_FLOW
+        self.tcpOverlap = TcpStreamReassembler.OVERLAP_FIRST
+        self.tcpGap = TcpStreamReassembler.GAP_SKIP
+        # Where to write .fuzzer files, None for next to each capture
+        self.outputDirectory = None
+        # Whitespace separated glob patterns picking captures out of a directory
+        self.captures = "*.pcap *.pcapng *.cap"
+
+    # Profile key -> (attribute, conversion)
+    # Conversions take the string from the INI file and raise ValueError if it's no good
+    def _getKeys(self):
+        return {
+            "proto": ("proto", lambda value: _parseChoice(value, [PrepProfile.PROTO_ANY, "tcp", "udp"])),
+            "server_port": ("serverPort", _parseServerPort),
+            "combine_packets": ("combinePackets", _parseBool),
+            "fuzz_messages": ("fuzzMessages", _parseFuzzMessages),
+            "split": ("split", lambda value: _parseChoice(value, [PrepProfile.SPLIT_FLOW, PrepProfile.SPLIT_SHAPE])),
+            "tcp_overlap": ("tcpOverlap", lambda value: _parseChoice(value, [TcpStreamReassembler.OVERLAP_FIRST, TcpStreamReassembler.OVERLAP_LAST])),
+            "tcp_gap": ("tcpGap", lambda value: _parseChoice(value, [TcpStreamReassembler.GAP_SKIP, TcpStreamReassembler.GAP_TRUNCATE])),
+            "receive_timeout": ("receiveTimeout", float),
+            "failure_threshold": ("failureThreshold", int),
+            "failure_timeout": ("failureTimeout", int),
+            "processor_dir": ("processorDirectory", str),
+            "blob_threshold": ("blobThreshold", int),
+            "output_dir": ("outputDirectory", str),
+            "captures": ("captures", str),
+        }
+
+    # Set attributes from a dict of profile key -> value
+    def setFromDict(self, values):
+        keys = self._getKeys()
+        for (key, value) in values.items():
+            if key not in keys:
+                raise RuntimeError("Unknown prep profile setting %s" % (key))
+            (attribute, conversion) = keys[key]
+            # YAML hands us ints/bools already, go through str so both formats convert the same
+            if isinstance(value, bool):
+                value = "yes" if value else "no"
+            try:
+                setattr(self, attribute, conversion(str(value).strip()))
+            except ValueError as e:
+                raise RuntimeError("Invalid value %s for prep profile setting %s: %s" % (value, key, str(e)))
+
+    # Message numbers to fuzz in each .fuzzer written for flow,
+    # as a list of lists (one .fuzzer each), None meaning the first client message
+    def getFuzzedMessageSets(self, flow):
+        if self.fuzzMessages == PrepProfile.FUZZ_FIRST:
+            return [None]
+        if self.fuzzMessages == PrepProfile.FUZZ_EACH:
+            return [[i] for (i, (direction, data)) in enumerate(flow.messages) if direction == Message.Direction.Outbound]
+        fuzzedMessages = [i for i in validateNumberRange(self.fuzzMessages, flattenList=True) if i < len(flow.messages)]
+        return [fuzzedMessages] if fuzzedMessages else []
+
+def _parseBool(value):
+    if value.lower() in ["yes", "y", "true", "on", "1"]:
+        return True
+    if value.lower() in ["no", "n", "false", "off", "0"]:
+        return False
+    raise ValueError("expected yes or no")
+
+def _parseChoice(value, choices):
+    if value.lower() not in choices:
+        raise ValueError("expected one of %s" % (", ".join(choices)))
+    return value.lower()
+
+def _parseServerPort(value):
+    if value.lower() in [PrepProfile.SERVER_PORT_AUTO, PrepProfile.SERVER_PORT_LOWER]:
+        return value.lower()
+    port = int(value)
+    if port < 1 or port > 65535:
+        raise ValueError("port out of range")
+    return port
+
+def _parseFuzzMessages(value):
+    if value.lower() in [PrepProfile.FUZZ_FIRST, PrepProfile.FUZZ_EACH]:
+        return value.lower()
+    # validateNumberRange() prints its own complaint
+    if not validateNumberRange(value, flattenList=True):
+        raise ValueError("expected first, each, or message numbers like 0,2-3")
+    return value
+
+# Read a PrepProfile from an INI or YAML file
+def loadProfile(profilePath):
+    profile = PrepProfile()
+    if os.path.splitext(profilePath)[1].lower() in [".yaml", ".yml"]:
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError("PyYAML is needed for YAML prep profiles, use an INI profile or pip install pyyaml")
+        with open(profilePath, "r") as profileFile:
+            values = yaml.safe_load(profileFile)
+        if isinstance(values, dict) and isinstance(values.get("prep"), dict):
+            values = values["prep"]
+        if not isinstance(values, dict):
+            raise RuntimeError("Expected a mapping of settings in %s" % (profilePath))
+    else:
+        config = ConfigParser.RawConfigParser()
+        if not config.read(profilePath):
+            raise RuntimeError("Cannot read prep profile %s" % (profilePath))
+        if not config.has_section("prep"):
+            raise RuntimeError("No [prep] section in %s" % (profilePath))
+        values = dict(config.items("prep"))
+    profile.setFromDict(values)
+    return profile
+
+# All the captures the profile applies to under directoryPath, sorted
+def findCaptures(directoryPath, profile):
+    capturePaths = set()
+    for pattern in profile.captures.split():
+        capturePaths.update(path for path in glob.glob(os.path.join(directoryPath, pattern)) if os.path.isfile(path))
+    return sorted(capturePaths)
+
+# Apply profile to a single capture, writing its .fuzzer files
+# Returns a list of manifest entries (dicts), never raises so one bad
+# capture doesn't take the rest of the batch down
+def prepCapture(capturePath, profile):
+    entries = []
+    if profile.outputDirectory:
+        outputPrefix = os.path.join(profile.outputDirectory, os.path.splitext(os.path.basename(capturePath))[0])
+    else:
+        outputPrefix = os.path.splitext(capturePath)[0]
+    seenShapes = set()
+
+    try:
+        for flow in iterCaptureFlows(capturePath, combinePackets=profile.combinePackets, overlapPolicy=profile.tcpOverlap, gapPolicy=profile.tcpGap):
+            if profile.proto != PrepProfile.PROTO_ANY and flow.proto != profile.proto:
+                continue
+            if profile.serverPort == PrepProfile.SERVER_PORT_LOWER:
+                flow.setServerPort(min(flow.client[1], flow.server[1]))
+            elif profile.serverPort != PrepProfile.SERVER_PORT_AUTO:
+                if not flow.setServerPort(profile.serverPort):
+                    continue
+            if not flow.hasClientData():
+                continue
+            if profile.split == PrepProfile.SPLIT_SHAPE:
+                shape = flow.getShape()
+                if shape in seenShapes:
+                    continue
+                seenShapes.add(shape)
+
+            for fuzzedMessages in profile.getFuzzedMessageSets(flow):
+                outputFilePath = "{0}-flow{1}-{2}-{3}".format(outputPrefix, flow.index, flow.proto, flow.server[1])
+                if profile.fuzzMessages == PrepProfile.FUZZ_EACH:
+                    # Same suffix mutiny_prep.py uses when auto-generating per client message
+                    outputFilePath += "-%d" % (fuzzedMessages[0])
+                outputFilePath += ".fuzzer"
+                fuzzerData = flowToFuzzerData(flow, profile, fuzzedMessages=fuzzedMessages)
+                actualPath = fuzzerData.writeToFile(outputFilePath, defaultComments=True, blobThreshold=profile.blobThreshold)
+                entries.append({
+                    "capture": capturePath,
+                    "flow": flow.getDescription(),
+                    "fuzzer": actualPath,
+                    "fuzzed_messages": [i for (i, message) in enumerate(fuzzerData.messageCollection.messages) if message.isFuzzed],
+                })
+    except Exception as e:
+        entries.append({"capture": capturePath, "error": str(e)})
+    return entries
+
+# Pool worker
+def _prepCaptureTask(task):
+    (capturePath, profile) = task
+    return prepCapture(capturePath, profile)
+
+# Write manifest atomically so a pipeline polling for it never sees half a file
+def writeManifest(manifestPath, profilePath, entries):
+    manifest = {
+        "profile": profilePath,
+        "fuzzers": [entry for entry in entries if "fuzzer" in entry],
+        "errors": [entry for entry in entries if "error" in entry],
+    }
+    tempPath = manifestPath + ".tmp"
+    with open(tempPath, "w") as manifestFile:
+        json.dump(manifest, manifestFile, indent=2, sort_keys=True)
+        manifestFile.write("\n")
+    os.rename(tempPath, manifestPath)
+    return manifest
+
+# Apply the profile at profilePath to every capture in inputPath (a directory,
+# or a single capture), one capture per process, and write a JSON manifest
+# of everything generated to manifestPath (default manifest.json next to
+# the captures)
+# Returns the manifest dict
+def batchPrep(inputPath, profilePath, processes=None, manifestPath=None):
+    profile = loadProfile(profilePath)
+    if os.path.isdir(inputPath):
+        capturePaths = findCaptures(inputPath, profile)
+        directoryPath = inputPath
+    else:
+        capturePaths = [inputPath]
+        directoryPath = os.path.dirname(inputPath)
+    if profile.outputDirectory and not os.path.isdir(profile.outputDirectory):
+        os.makedirs(profile.outputDirectory)
+    if not manifestPath:
+        manifestPath = os.path.join(profile.outputDirectory or directoryPath, "manifest.json")
+
+    entries = []
+    if capturePaths:
+        pool = multiprocessing.Pool(processes)
+        try:
+            for captureEntries in pool.map(_prepCaptureTask, [(capturePath, profile) for capturePath in capturePaths]):
+                entries.extend(captureEntries)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    return writeManifest(manifestPath, profilePath, entries)
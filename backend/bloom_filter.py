@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# Bloom filters for remembering which fuzz cases have been seen in a
+# fixed amount of memory, at the cost of the odd false "already seen"
+#
+#------------------------------------------------------------------
+
+import hashlib
+import json
+import math
+import os
+import struct
+
+class BloomFilter(object):
+    # capacity - how many items it can hold before errorRate is exceeded
+    # errorRate - chance that something never added is reported as seen
+    def __init__(self, capacity, errorRate=0.001):
+        self.capacity = max(1, int(capacity))
+        self.errorRate = errorRate
+        # Optimal sizes for capacity items at errorRate
+        self.bitCount = int(math.ceil(-self.capacity * math.log(errorRate) / (math.log(2) ** 2)))
+        self.hashCount = max(1, int(round(self.bitCount / float(self.capacity) * math.log(2))))
+        self.bits = bytearray((self.bitCount + 7) // 8)
+        self.count = 0
+
+    # Two 32 bit hashes out of one md5, for double hashing
+    # (32 bit keeps the index maths in plain ints rather than longs)
+    @staticmethod
+    def getHash(item):
+        return struct.unpack("<II", hashlib.md5(item).digest()[:8])
+
+    def _getIndexes(self, itemHash):
+        (first, second) = itemHash
+        bitCount = self.bitCount
+        return [(first + i * second) % bitCount for i in xrange(self.hashCount)]
+
+    def __contains__(self, item):
+        return self.containsHash(BloomFilter.getHash(item))
+
+    # Returns whether item was (probably) already there
+    def add(self, item):
+        return self.addHash(BloomFilter.getHash(item))
+
+    def containsHash(self, itemHash):
+        bits = self.bits
+        for index in self._getIndexes(itemHash):
+            if not bits[index >> 3] & (1 << (index & 7)):
+                return False
+        return True
+
+    def addHash(self, itemHash):
+        bits = self.bits
+        wasPresent = True
+        for index in self._getIndexes(itemHash):
+            mask = 1 << (index & 7)
+            if not bits[index >> 3] & mask:
+                bits[index >> 3] |= mask
+                wasPresent = False
+        if not wasPresent:
+            self.count += 1
+        return wasPresent
+
+    def isFull(self):
+        return self.count >= self.capacity
+
+    def __len__(self):
+        return self.count
+
+# Bloom filter for when it's not known up front how many items there'll be:
+# each time it fills up another, bigger filter with a tighter error rate is
+# added, so the overall error rate stays under errorRate however many items
+# go in (Almeida et al., "Scalable Bloom Filters")
+class ScalableBloomFilter(object):
+    GROWTH = 2
+    TIGHTENING = 0.9
+
+    def __init__(self, initialCapacity=100000, errorRate=0.001):
+        self.initialCapacity = initialCapacity
+        self.errorRate = errorRate
+        self.filters = []
+
+    def __contains__(self, item):
+        return self._containsHash(BloomFilter.getHash(item))
+
+    def _containsHash(self, itemHash):
+        for bloomFilter in self.filters:
+            if bloomFilter.containsHash(itemHash):
+                return True
+        return False
+
+    # Returns whether item was (probably) already there
+    def add(self, item):
+        itemHash = BloomFilter.getHash(item)
+        if self._containsHash(itemHash):
+            return True
+        if not self.filters or self.filters[-1].isFull():
+            # Error rates of the filters sum to at most errorRate
+            capacity = self.initialCapacity * ScalableBloomFilter.GROWTH ** len(self.filters)
+            errorRate = self.errorRate * (1 - ScalableBloomFilter.TIGHTENING) * ScalableBloomFilter.TIGHTENING ** len(self.filters)
+            self.filters.append(BloomFilter(capacity, errorRate))
+        self.filters[-1].addHash(itemHash)
+        return False
+
+    def __len__(self):
+        return sum(len(bloomFilter) for bloomFilter in self.filters)
+
+    # Saved as a line of JSON describing the filters, followed by their bits,
+    # written atomically so a crash part way through leaves the old copy
+    def save(self, path):
+        header = {
+            "initialCapacity": self.initialCapacity,
+            "errorRate": self.errorRate,
+            "filters": [{"capacity": bloomFilter.capacity, "errorRate": bloomFilter.errorRate, "count": bloomFilter.count} for bloomFilter in self.filters],
+        }
+        tempPath = path + ".tmp"
+        with open(tempPath, "wb") as outputFile:
+            outputFile.write(json.dumps(header) + "\n")
+            for bloomFilter in self.filters:
+                outputFile.write(bloomFilter.bits)
+        os.rename(tempPath, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as inputFile:
+            header = json.loads(inputFile.readline())
+            scalableFilter = cls(header["initialCapacity"], header["errorRate"])
+            for filterHeader in header["filters"]:
+                bloomFilter = BloomFilter(filterHeader["capacity"], filterHeader["errorRate"])
+                bits = inputFile.read(len(bloomFilter.bits))
+                if len(bits) != len(bloomFilter.bits):
+                    raise ValueError("%s is truncated" % (path))
+                bloomFilter.bits = bytearray(bits)
+                bloomFilter.count = filterHeader["count"]
+                scalableFilter.filters.append(bloomFilter)
+        return scalableFilter
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# Runs several fuzzers (e.g. mutiny_classy.py given a directory of .fuzzer
+# files) at once, each in its own thread, sharing run time out by weight
+#
+#------------------------------------------------------------------
+
+import threading
+import time
+import traceback
+
+class _Slot(object):
+    def __init__(self, fuzzer, weight):
+        self.fuzzer = fuzzer
+        self.weight = weight
+        # Stride scheduling: the idle fuzzer with the lowest pass runs next, and
+        # each run adds its time divided by the fuzzer's weight, so run time
+        # gets shared out in proportion to weight
+        self.passValue = 0.0
+        self.runCount = 0
+        self.isBusy = False
+        self.isStopped = False
+
+# Fuzzers are anything with fuzz() (one run, raising SystemExit when it's
+# finished), getFindCount() and fuzzerFilePath, i.e. MutinyFuzzer
+#
+# Runs are blocking I/O on the target plus waiting on radamsa, so threads
+# run them concurrently well enough.  A fuzzer that exits, halts or raises
+# only stops itself; the campaign ends when they've all stopped
+class Campaign(object):
+    # Range the yield multiplier is kept to, like PowerScheduler's
+    YIELD_RANGE = (0.25, 4)
+    # Runs a fuzzer is assumed to have made at the overall yield, so a
+    # couple of lucky early runs don't take over
+    YIELD_PRIOR = 50
+
+    # jobs - fuzzers run at once, all of them by default.  Weights only
+    #   matter if it's fewer than there are fuzzers
+    # weights - {fuzzer: weight}, 1 for any not given
+    # useYield - also weight fuzzers by finds per run
+    def __init__(self, fuzzers, jobs=None, weights=None, useYield=False):
+        weights = weights or {}
+        self.slots = [_Slot(fuzzer, weights.get(fuzzer, 1.0)) for fuzzer in fuzzers]
+        self.jobs = min(jobs or len(self.slots), len(self.slots))
+        self.useYield = useYield
+        # Waiting for runExclusive()
+        self._exclusiveTasks = []
+        self._isExclusiveRunning = False
+        self._condition = threading.Condition()
+
+    # Calls task() as soon as every run in flight is over, with no new runs
+    # started until it returns, e.g. to replay runs against the target alone
+    # Safe to call from a fuzzer's run
+    def runExclusive(self, task):
+        with self._condition:
+            self._exclusiveTasks.append(task)
+            self._condition.notify_all()
+
+    def getWeight(self, slot):
+        weight = slot.weight
+        if self.useYield:
+            totalFinds = sum(other.fuzzer.getFindCount() for other in self.slots)
+            totalRuns = sum(other.runCount for other in self.slots)
+            overallYield = (totalFinds + 1.0) / (totalRuns + Campaign.YIELD_PRIOR)
+            slotYield = (slot.fuzzer.getFindCount() + overallYield * Campaign.YIELD_PRIOR) / (slot.runCount + Campaign.YIELD_PRIOR)
+            weight *= min(max(slotYield / overallYield, Campaign.YIELD_RANGE[0]), Campaign.YIELD_RANGE[1])
+        return weight
+
+    # Blocks until a fuzzer's free or an exclusive task can run
+    # Returns (slot, None) or (None, task), (None, None) when every fuzzer's stopped
+    def _takeNext(self):
+        with self._condition:
+            while True:
+                if self._isExclusiveRunning:
+                    self._condition.wait()
+                    continue
+                if self._exclusiveTasks:
+                    if any(slot.isBusy for slot in self.slots):
+                        # Start nothing new until the runs in flight are over
+                        self._condition.wait()
+                        continue
+                    self._isExclusiveRunning = True
+                    return (None, self._exclusiveTasks.pop(0))
+                liveSlots = [slot for slot in self.slots if not slot.isStopped]
+                if not liveSlots:
+                    return (None, None)
+                idleSlots = [slot for slot in liveSlots if not slot.isBusy]
+                if idleSlots:
+                    slot = min(idleSlots, key=lambda slot: slot.passValue)
+                    slot.isBusy = True
+                    return (slot, None)
+                self._condition.wait()
+
+    def _runExclusiveTask(self, task):
+        try:
+            task()
+        except Exception:
+            print "\nExclusive task failed:"
+            traceback.print_exc()
+        with self._condition:
+            self._isExclusiveRunning = False
+            self._condition.notify_all()
+
+    def _finishRun(self, slot, runTime, isStopped):
+        with self._condition:
+            slot.runCount += 1
+            slot.passValue += runTime / max(self.getWeight(slot), 1e-6)
+            slot.isBusy = False
+            slot.isStopped = isStopped
+            self._condition.notify_all()
+
+    def _work(self):
+        while True:
+            (slot, task) = self._takeNext()
+            if task:
+                self._runExclusiveTask(task)
+                continue
+            if slot is None:
+                return
+            isStopped = False
+            startTime = time.time()
+            try:
+                slot.fuzzer.fuzz()
+            except SystemExit as e:
+                print "\n%s stopped%s" % (slot.fuzzer.fuzzerFilePath, ": %s" % (e.code) if isinstance(e.code, basestring) else "")
+                isStopped = True
+            except Exception:
+                print "\n%s failed, stopping it:" % (slot.fuzzer.fuzzerFilePath)
+                traceback.print_exc()
+                isStopped = True
+            self._finishRun(slot, time.time() - startTime, isStopped)
+
+    # Returns once every fuzzer has stopped
+    def run(self):
+        threads = []
+        for _ in xrange(self.jobs):
+            thread = threading.Thread(target=self._work)
+            # Ctrl+C exits without waiting for runs in flight
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            # With a timeout, or signals don't get through while waiting
+            while thread.is_alive():
+                thread.join(0.5)
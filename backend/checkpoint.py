@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# Checkpoints of a fuzzing session, so --resume can carry on where it
+# stopped after the fuzzer dies or the host reboots
+#
+#------------------------------------------------------------------
+
+import atexit
+import json
+import os
+import sys
+import time
+
+CHECKPOINT_FILE_NAME = "checkpoint.json"
+
+# Returns the checkpoint in a session's log directory, exits if there isn't one
+def readCheckpoint(sessionDirectory):
+    path = os.path.join(sessionDirectory, CHECKPOINT_FILE_NAME)
+    if not os.path.isfile(path):
+        sys.exit("No %s in %s to resume from" % (CHECKPOINT_FILE_NAME, sessionDirectory))
+    with open(path, "r") as checkpointFile:
+        checkpoint = json.load(checkpointFile)
+    if checkpoint.get("version") != Checkpointer.VERSION:
+        sys.exit("%s is from a different version of Mutiny, can't resume from it" % (path))
+    return checkpoint
+
+# Returns the most recent session directory in logsDirectory (<XYZ>_logs)
+# that has a checkpoint, or None
+def findLatestSession(logsDirectory):
+    if not os.path.isdir(logsDirectory):
+        return None
+    # Session directories are named by date and time, so sort in order
+    for sessionName in sorted(os.listdir(logsDirectory), reverse=True):
+        if os.path.isfile(os.path.join(logsDirectory, sessionName, CHECKPOINT_FILE_NAME)):
+            return os.path.join(logsDirectory, sessionName)
+    return None
+
+# Writes checkpoint.json to the session's log directory every so often and
+# on exit.  Anything with getState() (returning something json can write)
+# and setState() can be added as a component
+#
+# A checkpoint is only written between runs, and never more than about 1%
+# of the time is spent writing them, however big they get
+class Checkpointer(object):
+    VERSION = 1
+    # Minimum seconds between checkpoints
+    INTERVAL = 60
+    # Keep the time spent checkpointing under 1/OVERHEAD_RATIO of the session
+    OVERHEAD_RATIO = 100
+
+    # getRunState - returns where the run loop is up to, e.g. {"runNumber": i}
+    # argv - the command line, for resuming with the same options
+    def __init__(self, sessionDirectory, getRunState, argv=None, interval=INTERVAL):
+        self.path = os.path.join(sessionDirectory, CHECKPOINT_FILE_NAME)
+        self.getRunState = getRunState
+        self.argv = argv
+        self.interval = interval
+        self.components = {}
+        self.lastSaveDuration = 0
+        self._lastSaveTime = time.time()
+        atexit.register(self._saveOnExit)
+
+    # component - None is ignored, so optional parts can be added regardless
+    def add(self, name, component):
+        if component is not None:
+            self.components[name] = component
+
+    # Puts every component back the way the checkpoint had it
+    # Returns the run loop state that was passed in as getRunState
+    def restore(self, checkpoint):
+        for (name, component) in self.components.items():
+            if name in checkpoint["components"]:
+                component.setState(checkpoint["components"][name])
+        return checkpoint["run"]
+
+    def maybeSave(self):
+        interval = max(self.interval, self.lastSaveDuration * Checkpointer.OVERHEAD_RATIO)
+        if time.time() - self._lastSaveTime >= interval:
+            self.save()
+
+    # Exiting is no time for a traceback
+    def _saveOnExit(self):
+        # Nothing to resume if the log directory's been removed
+        if not os.path.isdir(os.path.dirname(self.path)):
+            return
+        try:
+            self.save()
+        except (IOError, OSError) as e:
+            print "Unable to write checkpoint %s: %s" % (self.path, e)
+
+    def save(self):
+        startTime = time.time()
+        checkpoint = {
+            "version": Checkpointer.VERSION,
+            "timestamp": startTime,
+            "argv": self.argv,
+            "run": self.getRunState(),
+            "components": dict((name, component.getState()) for (name, component) in self.components.items()),
+        }
+        # Atomic, so dying part way through leaves the last checkpoint intact
+        tempPath = self.path + ".tmp"
+        with open(tempPath, "w") as checkpointFile:
+            json.dump(checkpoint, checkpointFile, sort_keys=True)
+            checkpointFile.flush()
+            os.fsync(checkpointFile.fileno())
+        os.rename(tempPath, self.path)
+        self._lastSaveTime = time.time()
+        self.lastSaveDuration = self._lastSaveTime - startTime
@@ -0,0 +1,410 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# Spreads one fuzzing campaign over many mutiny.py workers (--coordinator),
+# on as many machines as you like, by leasing out blocks of seeds
+#
+#------------------------------------------------------------------
+
+import atexit
+import json
+import os
+import re
+import socket
+import threading
+import time
+import SocketServer
+
+from backend.seed_set import SeedSet
+
+# address - "host:port", ":port"/"port" for localhost, or a path for a unix
+# socket, as with --metrics
+# Returns (socket family, address to bind or connect to)
+def parseAddress(address):
+    if "/" in address:
+        return (socket.AF_UNIX, address)
+    (host, separator, port) = address.rpartition(":")
+    return (socket.AF_INET, (host or "127.0.0.1", int(port)))
+
+# Crashes with the same bucket are taken to be the same bug, so the
+# monitor's description with the numbers (pids, addresses, timestamps) taken
+# out, e.g. "ProcessMonitor: pid N killed by SIGSEGV"
+def getCrashBucket(description):
+    return re.sub(r"0x[0-9a-fA-F]+|\d+", "N", description)
+
+class _Lease(object):
+    def __init__(self, leaseId, workerName, seeds, expiry):
+        self.leaseId = leaseId
+        self.workerName = workerName
+        self.seeds = seeds
+        # Seeds the worker has said it's finished
+        self.doneSeeds = SeedSet()
+        self.expiry = expiry
+
+# Keeps track of which seeds are done, which are out with which worker and
+# which are still to be handed out, along with the crashes and stats the
+# workers report.  Every request is a dict with a "type", answered by the
+# method of the same name
+#
+# A worker that doesn't renew its lease within leaseTimeout seconds is taken
+# to be gone, and whatever it hadn't finished goes back to be handed out
+# again, so no seed gets dropped
+class Coordinator(object):
+    # Seconds a worker waits before asking again when every seed left is out
+    # on a lease that might still expire
+    WAIT_INTERVAL = 5
+
+    # seeds - SeedSet of the whole campaign, e.g. SeedSet.parse("0-")
+    # blockSize - seeds per lease
+    def __init__(self, seeds, blockSize=1000, leaseTimeout=300):
+        self.seeds = seeds
+        self.blockSize = blockSize
+        self.leaseTimeout = leaseTimeout
+        self.doneSeeds = SeedSet()
+        # Not done and not out on a lease
+        self.pendingSeeds = seeds
+        self.leases = {}
+        self.nextLeaseId = 1
+        # bucket -> {"count", "description" (the first), "seeds", "workers"}
+        self.crashBuckets = {}
+        # workerName -> its StatsCollector's latest getState()
+        self.workerStats = {}
+        self._lock = threading.Lock()
+
+    def handle(self, request):
+        with self._lock:
+            self._expireLeases()
+            handler = getattr(self, "_handle_%s" % (request.get("type")), None)
+            if handler is None:
+                return {"error": "Unknown request type %s" % (request.get("type"))}
+            return handler(request)
+
+    def _expireLeases(self):
+        now = time.time()
+        for lease in self.leases.values():
+            if lease.expiry < now:
+                print "Lease %d on seeds %s expired, %s seems to be gone" % (lease.leaseId, lease.seeds, lease.workerName)
+                self._endLease(lease)
+
+    # Whatever the lease's worker hadn't finished goes back to be handed out
+    def _endLease(self, lease):
+        del self.leases[lease.leaseId]
+        self.doneSeeds = self.doneSeeds.union(lease.doneSeeds)
+        self.pendingSeeds = self.pendingSeeds.union(lease.seeds.subtract(lease.doneSeeds))
+
+    def expireLeases(self):
+        with self._lock:
+            self._expireLeases()
+
+    def isFinished(self):
+        with self._lock:
+            return self.pendingSeeds.isEmpty() and not self.leases
+
+    # {"type": "lease", "worker": name}
+    # Answers {"leaseId", "seeds", "timeout"}, {"wait": seconds} if there's
+    # nothing to hand out just yet or {"finished": True}
+    def _handle_lease(self, request):
+        if self.pendingSeeds.isEmpty():
+            if self.leases:
+                return {"wait": Coordinator.WAIT_INTERVAL}
+            return {"finished": True}
+        seeds = self.pendingSeeds.getSlice(0, self.blockSize)
+        self.pendingSeeds = self.pendingSeeds.subtract(seeds)
+        lease = _Lease(self.nextLeaseId, request["worker"], seeds, time.time() + self.leaseTimeout)
+        self.leases[lease.leaseId] = lease
+        self.nextLeaseId += 1
+        return {"leaseId": lease.leaseId, "seeds": str(seeds), "timeout": self.leaseTimeout}
+
+    # {"type": "renew", "leaseId", "done": seeds finished so far}
+    # Answers {"ok": False} if the lease has already expired and been handed
+    # out again, in which case the worker should drop it
+    def _handle_renew(self, request):
+        lease = self.leases.get(request["leaseId"])
+        if lease is None:
+            return {"ok": False}
+        lease.doneSeeds = SeedSet.parse(request["done"]) or SeedSet()
+        lease.expiry = time.time() + self.leaseTimeout
+        return {"ok": True}
+
+    # {"type": "release", "leaseId", "done"}, when a worker's finished with a
+    # lease or is stopping part way through it
+    def _handle_release(self, request):
+        lease = self.leases.get(request["leaseId"])
+        if lease is None:
+            return {"ok": False}
+        lease.doneSeeds = SeedSet.parse(request["done"]) or SeedSet()
+        self._endLease(lease)
+        return {"ok": True}
+
+    # {"type": "crash", "worker", "seed", "description"}
+    def _handle_crash(self, request):
+        bucket = getCrashBucket(request["description"])
+        if bucket not in self.crashBuckets:
+            print "New crash from %s, seed %s: %s" % (request["worker"], request["seed"], request["description"])
+            self.crashBuckets[bucket] = {"count": 0, "description": request["description"], "seeds": "", "workers": []}
+        crashBucket = self.crashBuckets[bucket]
+        crashBucket["count"] += 1
+        if request["seed"] >= 0:
+            seeds = SeedSet.parse(crashBucket["seeds"]) or SeedSet()
+            seeds.add(request["seed"])
+            crashBucket["seeds"] = str(seeds)
+        if request["worker"] not in crashBucket["workers"]:
+            crashBucket["workers"].append(request["worker"])
+        return {"ok": True}
+
+    # {"type": "stats", "worker", "stats": StatsCollector.getState()}
+    def _handle_stats(self, request):
+        self.workerStats[request["worker"]] = request["stats"]
+        return {"ok": True}
+
+    # Runs and crashes across every worker that's reported its stats
+    def getTotals(self):
+        with self._lock:
+            return (sum(stats["runs"] for stats in self.workerStats.values()), sum(stats["crashes"] for stats in self.workerStats.values()))
+
+    def getStatusLine(self):
+        (runCount, crashCount) = self.getTotals()
+        with self._lock:
+            return "[coordinator] %d of %s seeds done, %d leases out, %d workers, %d runs, %d crashes in %d buckets" % (self.doneSeeds.getCount(), "unlimited" if self.seeds.isUnbounded() else str(self.seeds.getCount()), len(self.leases), len(self.workerStats), runCount, crashCount, len(self.crashBuckets))
+
+    # For the coordinator's checkpoint.  Seeds out on a lease count as
+    # pending, as their workers' leases won't survive the coordinator stopping
+    def getState(self):
+        with self._lock:
+            doneSeeds = self.doneSeeds
+            for lease in self.leases.values():
+                doneSeeds = doneSeeds.union(lease.doneSeeds)
+            return {
+                "seeds": self.seeds.getState(),
+                "blockSize": self.blockSize,
+                "leaseTimeout": self.leaseTimeout,
+                "doneSeeds": doneSeeds.getState(),
+                "crashBuckets": self.crashBuckets,
+                "workerStats": self.workerStats,
+            }
+
+    def setState(self, state):
+        with self._lock:
+            self.seeds = SeedSet()
+            self.seeds.setState(state["seeds"])
+            self.blockSize = state["blockSize"]
+            self.leaseTimeout = state["leaseTimeout"]
+            self.doneSeeds.setState(state["doneSeeds"])
+            self.pendingSeeds = self.seeds.subtract(self.doneSeeds)
+            self.leases = {}
+            self.crashBuckets = state["crashBuckets"]
+            self.workerStats = state["workerStats"]
+
+class _CoordinatorRequestHandler(SocketServer.StreamRequestHandler):
+    # One json request per line, each answered with one json line
+    def handle(self):
+        for line in iter(self.rfile.readline, ""):
+            try:
+                response = self.server.coordinator.handle(json.loads(line))
+            except (ValueError, KeyError, TypeError) as e:
+                response = {"error": "Bad request: %s" % (str(e))}
+            self.wfile.write(json.dumps(response) + "\n")
+            self.wfile.flush()
+
+class _TcpCoordinatorServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+class _UnixCoordinatorServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+# Answers workers' requests for coordinator on its own thread, on TCP or a
+# unix socket (see parseAddress())
+class CoordinatorServer(object):
+    def __init__(self, coordinator, address):
+        self.coordinator = coordinator
+        (self.family, self.address) = parseAddress(address)
+        self._server = None
+        self._task = None
+
+    def start(self):
+        if self.family == socket.AF_UNIX:
+            # Left over from a previous session
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+            self._server = _UnixCoordinatorServer(self.address, _CoordinatorRequestHandler)
+        else:
+            self._server = _TcpCoordinatorServer(self.address, _CoordinatorRequestHandler)
+        self._server.coordinator = self.coordinator
+        self._task = threading.Thread(target=self._server.serve_forever, args=(0.5,))
+        self._task.daemon = True
+        self._task.start()
+        atexit.register(self.stop)
+
+    # The port actually bound, for ":0"
+    def getAddress(self):
+        return self._server.server_address
+
+    def stop(self):
+        if self._task and self._task.isAlive():
+            self._server.shutdown()
+            self._task.join()
+            self._server.server_close()
+            if self.family == socket.AF_UNIX and os.path.exists(self.address):
+                os.unlink(self.address)
+
+class CoordinatorError(Exception):
+    pass
+
+# A mutiny.py worker's side of the coordinator: hands out seeds one at a
+# time from its current lease, leasing another block when that runs out,
+# and reports progress, crashes and stats back
+#
+# Losing touch with the coordinator doesn't stop the worker; it finishes
+# the lease it has and keeps asking for another until the coordinator is
+# back.  Crash reports that couldn't be sent are sent with the next request
+class CoordinatorClient(object):
+    # Seconds between tries when the coordinator can't be reached
+    RETRY_INTERVAL = 5
+
+    # stats - the worker's StatsCollector, sent along every so often
+    def __init__(self, address, stats=None, workerName=None):
+        (self.family, self.address) = parseAddress(address)
+        self.stats = stats
+        self.workerName = workerName or "%s:%d" % (socket.gethostname(), os.getpid())
+        self.leaseId = None
+        self.leaseSeeds = SeedSet()
+        # How many of leaseSeeds are done, they're run in order
+        self.leaseIndex = 0
+        self.leaseTimeout = None
+        self.isFinished = False
+        self._lastRenewTime = 0
+        self._unsentReports = []
+        atexit.register(self.release)
+
+    # A connection per request, as they're only every few seconds at most,
+    # and then a restarted coordinator is no different to a running one
+    # Raises CoordinatorError if the coordinator can't be reached
+    def _request(self, request):
+        coordinatorSocket = socket.socket(self.family, socket.SOCK_STREAM)
+        coordinatorSocket.settimeout(30)
+        try:
+            coordinatorSocket.connect(self.address)
+            coordinatorSocket.sendall(json.dumps(request) + "\n")
+            response = json.loads(coordinatorSocket.makefile("rb").readline())
+        except (socket.error, ValueError) as e:
+            raise CoordinatorError("Couldn't reach the coordinator at %s: %s" % (str(self.address), str(e)))
+        finally:
+            coordinatorSocket.close()
+        if "error" in response:
+            raise CoordinatorError(response["error"])
+        return response
+
+    def _flushReports(self):
+        while self._unsentReports:
+            self._request(self._unsentReports[0])
+            self._unsentReports.pop(0)
+
+    def _sendStats(self):
+        if self.stats:
+            self._request({"type": "stats", "worker": self.workerName, "stats": self.stats.getState()})
+
+    def _getDoneSeeds(self):
+        return str(self.leaseSeeds.getSlice(0, self.leaseIndex))
+
+    # The seed to run next, the same one until finishSeed() is called for it
+    # Returns None once the coordinator has no more seeds for anyone
+    def getSeed(self):
+        while self.leaseIndex >= self.leaseSeeds.getCount():
+            if self.isFinished:
+                return None
+            if self.leaseId is not None:
+                self.release()
+            try:
+                self._flushReports()
+                response = self._request({"type": "lease", "worker": self.workerName})
+            except CoordinatorError as e:
+                print "%s, trying again in %d seconds" % (str(e), CoordinatorClient.RETRY_INTERVAL)
+                time.sleep(CoordinatorClient.RETRY_INTERVAL)
+                continue
+            if response.get("finished"):
+                self.isFinished = True
+            elif "wait" in response:
+                time.sleep(response["wait"])
+            else:
+                self.leaseId = response["leaseId"]
+                self.leaseSeeds = SeedSet.parse(response["seeds"])
+                self.leaseIndex = 0
+                self.leaseTimeout = response["timeout"]
+                self._lastRenewTime = time.time()
+                print "Leased seeds %s from the coordinator" % (response["seeds"])
+        return self.leaseSeeds.getSeed(self.leaseIndex)
+
+    def finishSeed(self, seed):
+        if self.leaseIndex < self.leaseSeeds.getCount() and self.leaseSeeds.getSeed(self.leaseIndex) == seed:
+            self.leaseIndex += 1
+
+    # Renews the lease, and sends stats along, every third of the lease
+    # timeout.  Cheap enough to call after every run
+    def maybeRenew(self):
+        if self.leaseId is None or time.time() - self._lastRenewTime < self.leaseTimeout / 3.0:
+            return
+        self._lastRenewTime = time.time()
+        try:
+            self._flushReports()
+            self._sendStats()
+            if not self._request({"type": "renew", "leaseId": self.leaseId, "done": self._getDoneSeeds()})["ok"]:
+                # Someone else has the rest of it now
+                print "Lease on seeds %s expired, dropping it" % (str(self.leaseSeeds))
+                self.leaseId = None
+                self.leaseSeeds = SeedSet()
+                self.leaseIndex = 0
+        except CoordinatorError as e:
+            # The lease may well expire, but the seeds are better run twice than not at all
+            print "Unable to renew lease: %s" % (str(e))
+
+    # Hands back the current lease with whatever's done, so the rest can go
+    # to another worker straight away rather than once the lease expires
+    def release(self):
+        if self.leaseId is None:
+            return
+        try:
+            self._flushReports()
+            self._sendStats()
+            self._request({"type": "release", "leaseId": self.leaseId, "done": self._getDoneSeeds()})
+        except CoordinatorError as e:
+            print "Unable to release lease: %s" % (str(e))
+        self.leaseId = None
+
+    # description - what the crash event or exception had to say
+    # seed - the run's seed, -1 if it wasn't a fuzzed run
+    def reportCrash(self, description, seed):
+        self._unsentReports.append({"type": "crash", "worker": self.workerName, "seed": seed, "description": description})
+        try:
+            self._flushReports()
+        except CoordinatorError as e:
+            print "Unable to report crash, will try again later: %s" % (str(e))
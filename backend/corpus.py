@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# Response-novelty feedback: runs that get the target to respond in a way
+# it hasn't before (or reach new code, with coverage) are kept in a corpus,
+# and later runs mutate those inputs further instead of always starting
+# from the .fuzzer file
+#
+#------------------------------------------------------------------
+
+import hashlib
+import os
+import random
+import re
+import struct
+import time
+
+from backend.fuzzer_types import Message
+
+# A run's signature is made from how far through the conversation it got,
+# roughly how long each response was and what each response started with,
+# with runs of digits squashed so counters, timestamps and session IDs
+# don't make every run look new
+class ResponseSignature(object):
+    # Only the start of each response is hashed, which is usually where any
+    # status/error code is, and keeps echoed-back fuzz data out of it
+    HASH_PREFIX = 64
+    DIGITS = re.compile("[0-9]+")
+
+    def __init__(self):
+        self._hash = hashlib.md5()
+        self.highestMessageNumber = -1
+        self.responseCount = 0
+
+    # Length bucket, 0 for nothing then powers of two (1, 2-3, 4-7, ...)
+    @classmethod
+    def getLengthBucket(cls, length):
+        bucket = 0
+        while length:
+            bucket += 1
+            length >>= 1
+        return bucket
+
+    @classmethod
+    def normalize(cls, data):
+        return cls.DIGITS.sub("0", str(data[:cls.HASH_PREFIX]))
+
+    def addResponse(self, messageNumber, data):
+        normalized = ResponseSignature.normalize(data)
+        self._hash.update(struct.pack("<IB", messageNumber, ResponseSignature.getLengthBucket(len(data))))
+        self._hash.update(struct.pack("<I", len(normalized)))
+        self._hash.update(normalized)
+        self.responseCount += 1
+
+    def getDigest(self):
+        signature = self._hash.copy()
+        signature.update(struct.pack("<i", self.highestMessageNumber))
+        return signature.hexdigest()[:16]
+
+# An input that got a new response signature
+# data - {(messageNumber, subcomponentNumber): bytearray} of the fuzzed
+#   subcomponents as radamsa left them (before preSendProcess), so fixups
+#   like lengths and checksums are redone when it's mutated again
+class CorpusEntry(object):
+    def __init__(self, entryId, data, signature, seed=-1, parentId=None):
+        self.entryId = entryId
+        self.data = data
+        self.signature = signature
+        self.seed = seed
+        self.parentId = parentId
+
+    def getFileName(self):
+        return "%06d" % (self.entryId)
+
+    def writeToFile(self, filePath):
+        with open(filePath + ".tmp", "w") as outputFile:
+            outputFile.write("# Mutiny corpus entry, the fuzzed subcomponents of a run that got a new response\n")
+            outputFile.write("seed %d\n" % (self.seed))
+            outputFile.write("parent %s\n" % ("none" if self.parentId is None else self.parentId))
+            outputFile.write("signature %s\n" % (self.signature))
+            for (messageNumber, subcomponentNumber) in sorted(self.data):
+                outputFile.write("fuzz %d %d %s\n" % (messageNumber, subcomponentNumber, Message.serializeByteArray(self.data[(messageNumber, subcomponentNumber)])))
+        os.rename(filePath + ".tmp", filePath)
+
+    @classmethod
+    def readFromFile(cls, filePath):
+        entryId = int(os.path.basename(filePath))
+        data = {}
+        seed = -1
+        parentId = None
+        signature = None
+        with open(filePath, "r") as inputFile:
+            for line in inputFile:
+                line = line.rstrip("\n")
+                if not line or line.startswith("#"):
+                    continue
+                if line.startswith("fuzz "):
+                    (_, messageNumber, subcomponentNumber, serialized) = line.split(" ", 3)
+                    data[(int(messageNumber), int(subcomponentNumber))] = Message.deserializeByteArray(serialized)
+                else:
+                    (key, value) = line.split(" ", 1)
+                    if key == "seed":
+                        seed = int(value)
+                    elif key == "parent" and value != "none":
+                        parentId = int(value)
+                    elif key == "signature":
+                        signature = value
+        return cls(entryId, data, signature, seed, parentId)
+
+# The corpus is a directory with a file per entry, so it carries over between
+# sessions and can be looked through or pruned by hand
+#
+# Which input a run starts from is decided by a scheduler (see
+# backend/scheduler.py) if there is one, otherwise it's picked from the seed,
+# so the same seed with the same corpus is the same run
+class Corpus(object):
+    # Share of runs that still start from the .fuzzer file's own messages
+    ORIGINAL_SHARE = 0.5
+    # Past this many entries, new signatures are remembered but not kept as inputs
+    MAX_ENTRIES = 10000
+
+    # directory - where entries are kept, created if needed
+    # scheduler - e.g. a PowerScheduler, told about every input and run
+    def __init__(self, directory, scheduler=None):
+        self.directory = directory
+        self.scheduler = scheduler
+        self.entries = []
+        self.signatures = set()
+        self.newSignatureCount = 0
+        self._base = None
+        self._seed = -1
+        self._signature = None
+        self._fuzzedData = {}
+        self._startTime = 0
+        if scheduler:
+            # The .fuzzer file's own messages
+            scheduler.addCandidate(None)
+        if os.path.isdir(directory):
+            for fileName in sorted(os.listdir(directory)):
+                if fileName.isdigit():
+                    entry = CorpusEntry.readFromFile(os.path.join(directory, fileName))
+                    self._addEntry(entry)
+            if self.entries:
+                print "Loaded %d corpus entries from %s" % (len(self.entries), directory)
+        else:
+            os.makedirs(directory)
+
+    def _addEntry(self, entry):
+        self.entries.append(entry)
+        self.signatures.add(entry.signature)
+        if self.scheduler:
+            self.scheduler.addCandidate(entry)
+
+    # For checkpoints, see backend/checkpoint.py
+    # Entries are already on disk, but signatures of runs that weren't kept
+    # (the test run, or once the corpus is full) would be forgotten
+    def getState(self):
+        return {
+            "signatures": sorted(self.signatures),
+            "newSignatureCount": self.newSignatureCount,
+        }
+
+    def setState(self, state):
+        self.signatures.update(state["signatures"])
+        self.newSignatureCount = state["newSignatureCount"]
+
+    # Picks the input for this run, None for the .fuzzer file's own messages
+    def chooseBase(self, seed):
+        if seed < 0 or not self.entries:
+            return None
+        chooser = random.Random(seed)
+        if chooser.random() < Corpus.ORIGINAL_SHARE:
+            return None
+        return self.entries[chooser.randrange(len(self.entries))]
+
+    # seed - -1 for the test run, whose signature is remembered but not kept
+    # Returns the CorpusEntry the run starts from, None if it's the original messages
+    def startRun(self, seed):
+        self._seed = seed
+        if self.scheduler and seed > -1:
+            self._base = self.scheduler.next()
+        else:
+            self._base = self.chooseBase(seed)
+        self._signature = ResponseSignature()
+        self._fuzzedData = {}
+        self._startTime = time.time()
+        return self._base
+
+    # Called after resetAlteredMessage(), before any callbacks or fuzzing
+    def applyBase(self, messageNumber, message):
+        if self._base is None:
+            return
+        for (subcomponentNumber, subcomponent) in enumerate(message.subcomponents):
+            key = (messageNumber, subcomponentNumber)
+            if subcomponent.isFuzzed and key in self._base.data:
+                subcomponent.setAlteredByteArray(bytearray(self._base.data[key]))
+
+    # Called with each outbound message once radamsa has been over it
+    def addFuzzed(self, messageNumber, message):
+        for (subcomponentNumber, subcomponent) in enumerate(message.subcomponents):
+            if subcomponent.isFuzzed:
+                self._fuzzedData[(messageNumber, subcomponentNumber)] = bytearray(subcomponent.getAlteredByteArray())
+
+    def addResponse(self, messageNumber, data):
+        self._signature.addResponse(messageNumber, data)
+
+    def setHighestMessageNumber(self, messageNumber):
+        self._signature.highestMessageNumber = messageNumber
+
+    # hasNewCoverage - keep the run even if the responses were nothing new,
+    #   see backend/coverage.py
+    # Returns the new CorpusEntry if the run was kept, otherwise None
+    def endRun(self, hasNewCoverage=False):
+        entry = self._endRun(hasNewCoverage)
+        if self.scheduler and self._seed > -1:
+            self.scheduler.recordRun(self._base, time.time() - self._startTime, entry is not None)
+        return entry
+
+    def _endRun(self, hasNewCoverage):
+        signature = self._signature
+        if signature is None or signature.highestMessageNumber < 0:
+            # Never got anywhere, e.g. connection refused
+            return None
+        digest = signature.getDigest()
+        isNewSignature = digest not in self.signatures
+        self.signatures.add(digest)
+        if self._seed < 0 or not (isNewSignature or hasNewCoverage):
+            return None
+        if isNewSignature:
+            self.newSignatureCount += 1
+        if not self._fuzzedData or len(self.entries) >= Corpus.MAX_ENTRIES:
+            return None
+        entryId = self.entries[-1].entryId + 1 if self.entries else 0
+        entry = CorpusEntry(entryId, self._fuzzedData, digest, self._seed, self._base.entryId if self._base else None)
+        entry.writeToFile(os.path.join(self.directory, entry.getFileName()))
+        self._addEntry(entry)
+        return entry
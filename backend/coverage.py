@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# Coverage feedback from a target built with SanitizerCoverage, through a
+# shared memory bitmap of edge hit counts (see sample_apps/coverage_server
+# for the target side)
+#
+#------------------------------------------------------------------
+
+import atexit
+import base64
+import binascii
+import mmap
+import os
+
+# The target finds the bitmap through these, so they have to be set before
+# it's launched
+COVERAGE_SHM_ENV = "MUTINY_SHM_NAME"
+COVERAGE_SIZE_ENV = "MUTINY_SHM_SIZE"
+
+# AFL's hit count classes: 0, 1, 2, 3, 4-7, 8-15, 16-31, 32-127, 128+
+# A loop going round a few more times is only new once it reaches the next class
+def _getCountClass(count):
+    if count <= 2:
+        return count
+    elif count == 3:
+        return 4
+    elif count < 8:
+        return 8
+    elif count < 16:
+        return 16
+    elif count < 32:
+        return 32
+    elif count < 128:
+        return 64
+    return 128
+COUNT_CLASSES = str(bytearray(_getCountClass(count) for count in range(256)))
+
+# The bitmap is a POSIX shared memory object (/dev/shm/<name>) the target
+# maps and counts edges into.  It's reset before each run and classified
+# after it, all with whole-map operations (translate() and long integer
+# arithmetic) rather than a Python loop over every byte
+#
+# The target is a long running server, so anything it does after Mutiny
+# closes the connection (e.g. tidying up the session) lands in the next
+# run's counts
+class CoverageMap(object):
+    DEFAULT_SIZE = 1 << 16
+
+    # name - shared memory object name, defaults to one unique to this process
+    # size - bytes in the bitmap, edge indexes are taken modulo this
+    def __init__(self, name=None, size=DEFAULT_SIZE):
+        self.name = name or "mutiny-%d" % (os.getpid())
+        self.size = size
+        self.path = os.path.join("/dev/shm", self.name)
+        if not os.path.isdir("/dev/shm"):
+            raise RuntimeError("Coverage needs POSIX shared memory (/dev/shm)")
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0600)
+        try:
+            os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self._zeroes = "\x00" * size
+        # Bits that no run has hit yet, as one big integer
+        self._virgin = (1 << (size * 8)) - 1
+        # Edges (bitmap entries) hit by any run so far
+        self.edgeCount = 0
+        # Edges hit by the last run
+        self.runEdgeCount = 0
+        atexit.register(self.close)
+
+    # Lets targets launched from now on (e.g. by a ProcessMonitor) find the bitmap
+    def exportEnvironment(self, environment=os.environ):
+        environment[COVERAGE_SHM_ENV] = "/" + self.name
+        environment[COVERAGE_SIZE_ENV] = str(self.size)
+
+    def startRun(self):
+        self._map[:] = self._zeroes
+
+    # Returns whether the run hit an edge, or an edge a number of times,
+    # that no earlier run has
+    def endRun(self):
+        classified = self._map[:].translate(COUNT_CLASSES)
+        self.runEdgeCount = self.size - classified.count("\x00")
+        if not self.runEdgeCount:
+            return False
+        current = int(binascii.hexlify(classified), 16)
+        if not current & self._virgin:
+            return False
+        self._virgin &= ~current
+        self.edgeCount = self.size - binascii.unhexlify("%0*x" % (self.size * 2, self._virgin)).count("\xff")
+        return True
+
+    # For checkpoints, see backend/checkpoint.py
+    def getState(self):
+        return {
+            "size": self.size,
+            "virgin": base64.b64encode(binascii.unhexlify("%0*x" % (self.size * 2, self._virgin))),
+            "edgeCount": self.edgeCount,
+        }
+
+    def setState(self, state):
+        if state["size"] != self.size:
+            print "Coverage map size has changed, starting coverage from scratch"
+            return
+        self._virgin = int(binascii.hexlify(base64.b64decode(state["virgin"])), 16)
+        self.edgeCount = state["edgeCount"]
+
+    def close(self):
+        if self._map is None:
+            return
+        self._map.close()
+        self._map = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
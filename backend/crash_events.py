@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# Crash events raised by monitors, and the run history used to work
+# out which seeds could have caused them
+#
+# Monitors run on their own threads and push CrashEvents onto a
+# CrashEventQueue, the fuzz loop picks them up between runs (and
+# between messages) rather than being interrupted mid-run
+#
+#------------------------------------------------------------------
+
+import collections
+import datetime
+import errno
+import socket
+import threading
+import time
+
+# Errors a run fails with when the target's died under it, so worth giving
+# the monitors a moment to report the crash
+# Timeouts, closed connections and the like are usually just the target
+# turning the input down
+TARGET_DEATH_ERRNOS = (errno.ECONNREFUSED, errno.ECONNRESET, errno.EPIPE)
+
+# A monitor telling us the target crashed
+class CrashEvent(object):
+    # monitorName - which monitor saw it
+    # payload - whatever the monitor had to say: a signal, exit code, log line, etc
+    # targetName - the TargetPool instance that crashed, if the monitor knows
+    def __init__(self, monitorName, payload=None, timestamp=None, targetName=None):
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.monitorName = monitorName
+        self.payload = payload
+        self.targetName = targetName
+
+    def __str__(self):
+        description = "Crash event from %s at %s" % (self.monitorName, datetime.datetime.fromtimestamp(self.timestamp).strftime("%H:%M:%S.%f"))
+        if self.payload is not None:
+            description += ": %s" % (str(self.payload))
+        return description
+
+    # What happened but not when, e.g. to tell whether two crashes look alike
+    def getSummary(self):
+        if self.payload is None:
+            return self.monitorName
+        return "%s: %s" % (self.monitorName, str(self.payload))
+
+# Thread safe channel from monitors to the fuzz loop
+class CrashEventQueue(object):
+    def __init__(self):
+        self._crashEvents = collections.deque()
+        self._condition = threading.Condition()
+
+    def put(self, crashEvent):
+        with self._condition:
+            self._crashEvents.append(crashEvent)
+            self._condition.notifyAll()
+
+    # Cheap enough to call between every message
+    def isPending(self):
+        return len(self._crashEvents) > 0
+
+    # Number of events waiting to be drained
+    def __len__(self):
+        return len(self._crashEvents)
+
+    # Block up to timeout seconds for an event to be queued, without taking it
+    # Returns whether there is one
+    def waitPending(self, timeout=None):
+        with self._condition:
+            if not self._crashEvents:
+                self._condition.wait(timeout)
+            return len(self._crashEvents) > 0
+
+    # Whether a run that failed with exception looks to have crashed the
+    # target: an event's already queued, or the error is one a dying target
+    # causes and an event turns up within grace seconds
+    def waitRunFailure(self, exception, grace):
+        if self.isPending():
+            return True
+        if not isinstance(exception, socket.error) or exception.errno not in TARGET_DEATH_ERRNOS:
+            return False
+        return self.waitPending(grace)
+
+    # Block up to timeout seconds for an event, None if there wasn't one
+    def wait(self, timeout=None):
+        with self._condition:
+            if not self._crashEvents:
+                self._condition.wait(timeout)
+            return self._crashEvents.popleft() if self._crashEvents else None
+
+    # Everything queued so far, oldest first, without blocking
+    def drain(self):
+        with self._condition:
+            crashEvents = list(self._crashEvents)
+            self._crashEvents.clear()
+            return crashEvents
+
+# One performRun() call
+class RunRecord(object):
+    # ownerName - which fuzzer made the run, when several share a RunHistory
+    # targetName - which TargetPool instance the run went to, if there's a pool
+    def __init__(self, runNumber, seed, ownerName=None, targetName=None):
+        self.runNumber = runNumber
+        self.seed = seed
+        self.ownerName = ownerName
+        self.targetName = targetName
+        self.startTime = time.time()
+        # None while the run is still going
+        self.endTime = None
+        # Message number -> bytes sent, if the fuzzer records them, for replaying the run
+        self.outbound = {}
+
+    def __str__(self):
+        description = "run %d (seed %d)" % (self.runNumber, self.seed)
+        if self.ownerName is not None:
+            description = "%s %s" % (self.ownerName, description)
+        if self.targetName is not None:
+            description += " on %s" % (self.targetName)
+        return description
+
+# The last few runs, so a crash event can be matched to the runs that were
+# in flight when it happened
+#
+# Can be shared by fuzzers running on different threads (mutiny_classy.py)
+class RunHistory(object):
+    # window - how many seconds after a run ends a monitor might still be
+    #   reporting a crash it caused
+    # maxRuns - how many runs to remember
+    def __init__(self, window=1.0, maxRuns=256):
+        self.window = window
+        self._runs = collections.deque(maxlen=maxRuns)
+        self._lock = threading.Lock()
+
+    # Returns the RunRecord, to pass to endRun() when several fuzzers share the history
+    def startRun(self, runNumber, seed, ownerName=None, targetName=None):
+        run = RunRecord(runNumber, seed, ownerName, targetName)
+        with self._lock:
+            self._runs.append(run)
+        return run
+
+    # run - the run that's over, the most recent one by default
+    def endRun(self, run=None):
+        with self._lock:
+            if run is None and len(self._runs):
+                run = self._runs[-1]
+            if run is not None and run.endTime is None:
+                run.endTime = time.time()
+
+    # The last count runs, most recent first
+    # ownerName - only count that fuzzer's runs
+    def getLastRuns(self, count, ownerName=None):
+        with self._lock:
+            runs = [run for run in self._runs if ownerName is None or run.ownerName == ownerName]
+        return runs[:-count-1:-1]
+
+    # Runs that were going at timestamp, or ended less than window seconds
+    # before it, most recent first
+    # targetName - only runs that went to this TargetPool instance
+    def getCandidates(self, timestamp, targetName=None):
+        with self._lock:
+            runs = list(self._runs)
+        # Not stopping at the first run that ended too early, as with several
+        # fuzzers an older run can still be going
+        return [run for run in reversed(runs) if run.startTime <= timestamp and (run.endTime is None or run.endTime + self.window >= timestamp) and (targetName is None or run.targetName == targetName)]
+
+def describeCrashEvent(crashEvent, candidates):
+    return "%s, runs in flight: %s" % (str(crashEvent), ", ".join(str(run) for run in candidates) if candidates else "none")
+
+# Print crashEvent along with the runs that could have caused it, and log
+# whichever of the current and previous runs are among them, those being
+# the only two the Logger still has the data for
+# messageCollection/lastMessageCollection - as sent in the current/previous run
+# Returns the candidate runs
+def logCrashEvent(logger, runHistory, crashEvent, messageCollection, lastMessageCollection):
+    candidates = runHistory.getCandidates(crashEvent.timestamp, crashEvent.targetName)
+    description = describeCrashEvent(crashEvent, candidates)
+    print description
+    logCandidateRuns(logger, runHistory, candidates, description, messageCollection, lastMessageCollection)
+    return candidates
+
+# The logging half of logCrashEvent()
+# ownerName - only log that fuzzer's runs, when several share runHistory
+def logCandidateRuns(logger, runHistory, candidates, description, messageCollection, lastMessageCollection, ownerName=None):
+    if ownerName is not None:
+        candidates = [run for run in candidates if run.ownerName == ownerName]
+    lastRuns = runHistory.getLastRuns(2, ownerName)
+    if logger and lastRuns:
+        currentRun = lastRuns[0]
+        if currentRun in candidates or not candidates:
+            # Nothing matched, the current run is still the best guess
+            logger.outputLog(currentRun.runNumber, messageCollection, description)
+        if len(lastRuns) > 1:
+            previousRun = lastRuns[1]
+            if previousRun in candidates and previousRun.runNumber != currentRun.runNumber:
+                logger.outputLastLog(previousRun.runNumber, lastMessageCollection, description)
+
+# When several fuzzers share one monitor (mutiny_classy.py), works out whose
+# run caused each crash: every run in flight around the crash is a
+# candidate, and each is replayed on its own to see which crash again
+class CrashTriage(object):
+    def __init__(self, runHistory):
+        self.runHistory = runHistory
+        # (crashEvent, reporterName) not triaged yet
+        self._pending = []
+        self._lock = threading.Lock()
+
+    # reporterName - the fuzzer that picked the event up, which gets the blame
+    #   if no runs were in flight
+    def addCrashEvent(self, crashEvent, reporterName):
+        with self._lock:
+            self._pending.append((crashEvent, reporterName))
+
+    def hasPending(self):
+        return len(self._pending) > 0
+
+    # Only call with nothing else running, or other runs will get in the way
+    # replayRun(run) - sends what run sent again, returns whether the target crashed
+    # Returns [(crashEvent, reporterName, candidates, confirmedRuns)] for the
+    # events added since last time
+    def triage(self, replayRun):
+        with self._lock:
+            pending = self._pending
+            self._pending = []
+        results = []
+        # Run -> whether replaying it crashed the target, so runs that were
+        # in flight for several events are only replayed once
+        replayed = {}
+        for (crashEvent, reporterName) in pending:
+            candidates = self.runHistory.getCandidates(crashEvent.timestamp, crashEvent.targetName)
+            # Oldest first, the order the target saw them in
+            for run in reversed(candidates):
+                if run not in replayed:
+                    replayed[run] = replayRun(run)
+            confirmedRuns = [run for run in candidates if replayed[run]]
+            results.append((crashEvent, reporterName, candidates, confirmedRuns))
+        return results
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# Skips runs that would send exactly what an earlier run already sent,
+# which happens a lot as radamsa often makes the same output from
+# different seeds
+#
+#------------------------------------------------------------------
+
+import atexit
+import hashlib
+import os
+import struct
+import time
+
+from backend.bloom_filter import ScalableBloomFilter
+
+# A conversation is fingerprinted by every outbound message up to and
+# including the last fuzzed one, as sent (after preSendProcess).  The check
+# happens just before that last fuzzed message goes out, so a duplicate run
+# costs at most the unfuzzed messages before it
+#
+# Fingerprints are remembered once a run completes or the target turns it
+# away (closes the connection, times out...), but not when it crashed the
+# target, so a run that crashed it is never skipped when it's retried
+class DuplicateRunFilter(object):
+    # Seconds between saves while fuzzing, it's also saved on exit
+    SAVE_INTERVAL = 60
+
+    # path - file the fingerprints are kept in between sessions, None to not keep them
+    def __init__(self, path=None, initialCapacity=100000, errorRate=0.0001):
+        self.path = path
+        if path and os.path.exists(path):
+            self.seen = ScalableBloomFilter.load(path)
+            print "Loaded %d run fingerprints from %s" % (len(self.seen), path)
+        else:
+            self.seen = ScalableBloomFilter(initialCapacity, errorRate)
+        self.skippedCount = 0
+        self._lastSaveTime = time.time()
+        self._isDirty = False
+        self._hash = None
+        self._fingerprint = None
+        self._lastFuzzedMessageNumber = -1
+        self._isFuzzing = False
+        if path:
+            atexit.register(self.save)
+
+    # seed - -1 for the test run, which is remembered but never skipped
+    def startRun(self, messageCollection, seed):
+        self._hash = hashlib.md5()
+        self._fingerprint = None
+        self._isFuzzing = seed > -1
+        self._lastFuzzedMessageNumber = -1
+        for (messageNumber, message) in enumerate(messageCollection.messages):
+            if message.isOutbound() and message.isFuzzed:
+                self._lastFuzzedMessageNumber = messageNumber
+
+    # Called with each outbound message as it's about to be sent
+    # Returns whether the run should be skipped as a duplicate
+    def addOutbound(self, messageNumber, byteArray):
+        # Length first, so where one message ends and the next starts matters
+        self._hash.update(struct.pack("<I", len(byteArray)))
+        self._hash.update(byteArray)
+        if messageNumber != self._lastFuzzedMessageNumber:
+            return False
+        self._fingerprint = self._hash.digest()
+        if self._isFuzzing and self._fingerprint in self.seen:
+            self.skippedCount += 1
+            return True
+        return False
+
+    # The run is over without crashing the target, so don't do it again
+    def endRun(self):
+        if self._fingerprint and not self.seen.add(self._fingerprint):
+            self._isDirty = True
+
+    # For checkpoints, see backend/checkpoint.py
+    # The fingerprints themselves are saved to their own file
+    def getState(self):
+        self.save()
+        return {"skippedCount": self.skippedCount}
+
+    def setState(self, state):
+        self.skippedCount = state["skippedCount"]
+
+    def maybeSave(self):
+        if time.time() - self._lastSaveTime >= DuplicateRunFilter.SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        if self.path and self._isDirty:
+            self.seen.save(self.path)
+            self._isDirty = False
+        self._lastSaveTime = time.time()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# Demultiplexes a capture into its individual TCP/UDP flows for
+# mutiny_prep.py, so a capture with many sessions can be turned into
+# many .fuzzer files in one pass
+#
+#------------------------------------------------------------------
+
+import multiprocessing
+import os.path
+
+from backend.fuzzer_types import Message
+from backend.fuzzerdata import FuzzerData
+from backend.pcap_reader import PcapReader, TCP_SYN, TCP_ACK, TCP_FIN, TCP_RST
+from backend.tcp_reassembly import TcpStreamReassembler
+
+# One TCP/UDP conversation out of a capture
+class Flow(object):
+    # overlapPolicy/gapPolicy - see TcpStreamReassembler, only used for tcp
+    def __init__(self, packetInfo, index, overlapPolicy=TcpStreamReassembler.OVERLAP_FIRST, gapPolicy=TcpStreamReassembler.GAP_SKIP):
+        # Order the flow was first seen in, used for naming output
+        self.index = index
+        self.proto = packetInfo.proto
+        self.firstTimestamp = packetInfo.timestamp
+
+        # Work out which end is the client
+        # A SYN tells us for sure, otherwise guess the lower port is the server
+        if packetInfo.proto == "tcp" and packetInfo.flags & TCP_SYN:
+            isFromClient = not packetInfo.flags & TCP_ACK
+        else:
+            isFromClient = packetInfo.srcPort >= packetInfo.dstPort
+        if isFromClient:
+            self.client = (packetInfo.srcIP, packetInfo.srcPort)
+            self.server = (packetInfo.dstIP, packetInfo.dstPort)
+        else:
+            self.client = (packetInfo.dstIP, packetInfo.dstPort)
+            self.server = (packetInfo.srcIP, packetInfo.srcPort)
+
+        # List of (direction, bytearray) in the order they were seen
+        self.messages = []
+        # TCP data goes through this so the messages are the actual byte streams
+        self.reassembler = TcpStreamReassembler(overlapPolicy, gapPolicy) if self.proto == "tcp" else None
+        # Directions we've seen a FIN from, or True once there's been a RST
+        self._finished = set()
+        self._reset = False
+
+    def getDirection(self, packetInfo):
+        if (packetInfo.srcIP, packetInfo.srcPort) == self.client:
+            return Message.Direction.Outbound
+        return Message.Direction.Inbound
+
+    # Add data to the conversation
+    # combinePackets - append back-to-back data in the same direction to the
+    #   previous message rather than starting a new one
+    def addData(self, direction, data, combinePackets=True):
+        if len(data) == 0:
+            return
+        if combinePackets and len(self.messages) and self.messages[-1][0] == direction:
+            self.messages[-1][1].extend(data)
+        else:
+            self.messages.append((direction, bytearray(data)))
+
+    def addPacket(self, packetInfo, combinePackets=True):
+        direction = self.getDirection(packetInfo)
+        if not self.reassembler:
+            self.addData(direction, packetInfo.payload, combinePackets=combinePackets)
+            return
+
+        for (deliveredDirection, data) in self.reassembler.addSegment(direction, packetInfo.seq, packetInfo.ack, packetInfo.flags, packetInfo.payload):
+            self.addData(deliveredDirection, data, combinePackets=combinePackets)
+        if packetInfo.flags & TCP_RST:
+            self._reset = True
+        elif packetInfo.flags & TCP_FIN:
+            self._finished.add(direction)
+        if self.isFinished():
+            self.finish(combinePackets=combinePackets)
+
+    # No more packets are coming, deliver anything held up behind a gap
+    def finish(self, combinePackets=True):
+        if self.reassembler:
+            for (deliveredDirection, data) in self.reassembler.flush():
+                self.addData(deliveredDirection, data, combinePackets=combinePackets)
+
+    # True once a TCP flow has been closed from both ends or reset
+    # UDP flows never finish, they only end with the capture
+    def isFinished(self):
+        return self._reset or len(self._finished) == 2
+
+    # Make the end using port the server, flipping the conversation around
+    # if the guess in __init__ got it the wrong way round
+    # Returns False if neither end of the flow uses port
+    def setServerPort(self, port):
+        if self.server[1] == port:
+            return True
+        if self.client[1] != port:
+            return False
+        (self.client, self.server) = (self.server, self.client)
+        flipped = {Message.Direction.Outbound: Message.Direction.Inbound, Message.Direction.Inbound: Message.Direction.Outbound}
+        self.messages = [(flipped[direction], data) for (direction, data) in self.messages]
+        return True
+
+    def hasClientData(self):
+        return any(direction == Message.Direction.Outbound for (direction, data) in self.messages)
+
+    # Rough outline of the conversation: who talks in what order and
+    # roughly how much (lengths bucketed by power of two)
+    # Flows with the same shape are usually the same kind of session
+    def getShape(self):
+        return (self.proto, self.server[1], tuple((direction, len(data).bit_length()) for (direction, data) in self.messages))
+
+    def getDescription(self):
+        return "{0} {1}:{2} -> {3}:{4}".format(self.proto, self.client[0], self.client[1], self.server[0], self.server[1])
+
+# Tracks every flow in a capture keyed by its 5-tuple
+class FlowTable(object):
+    def __init__(self, combinePackets=True, overlapPolicy=TcpStreamReassembler.OVERLAP_FIRST, gapPolicy=TcpStreamReassembler.GAP_SKIP):
+        self.combinePackets = combinePackets
+        self.overlapPolicy = overlapPolicy
+        self.gapPolicy = gapPolicy
+        self.flows = {}
+        self._flowCount = 0
+
+    # Returns the flow if this packet finished it, in which case it's also
+    # dropped from the table so its memory can go as soon as the caller is done
+    def addPacket(self, packetInfo):
+        key = packetInfo.getFlowKey()
+        flow = self.flows.get(key)
+        if not flow:
+            flow = Flow(packetInfo, self._flowCount, overlapPolicy=self.overlapPolicy, gapPolicy=self.gapPolicy)
+            self._flowCount += 1
+            self.flows[key] = flow
+        flow.addPacket(packetInfo, combinePackets=self.combinePackets)
+        if flow.isFinished():
+            del self.flows[key]
+            return flow
+        return None
+
+    # Everything that's still open, in the order it was first seen
+    def drain(self):
+        flows = sorted(self.flows.values(), key=lambda flow: flow.index)
+        for flow in flows:
+            flow.finish(combinePackets=self.combinePackets)
+        self.flows = {}
+        return flows
+
+# Settings applied to every .fuzzer written for a flow
+# Kept as a plain object so it can be handed to worker processes
+class FlowFuzzerSettings(object):
+    def __init__(self):
+        self.processorDirectory = "default"
+        self.failureThreshold = 3
+        self.failureTimeout = 5
+        self.receiveTimeout = 1.0
+        # -1 to keep all messages inline, see FuzzerData.writeToFile()
+        self.blobThreshold = -1
+
+# Build the FuzzerData for a single flow
+# fuzzedMessages - message numbers to fuzz, None for just the first client message
+def flowToFuzzerData(flow, settings, fuzzedMessages=None):
+    fuzzerData = FuzzerData()
+    fuzzerData.processorDirectory = settings.processorDirectory
+    fuzzerData.failureThreshold = settings.failureThreshold
+    fuzzerData.failureTimeout = settings.failureTimeout
+    fuzzerData.receiveTimeout = settings.receiveTimeout
+    fuzzerData.proto = flow.proto
+    fuzzerData.port = flow.server[1]
+
+    isFuzzed = True
+    for (messageNum, (direction, data)) in enumerate(flow.messages):
+        message = Message()
+        message.direction = direction
+        if fuzzedMessages is None:
+            # Only fuzz the first outbound message
+            message.setMessageFrom(Message.Format.Raw, data, isFuzzed and direction == Message.Direction.Outbound)
+            if message.isFuzzed:
+                isFuzzed = False
+        else:
+            message.setMessageFrom(Message.Format.Raw, data, messageNum in fuzzedMessages)
+        fuzzerData.messageCollection.addMessage(message)
+    return fuzzerData
+
+# Pool worker, returns (flow description, path actually written)
+def _writeFlowFuzzer(task):
+    (outputFilePath, flow, settings) = task
+    fuzzerData = flowToFuzzerData(flow, settings)
+    actualPath = fuzzerData.writeToFile(outputFilePath, defaultComments=True, blobThreshold=settings.blobThreshold)
+    return (flow.getDescription(), actualPath)
+
+# Yield every flow in inputFilePath as it finishes, then whatever is
+# still open at the end of the capture
+def iterCaptureFlows(inputFilePath, combinePackets=True, overlapPolicy=TcpStreamReassembler.OVERLAP_FIRST, gapPolicy=TcpStreamReassembler.GAP_SKIP):
+    flowTable = FlowTable(combinePackets=combinePackets, overlapPolicy=overlapPolicy, gapPolicy=gapPolicy)
+    for packetInfo in PcapReader(inputFilePath):
+        finishedFlow = flowTable.addPacket(packetInfo)
+        if finishedFlow:
+            yield finishedFlow
+    for flow in flowTable.drain():
+        yield flow
+
+# Read inputFilePath once and write a .fuzzer per flow (splitBy="flow") or
+# per distinct conversation shape (splitBy="shape"), with the writing done
+# across a pool of processes
+# Returns list of (flow description, .fuzzer path)
+def splitCapture(inputFilePath, settings, splitBy="flow", processes=None, combinePackets=True, overlapPolicy=TcpStreamReassembler.OVERLAP_FIRST, gapPolicy=TcpStreamReassembler.GAP_SKIP):
+    outputPrefix = os.path.splitext(inputFilePath)[0]
+    seenShapes = set()
+    pool = multiprocessing.Pool(processes)
+    pending = []
+
+    def submit(flow):
+        if not flow.hasClientData():
+            # Nothing for us to send, not worth a .fuzzer
+            return
+        if splitBy == "shape":
+            shape = flow.getShape()
+            if shape in seenShapes:
+                return
+            seenShapes.add(shape)
+        outputFilePath = "{0}-flow{1}-{2}-{3}.fuzzer".format(outputPrefix, flow.index, flow.proto, flow.server[1])
+        # Reassembly state is done with, no point sending it to the worker
+        flow.reassembler = None
+        pending.append(pool.apply_async(_writeFlowFuzzer, [(outputFilePath, flow, settings)]))
+
+    try:
+        for flow in iterCaptureFlows(inputFilePath, combinePackets=combinePackets, overlapPolicy=overlapPolicy, gapPolicy=gapPolicy):
+            submit(flow)
+        pool.close()
+        results = [result.get() for result in pending]
+    finally:
+        pool.terminate()
+        pool.join()
+    return results
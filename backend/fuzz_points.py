@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# Picks which fuzzed subcomponents ("fuzz points") to mutate each run when
+# a .fuzzer sets fuzzPointsPerRun, instead of mutating all of them
+#
+#------------------------------------------------------------------
+
+import collections
+import hashlib
+import random
+import struct
+import time
+
+from backend.scheduler import PowerScheduler
+
+# Mutating a single point (or a few) leaves the rest of the conversation
+# valid, so runs get further into the protocol.  Points are picked at random
+# from the run's seed, weighted by a PowerScheduler so points whose runs
+# find more (new corpus entries or crashes) or run faster get picked more often
+#
+# Each chosen point gets its own seed derived from the run's, as mutating
+# several points with the same seed correlates the mutations
+class FuzzPointChooser(object):
+    # How many finished runs' points are kept for recordCrash()
+    RECENT_RUNS = 32
+
+    # pointsPerRun - how many points to mutate in each run
+    def __init__(self, messageCollection, pointsPerRun):
+        self.pointsPerRun = pointsPerRun
+        self.scheduler = PowerScheduler()
+        # (messageNumber, subcomponentNumber) of every fuzzed outbound subcomponent
+        self.points = []
+        for (messageNumber, message) in enumerate(messageCollection.messages):
+            if message.isOutbound():
+                for (subcomponentNumber, subcomponent) in enumerate(message.subcomponents):
+                    if subcomponent.isFuzzed:
+                        self.points.append((messageNumber, subcomponentNumber))
+                        self.scheduler.addCandidate((messageNumber, subcomponentNumber))
+        self._chosen = {}
+        self._seed = -1
+        self._startTime = 0
+        # seed => (points, isFind) of the last few runs
+        self._recentRuns = collections.OrderedDict()
+
+    # A point's own seed for a run, from the run's seed
+    @classmethod
+    def getPointSeed(cls, seed, messageNumber, subcomponentNumber):
+        digest = hashlib.md5(struct.pack("<qII", seed, messageNumber, subcomponentNumber)).digest()
+        return struct.unpack("<I", digest[:4])[0] & 0x7fffffff
+
+    # seed - -1 for the test run, which doesn't mutate anything
+    # Returns {(messageNumber, subcomponentNumber): seed} of the points to mutate this run
+    def startRun(self, seed):
+        self._chosen = {}
+        self._seed = seed
+        if seed > -1:
+            for point in self.scheduler.chooseWeighted(self.pointsPerRun, random.Random(seed)):
+                self._chosen[point] = FuzzPointChooser.getPointSeed(seed, *point)
+        self._startTime = time.time()
+        return self._chosen
+
+    # Returns the seed to mutate a point with this run, or None to leave it alone
+    def getSeed(self, messageNumber, subcomponentNumber):
+        return self._chosen.get((messageNumber, subcomponentNumber))
+
+    # For checkpoints, see backend/checkpoint.py
+    def getState(self):
+        return self.scheduler.getState()
+
+    def setState(self, state):
+        self.scheduler.setState(state)
+
+    # isFind - whether the run found something new (e.g. was kept in the corpus)
+    def endRun(self, isFind=False):
+        runTime = time.time() - self._startTime
+        for point in self._chosen:
+            self.scheduler.recordRun(point, runTime, isFind)
+        if self._chosen:
+            self._recentRuns.pop(self._seed, None)
+            self._recentRuns[self._seed] = (list(self._chosen), isFind)
+            while len(self._recentRuns) > FuzzPointChooser.RECENT_RUNS:
+                self._recentRuns.popitem(last=False)
+        self._chosen = {}
+
+    # The run with seed crashed the target, a find for the points it mutated
+    # Crashes are only pinned on a run after endRun(), by the exception
+    # processor or a monitor, so this looks the run up among the recent ones
+    def recordCrash(self, seed):
+        (points, isFind) = self._recentRuns.pop(seed, ([], False))
+        if isFind:
+            # Already counted
+            return
+        for point in points:
+            self.scheduler.recordFind(point)
@@ -35,14 +35,129 @@
 # the fuzzer, and utility functions used by them.
 #------------------------------------------------------------------
 
+import mmap
+import os
+import os.path
+
+# Points at a run of raw bytes in a file outside the .fuzzer, written in
+# the .fuzzer as @path:offset:length
+# path is kept exactly as written (usually relative to the .fuzzer file),
+# fullPath is where it actually resolved to when loaded
+class BlobReference(object):
+    def __init__(self, path, offset, length, fullPath=None):
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.fullPath = fullPath if fullPath else path
+
+    def getSerialized(self, path=None):
+        return "@{0}:{1}:{2}".format(path if path else self.path, self.offset, self.length)
+
+    # Parse "@path:offset:length", path can contain colons
+    @classmethod
+    def fromSerialized(cls, string):
+        string = string.strip()
+        if not string.startswith("@"):
+            raise RuntimeError("Invalid blob reference, must start with @: {0}".format(string))
+        try:
+            (path, offset, length) = string[1:].rsplit(":", 2)
+            offset = int(offset)
+            length = int(length)
+        except ValueError:
+            raise RuntimeError("Invalid blob reference, expected @file:offset:length: {0}".format(string))
+        if len(path) == 0 or offset < 0 or length < 0:
+            raise RuntimeError("Invalid blob reference: {0}".format(string))
+        return cls(path, offset, length)
+
+# Memory-maps the raw files referenced by @file:offset:length message lines
+# Each file is only opened and mapped once no matter how many messages point
+# into it, and only the referenced pages are ever read in
+class BlobStore(object):
+    def __init__(self, baseDirectory="."):
+        # Relative blob paths are resolved against this, normally the
+        # folder the .fuzzer file is in
+        self.baseDirectory = baseDirectory
+        self._maps = {}
+
+    def _getMap(self, fullPath):
+        if fullPath not in self._maps:
+            with open(fullPath, "rb") as blobFile:
+                if os.fstat(blobFile.fileno()).st_size == 0:
+                    # mmap refuses empty files, nothing can be sliced out anyway
+                    self._maps[fullPath] = ""
+                else:
+                    # The map keeps its own reference to the file, fine to close
+                    self._maps[fullPath] = mmap.mmap(blobFile.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._maps[fullPath]
+
+    # Resolves blobReference.fullPath and returns the referenced bytes
+    # Data is copied straight out of the map, no escape decoding involved
+    def load(self, blobReference):
+        blobReference.fullPath = os.path.join(self.baseDirectory, blobReference.path)
+        blobMap = self._getMap(blobReference.fullPath)
+        end = blobReference.offset + blobReference.length
+        if end > len(blobMap):
+            raise RuntimeError("Blob reference {0} runs past end of {1} ({2} bytes)".format(blobReference.getSerialized(), blobReference.fullPath, len(blobMap)))
+        return bytearray(blobMap[blobReference.offset:end])
+
+    def close(self):
+        for blobMap in self._maps.values():
+            if blobMap:
+                blobMap.close()
+        self._maps = {}
+
+# Used while writing a .fuzzer to move any subcomponent bigger than
+# threshold bytes out into a single raw blob file next to it
+# Data goes into a temp file that only replaces blobFilePath on close(),
+# so a blob that's currently mapped by a BlobStore is never truncated under it
+class BlobWriter(object):
+    def __init__(self, blobFilePath, threshold):
+        self.blobFilePath = blobFilePath
+        self.threshold = threshold
+        # References are written relative to the folder the .fuzzer goes into
+        self.referenceDirectory = os.path.dirname(os.path.abspath(blobFilePath))
+        self._tempFilePath = "{0}.tmp".format(blobFilePath)
+        self._blobFile = None
+        self._offset = 0
+
+    # Returns the @file:offset:length string for subcomponent, or None if it
+    # should just be written inline
+    # threshold < 0 never moves anything new out, but existing references are kept
+    def serialize(self, subcomponent):
+        data = subcomponent.message
+        existingReference = subcomponent.blobReference
+        if existingReference and os.path.abspath(existingReference.fullPath) != os.path.abspath(self.blobFilePath):
+            # Already external in some other file, keep pointing there
+            path = os.path.relpath(os.path.abspath(existingReference.fullPath), self.referenceDirectory)
+            return existingReference.getSerialized(path)
+
+        # Anything that lived in the blob we're about to replace has to be copied into the new one
+        if existingReference or (self.threshold >= 0 and len(data) > self.threshold):
+            if not self._blobFile:
+                self._blobFile = open(self._tempFilePath, "wb")
+            self._blobFile.write(data)
+            blobReference = BlobReference(os.path.basename(self.blobFilePath), self._offset, len(data))
+            self._offset += len(data)
+            return blobReference.getSerialized()
+        return None
+
+    def close(self):
+        if self._blobFile:
+            self._blobFile.close()
+            self._blobFile = None
+            os.rename(self._tempFilePath, self.blobFilePath)
+
 class MessageSubComponent(object):
-    def __init__(self, message, isFuzzed):
+    def __init__(self, message, isFuzzed, blobReference=None):
         self.message = message
         self.isFuzzed = isFuzzed
         # This includes both fuzzed messages and messages the user
         # has altered with messageprocessor callbacks
         self._altered = message
-    
+        # BlobReference if message was loaded from an external file rather
+        # than inline in the .fuzzer, None otherwise
+        self.blobReference = blobReference
+
     def setAlteredByteArray(self, byteArray):
         self._altered = byteArray
     
@@ -135,6 +250,8 @@ class Message(object):
             self.subcomponents.append(MessageSubComponent(newMessage, isFuzzed))
         else:
             self.subcomponents[-1].message += newMessage
+            # Data no longer matches what's in the external file, if it came from one
+            self.subcomponents[-1].blobReference = None
 
         if isFuzzed:
             # Make sure message is set to fuzz as well
@@ -167,19 +284,59 @@ class Message(object):
             
             return serializedMessage
     
-    def getSerialized(self):
+    # blobWriter - optional BlobWriter, lets large subcomponents be written
+    #   out as @file:offset:length references instead of inline
+    def getSerialized(self, blobWriter=None):
         if len(self.subcomponents) < 1:
             return "{0} {1}\n".format(self.direction, "ERROR: No data in message.")
         else:
-            serializedMessage = "{0} {1}{2}\n".format(self.direction, "fuzz " if self.subcomponents[0].isFuzzed else "", self.serializeByteArray(self.subcomponents[0].message))
+            serializedMessage = "{0} {1}{2}\n".format(self.direction, "fuzz " if self.subcomponents[0].isFuzzed else "", self._serializeSubcomponentData(self.subcomponents[0], blobWriter))
             
             for subcomponent in self.subcomponents[1:]:
-                serializedMessage += "sub {0}{1}\n".format("fuzz " if subcomponent.isFuzzed else "", self.serializeByteArray(subcomponent.message))
+                serializedMessage += "sub {0}{1}\n".format("fuzz " if subcomponent.isFuzzed else "", self._serializeSubcomponentData(subcomponent, blobWriter))
             
             return serializedMessage
 
+    # Either the quoted data or a blob reference for getSerialized() above
+    def _serializeSubcomponentData(self, subcomponent, blobWriter):
+        if blobWriter:
+            serializedReference = blobWriter.serialize(subcomponent)
+            if serializedReference:
+                return serializedReference
+        elif subcomponent.blobReference:
+            return subcomponent.blobReference.getSerialized()
+        return self.serializeByteArray(subcomponent.message)
+
+    # Returns position of the '@' in a line like "outbound fuzz @file:0:100"
+    # or -1 if the message data isn't a blob reference
+    # Anything after a quote is message data, so an @ in there doesn't count
+    def _findBlobReference(self, serializedData):
+        atPos = serializedData.find("@")
+        if atPos == -1:
+            return -1
+        quotePositions = [pos for pos in (serializedData.find('\''), serializedData.find('"')) if pos != -1]
+        if len(quotePositions) and min(quotePositions) < atPos:
+            return -1
+        if atPos > 0 and serializedData[atPos-1] != " ":
+            return -1
+        return atPos
+
+    # Turns messageData from _extractMessageComponents() into (bytearray, BlobReference or None)
+    def _loadMessageData(self, messageData, blobStore):
+        if messageData.startswith("@"):
+            blobReference = BlobReference.fromSerialized(messageData)
+            if not blobStore:
+                blobStore = BlobStore()
+            return (blobStore.load(blobReference), blobReference)
+        return (self.deserializeByteArray(messageData), None)
+
     # Utility function for setFromSerialized and appendFromSerialized below
     def _extractMessageComponents(self, serializedData):
+        blobPos = self._findBlobReference(serializedData)
+        if blobPos != -1:
+            # Same split as below, message data is just the reference itself
+            return (serializedData[:blobPos].split(" "), serializedData[blobPos:].strip())
+
         firstQuoteSingle = serializedData.find('\'')
         lastQuoteSingle = serializedData.rfind('\'')
         firstQuoteDouble = serializedData.find('"')
@@ -216,7 +373,9 @@ class Message(object):
     
     # Handles _one line_ of data, either "inbound" or "outbound"
     # Lines following this should be passed to appendFromSerialized() below
-    def setFromSerialized(self, serializedData):
+    # blobStore - BlobStore used to load any @file:offset:length message data,
+    #   defaults to one resolving paths against the current directory
+    def setFromSerialized(self, serializedData, blobStore=None):
         serializedData = serializedData.replace("\n", "")
         (serializedData, messageData) = self._extractMessageComponents(serializedData)
         
@@ -236,10 +395,12 @@ class Message(object):
                 raise RuntimeError("Invalid message data")
         
         self.direction = direction
-        self.setMessageFrom(self.Format.Ascii, messageData, isFuzzed)
+        (message, blobReference) = self._loadMessageData(messageData, blobStore)
+        self.setMessageFrom(self.Format.Raw, message, isFuzzed)
+        self.subcomponents[-1].blobReference = blobReference
     
     # Add another line, used for multiline messages
-    def appendFromSerialized(self, serializedData, createNewSubcomponent=True):
+    def appendFromSerialized(self, serializedData, createNewSubcomponent=True, blobStore=None):
         serializedData = serializedData.replace("\n", "")
         (serializedData, messageData) = self._extractMessageComponents(serializedData)
         
@@ -259,7 +420,10 @@ class Message(object):
         if "fuzz" in args:
             isFuzzed = True
         
-        self.appendMessageFrom(self.Format.Ascii, messageData, isFuzzed, createNewSubcomponent=createNewSubcomponent)
+        (message, blobReference) = self._loadMessageData(messageData, blobStore)
+        self.appendMessageFrom(self.Format.Raw, message, isFuzzed, createNewSubcomponent=createNewSubcomponent)
+        if createNewSubcomponent:
+            self.subcomponents[-1].blobReference = blobReference
 
 class MessageCollection(object):
     def __init__(self):
@@ -290,9 +454,12 @@ from copy import deepcopy
 # Handles all the logging of the fuzzing session
 # Log messages can be found at sample_apps/<app>/<app>_logs/<date>/
 class Logger(object):
-    def __init__(self, folderPath):
+    # isResuming - carrying on a session in an existing folder (--resume)
+    def __init__(self, folderPath, isResuming=False):
         self._folderPath = folderPath
-        if os.path.exists(folderPath):
+        if isResuming and os.path.isdir(folderPath):
+            pass
+        elif os.path.exists(folderPath):
             print "Data output directory already exists: %s" % (folderPath)
             exit()
         else:
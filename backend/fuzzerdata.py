@@ -35,7 +35,7 @@
 #
 #------------------------------------------------------------------
 
-from backend.fuzzer_types import MessageCollection, Message
+from backend.fuzzer_types import MessageCollection, Message, BlobStore, BlobWriter
 from backend.menu_functions import validateNumberRange
 import os.path
 import sys
@@ -65,6 +65,9 @@ class FuzzerData(object):
         self.shouldPerformTestRun = True
         # How long to time out on receive() (seconds)
         self.receiveTimeout = 1.0
+        # How many of the fuzzed subcomponents ("fuzz points") to mutate each run,
+        # 0 = all of them
+        self.fuzzPointsPerRun = 0
         # Dictionary to save comments made to a .fuzzer file.  Only really does anything if 
         # using readFromFile and then writeToFile in the same program
         # (For example, fuzzerconverter)
@@ -74,10 +77,14 @@ class FuzzerData(object):
         self._readComments = ""
         # Update for compatibilty with new Decept
         self.messagesToFuzz = [] 
+        # Maps any external files referenced by @file:offset:length messages
+        # Relative paths are against the .fuzzer file's folder when using readFromFile
+        self.blobStore = BlobStore()
     
     
     # Read in the FuzzerData from the specified .fuzzer file
     def readFromFile(self, filePath, quiet=False):
+        self.blobStore.baseDirectory = os.path.dirname(os.path.abspath(filePath))
         with open(filePath, 'r') as inputFile:
             self.readFromFD(inputFile, quiet=quiet)
     
@@ -160,6 +167,11 @@ class FuzzerData(object):
                     elif args[0] == "receiveTimeout":
                         self.receiveTimeout = float(args[1])
                         self._pushComments("receiveTimeout")
+                    elif args[0] == "fuzzPointsPerRun":
+                        self.fuzzPointsPerRun = int(args[1])
+                        if self.fuzzPointsPerRun < 0:
+                            raise RuntimeError("fuzzPointsPerRun can't be negative")
+                        self._pushComments("fuzzPointsPerRun")
                     elif args[0] == "messagesToFuzz":
                         print("WARNING: It looks like you're using a legacy .fuzzer file with messagesToFuzz set.  This is now deprecated, so please update to the new format")
                         self.messagesToFuzz = validateNumberRange(args[1], flattenList=True)
@@ -171,7 +183,7 @@ class FuzzerData(object):
                         sys.exit(-1)
                     elif args[0] == "inbound" or args[0] == "outbound":
                         message = Message()
-                        message.setFromSerialized(line)
+                        message.setFromSerialized(line, blobStore=self.blobStore)
                         self.messageCollection.addMessage(message)
                         # Legacy code to handle old messagesToFuzz format
                         if messageNum in self.messagesToFuzz:
@@ -186,15 +198,15 @@ class FuzzerData(object):
                         if not 'message' in locals():
                             print "\tERROR: 'sub' line declared before any 'message' lines, throwing subcomponent out: {0}".format(line)
                         else:
-                            message.appendFromSerialized(line)
+                            message.appendFromSerialized(line, blobStore=self.blobStore)
                             if not quiet:
                                 print "\t\tSubcomponent: {1} additional bytes".format(messageNum, len(message.subcomponents[-1].message))
-                    elif line.lstrip()[0] == "'" and 'message' in locals():
-                        # If the line begins with ' and a message line has been found,
-                        # assume that this is additional message data
+                    elif line.lstrip()[0] in "'@" and 'message' in locals():
+                        # If the line begins with ' (or @ for external blob data) and a
+                        # message line has been found, assume that this is additional message data
                         # (Different from a subcomponent because it can't have additional data 
                         # tacked on)
-                        message.appendFromSerialized(line.lstrip(), createNewSubcomponent=False)
+                        message.appendFromSerialized(line.lstrip(), createNewSubcomponent=False, blobStore=self.blobStore)
                     else:
                         if not quiet:
                             print "Unknown setting in .fuzzer file: {0}".format(args[0])
@@ -224,7 +236,10 @@ class FuzzerData(object):
 
     
     # Write out the FuzzerData to the specified .fuzzer file
-    def writeToFile(self, filePath, defaultComments=False, finalMessageNum=-1):
+    # blobThreshold - subcomponents bigger than this many bytes are written raw
+    #   into <filePath>.blob and referenced as @file:offset:length instead of
+    #   being escaped inline, -1 to keep everything inline
+    def writeToFile(self, filePath, defaultComments=False, finalMessageNum=-1, blobThreshold=-1):
         origFilePath = filePath
         tail = 0
         while os.path.isfile(filePath):
@@ -235,15 +250,19 @@ class FuzzerData(object):
         if origFilePath != filePath:
             print("File {0} already exists, using {1} instead".format(origFilePath, filePath))
 
+        blobWriter = BlobWriter("{0}.blob".format(filePath), blobThreshold)
         with open(filePath, 'w') as outputFile:
-            self.writeToFD(outputFile, defaultComments=defaultComments, finalMessageNum=finalMessageNum)
+            self.writeToFD(outputFile, defaultComments=defaultComments, finalMessageNum=finalMessageNum, blobWriter=blobWriter)
+        blobWriter.close()
         
         return filePath
 
     # Write out the FuzzerData to a specific file descriptor
     # Most usefully can be used to write to stdout by passing
     # sys.stdout
-    def writeToFD(self, fileDescriptor, defaultComments=False, finalMessageNum=-1):
+    # blobWriter - optional BlobWriter to move large messages into an external file,
+    #   see writeToFile()
+    def writeToFD(self, fileDescriptor, defaultComments=False, finalMessageNum=-1, blobWriter=None):
         if not defaultComments and "start" in self.comments:
             fileDescriptor.write(self.comments["start"])
         
@@ -286,6 +305,14 @@ class FuzzerData(object):
             fileDescriptor.write(self._getComments("shouldPerformTestRun"))
         sPTR = 1 if self.shouldPerformTestRun else 0
         fileDescriptor.write("shouldPerformTestRun {0}\n".format(sPTR))
+
+        # Fuzz Points Per Run
+        if defaultComments:
+            fileDescriptor.write("# How many of the fuzzed messages/subcomponents to mutate each run, each\n")
+            fileDescriptor.write("# with its own seed, favouring ones that have found more (0 for all of them)\n")
+        else:
+            fileDescriptor.write(self._getComments("fuzzPointsPerRun"))
+        fileDescriptor.write("fuzzPointsPerRun {0}\n".format(self.fuzzPointsPerRun))
         
         # Protocol
         if defaultComments:
@@ -324,7 +351,7 @@ class FuzzerData(object):
             message = self.messageCollection.messages[i]
             if not defaultComments:
                 fileDescriptor.write(self._getComments("message{0}".format(i)))
-            fileDescriptor.write(message.getSerialized())
+            fileDescriptor.write(message.getSerialized(blobWriter=blobWriter))
             
         
         if not defaultComments:
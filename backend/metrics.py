@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# Serves a fuzzing session's live stats in Prometheus text format, over
+# HTTP on a local port or on a unix socket
+#
+#------------------------------------------------------------------
+
+import atexit
+import os
+import socket
+import threading
+import BaseHTTPServer
+import SocketServer
+
+from backend.stats import StatsCollector
+
+# Quantiles reported for each phase's latency summary
+QUANTILES = [0.5, 0.9, 0.99]
+
+def _escapeLabel(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace("\"", "\\\"")
+
+def _formatLabels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join("%s=\"%s\"" % (name, _escapeLabel(value)) for (name, value) in labels) + "}"
+
+# Builds up the text exposition format, one metric family at a time
+class _MetricsText(object):
+    def __init__(self):
+        self.lines = []
+
+    def addFamily(self, name, metricType, helpText):
+        self.lines.append("# HELP %s %s" % (name, helpText))
+        self.lines.append("# TYPE %s %s" % (name, metricType))
+
+    def addSample(self, name, labels, value):
+        self.lines.append("%s%s %s" % (name, _formatLabels(labels), repr(float(value))))
+
+    def getText(self):
+        return "\n".join(self.lines) + "\n"
+
+class _MetricsRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.metricsServer.render()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Scrapes every few seconds would drown out the fuzzer's own output
+    def log_message(self, format, *args):
+        pass
+
+class _TcpHttpServer(BaseHTTPServer.HTTPServer):
+    allow_reuse_address = True
+
+class _UnixHttpServer(SocketServer.UnixStreamServer):
+    # BaseHTTPRequestHandler wants (host, port) for the client
+    def get_request(self):
+        (request, clientAddress) = self.socket.accept()
+        return (request, ("unix", 0))
+
+# Serves the counters of one or more StatsCollectors (one per fuzzer) plus
+# the shared monitor's target restarts and crash queue depth
+#
+# The fuzzing loop never talks to this, it just keeps updating its
+# StatsCollector, and requests are answered from a snapshot taken on the
+# server's thread, so there's nothing added to each run
+class MetricsServer(object):
+    # address - "host:port", ":port"/"port" for localhost, or a path for a unix socket
+    def __init__(self, address):
+        self.address = address
+        self.collectors = []
+        self.monitor = None
+        self._server = None
+        self._task = None
+
+        if "/" in address:
+            self.unixPath = address
+            self.hostPort = None
+        else:
+            self.unixPath = None
+            (host, separator, port) = address.rpartition(":")
+            self.hostPort = (host or "127.0.0.1", int(port))
+
+    def addCollector(self, stats):
+        self.collectors.append(stats)
+
+    # monitor - ProcDirector.MonitorWrapper the fuzzers share
+    def setMonitor(self, monitor):
+        self.monitor = monitor
+
+    def start(self):
+        if self.unixPath:
+            # Left over from a previous session
+            if os.path.exists(self.unixPath):
+                os.unlink(self.unixPath)
+            self._server = _UnixHttpServer(self.unixPath, _MetricsRequestHandler)
+        else:
+            self._server = _TcpHttpServer(self.hostPort, _MetricsRequestHandler)
+        self._server.metricsServer = self
+        self._task = threading.Thread(target=self._server.serve_forever, args=(0.5,))
+        self._task.daemon = True
+        self._task.start()
+        atexit.register(self.stop)
+        print "Serving metrics on %s" % (self.getUrl())
+
+    def getUrl(self):
+        if self.unixPath:
+            return "unix:%s" % (self.unixPath)
+        return "http://%s:%d/metrics" % (self.hostPort[0], self._server.server_address[1])
+
+    def stop(self):
+        if self._task and self._task.isAlive():
+            self._server.shutdown()
+            self._task.join()
+            self._server.server_close()
+            if self.unixPath and os.path.exists(self.unixPath):
+                os.unlink(self.unixPath)
+
+    def render(self):
+        text = _MetricsText()
+        # Snapshot everything first, the fuzzing loop carries on underneath us
+        snapshots = [(stats.name or str(index), stats.getSnapshot()) for (index, stats) in enumerate(self.collectors)]
+
+        text.addFamily("mutiny_runs_total", "counter", "Fuzz runs finished")
+        for (name, snapshot) in snapshots:
+            text.addSample("mutiny_runs_total", [("fuzzer", name)], snapshot["runs"])
+
+        text.addFamily("mutiny_run_outcomes_total", "counter", "Fuzz runs by how they ended, ok or the exception that ended them")
+        for (name, snapshot) in snapshots:
+            for (outcome, count) in sorted(snapshot["outcomes"].items()):
+                text.addSample("mutiny_run_outcomes_total", [("fuzzer", name), ("outcome", outcome)], count)
+
+        text.addFamily("mutiny_crashes_total", "counter", "Crashes reported by monitors or the message processor")
+        for (name, snapshot) in snapshots:
+            text.addSample("mutiny_crashes_total", [("fuzzer", name)], snapshot["crashes"])
+
+        text.addFamily("mutiny_current_seed", "gauge", "Seed of the run in progress, -1 for the test run")
+        for (name, snapshot) in snapshots:
+            text.addSample("mutiny_current_seed", [("fuzzer", name)], snapshot["currentSeed"])
+
+        text.addFamily("mutiny_runs_per_second", "gauge", "Runs per second over the whole session")
+        for (name, snapshot) in snapshots:
+            text.addSample("mutiny_runs_per_second", [("fuzzer", name)], snapshot["runsPerSecond"])
+
+        text.addFamily("mutiny_phase_seconds", "summary", "Time spent in each phase of a run")
+        for (name, snapshot) in snapshots:
+            for phase in StatsCollector.PHASES:
+                histogram = snapshot["phases"][phase]
+                labels = [("fuzzer", name), ("phase", phase)]
+                for quantile in QUANTILES:
+                    text.addSample("mutiny_phase_seconds", labels + [("quantile", quantile)], histogram.getPercentile(quantile * 100))
+                text.addSample("mutiny_phase_seconds_sum", labels, histogram.totalMicroseconds / 1000000.0)
+                text.addSample("mutiny_phase_seconds_count", labels, histogram.count)
+
+        if self.monitor:
+            text.addFamily("mutiny_target_restarts_total", "counter", "Times a monitor restarted the target")
+            text.addSample("mutiny_target_restarts_total", [], self.monitor.getRestartCount())
+            text.addFamily("mutiny_crash_queue_depth", "gauge", "Crash events reported by monitors but not yet logged")
+            text.addSample("mutiny_crash_queue_depth", [], len(self.monitor.crashQueue))
+
+        return text.getText()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# Single threaded event loop that all event driven monitors share,
+# waking on file descriptor readiness (epoll where available) and
+# timers instead of each monitor sleeping in its own polling thread
+#
+#------------------------------------------------------------------
+
+import collections
+import ctypes
+import errno
+import fcntl
+import heapq
+import itertools
+import os
+import select
+import struct
+import sys
+import time
+
+# Base class for monitors that run on the shared EventLoop
+# Rather than blocking in monitorTarget() on their own thread, these
+# register file descriptors and timers with the loop in start() and do
+# their work in the callbacks, which must never block
+class EventMonitor(object):
+    # Shown in crash events, defaults to the class name
+    name = None
+
+    # Called on the loop's thread once it's running
+    # signalMain(payload=None) reports a crash, as for Monitor.monitorTarget()
+    # Remove readers/writers from the loop before closing their sockets/files
+    def start(self, loop, targetIP, targetPort, signalMain):
+        pass
+
+    # Called on the loop's thread when monitoring stops
+    def stop(self):
+        pass
+
+    # Called on the main thread before the first run and after a crash,
+    # should block until the target is ready to be fuzzed again, e.g. if
+    # the monitor is restarting it
+    def waitForTarget(self):
+        pass
+
+# Handle for EventLoop.callLater()
+class Timer(object):
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.isCancelled = False
+
+    def cancel(self):
+        self.isCancelled = True
+
+def _getFd(fileObject):
+    return fileObject if isinstance(fileObject, (int, long)) else fileObject.fileno()
+
+class EventLoop(object):
+    def __init__(self):
+        # fd -> (callback, args)
+        self._readers = {}
+        self._writers = {}
+        # Heap of (when, sequence, Timer)
+        self._timers = []
+        self._sequence = itertools.count()
+        # Callbacks handed over from other threads
+        self._pending = collections.deque()
+        self._isRunning = False
+        self._epoll = select.epoll() if hasattr(select, "epoll") else None
+        # fd -> mask currently registered with epoll
+        self._registered = {}
+        # Self pipe, written to by other threads to wake the loop up
+        (self._wakeRead, self._wakeWrite) = os.pipe()
+        for fd in (self._wakeRead, self._wakeWrite):
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self.addReader(self._wakeRead, self._drainWakeups)
+
+    # Call callback(*args) whenever fileObject (fd or anything with fileno()) is readable
+    def addReader(self, fileObject, callback, *args):
+        fd = _getFd(fileObject)
+        self._readers[fd] = (callback, args)
+        self._updateFd(fd)
+
+    def removeReader(self, fileObject):
+        fd = _getFd(fileObject)
+        self._readers.pop(fd, None)
+        self._updateFd(fd)
+
+    # Call callback(*args) whenever fileObject is writable, e.g. a non-blocking connect() finishing
+    def addWriter(self, fileObject, callback, *args):
+        fd = _getFd(fileObject)
+        self._writers[fd] = (callback, args)
+        self._updateFd(fd)
+
+    def removeWriter(self, fileObject):
+        fd = _getFd(fileObject)
+        self._writers.pop(fd, None)
+        self._updateFd(fd)
+
+    # Call callback(*args) in delay seconds, returns a Timer that can be cancelled
+    def callLater(self, delay, callback, *args):
+        timer = Timer(time.time() + delay, callback, args)
+        heapq.heappush(self._timers, (timer.when, next(self._sequence), timer))
+        return timer
+
+    # The only way in from other threads: run callback(*args) on the loop's thread
+    def callSoonThreadsafe(self, callback, *args):
+        self._pending.append((callback, args))
+        try:
+            os.write(self._wakeWrite, "\0")
+        except OSError as e:
+            # Pipe full means a wakeup is already on its way
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def stop(self):
+        self.callSoonThreadsafe(self._stop)
+
+    def _stop(self):
+        self._isRunning = False
+
+    def run(self):
+        self._isRunning = True
+        while self._isRunning:
+            for (fd, isReadable, isWritable) in self._poll(self._getTimeout()):
+                if isReadable and fd in self._readers:
+                    self._call(*self._readers[fd])
+                if isWritable and fd in self._writers:
+                    self._call(*self._writers[fd])
+            self._runTimers()
+
+    def close(self):
+        if self._epoll:
+            self._epoll.close()
+        os.close(self._wakeRead)
+        os.close(self._wakeWrite)
+
+    # A misbehaving monitor shouldn't take the loop, and every other monitor, down with it
+    def _call(self, callback, args):
+        try:
+            callback(*args)
+        except Exception as e:
+            print "Monitor callback %s failed: %s" % (getattr(callback, "__name__", str(callback)), str(e))
+
+    def _getTimeout(self):
+        if self._pending:
+            return 0
+        while self._timers and self._timers[0][2].isCancelled:
+            heapq.heappop(self._timers)
+        if not self._timers:
+            return None
+        return max(0, self._timers[0][0] - time.time())
+
+    def _runTimers(self):
+        now = time.time()
+        while self._timers and self._timers[0][0] <= now:
+            timer = heapq.heappop(self._timers)[2]
+            if not timer.isCancelled:
+                self._call(timer.callback, timer.args)
+        while self._pending:
+            self._call(*self._pending.popleft())
+
+    def _drainWakeups(self):
+        try:
+            while os.read(self._wakeRead, 4096):
+                pass
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+
+    # Returns list of (fd, isReadable, isWritable)
+    # Errors and hangups count as both, so whoever's waiting finds out
+    def _poll(self, timeout):
+        try:
+            if self._epoll:
+                events = self._epoll.poll(-1 if timeout is None else timeout)
+                errorMask = select.EPOLLERR | select.EPOLLHUP
+                return [(fd, bool(mask & (select.EPOLLIN | errorMask)), bool(mask & (select.EPOLLOUT | errorMask))) for (fd, mask) in events]
+            (readable, writable, failed) = select.select(self._readers.keys(), self._writers.keys(), self._writers.keys(), timeout)
+            return [(fd, fd in readable, fd in writable or fd in failed) for fd in set(readable + writable + failed)]
+        except (IOError, OSError, select.error) as e:
+            # Interrupted by a signal, just go round again
+            if e.args[0] == errno.EINTR:
+                return []
+            raise
+
+    def _updateFd(self, fd):
+        if not self._epoll:
+            return
+        mask = 0
+        if fd in self._readers:
+            mask |= select.EPOLLIN
+        if fd in self._writers:
+            mask |= select.EPOLLOUT
+        oldMask = self._registered.get(fd)
+        try:
+            if not mask:
+                if oldMask is not None:
+                    del self._registered[fd]
+                    self._epoll.unregister(fd)
+            elif oldMask is None:
+                self._epoll.register(fd, mask)
+                self._registered[fd] = mask
+            elif oldMask != mask:
+                self._registered[fd] = mask
+                self._epoll.modify(fd, mask)
+        except (IOError, OSError) as e:
+            # Closed without being removed first, epoll dropped it on its own
+            if e.errno not in [errno.EBADF, errno.ENOENT]:
+                raise
+            if mask and e.errno == errno.ENOENT:
+                # ...and the fd number has since been reused
+                self._epoll.register(fd, mask)
+
+# Minimal inotify binding, Python 2 doesn't come with one
+# The fd can be handed to EventLoop.addReader()
+class Inotify(object):
+    IN_MODIFY = 0x2
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_NONBLOCK = os.O_NONBLOCK
+    IN_CLOEXEC = 0o2000000
+    _EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(Inotify.IN_NONBLOCK | Inotify.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+
+    # Returns None if inotify isn't available on this platform
+    @staticmethod
+    def create():
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            return Inotify()
+        except (OSError, AttributeError):
+            return None
+
+    # Returns the watch descriptor
+    def addWatch(self, path, mask):
+        wd = self._libc.inotify_add_watch(self.fd, path, ctypes.c_uint32(mask))
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()), path)
+        return wd
+
+    def fileno(self):
+        return self.fd
+
+    # Everything queued so far, as a list of (wd, mask, name)
+    def read(self):
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    return events
+                raise
+            offset = 0
+            while offset < len(data):
+                (wd, mask, cookie, nameLength) = Inotify._EVENT_HEADER.unpack_from(data, offset)
+                offset += Inotify._EVENT_HEADER.size
+                events.append((wd, mask, data[offset:offset + nameLength].rstrip("\0")))
+                offset += nameLength
+
+    def close(self):
+        os.close(self.fd)
@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# Streaming pcap/pcapng reader for mutiny_prep.py
+#
+# Reads one record at a time and only parses as far as the transport
+# header (Ethernet/SLL/raw IP -> IPv4/IPv6 -> TCP/UDP), so memory use
+# doesn't grow with capture size.  Link types we don't understand are
+# handed to scapy one frame at a time instead.
+#
+#------------------------------------------------------------------
+
+import socket
+import struct
+
+# Link layer types (http://www.tcpdump.org/linktypes.html)
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+# Some platforms write DLT_RAW with its old value
+LINKTYPE_RAW_ALTERNATES = [12, 14]
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+ETHERTYPE_VLAN = [0x8100, 0x88A8, 0x9100]
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+# IPv6 extension headers we walk over to find TCP/UDP
+IPV6_EXTENSION_HEADERS = [0, 43, 60]
+IPV6_FRAGMENT = 44
+IPV6_AH = 51
+
+# TCP flags
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+
+PCAP_MAGIC_USEC = 0xa1b2c3d4
+PCAP_MAGIC_NSEC = 0xa1b23c4d
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+PCAPNG_IDB = 1
+PCAPNG_OPB = 2
+PCAPNG_SPB = 3
+PCAPNG_EPB = 6
+PCAPNG_OPTION_TSRESOL = 9
+
+_ethernetHeader = struct.Struct("!6s6sH")
+_ipv4Header = struct.Struct("!BBHHHBBH4s4s")
+_ipv6Header = struct.Struct("!IHBB16s16s")
+_portsHeader = struct.Struct("!HH")
+_tcpHeader = struct.Struct("!HHIIBB")
+
+# The parts of a TCP/UDP packet mutiny_prep.py cares about
+class PacketInfo(object):
+    def __init__(self):
+        # Seconds since epoch, as a float
+        self.timestamp = 0.0
+        # "aa:bb:cc:dd:ee:ff" if there was an Ethernet header, None otherwise
+        self.srcMac = None
+        self.dstMac = None
+        # Dotted quad or IPv6 string
+        self.srcIP = None
+        self.dstIP = None
+        # "tcp" or "udp"
+        self.proto = None
+        self.srcPort = None
+        self.dstPort = None
+        # Only meaningful for tcp
+        self.seq = 0
+        self.ack = 0
+        self.flags = 0
+        # Transport payload as a str, may be empty
+        self.payload = ""
+
+    # Key that's the same for both directions of a flow
+    def getFlowKey(self):
+        endpoints = sorted([(self.srcIP, self.srcPort), (self.dstIP, self.dstPort)])
+        return (self.proto, endpoints[0], endpoints[1])
+
+def _formatMac(macBytes):
+    return ":".join("%02x" % ord(byte) for byte in macBytes)
+
+# Parse from the IP header on, returns PacketInfo or None if this isn't TCP/UDP
+def parseIP(data, offset=0):
+    if len(data) <= offset:
+        return None
+    version = ord(data[offset]) >> 4
+    if version == 4:
+        return _parseIPv4(data, offset)
+    elif version == 6:
+        return _parseIPv6(data, offset)
+    return None
+
+def _parseIPv4(data, offset):
+    if len(data) < offset + _ipv4Header.size:
+        return None
+    (versionIHL, tos, totalLength, ipID, fragment, ttl, proto, checksum, src, dst) = _ipv4Header.unpack_from(data, offset)
+    headerLength = (versionIHL & 0x0F) * 4
+    # Bogus header length, or a header that's been cut off by the snap length
+    if headerLength < _ipv4Header.size or len(data) < offset + headerLength:
+        return None
+    if fragment & 0x1FFF:
+        # Not the first fragment, no transport header in here
+        return None
+    # Ethernet pads short frames, only trust the IP length
+    # (unless it's 0, which happens with TSO captures)
+    end = offset + totalLength if totalLength else len(data)
+    packetInfo = _parseTransport(data, offset + headerLength, min(end, len(data)), proto)
+    if packetInfo:
+        packetInfo.srcIP = socket.inet_ntoa(src)
+        packetInfo.dstIP = socket.inet_ntoa(dst)
+    return packetInfo
+
+def _parseIPv6(data, offset):
+    if len(data) < offset + _ipv6Header.size:
+        return None
+    (versionClassFlow, payloadLength, nextHeader, hopLimit, src, dst) = _ipv6Header.unpack_from(data, offset)
+    end = offset + _ipv6Header.size + payloadLength if payloadLength else len(data)
+    position = offset + _ipv6Header.size
+    while nextHeader not in [IPPROTO_TCP, IPPROTO_UDP]:
+        if position + 8 > len(data):
+            return None
+        if nextHeader in IPV6_EXTENSION_HEADERS:
+            headerLength = (ord(data[position+1]) + 1) * 8
+        elif nextHeader == IPV6_FRAGMENT:
+            if struct.unpack_from("!H", data, position+2)[0] & 0xFFF8:
+                # Not the first fragment
+                return None
+            headerLength = 8
+        elif nextHeader == IPV6_AH:
+            headerLength = (ord(data[position+1]) + 2) * 4
+        else:
+            return None
+        nextHeader = ord(data[position])
+        position += headerLength
+    packetInfo = _parseTransport(data, position, min(end, len(data)), nextHeader)
+    if packetInfo:
+        packetInfo.srcIP = socket.inet_ntop(socket.AF_INET6, src)
+        packetInfo.dstIP = socket.inet_ntop(socket.AF_INET6, dst)
+    return packetInfo
+
+def _parseTransport(data, offset, end, proto):
+    packetInfo = PacketInfo()
+    if proto == IPPROTO_TCP:
+        if end < offset + 20:
+            return None
+        (packetInfo.srcPort, packetInfo.dstPort, packetInfo.seq, packetInfo.ack, dataOffset, packetInfo.flags) = _tcpHeader.unpack_from(data, offset)
+        headerLength = (dataOffset >> 4) * 4
+        # As for the IPv4 header length
+        if headerLength < 20 or end < offset + headerLength:
+            return None
+        packetInfo.proto = "tcp"
+        packetInfo.payload = data[offset + headerLength:end]
+    elif proto == IPPROTO_UDP:
+        if end < offset + 8:
+            return None
+        (packetInfo.srcPort, packetInfo.dstPort) = _portsHeader.unpack_from(data, offset)
+        packetInfo.proto = "udp"
+        packetInfo.payload = data[offset + 8:end]
+    else:
+        return None
+    return packetInfo
+
+# Parse a whole link layer frame, returns PacketInfo, or None if it's not TCP/UDP
+# Raises NotImplementedError for link types we don't decode ourselves
+def parseFrame(linkType, frame):
+    if linkType == LINKTYPE_ETHERNET:
+        if len(frame) < _ethernetHeader.size:
+            return None
+        (dstMac, srcMac, etherType) = _ethernetHeader.unpack_from(frame)
+        offset = _ethernetHeader.size
+        while etherType in ETHERTYPE_VLAN and len(frame) >= offset + 4:
+            etherType = struct.unpack_from("!H", frame, offset+2)[0]
+            offset += 4
+        if etherType not in [ETHERTYPE_IPV4, ETHERTYPE_IPV6]:
+            return None
+        packetInfo = parseIP(frame, offset)
+        if packetInfo:
+            packetInfo.srcMac = _formatMac(srcMac)
+            packetInfo.dstMac = _formatMac(dstMac)
+        return packetInfo
+    elif linkType in [LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6] or linkType in LINKTYPE_RAW_ALTERNATES:
+        return parseIP(frame)
+    elif linkType in [LINKTYPE_NULL, LINKTYPE_LOOP]:
+        # 4 byte address family, value varies by OS so just check the IP version
+        return parseIP(frame, 4)
+    elif linkType == LINKTYPE_LINUX_SLL:
+        return parseIP(frame, 16)
+    elif linkType == LINKTYPE_LINUX_SLL2:
+        return parseIP(frame, 20)
+    raise NotImplementedError("Unsupported link type {0}".format(linkType))
+
+# Fallback for link types parseFrame() doesn't handle
+# scapy is only imported if we actually end up here
+def parseFrameWithScapy(linkType, frame):
+    import scapy.all
+    if linkType not in scapy.all.conf.l2types:
+        raise RuntimeError("Link type {0} not supported by scapy either".format(linkType))
+    packet = scapy.all.conf.l2types[linkType](frame)
+    for ipLayer in [scapy.all.IP, scapy.all.IPv6]:
+        if ipLayer in packet:
+            return parseIP(str(packet[ipLayer]))
+    return None
+
+# Iterates over the TCP/UDP packets in a pcap or pcapng file, one at a time
+# Non-TCP/UDP packets are skipped
+# Raises RuntimeError if the file isn't a pcap or pcapng
+class PcapReader(object):
+    def __init__(self, filePath):
+        self.filePath = filePath
+        # How many frames were read, including ones that weren't TCP/UDP
+        self.frameCount = 0
+        # Link types that had to go through scapy
+        self.scapyLinkTypes = set()
+
+    def __iter__(self):
+        with open(self.filePath, "rb") as pcapFile:
+            magic = pcapFile.read(4)
+            if len(magic) < 4:
+                raise RuntimeError("File too short to be a pcap")
+            if struct.unpack("<I", magic)[0] == PCAPNG_SHB:
+                frames = self._readPcapng(pcapFile, magic)
+            else:
+                frames = self._readPcap(pcapFile, magic)
+
+            for (linkType, timestamp, frame) in frames:
+                self.frameCount += 1
+                try:
+                    packetInfo = parseFrame(linkType, frame)
+                except NotImplementedError:
+                    self.scapyLinkTypes.add(linkType)
+                    packetInfo = parseFrameWithScapy(linkType, frame)
+                if packetInfo:
+                    packetInfo.timestamp = timestamp
+                    yield packetInfo
+
+    # Yields (linkType, timestamp, frame)
+    def _readPcap(self, pcapFile, magic):
+        for byteOrder in ["<", ">"]:
+            magicValue = struct.unpack(byteOrder + "I", magic)[0]
+            if magicValue in [PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC]:
+                break
+        else:
+            raise RuntimeError("Not a pcap or pcapng file")
+        tsDivisor = 1000000000.0 if magicValue == PCAP_MAGIC_NSEC else 1000000.0
+
+        header = pcapFile.read(20)
+        if len(header) < 20:
+            raise RuntimeError("Truncated pcap header")
+        linkType = struct.unpack(byteOrder + "HHiIII", header)[5] & 0x0FFFFFFF
+        recordHeader = struct.Struct(byteOrder + "IIII")
+
+        while True:
+            header = pcapFile.read(recordHeader.size)
+            if len(header) < recordHeader.size:
+                break
+            (tsSec, tsFraction, capturedLength, originalLength) = recordHeader.unpack(header)
+            frame = pcapFile.read(capturedLength)
+            if len(frame) < capturedLength:
+                print "Warning: capture truncated in the middle of a packet, ignoring it"
+                break
+            yield (linkType, tsSec + tsFraction / tsDivisor, frame)
+
+    # Yields (linkType, timestamp, frame)
+    def _readPcapng(self, pcapFile, magic):
+        byteOrder = "<"
+        # Per interface (linkType, timestamp units per second)
+        interfaces = []
+        blockType = magic
+
+        while True:
+            if blockType is None:
+                blockType = pcapFile.read(4)
+            if len(blockType) < 4:
+                break
+            lengthBytes = pcapFile.read(4)
+            if len(lengthBytes) < 4:
+                break
+
+            if struct.unpack("<I", blockType)[0] == PCAPNG_SHB:
+                # Byte order is set per section, so figure it out before anything else
+                byteOrderMagic = pcapFile.read(4)
+                byteOrder = "<" if struct.unpack("<I", byteOrderMagic)[0] == PCAPNG_BYTE_ORDER_MAGIC else ">"
+                blockLength = struct.unpack(byteOrder + "I", lengthBytes)[0]
+                body = byteOrderMagic + pcapFile.read(blockLength - 12 - 4)
+                interfaces = []
+            else:
+                blockLength = struct.unpack(byteOrder + "I", lengthBytes)[0]
+                body = pcapFile.read(blockLength - 12)
+            trailer = pcapFile.read(4)
+            if len(trailer) < 4 or blockLength < 12:
+                print "Warning: capture truncated in the middle of a block, ignoring it"
+                break
+            typeValue = struct.unpack(byteOrder + "I", blockType)[0]
+            blockType = None
+
+            if typeValue == PCAPNG_IDB:
+                linkType = struct.unpack_from(byteOrder + "H", body)[0]
+                interfaces.append((linkType, self._getTimestampResolution(body[8:], byteOrder)))
+            elif typeValue == PCAPNG_EPB:
+                (interfaceID, tsHigh, tsLow, capturedLength, originalLength) = struct.unpack_from(byteOrder + "IIIII", body)
+                (linkType, tsUnits) = interfaces[interfaceID]
+                yield (linkType, ((tsHigh << 32) | tsLow) / tsUnits, body[20:20+capturedLength])
+            elif typeValue == PCAPNG_OPB:
+                (interfaceID, drops, tsHigh, tsLow, capturedLength, originalLength) = struct.unpack_from(byteOrder + "HHIIII", body)
+                (linkType, tsUnits) = interfaces[interfaceID]
+                yield (linkType, ((tsHigh << 32) | tsLow) / tsUnits, body[20:20+capturedLength])
+            elif typeValue == PCAPNG_SPB:
+                # No timestamp or captured length, data is the rest of the block
+                originalLength = struct.unpack_from(byteOrder + "I", body)[0]
+                yield (interfaces[0][0], 0.0, body[4:4+originalLength])
+
+    # Look through interface description options for if_tsresol, default is microseconds
+    def _getTimestampResolution(self, options, byteOrder):
+        position = 0
+        while position + 4 <= len(options):
+            (code, length) = struct.unpack_from(byteOrder + "HH", options, position)
+            if code == 0:
+                break
+            if code == PCAPNG_OPTION_TSRESOL and length >= 1:
+                resolution = ord(options[position+4])
+                if resolution & 0x80:
+                    return float(2 ** (resolution & 0x7F))
+                return float(10 ** resolution)
+            position += 4 + ((length + 3) & ~3)
+        return 1000000.0
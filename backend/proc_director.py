@@ -34,10 +34,12 @@
 # message_processor.py, or monitor.py files specified by the 
 # processor_dir parameter passed in the .fuzzer file generated
 # by the mutiny_prep.py file.
-# It also spawns any Monitors in a parallel thread
+# It also spawns any Monitors, old style ones each in a parallel thread
+# and event driven ones together on a shared EventLoop thread
 #
 #------------------------------------------------------------------
 
+import atexit
 import imp
 import sys
 import os.path
@@ -45,7 +47,8 @@ import threading
 import socket
 
 from os import listdir
-from threading import Event
+from backend.crash_events import CrashEvent, CrashEventQueue
+from backend.monitor_loop import EventLoop, EventMonitor
 from mutiny_classes.mutiny_exceptions import MessageProcessorExceptions
 
 class ProcDirector(object):
@@ -76,29 +79,101 @@ class ProcDirector(object):
         # Set all the appropriate classes to the appropriate modules
         self.messageProcessor = sys.modules['message_processor'].MessageProcessor
         self.exceptionProcessor = sys.modules['exception_processor'].ExceptionProcessor
-        self.monitor = sys.modules['monitor'].Monitor 
-        self.crashQueue = Event()
+        # monitor.py can have a Monitor class, a MONITORS list of monitor
+        # instances (e.g. from mutiny_classes.builtin_monitors), or both
+        self.monitor = getattr(sys.modules['monitor'], "Monitor", None)
+        self.monitors = list(getattr(sys.modules['monitor'], "MONITORS", []))
+        # Monitors report crashes here, the fuzz loop drains it between runs
+        self.crashQueue = CrashEventQueue()
     
     class MonitorWrapper(object):
-        def __init__(self, targetIP, targetPort, monitor):
-            # crashDetectedEvent signals main thread on a detected crash,
-            # interrupt_main() and CTRL+C, otherwise raise the same signal
-            # monitor is the actual user custom monitor that implements monitorTarget
-            self.monitor = monitor
-            self.crashEvent = threading.Event()
-            self.task = threading.Thread(target=self.monitor.monitorTarget,args=(targetIP,targetPort,self.signalCrashDetectedOnMain))
-            self.task.daemon = True
-            self.task.start()
+        def __init__(self, targetIP, targetPort, monitors, crashQueue):
+            # crashQueue carries CrashEvents back to the main thread, which
+            # checks it at safe points rather than being interrupted mid-run
+            # monitors are the actual user custom monitors
+            self.monitors = monitors
+            self.crashQueue = crashQueue
+            self.tasks = []
+            self.loop = None
+            # Looking after TargetPool instances, see startInstanceMonitor()
+            self.instanceMonitors = []
+
+            eventMonitors = []
+            for monitor in monitors:
+                if isinstance(monitor, EventMonitor):
+                    eventMonitors.append(monitor)
+                else:
+                    # Old style monitor that blocks in monitorTarget, needs its own thread
+                    self._startTask(monitor.monitorTarget, targetIP, targetPort, self.getSignalFunction(monitor))
+
+            # Everything else shares one thread, woken up by epoll/timers
+            if eventMonitors:
+                self._startLoop()
+                for monitor in eventMonitors:
+                    self.loop.callSoonThreadsafe(monitor.start, self.loop, targetIP, targetPort, self.getSignalFunction(monitor))
+
+        def _startLoop(self):
+            self.loop = EventLoop()
+            self.loopTask = threading.Thread(target=self.loop.run)
+            self.loopTask.daemon = True
+            self.loopTask.start()
+            self.tasks.append(self.loopTask)
+            # Otherwise the loop thread can still be polling while the interpreter tears down
+            atexit.register(self.stop)
+
+        # Runs an EventMonitor looking after one instance of a TargetPool
+        # rather than the target the monitors were given, reporting crashes
+        # as that instance's.  waitForTarget() doesn't wait for these, the
+        # pool just leaves instances that aren't ready out of rotation
+        def startInstanceMonitor(self, monitor, targetIP, targetPort, targetName):
+            if self.loop is None:
+                self._startLoop()
+            self.instanceMonitors.append(monitor)
+            self.loop.callSoonThreadsafe(monitor.start, self.loop, targetIP, targetPort, self.getSignalFunction(monitor, targetName))
+
+        def _startTask(self, target, *args):
+            task = threading.Thread(target=target, args=args)
+            task.daemon = True
+            task.start()
+            self.tasks.append(task)
 
         # Don't override this function
-        def signalCrashDetectedOnMain(self):
-            # Raises a KeyboardInterrupt exception on main thread
-            self.crashEvent.set()
-            # Ugly but have to import here for this to work in monitorTarget on a custom processor
-            import thread
-            thread.interrupt_main()
+        # Returns the signalMain() handed to monitor, which takes an optional
+        # payload for the log, e.g. signal, exit code or log line
+        # targetName - the TargetPool instance monitor is looking after, if any
+        def getSignalFunction(self, monitor, targetName=None):
+            name = getattr(monitor, "name", None) or monitor.__class__.__name__
+            def signalCrashDetectedOnMain(payload=None):
+                self.crashQueue.put(CrashEvent(name, payload, targetName=targetName))
+            return signalCrashDetectedOnMain
+
+        # Event driven monitors report crashes as they happen, so when a run
+        # fails it's worth giving them a moment to say if the target died
+        def hasEventMonitors(self):
+            return self.loop is not None
+
+        # Block until the monitors that look after the target say it's up,
+        # e.g. after restarting it
+        def waitForTarget(self):
+            for monitor in self.monitors:
+                if isinstance(monitor, EventMonitor):
+                    monitor.waitForTarget()
+
+        # Total times the monitors have relaunched the target, e.g. ProcessMonitor
+        def getRestartCount(self):
+            return sum(getattr(monitor, "restartCount", 0) for monitor in self.monitors + self.instanceMonitors)
+
+        # Stop the event driven monitors, old style ones just die with the process
+        def stop(self):
+            if self.loop and self.loopTask.isAlive():
+                for monitor in self.monitors + self.instanceMonitors:
+                    if isinstance(monitor, EventMonitor):
+                        self.loop.callSoonThreadsafe(monitor.stop)
+                self.loop.stop()
+                self.loopTask.join(1.0)
     
     def startMonitor(self, host, port):
-        self.monitorWrapper = self.MonitorWrapper(host, port, self.monitor())
+        monitors = ([self.monitor()] if self.monitor else []) + self.monitors
+        self.monitorWrapper = self.MonitorWrapper(host, port, monitors, self.crashQueue)
         return self.monitorWrapper
         
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# Sampling profiler for fuzz runs, writing collapsed stacks (the input
+# flamegraph.pl and most flame graph viewers take) to the session's log
+# directory
+#
+#------------------------------------------------------------------
+
+import atexit
+import os
+import sys
+import threading
+import time
+
+# Flame graph frames are "function (file:line)", line being where the function starts
+def _getFrameName(frame):
+    code = frame.f_code
+    return "%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+# Samples the main thread's stack from a background thread while a profiled
+# run is in progress, so it sees time spent blocked (in recv, or waiting on
+# radamsa) as well as time spent in Python, and never interrupts the run
+# with a signal
+class RunProfiler(object):
+    # outputDirectory - where the .collapsed files go
+    # every - profile one run in every this many, 0 to not profile at all
+    # stats - StatsCollector, whose current phase each sample is also filed under
+    # interval - seconds between samples
+    def __init__(self, outputDirectory, every=1, stats=None, interval=0.002):
+        self.outputDirectory = outputDirectory
+        self.every = every
+        self.stats = stats
+        self.interval = interval
+        self.runCount = 0
+        self.profiledRunCount = 0
+        # phase -> {collapsed stack: sample count}, "all" for every sample
+        self.samples = {}
+        self.sampleCount = 0
+        self._writtenSampleCount = 0
+        self._lock = threading.Lock()
+        self._isProfiling = threading.Event()
+        self._isStopping = False
+        self._mainThreadId = threading.current_thread().ident
+        if self.every > 0:
+            self._task = threading.Thread(target=self._sampleLoop)
+            self._task.daemon = True
+            self._task.start()
+            atexit.register(self.stop)
+
+    def _sampleLoop(self):
+        while True:
+            self._isProfiling.wait()
+            if self._isStopping:
+                return
+            frame = sys._current_frames().get(self._mainThreadId)
+            # Checked again, the run could have ended while we waited for the GIL
+            if frame is not None and self._isProfiling.isSet():
+                stack = []
+                while frame is not None:
+                    stack.append(_getFrameName(frame))
+                    frame = frame.f_back
+                stack.reverse()
+                self._addSample(";".join(stack))
+            time.sleep(self.interval)
+
+    def _addSample(self, stack):
+        phase = self.stats.currentPhase if self.stats else None
+        with self._lock:
+            self.sampleCount += 1
+            for key in ("all", phase):
+                if key:
+                    counts = self.samples.setdefault(key, {})
+                    counts[stack] = counts.get(stack, 0) + 1
+
+    # with profiler.profileRun():
+    #     performRun(...)
+    # Only every'th call is actually sampled
+    def profileRun(self):
+        return _ProfiledRun(self)
+
+    def startRun(self):
+        if self.every <= 0:
+            return
+        self.runCount += 1
+        if (self.runCount - 1) % self.every == 0:
+            self.profiledRunCount += 1
+            self._isProfiling.set()
+
+    def endRun(self):
+        self._isProfiling.clear()
+
+    # Stops sampling for good (otherwise the thread can still be running as
+    # the interpreter tears down) and writes out what there is
+    def stop(self):
+        if self.every > 0 and self._task.isAlive():
+            self._isStopping = True
+            self._isProfiling.set()
+            self._task.join()
+        self.writeCollapsed()
+
+    # Writes profile.collapsed with every sample, and profile-<phase>.collapsed
+    # with just the samples taken in that phase, e.g. profile-processor.collapsed
+    # for time spent in the message processor's callbacks
+    def writeCollapsed(self):
+        with self._lock:
+            if self.sampleCount == self._writtenSampleCount:
+                return
+            samples = dict((phase, dict(counts)) for (phase, counts) in self.samples.items())
+            self._writtenSampleCount = self.sampleCount
+        if not os.path.isdir(self.outputDirectory):
+            os.makedirs(self.outputDirectory)
+        for (phase, counts) in samples.items():
+            fileName = "profile.collapsed" if phase == "all" else "profile-%s.collapsed" % (phase)
+            with open(os.path.join(self.outputDirectory, fileName), "w") as outputFile:
+                for (stack, count) in sorted(counts.items()):
+                    outputFile.write("%s %d\n" % (stack, count))
+        print "Wrote profile of %d runs to %s" % (self.profiledRunCount, self.outputDirectory)
+
+class _ProfiledRun(object):
+    def __init__(self, profiler):
+        self._profiler = profiler
+
+    def __enter__(self):
+        self._profiler.startRun()
+
+    def __exit__(self, exceptionType, exception, traceback):
+        self._profiler.endRun()
+        return False
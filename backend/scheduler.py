@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# Power schedule for deciding which input each run mutates, after AFL's:
+# inputs get a number of runs ("energy") each cycle from how fast they run,
+# how often mutating them finds something new, and how new they are
+#
+#------------------------------------------------------------------
+
+class _Candidate(object):
+    def __init__(self, key, addedCycle):
+        self.key = key
+        self.addedCycle = addedCycle
+        self.runCount = 0
+        self.findCount = 0
+        self.totalRunTime = 0.0
+        # Energy it was given in the current cycle
+        self.energy = 0
+
+# Doesn't know what the inputs are, candidates are just hashable keys (e.g.
+# corpus entries, with None for the .fuzzer file's own messages) and the caller
+# reports back how each run went
+#
+# Every cycle, each candidate gets its energy's worth of runs in a row,
+# then energies are worked out again for the next cycle, including any
+# candidates added along the way
+class PowerScheduler(object):
+    # Runs a candidate gets per cycle before its speed/yield/age are considered
+    BASE_ENERGY = 16
+    MIN_ENERGY = 1
+    MAX_ENERGY = 256
+    # Limits on how much each factor can scale the energy by
+    SPEED_RANGE = (0.25, 3.0)
+    YIELD_RANGE = (0.25, 4.0)
+    # A candidate's yield is counted as if it had already had this many runs
+    # at the overall yield, so it isn't written off (or favoured) on the
+    # strength of its first few runs
+    YIELD_PRIOR = 50
+
+    def __init__(self, baseEnergy=BASE_ENERGY):
+        self.baseEnergy = baseEnergy
+        self.candidates = []
+        self.cycle = 0
+        self._totalRunCount = 0
+        self._totalFindCount = 0
+        self._totalRunTime = 0.0
+        self._queue = []
+        self._queuePosition = 0
+        self._remaining = 0
+        self._candidatesByKey = {}
+
+    def addCandidate(self, key):
+        candidate = _Candidate(key, self.cycle)
+        self.candidates.append(candidate)
+        self._candidatesByKey[key] = candidate
+        return candidate
+
+    def getCandidate(self, key):
+        return self._candidatesByKey.get(key)
+
+    @classmethod
+    def _clip(cls, value, limits):
+        return max(limits[0], min(limits[1], value))
+
+    def getEnergy(self, candidate):
+        energy = float(self.baseEnergy)
+        # Faster than average gets more runs, slower fewer
+        if candidate.runCount and candidate.totalRunTime > 0 and self._totalRunCount:
+            averageRunTime = self._totalRunTime / self._totalRunCount
+            candidateRunTime = candidate.totalRunTime / candidate.runCount
+            energy *= PowerScheduler._clip(averageRunTime / candidateRunTime, PowerScheduler.SPEED_RANGE)
+        # Finds per run compared to every input's
+        overallYield = (self._totalFindCount + 1.0) / (self._totalRunCount + 1.0)
+        candidateYield = (candidate.findCount + overallYield * PowerScheduler.YIELD_PRIOR) / (candidate.runCount + PowerScheduler.YIELD_PRIOR)
+        energy *= PowerScheduler._clip(candidateYield / overallYield, PowerScheduler.YIELD_RANGE)
+        # New inputs get a boost that wears off over the next few cycles
+        energy *= 1.0 + 1.0 / (1 + self.cycle - candidate.addedCycle)
+        return int(max(PowerScheduler.MIN_ENERGY, min(PowerScheduler.MAX_ENERGY, round(energy))))
+
+    def _startCycle(self):
+        self.cycle += 1
+        for candidate in self.candidates:
+            candidate.energy = self.getEnergy(candidate)
+        self._queue = list(self.candidates)
+        self._queuePosition = 0
+        self._remaining = self._queue[0].energy
+        print "\n** Cycle %d: %d inputs, %d runs **" % (self.cycle, len(self._queue), sum(candidate.energy for candidate in self._queue))
+
+    # Returns the key of the candidate the next run should use
+    def next(self):
+        if not self.candidates:
+            return None
+        while self._remaining <= 0:
+            self._queuePosition += 1
+            if self._queuePosition >= len(self._queue):
+                self._startCycle()
+            else:
+                self._remaining = self._queue[self._queuePosition].energy
+        self._remaining -= 1
+        return self._queue[self._queuePosition].key
+
+    # For candidates used together rather than one after another: picks
+    # count different ones at random, weighted by their energy
+    # chooser - random.Random to pick with
+    def chooseWeighted(self, count, chooser):
+        weighted = [(self.getEnergy(candidate), candidate.key) for candidate in self.candidates]
+        chosen = []
+        while weighted and len(chosen) < count:
+            point = chooser.uniform(0, sum(weight for (weight, key) in weighted))
+            for (index, (weight, key)) in enumerate(weighted):
+                point -= weight
+                if point < 0 or index == len(weighted) - 1:
+                    chosen.append(key)
+                    del weighted[index]
+                    break
+        return chosen
+
+    # For checkpoints, see backend/checkpoint.py
+    # Candidates are saved in the order they were added, and restored onto
+    # whichever candidates have been added again in the same order by then
+    def getState(self):
+        return {
+            "cycle": self.cycle,
+            "totalRunCount": self._totalRunCount,
+            "totalFindCount": self._totalFindCount,
+            "totalRunTime": self._totalRunTime,
+            "candidates": [[candidate.runCount, candidate.findCount, candidate.totalRunTime, candidate.addedCycle, candidate.energy] for candidate in self.candidates],
+            "queueLength": len(self._queue),
+            "queuePosition": self._queuePosition,
+            "remaining": self._remaining,
+        }
+
+    def setState(self, state):
+        self.cycle = state["cycle"]
+        self._totalRunCount = state["totalRunCount"]
+        self._totalFindCount = state["totalFindCount"]
+        self._totalRunTime = state["totalRunTime"]
+        for (candidate, candidateState) in zip(self.candidates, state["candidates"]):
+            (candidate.runCount, candidate.findCount, candidate.totalRunTime, candidate.addedCycle, candidate.energy) = candidateState
+        self._queue = self.candidates[:min(state["queueLength"], len(self.candidates))]
+        if state["queuePosition"] < len(self._queue):
+            self._queuePosition = state["queuePosition"]
+            self._remaining = state["remaining"]
+        else:
+            # Start a new cycle on the next run
+            self._queuePosition = len(self._queue)
+            self._remaining = 0
+
+    # runTime - seconds the run took
+    # isFind - whether it found something new (e.g. was kept in the corpus)
+    def recordRun(self, key, runTime, isFind):
+        candidate = self.getCandidate(key)
+        if candidate is None:
+            return
+        candidate.runCount += 1
+        candidate.totalRunTime += runTime
+        self._totalRunCount += 1
+        self._totalRunTime += runTime
+        if isFind:
+            candidate.findCount += 1
+            self._totalFindCount += 1
+
+    # A run that's already been recorded turned out to have found something
+    # after all (e.g. crashed the target, which only comes to light later)
+    def recordFind(self, key):
+        candidate = self.getCandidate(key)
+        if candidate is None:
+            return
+        candidate.findCount += 1
+        self._totalFindCount += 1
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# Sets of seeds (or run numbers) kept as sorted, merged intervals, so ranges
+# of hundreds of millions of seeds take a few bytes, e.g. for --range/--loop
+# and for tracking which seeds a session has finished
+#
+#------------------------------------------------------------------
+
+import bisect
+import sys
+
+class SeedSet(object):
+    # Top end of open ended ranges, e.g. "5-"
+    MAX_SEED = sys.maxint
+
+    # intervals - (start, end) pairs, both inclusive, in any order and may overlap
+    def __init__(self, intervals=()):
+        self._setIntervals(intervals)
+
+    # Parses the formats validateNumberRange() takes: X | X-Y | X- | X,Y,Z-Q,R...
+    # Returns None if it isn't valid
+    @classmethod
+    def parse(cls, rangeStr):
+        intervals = []
+        for part in filter(None, rangeStr.split(",")):
+            bounds = part.strip().split("-")
+            try:
+                if len(bounds) == 1:
+                    intervals.append((int(bounds[0]), int(bounds[0])))
+                elif len(bounds) == 2:
+                    end = int(bounds[1]) if bounds[1] else cls.MAX_SEED
+                    if end < int(bounds[0]):
+                        return None
+                    intervals.append((int(bounds[0]), end))
+                else:
+                    return None
+            except ValueError:
+                return None
+        if not intervals:
+            return None
+        return cls(intervals)
+
+    def _setIntervals(self, intervals):
+        self._starts = []
+        self._ends = []
+        for (start, end) in sorted(intervals):
+            if end < start:
+                continue
+            # Touching intervals are merged too, so the set has one way to be stored
+            if self._ends and start <= self._ends[-1] + 1:
+                self._ends[-1] = max(self._ends[-1], end)
+            else:
+                self._starts.append(start)
+                self._ends.append(end)
+        self._updateOffsets(0)
+
+    # _offsets[k] - how many seeds are in the intervals before interval k,
+    # for finding the seed at a position with a binary search
+    def _updateOffsets(self, fromInterval):
+        if fromInterval == 0:
+            self._offsets = []
+        else:
+            del self._offsets[fromInterval:]
+        count = self._offsets[-1] + self._ends[fromInterval - 1] - self._starts[fromInterval - 1] + 1 if self._offsets else 0
+        for k in xrange(fromInterval, len(self._starts)):
+            self._offsets.append(count)
+            count += self._ends[k] - self._starts[k] + 1
+        self._count = count
+
+    def getIntervals(self):
+        return zip(self._starts, self._ends)
+
+    # Not __len__, as sets with open ended ranges are too big for it
+    def getCount(self):
+        return self._count
+
+    def isEmpty(self):
+        return not self._starts
+
+    # Whether the set has an open ended range, e.g. "5-"
+    def isUnbounded(self):
+        return bool(self._ends) and self._ends[-1] == SeedSet.MAX_SEED
+
+    def getFirst(self):
+        return self._starts[0] if self._starts else None
+
+    def getLast(self):
+        return self._ends[-1] if self._ends else None
+
+    # Index of the interval seed would be in, if it's in one, else -1 or the one before it
+    def _findInterval(self, seed):
+        return bisect.bisect_right(self._starts, seed) - 1
+
+    def __contains__(self, seed):
+        k = self._findInterval(seed)
+        return k >= 0 and seed <= self._ends[k]
+
+    def __iter__(self):
+        for (start, end) in zip(self._starts, self._ends):
+            seed = start
+            while seed <= end:
+                yield seed
+                seed += 1
+
+    # The seed at position index, as if the set was a sorted list
+    def getSeed(self, index):
+        if not 0 <= index < self._count:
+            raise IndexError("Seed index %d out of range" % (index))
+        k = bisect.bisect_right(self._offsets, index) - 1
+        return self._starts[k] + index - self._offsets[k]
+
+    # Seeds at positions start to stop-1, as a new SeedSet
+    def getSlice(self, start, stop):
+        stop = min(stop, self._count)
+        if start >= stop:
+            return SeedSet()
+        first = bisect.bisect_right(self._offsets, start) - 1
+        last = bisect.bisect_right(self._offsets, stop - 1) - 1
+        intervals = zip(self._starts[first:last + 1], self._ends[first:last + 1])
+        intervals[0] = (self.getSeed(start), intervals[0][1])
+        intervals[-1] = (intervals[-1][0], self.getSeed(stop - 1))
+        return SeedSet(intervals)
+
+    # Splits the set into count parts of (nearly) the same size, in order,
+    # e.g. to share a range out between workers
+    def split(self, count):
+        return [self.getSlice(self._count * n // count, self._count * (n + 1) // count) for n in xrange(count)]
+
+    # Lowest seed >= seed that's in the set, None if there isn't one
+    def getNext(self, seed):
+        k = self._findInterval(seed)
+        if k >= 0 and seed <= self._ends[k]:
+            return seed
+        return self._starts[k + 1] if k + 1 < len(self._starts) else None
+
+    # Lowest seed >= seed that isn't in the set, e.g. the next one not done yet
+    def getNextMissing(self, seed):
+        k = self._findInterval(seed)
+        if k >= 0 and seed <= self._ends[k]:
+            # Intervals never touch, so the seed after one is always missing
+            return self._ends[k] + 1
+        return seed
+
+    def add(self, seed):
+        self.addRange(seed, seed)
+
+    # Adds start to end (inclusive) in place
+    def addRange(self, start, end):
+        if end < start:
+            return
+        # The usual case, seeds being finished in order
+        if self._ends and self._ends[-1] + 1 >= start >= self._starts[-1]:
+            if end > self._ends[-1]:
+                self._count += end - self._ends[-1]
+                self._ends[-1] = end
+            return
+        # Intervals that overlap or touch start to end get merged with it
+        first = bisect.bisect_left(self._ends, start - 1)
+        last = bisect.bisect_right(self._starts, end + 1)
+        if first < last:
+            start = min(start, self._starts[first])
+            end = max(end, self._ends[last - 1])
+        self._starts[first:last] = [start]
+        self._ends[first:last] = [end]
+        self._updateOffsets(first)
+
+    def union(self, other):
+        return SeedSet(self.getIntervals() + other.getIntervals())
+
+    # Seeds in this set but not in other, as a new SeedSet
+    def subtract(self, other):
+        intervals = []
+        otherIntervals = other.getIntervals()
+        k = 0
+        for (start, end) in self.getIntervals():
+            # Skip other's intervals that end before this one starts
+            while k < len(otherIntervals) and otherIntervals[k][1] < start:
+                k += 1
+            j = k
+            while j < len(otherIntervals) and otherIntervals[j][0] <= end:
+                (otherStart, otherEnd) = otherIntervals[j]
+                if otherStart > start:
+                    intervals.append((start, otherStart - 1))
+                start = max(start, otherEnd + 1)
+                j += 1
+            if start <= end:
+                intervals.append((start, end))
+        return SeedSet(intervals)
+
+    def __eq__(self, other):
+        return isinstance(other, SeedSet) and self.getIntervals() == other.getIntervals()
+
+    def __ne__(self, other):
+        return not self == other
+
+    # The same format parse() takes, e.g. "0-99,150,200-"
+    def __str__(self):
+        parts = []
+        for (start, end) in self.getIntervals():
+            if start == end:
+                parts.append(str(start))
+            elif end == SeedSet.MAX_SEED:
+                parts.append("%d-" % (start))
+            else:
+                parts.append("%d-%d" % (start, end))
+        return ",".join(parts)
+
+    def __repr__(self):
+        return "SeedSet(%r)" % (str(self))
+
+    # For checkpoints, see backend/checkpoint.py
+    def getState(self):
+        return str(self)
+
+    def setState(self, state):
+        self._setIntervals(SeedSet.parse(state).getIntervals() if state else [])
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# Runs radamsa over a range of seeds for each input and works out how many
+# outputs are repeats, how long the outputs are and which mutations radamsa
+# used, see mutiny_seedstats.py
+#
+#------------------------------------------------------------------
+
+import collections
+import hashlib
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+from backend.bloom_filter import BloomFilter
+from backend.fuzzerdata import FuzzerData
+
+# Seeds handed to a worker at a time
+CHUNK_SIZE = 256
+
+# Inputs to mutate from a file: the fuzzed subcomponents of a .fuzzer file,
+# otherwise the whole file
+# Returns [(label, data)]
+def getInputsFromFile(filePath):
+    if not filePath.endswith(".fuzzer"):
+        with open(filePath, "rb") as inputFile:
+            return [(os.path.basename(filePath), inputFile.read())]
+    fuzzerData = FuzzerData()
+    fuzzerData.readFromFile(filePath, quiet=True)
+    inputs = []
+    for (messageNumber, message) in enumerate(fuzzerData.messageCollection.messages):
+        for (subcomponentNumber, subcomponent) in enumerate(message.subcomponents):
+            if subcomponent.isFuzzed:
+                label = "%s message %d subcomponent %d" % (os.path.basename(filePath), messageNumber, subcomponentNumber)
+                inputs.append((label, str(subcomponent.getOriginalByteArray())))
+    return inputs
+
+# Mutation names out of radamsa's --meta output, which lists the mutations
+# it used after a "mutations" key, e.g. "mutations: {sr: 1, num: 2}" or
+# "(mutations (sr . 1) (num . 2))"
+def parseOperators(metaText):
+    index = metaText.find("mutations")
+    if index < 0:
+        return []
+    text = metaText[index + len("mutations"):]
+    # The value ends at the next key, or where whatever it's in closes
+    depth = 0
+    end = len(text)
+    for (position, character) in enumerate(text):
+        if character in "({[":
+            depth += 1
+        elif character in ")}]":
+            depth -= 1
+        if depth < 0 or (depth == 0 and character in ",\n"):
+            end = position
+            break
+    # Anything numeric is a count rather than a mutation
+    return re.findall(r"[a-z][a-z0-9]*", text[:end])
+
+# Pool worker, mutates data once for each seed
+# Returns (inputIndex, [(seed, md5 of output, output length, mutations or None)])
+def _mutateChunk(task):
+    (radamsaPath, inputIndex, data, seeds, wantOperators) = task
+    metaPath = None
+    if wantOperators:
+        (metaFile, metaPath) = tempfile.mkstemp(prefix="mutiny_seedstats_")
+        os.close(metaFile)
+    results = []
+    try:
+        for seed in seeds:
+            command = [radamsaPath, "--seed", str(seed)]
+            if metaPath:
+                command += ["--meta", metaPath]
+            radamsa = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            (output, errorOutput) = radamsa.communicate(input=data)
+            if radamsa.returncode != 0:
+                raise RuntimeError("radamsa failed on seed %d: %s" % (seed, errorOutput.strip()))
+            operators = None
+            if metaPath:
+                with open(metaPath) as metaFile:
+                    operators = parseOperators(metaFile.read())
+            results.append((seed, hashlib.md5(output).digest(), len(output), operators))
+    finally:
+        if metaPath:
+            os.unlink(metaPath)
+    return (inputIndex, results)
+
+def _getPercentile(counts, total, percentile):
+    target = max(1, int(round(total * percentile / 100.0)))
+    seen = 0
+    for (value, count) in sorted(counts.items()):
+        seen += count
+        if seen >= target:
+            return value
+    return 0
+
+# Output lengths bucketed by power of two: "0", "1", "2-3", "4-7", ...
+def _getLengthDistribution(lengths):
+    distribution = []
+    for (length, count) in sorted(lengths.items()):
+        if length < 2:
+            bucket = str(length)
+        else:
+            low = 1 << (length.bit_length() - 1)
+            bucket = "%d-%d" % (low, low * 2 - 1)
+        if distribution and distribution[-1]["lengths"] == bucket:
+            distribution[-1]["count"] += count
+        else:
+            distribution.append({"lengths": bucket, "count": count})
+    return distribution
+
+# Tallies for one input
+class InputStats(object):
+    # seedCount - how many seeds will be run, to size the Bloom filter
+    # errorRate - Bloom filter false positive rate, None to remember every output exactly
+    # bucketSize - seeds per entry in the duplicate rate by seed range
+    def __init__(self, label, data, seedCount, errorRate=None, bucketSize=1000):
+        self.label = label
+        self.data = data
+        self.errorRate = errorRate
+        self.bucketSize = bucketSize
+        self.seen = BloomFilter(seedCount, errorRate) if errorRate else set()
+        self.runCount = 0
+        self.duplicateCount = 0
+        self.lengths = collections.Counter()
+        self.operators = None
+        # First seed of bucket -> [runs, duplicates]
+        self.buckets = {}
+
+    def add(self, seed, digest, length, operators):
+        if self.errorRate:
+            isDuplicate = self.seen.add(digest)
+        else:
+            isDuplicate = digest in self.seen
+            self.seen.add(digest)
+        self.runCount += 1
+        self.lengths[length] += 1
+        bucket = self.buckets.setdefault(seed - seed % self.bucketSize, [0, 0])
+        bucket[0] += 1
+        if isDuplicate:
+            self.duplicateCount += 1
+            bucket[1] += 1
+        if operators is not None:
+            if self.operators is None:
+                self.operators = collections.Counter()
+            self.operators.update(operators)
+
+    def getReport(self):
+        runCount = max(1, self.runCount)
+        return {
+            "input": self.label,
+            "inputLength": len(self.data),
+            "runs": self.runCount,
+            "unique": self.runCount - self.duplicateCount,
+            "duplicates": self.duplicateCount,
+            "duplicateRate": self.duplicateCount / float(runCount),
+            "outputLength": {
+                "min": min(self.lengths) if self.lengths else 0,
+                "max": max(self.lengths) if self.lengths else 0,
+                "mean": sum(length * count for (length, count) in self.lengths.items()) / float(runCount),
+                "p50": _getPercentile(self.lengths, self.runCount, 50),
+                "p99": _getPercentile(self.lengths, self.runCount, 99),
+                "distribution": _getLengthDistribution(self.lengths),
+            },
+            "operators": dict(self.operators) if self.operators is not None else None,
+            "duplicateRateBySeeds": [
+                {"seeds": "%d-%d" % (start, start + self.bucketSize - 1), "duplicateRate": duplicates / float(runs)}
+                for (start, (runs, duplicates)) in sorted(self.buckets.items())
+            ],
+        }
+
+# inputs - [(label, data)], see getInputsFromFile()
+# seeds - SeedSet of seeds to run
+# processes - radamsa workers, None for one per CPU
+# errorRate - use a Bloom filter with this false positive rate rather than
+#   remembering every output, for seed ranges too big to hold in memory
+# wantOperators - ask radamsa which mutations it used (needs --meta support)
+# Returns [InputStats]
+def analyzeInputs(inputs, seeds, radamsaPath, processes=None, errorRate=None, wantOperators=False, bucketSize=1000, progress=True):
+    seedCount = seeds.getCount()
+    stats = [InputStats(label, data, seedCount, errorRate, bucketSize) for (label, data) in inputs]
+
+    def getTasks():
+        for (inputIndex, (label, data)) in enumerate(inputs):
+            for start in xrange(0, seedCount, CHUNK_SIZE):
+                yield (radamsaPath, inputIndex, data, list(seeds.getSlice(start, start + CHUNK_SIZE)), wantOperators)
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        completed = 0
+        for (inputIndex, results) in pool.imap(_mutateChunk, getTasks()):
+            for result in results:
+                stats[inputIndex].add(*result)
+            completed += len(results)
+            if progress:
+                sys.stderr.write("\r%d of %d cases" % (completed, seedCount * len(inputs)))
+        pool.close()
+    finally:
+        pool.terminate()
+        if progress:
+            sys.stderr.write("\n")
+    return stats
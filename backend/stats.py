@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# Execution statistics for a fuzzing session: runs per second, latency
+# histograms for each phase of a run, and counts of how runs ended
+#
+#------------------------------------------------------------------
+
+import json
+import os
+import time
+
+# Latency histogram in the style of HdrHistogram: log-linear buckets so
+# recording is a couple of integer operations, with every value kept to
+# within about 3% (SUB_BUCKET_BITS) however big it is
+# Values are recorded in microseconds
+class LatencyHistogram(object):
+    SUB_BUCKET_BITS = 5
+    SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+
+    def __init__(self):
+        self.counts = []
+        self.count = 0
+        self.totalMicroseconds = 0
+        self.maxMicroseconds = 0
+
+    @staticmethod
+    def _getIndex(microseconds):
+        if microseconds < LatencyHistogram.SUB_BUCKET_COUNT:
+            return microseconds
+        shift = microseconds.bit_length() - LatencyHistogram.SUB_BUCKET_BITS - 1
+        return (shift + 1) * LatencyHistogram.SUB_BUCKET_COUNT + (microseconds >> shift) - LatencyHistogram.SUB_BUCKET_COUNT
+
+    # Highest value that lands in bucket index
+    @staticmethod
+    def _getValue(index):
+        if index < LatencyHistogram.SUB_BUCKET_COUNT:
+            return index
+        shift = index // LatencyHistogram.SUB_BUCKET_COUNT - 1
+        subBucket = index % LatencyHistogram.SUB_BUCKET_COUNT + LatencyHistogram.SUB_BUCKET_COUNT
+        return ((subBucket + 1) << shift) - 1
+
+    def record(self, seconds):
+        microseconds = int(seconds * 1000000)
+        if microseconds < 0:
+            microseconds = 0
+        index = LatencyHistogram._getIndex(microseconds)
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += 1
+        self.count += 1
+        self.totalMicroseconds += microseconds
+        if microseconds > self.maxMicroseconds:
+            self.maxMicroseconds = microseconds
+
+    # percentile from 0 to 100, in seconds
+    def getPercentile(self, percentile):
+        if not self.count:
+            return 0.0
+        target = max(1, int(round(self.count * percentile / 100.0)))
+        seen = 0
+        for (index, count) in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(LatencyHistogram._getValue(index), self.maxMicroseconds) / 1000000.0
+        return self.maxMicroseconds / 1000000.0
+
+    def getMean(self):
+        return self.totalMicroseconds / 1000000.0 / self.count if self.count else 0.0
+
+    # Safe to call from another thread while record() is being called, the
+    # copy might just be a recording or so behind
+    def copy(self):
+        histogram = LatencyHistogram()
+        histogram.counts = list(self.counts)
+        histogram.count = self.count
+        histogram.totalMicroseconds = self.totalMicroseconds
+        histogram.maxMicroseconds = self.maxMicroseconds
+        return histogram
+
+    # For checkpoints, see backend/checkpoint.py
+    def getState(self):
+        return {
+            "counts": list(self.counts),
+            "count": self.count,
+            "totalMicroseconds": self.totalMicroseconds,
+            "maxMicroseconds": self.maxMicroseconds,
+        }
+
+    def setState(self, state):
+        self.counts = list(state["counts"])
+        self.count = state["count"]
+        self.totalMicroseconds = state["totalMicroseconds"]
+        self.maxMicroseconds = state["maxMicroseconds"]
+
+    def getSummary(self):
+        return {
+            "count": self.count,
+            "total": self.totalMicroseconds / 1000000.0,
+            "mean": self.getMean(),
+            "p50": self.getPercentile(50),
+            "p90": self.getPercentile(90),
+            "p99": self.getPercentile(99),
+            "max": self.maxMicroseconds / 1000000.0,
+        }
+
+# Times a block into a StatsCollector phase, see StatsCollector.measure()
+class _PhaseTimer(object):
+    def __init__(self, collector, phase):
+        self._collector = collector
+        self._phase = phase
+        self._histogram = collector.phases[phase]
+
+    def __enter__(self):
+        self._previousPhase = self._collector.currentPhase
+        self._collector.currentPhase = self._phase
+        self._startTime = time.time()
+
+    def __exit__(self, exceptionType, exception, traceback):
+        self._histogram.record(time.time() - self._startTime)
+        self._collector.currentPhase = self._previousPhase
+        # Never swallow the exception
+        return False
+
+class StatsCollector(object):
+    # Phases of a run, in the order they're reported
+    PHASES = ["run", "connect", "mutation", "processor", "send", "recv", "logging"]
+    # Outcome of a run that didn't raise anything
+    OUTCOME_OK = "ok"
+    # Outcome of a run skipped as a duplicate of an earlier one
+    OUTCOME_SKIPPED = "skipped"
+
+    # reportInterval - seconds between status lines/stats file updates in maybeReport()
+    # statsFilePath - where to write the JSON stats, None for nowhere
+    # name - shown in the status line, for telling several sessions apart
+    def __init__(self, reportInterval=10, statsFilePath=None, name=None):
+        self.reportInterval = reportInterval
+        self.statsFilePath = statsFilePath
+        self.name = name
+        self.phases = dict((phase, LatencyHistogram()) for phase in StatsCollector.PHASES)
+        # Exception class name (or OUTCOME_OK) -> number of runs that ended that way
+        self.outcomes = {}
+        self.runCount = 0
+        # Crashes logged, whether a monitor or the message processor noticed them
+        self.crashCount = 0
+        # Seed of the run in progress
+        self.currentSeed = -1
+        # Innermost phase being measure()d right now, None between runs
+        self.currentPhase = None
+        self.startTime = time.time()
+        self._lastReportTime = self.startTime
+        self._lastReportRunCount = 0
+        self._timers = dict((phase, _PhaseTimer(self, phase)) for phase in self.phases)
+
+    # with stats.measure("send"):
+    #     ...
+    # Only for code that doesn't nest the same phase
+    def measure(self, phase):
+        return self._timers[phase]
+
+    def record(self, phase, seconds):
+        self.phases[phase].record(seconds)
+
+    # Count one finished run, outcome being OUTCOME_OK or the exception that ended it
+    def recordOutcome(self, outcome):
+        if isinstance(outcome, BaseException):
+            outcome = outcome.__class__.__name__
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        self.runCount += 1
+
+    def recordCrash(self, count=1):
+        self.crashCount += count
+
+    def getRunsPerSecond(self):
+        elapsed = time.time() - self.startTime
+        return self.runCount / elapsed if elapsed > 0 else 0.0
+
+    # Fraction of the session's wall clock time spent in each phase
+    # Mostly mutation means mutator bound, mostly recv means waiting on the
+    # target (or on receive timeouts if those show up in outcomes)
+    def getTimeShares(self):
+        elapsed = time.time() - self.startTime
+        if elapsed <= 0:
+            return dict((phase, 0.0) for phase in self.phases)
+        return dict((phase, histogram.totalMicroseconds / 1000000.0 / elapsed) for (phase, histogram) in self.phases.items())
+
+    def getStatusLine(self):
+        now = time.time()
+        recentRate = (self.runCount - self._lastReportRunCount) / (now - self._lastReportTime) if now > self._lastReportTime else 0.0
+        line = "[stats] %s%d runs, %.1f/s (%.1f/s recent)" % (self.name + ": " if self.name else "", self.runCount, self.getRunsPerSecond(), recentRate)
+        for phase in StatsCollector.PHASES:
+            histogram = self.phases[phase]
+            if histogram.count:
+                line += " | %s p50 %.1fms p99 %.1fms" % (phase, histogram.getPercentile(50) * 1000, histogram.getPercentile(99) * 1000)
+        outcomes = sorted(self.outcomes.items(), key=lambda item: -item[1])
+        line += " | " + ", ".join("%s %d" % (outcome, count) for (outcome, count) in outcomes)
+        return line
+
+    def getSummary(self):
+        timeShares = self.getTimeShares()
+        phases = {}
+        for (phase, histogram) in self.phases.items():
+            phases[phase] = histogram.getSummary()
+            phases[phase]["share"] = timeShares[phase]
+        return {
+            "timestamp": time.time(),
+            "elapsed": time.time() - self.startTime,
+            "runs": self.runCount,
+            "runsPerSecond": self.getRunsPerSecond(),
+            "crashes": self.crashCount,
+            "outcomes": self.outcomes,
+            "phases": phases,
+        }
+
+    # Copy of the counters for reading from another thread, see backend/metrics.py
+    def getSnapshot(self):
+        return {
+            "runs": self.runCount,
+            "outcomes": dict(self.outcomes),
+            "crashes": self.crashCount,
+            "currentSeed": self.currentSeed,
+            "runsPerSecond": self.getRunsPerSecond(),
+            "phases": dict((phase, histogram.copy()) for (phase, histogram) in self.phases.items()),
+        }
+
+    # For checkpoints, see backend/checkpoint.py
+    # Time the fuzzer wasn't running doesn't count towards runs/sec
+    def getState(self):
+        return {
+            "elapsed": time.time() - self.startTime,
+            "runs": self.runCount,
+            "crashes": self.crashCount,
+            "outcomes": dict(self.outcomes),
+            "phases": dict((phase, histogram.getState()) for (phase, histogram) in self.phases.items()),
+        }
+
+    def setState(self, state):
+        self.startTime = time.time() - state["elapsed"]
+        self.runCount = state["runs"]
+        self.crashCount = state["crashes"]
+        self.outcomes = dict(state["outcomes"])
+        for (phase, histogramState) in state["phases"].items():
+            if phase in self.phases:
+                self.phases[phase].setState(histogramState)
+        self._lastReportTime = time.time()
+        self._lastReportRunCount = self.runCount
+
+    def writeStatsFile(self):
+        if not self.statsFilePath:
+            return
+        # Atomic so anything watching the file never reads half of it
+        tempPath = self.statsFilePath + ".tmp"
+        with open(tempPath, "w") as statsFile:
+            json.dump(self.getSummary(), statsFile, indent=2, separators=(",", ": "), sort_keys=True)
+            statsFile.write("\n")
+        os.rename(tempPath, self.statsFilePath)
+
+    # Print a status line and update the stats file if it's been long enough
+    # force - do it regardless, e.g. at the end of a session
+    def maybeReport(self, force=False):
+        now = time.time()
+        if not force and now - self._lastReportTime < self.reportInterval:
+            return
+        print self.getStatusLine()
+        self.writeStatsFile()
+        self._lastReportTime = now
+        self._lastReportRunCount = self.runCount
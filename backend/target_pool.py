@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# A pool of instances of the target, so runs aren't held up by one target
+# being busy or restarting: either host:port pairs that are already
+# running, or a command line that's launched once per instance
+#
+#------------------------------------------------------------------
+
+import errno
+import socket
+import sys
+import threading
+import time
+
+from backend.crash_events import CrashEvent
+from mutiny_classes.builtin_monitors import ProcessMonitor
+
+# Errors that mean a remote instance isn't there any more
+# Resets and timeouts are left to the exception processor, plenty of
+# targets reset the connection on input they don't like
+DOWN_ERRNOS = (errno.ECONNREFUSED, errno.EHOSTUNREACH, errno.ENETUNREACH)
+
+# From mutiny.py/mutiny_classy.py's --pool, or --launch and --instances
+# host/fuzzerData - where launched instances listen, from the port in the
+#   .fuzzer upwards
+# Returns None if neither was given, exits if they don't make sense
+def getTargetPoolFromArgs(args, host, fuzzerData):
+    if not args.pool and not args.launch:
+        return None
+    if args.coverage:
+        sys.exit("--coverage needs the target to itself, it can't be used with --pool or --launch")
+    canProbe = fuzzerData.proto in ("tcp", "tls")
+    try:
+        if args.pool:
+            return TargetPool.fromAddresses(args.pool, canProbe)
+        if args.instances < 1:
+            raise ValueError("Invalid number of instances given: %d" % (args.instances))
+        return TargetPool.launch(args.launch, args.instances, host, fuzzerData.port, canProbe=canProbe)
+    except ValueError as e:
+        sys.exit(str(e))
+
+class TargetInstance(object):
+    # monitor - ProcessMonitor that launched this instance and restarts it,
+    #   None for an instance that was already running somewhere
+    def __init__(self, host, port, monitor=None):
+        self.host = host
+        self.port = port
+        self.monitor = monitor
+        self.name = ("[%s]:%d" if ":" in host else "%s:%d") % (host, port)
+        self.activeRuns = 0
+        self.runCount = 0
+        # For remote instances, set while it's out of rotation
+        self.isDown = False
+        self.nextProbeTime = 0
+
+    def isReady(self):
+        if self.monitor:
+            return self.monitor.isReady()
+        return not self.isDown
+
+# Hands each run the instance with the fewest runs in flight (then the
+# fewest runs so far), skipping any that are down
+#
+# A launched instance that dies is reported by its ProcessMonitor, which
+# restarts it; it's back in rotation once it's accepting connections again.
+# A remote instance that refuses a connection (and still does when the pool
+# tries connecting itself) is reported by the pool, and kept out of rotation
+# until a plain TCP connect to it works
+class TargetPool(object):
+    # Seconds between connects to a remote instance that's down
+    PROBE_INTERVAL = 5
+    PROBE_TIMEOUT = 1.0
+    # Seconds between checks when every instance is down
+    WAIT_INTERVAL = 0.05
+
+    # canProbe - whether instances can be checked with a TCP connect, i.e.
+    #   whether the target's tcp or tls
+    def __init__(self, instances, canProbe=True):
+        self.instances = instances
+        self.canProbe = canProbe
+        self.crashQueue = None
+        self._lock = threading.Lock()
+
+    # addresses - "host:port,host:port,...", with IPv6 hosts in []s
+    @classmethod
+    def fromAddresses(cls, addresses, canProbe=True):
+        instances = []
+        for address in filter(None, addresses.split(",")):
+            (host, separator, port) = address.strip().rpartition(":")
+            if not host or not port.isdigit():
+                raise ValueError("Invalid target address %s, expecting host:port" % (address))
+            instances.append(TargetInstance(host.strip("[]"), int(port)))
+        if not instances:
+            raise ValueError("No target addresses given")
+        return cls(instances, canProbe)
+
+    # command - command line with {port} where each instance's port goes
+    # count - number of instances, on ports firstPort, firstPort+1, ...
+    # restartDelay/startupTimeout/cwd - as for ProcessMonitor
+    @classmethod
+    def launch(cls, command, count, host, firstPort, restartDelay=0, startupTimeout=30, cwd=None, canProbe=True):
+        if "{port}" not in command:
+            raise ValueError("Launch command %s has no {port} for each instance's port" % (command))
+        instances = []
+        for port in range(firstPort, firstPort + count):
+            monitor = ProcessMonitor(command.replace("{port}", str(port)), restartDelay=restartDelay, waitForPort=canProbe, startupTimeout=startupTimeout, cwd=cwd)
+            monitor.name = "ProcessMonitor[%d]" % (port)
+            instances.append(TargetInstance(host, port, monitor))
+        return cls(instances, canProbe)
+
+    # Launches the instances that need launching on monitorWrapper's event
+    # loop, reporting crashes on its crashQueue, and waits for them all to
+    # come up
+    # monitorWrapper - ProcDirector.MonitorWrapper
+    def start(self, monitorWrapper):
+        self.crashQueue = monitorWrapper.crashQueue
+        for instance in self.instances:
+            if instance.monitor:
+                monitorWrapper.startInstanceMonitor(instance.monitor, instance.host, instance.port, instance.name)
+        for instance in self.instances:
+            if instance.monitor:
+                instance.monitor.waitForTarget()
+        print "Fuzzing a pool of %d targets: %s" % (len(self.instances), ", ".join(instance.name for instance in self.instances))
+
+    def getInstance(self, name):
+        for instance in self.instances:
+            if instance.name == name:
+                return instance
+        return None
+
+    # Blocks until instance is back in rotation, e.g. to replay a run on it
+    # Returns whether it came back within timeout seconds
+    def waitForInstance(self, instance, timeout=30):
+        endTime = time.time() + timeout
+        while not instance.isReady() and time.time() < endTime:
+            self._probe(instance)
+            time.sleep(TargetPool.WAIT_INTERVAL)
+        return instance.isReady()
+
+    # Connects to a remote instance that's down, if it's been long enough,
+    # and puts it back in rotation if that works
+    def _probe(self, instance):
+        if instance.monitor or not instance.isDown or time.time() < instance.nextProbeTime:
+            return
+        instance.nextProbeTime = time.time() + TargetPool.PROBE_INTERVAL
+        if not self._isReachable(instance):
+            return
+        print "%s is back, putting it back in rotation" % (instance.name)
+        instance.isDown = False
+
+    # Whether a plain TCP connect to instance works, always True if the
+    # target can't be checked that way
+    def _isReachable(self, instance):
+        if not self.canProbe:
+            return True
+        try:
+            socket.create_connection((instance.host, instance.port), TargetPool.PROBE_TIMEOUT).close()
+        except socket.error:
+            return False
+        return True
+
+    # Returns the instance for the next run to go to, which must be given
+    # back with release() once the run's over
+    # Blocks while every instance is down
+    def acquire(self):
+        while True:
+            for instance in self.instances:
+                self._probe(instance)
+            with self._lock:
+                readyInstances = [instance for instance in self.instances if instance.isReady()]
+                if readyInstances:
+                    instance = min(readyInstances, key=lambda instance: (instance.activeRuns, instance.runCount))
+                    instance.activeRuns += 1
+                    instance.runCount += 1
+                    return instance
+            time.sleep(TargetPool.WAIT_INTERVAL)
+
+    def release(self, instance):
+        with self._lock:
+            instance.activeRuns -= 1
+
+    # Called when a run on instance fails with exception
+    # A remote instance that looks to have gone away, and doesn't answer a
+    # probe either, is taken out of rotation and reported as a crash;
+    # launched ones are left to their ProcessMonitor
+    # Returns whether a crash was reported, if not the exception is the
+    # exception processor's to deal with
+    def reportFailure(self, instance, exception):
+        if instance.monitor or not isinstance(exception, socket.error) or exception.errno not in DOWN_ERRNOS:
+            return False
+        if self.canProbe and self._isReachable(instance):
+            return False
+        with self._lock:
+            if instance.isDown:
+                return False
+            instance.isDown = True
+            instance.nextProbeTime = time.time() + TargetPool.PROBE_INTERVAL
+        print "%s is down, taking it out of rotation" % (instance.name)
+        self.crashQueue.put(CrashEvent("TargetPool", "%s %s" % (instance.name, errno.errorcode.get(exception.errno, str(exception.errno))), targetName=instance.name))
+        return True
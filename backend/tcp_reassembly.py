@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# TCP stream reassembly for mutiny_prep.py
+#
+# Tracks sequence numbers per direction so retransmitted, out-of-order
+# and overlapping segments turn into the byte stream the endpoints
+# actually saw, rather than being copied into messages packet by packet
+#
+#------------------------------------------------------------------
+
+from backend.pcap_reader import TCP_SYN, TCP_ACK, TCP_RST
+
+# Signed distance from b to a in 32 bit sequence space
+def _sequenceDiff(a, b):
+    return ((a - b + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+
+# One direction of a connection
+class _HalfStream(object):
+    def __init__(self):
+        # Next sequence number we expect to deliver, None until we've seen
+        # a SYN or the first segment
+        self.nextSeq = None
+        # Stream offset of nextSeq, i.e. bytes delivered (or skipped) so far
+        self.offset = 0
+        # Out of order data waiting on a gap: list of [start, bytearray, arrival]
+        # sorted by start, never overlapping, all start > offset
+        # arrival - which segment it came in, for ordering against the other direction
+        self.pending = []
+        # Set when gapPolicy is truncate and a gap was given up on
+        self.isTruncated = False
+
+    def getPendingBytes(self):
+        return sum(len(data) for (start, data, arrival) in self.pending)
+
+class TcpStreamReassembler(object):
+    # Overlap policies, when the same stream bytes arrive twice with different data
+    # first - keep what arrived first (BSD/Windows behaviour)
+    # last - newer data replaces anything not yet delivered (Linux for most cases)
+    OVERLAP_FIRST = "first"
+    OVERLAP_LAST = "last"
+    # Gap policies, for when bytes are missing from the capture and
+    # later data has to be given up on or delivered around the hole
+    # skip - step over the hole and carry on with what's after it
+    # truncate - deliver nothing more in that direction
+    GAP_SKIP = "skip"
+    GAP_TRUNCATE = "truncate"
+
+    # maxPendingBytes - how much out-of-order data a direction can hold
+    #   before the oldest gap is assumed lost and gapPolicy applied
+    def __init__(self, overlapPolicy=OVERLAP_FIRST, gapPolicy=GAP_SKIP, maxPendingBytes=1024*1024):
+        if overlapPolicy not in [self.OVERLAP_FIRST, self.OVERLAP_LAST]:
+            raise RuntimeError("Invalid overlap policy {0}".format(overlapPolicy))
+        if gapPolicy not in [self.GAP_SKIP, self.GAP_TRUNCATE]:
+            raise RuntimeError("Invalid gap policy {0}".format(gapPolicy))
+        self.overlapPolicy = overlapPolicy
+        self.gapPolicy = gapPolicy
+        self.maxPendingBytes = maxPendingBytes
+        # Direction (whatever the caller uses, such as Message.Direction) => _HalfStream
+        self._streams = {}
+        # Segments seen so far, the arrival order of pending data
+        self._segmentCount = 0
+
+        # Some counters to tell the user how messy the capture was
+        self.retransmittedBytes = 0
+        self.outOfOrderSegments = 0
+        self.overlapConflicts = 0
+        self.gapBytes = 0
+
+    def _getStream(self, direction):
+        if direction not in self._streams:
+            self._streams[direction] = _HalfStream()
+        return self._streams[direction]
+
+    # Feed in one segment
+    # direction - which way it's going, any hashable value
+    # ack - acknowledgement number, used to spot data lost from the capture:
+    #   if the other side acks past a gap it got the data, we just didn't see it
+    # Returns list of (direction, str) of data that's now deliverable, in order
+    def addSegment(self, direction, seq, ack, flags, payload):
+        delivered = []
+        stream = self._getStream(direction)
+        self._segmentCount += 1
+
+        if flags & TCP_SYN:
+            # SYN takes up a sequence number but carries no data (ignoring TFO)
+            if stream.nextSeq is None:
+                stream.nextSeq = (seq + 1) & 0xFFFFFFFF
+            seq = (seq + 1) & 0xFFFFFFFF
+        elif stream.nextSeq is None:
+            # Capture started mid-connection, take this as the start of the stream
+            stream.nextSeq = seq
+
+        if flags & TCP_ACK:
+            # Anything the peer is waiting on below this ack was really sent
+            for (otherDirection, otherStream) in self._streams.items():
+                if otherDirection == direction or otherStream.nextSeq is None:
+                    continue
+                while otherStream.pending:
+                    ackedOffset = otherStream.offset + _sequenceDiff(ack, otherStream.nextSeq)
+                    if ackedOffset <= otherStream.offset or otherStream.pending[0][0] > ackedOffset:
+                        break
+                    delivered += self._resolveGap(otherDirection, otherStream)
+
+        if len(payload) and not stream.isTruncated:
+            self._insert(stream, stream.offset + _sequenceDiff(seq, stream.nextSeq), bytearray(payload), self._segmentCount)
+            delivered += self._deliver(direction, stream)
+            if stream.getPendingBytes() > self.maxPendingBytes:
+                delivered += self._resolveGap(direction, stream)
+
+        if flags & TCP_RST:
+            # Nothing more is coming for the missing pieces
+            delivered += self.flush()
+        return delivered
+
+    # End of capture or connection, give up on any gaps and return
+    # whatever is still deliverable under gapPolicy
+    # Data held up in both directions comes out in the order it arrived,
+    # so requests and responses stay interleaved
+    def flush(self):
+        delivered = []
+        while True:
+            waiting = [(direction, stream) for (direction, stream) in self._streams.items() if stream.pending]
+            if not waiting:
+                break
+            waiting.sort(key=lambda item: item[1].pending[0][2])
+            (direction, stream) = waiting[0]
+            # Only up to where the other direction's data arrived
+            before = waiting[1][1].pending[0][2] if len(waiting) > 1 else None
+            for (deliveredDirection, data) in self._resolveGap(direction, stream, before):
+                if delivered and delivered[-1][0] == deliveredDirection:
+                    delivered[-1] = (deliveredDirection, delivered[-1][1] + data)
+                else:
+                    delivered.append((deliveredDirection, data))
+        return delivered
+
+    # Put data starting at stream offset start into stream.pending,
+    # trimming anything already delivered and applying overlapPolicy
+    def _insert(self, stream, start, data, arrival):
+        if start + len(data) <= stream.offset:
+            self.retransmittedBytes += len(data)
+            return
+        if start < stream.offset:
+            self.retransmittedBytes += stream.offset - start
+            data = data[stream.offset - start:]
+            start = stream.offset
+        if start > stream.offset:
+            self.outOfOrderSegments += 1
+
+        end = start + len(data)
+        newPending = []
+        pieces = [[start, data, arrival]]
+        for (pendingStart, pendingData, pendingArrival) in stream.pending:
+            pendingEnd = pendingStart + len(pendingData)
+            if pendingEnd <= start or pendingStart >= end:
+                newPending.append([pendingStart, pendingData, pendingArrival])
+                continue
+
+            overlapStart = max(start, pendingStart)
+            overlapEnd = min(end, pendingEnd)
+            if data[overlapStart-start:overlapEnd-start] != pendingData[overlapStart-pendingStart:overlapEnd-pendingStart]:
+                self.overlapConflicts += 1
+            else:
+                self.retransmittedBytes += overlapEnd - overlapStart
+
+            if self.overlapPolicy == self.OVERLAP_FIRST:
+                # Existing data stays, only the bits of the new segment around it get added
+                newPending.append([pendingStart, pendingData, pendingArrival])
+                remaining = []
+                for (pieceStart, pieceData, pieceArrival) in pieces:
+                    pieceEnd = pieceStart + len(pieceData)
+                    if pieceStart < pendingStart:
+                        remaining.append([pieceStart, pieceData[:min(pieceEnd, pendingStart)-pieceStart], pieceArrival])
+                    if pieceEnd > pendingEnd:
+                        cutStart = max(pieceStart, pendingEnd)
+                        remaining.append([cutStart, pieceData[cutStart-pieceStart:], pieceArrival])
+                pieces = remaining
+            else:
+                # New data wins, keep only what's left of the existing segment
+                if pendingStart < start:
+                    newPending.append([pendingStart, pendingData[:start-pendingStart], pendingArrival])
+                if pendingEnd > end:
+                    newPending.append([end, pendingData[end-pendingStart:], pendingArrival])
+
+        stream.pending = sorted(newPending + [piece for piece in pieces if len(piece[1])], key=lambda piece: piece[0])
+
+    # Pop everything contiguous with what's been delivered so far
+    # before - only data that arrived before this segment, None for all of it
+    def _deliver(self, direction, stream, before=None):
+        delivered = []
+        while stream.pending and stream.pending[0][0] == stream.offset:
+            if before is not None and stream.pending[0][2] >= before:
+                break
+            (start, data, arrival) = stream.pending.pop(0)
+            stream.offset += len(data)
+            stream.nextSeq = (stream.nextSeq + len(data)) & 0xFFFFFFFF
+            if delivered:
+                # Contiguous pieces of the same direction are the same data, keep them together
+                delivered[-1] = (direction, delivered[-1][1] + str(data))
+            else:
+                delivered.append((direction, str(data)))
+        return delivered
+
+    # The bytes before stream.pending[0] are never coming, apply gapPolicy
+    # before - as for _deliver()
+    def _resolveGap(self, direction, stream, before=None):
+        if not stream.pending:
+            return []
+        if self.gapPolicy == self.GAP_TRUNCATE:
+            self.gapBytes += stream.getPendingBytes()
+            stream.pending = []
+            stream.isTruncated = True
+            return []
+        gapStart = stream.pending[0][0]
+        self.gapBytes += gapStart - stream.offset
+        stream.nextSeq = (stream.nextSeq + gapStart - stream.offset) & 0xFFFFFFFF
+        stream.offset = gapStart
+        return self._deliver(direction, stream, before)
@@ -47,15 +47,28 @@ import sys
 import threading
 import time
 import argparse
+import atexit
 import ssl
 from copy import deepcopy
 from backend.proc_director import ProcDirector
+from backend.checkpoint import Checkpointer, readCheckpoint
+from backend.coordinator import CoordinatorClient
+from backend.corpus import Corpus
+from backend.coverage import CoverageMap
+from backend.crash_events import RunHistory, logCrashEvent
+from backend.duplicate_filter import DuplicateRunFilter
+from backend.fuzz_points import FuzzPointChooser
 from backend.fuzzer_types import Message, MessageCollection, Logger
 from backend.packets import PROTO,IP
 from mutiny_classes.mutiny_exceptions import *
 from mutiny_classes.message_processor import MessageProcessorExtraParams
 from backend.fuzzerdata import FuzzerData
-from backend.menu_functions import validateNumberRange
+from backend.metrics import MetricsServer
+from backend.profiling import RunProfiler
+from backend.scheduler import PowerScheduler
+from backend.seed_set import SeedSet
+from backend.stats import StatsCollector
+from backend.target_pool import getTargetPoolFromArgs
 
 # Path to Radamsa binary
 RADAMSA=os.path.abspath( os.path.join(__file__, "../radamsa-0.3/bin/radamsa") )
@@ -66,9 +79,16 @@ MIN_RUN_NUMBER=0
 # Test number to go to, -1 is unlimited
 MAX_RUN_NUMBER=-1
 # For seed loop, finite range to repeat   
-SEED_LOOP = []
+SEED_LOOP = SeedSet()
 # For dumpraw option, dump into log directory by default, else 'dumpraw'
 DUMPDIR = ""
+# Seconds after a run ends that a crash reported by the monitor can still be blamed on it
+CRASH_WINDOW = 1.0
+# Seconds to give event driven monitors to report a crash when a run fails
+# in a way that suggests the target died (connection refused, reset...)
+CRASH_GRACE = 0.1
+# Seconds between stats status lines/stats.json updates
+STATS_INTERVAL = 10
 
 # Takes a socket and outbound data packet (byteArray), sends it out.
 # If debug mode is enabled, we print out the raw bytes
@@ -115,11 +135,27 @@ def receivePacket(connection, addr, bytesToRead):
 
 # Perform a fuzz run.  
 # If seed is -1, don't perform fuzzing (test run)
-def performRun(fuzzerData, host, logger, messageProcessor, seed=-1):
+# port - where to connect to, if not the .fuzzer's port (e.g. a TargetPool instance)
+def performRun(fuzzerData, host, logger, messageProcessor, seed=-1, port=None):
+    if port is None:
+        port = fuzzerData.port
     # Before doing anything, set up logger
     # Otherwise, if connection is refused, we'll log last, but it will be wrong
     if logger != None:
-        logger.resetForNewRun()
+        with stats.measure("logging"):
+            logger.resetForNewRun()
+    if duplicateFilter:
+        duplicateFilter.startRun(fuzzerData.messageCollection, seed)
+    if corpus:
+        base = corpus.startRun(seed)
+        if base:
+            print "\tMutating corpus entry %d" % (base.entryId)
+    if coverage:
+        coverage.startRun()
+    if fuzzPointChooser:
+        fuzzPoints = fuzzPointChooser.startRun(seed)
+        for (messageNumber, subcomponentNumber) in sorted(fuzzPoints):
+            print "\tFuzzing message %d subcomponent %d with seed %d" % (messageNumber, subcomponentNumber, fuzzPoints[(messageNumber, subcomponentNumber)])
     
     # We don't perform DNS resolution, but always automatically type "localhost"
     # ... really need to go ahead and add DNS resolution soon
@@ -131,10 +167,10 @@ def performRun(fuzzerData, host, logger, messageProcessor, seed=-1):
     # will have to actively go out of their way to subvert this.
     if "." in host:
         socket_family = socket.AF_INET
-        addr = (host,fuzzerData.port)
+        addr = (host,port)
     elif ":" in host:
         socket_family = socket.AF_INET6 
-        addr = (host,fuzzerData.port)
+        addr = (host,port)
     else:
         socket_family = socket.AF_UNIX
         addr = (host)
@@ -146,10 +182,13 @@ def performRun(fuzzerData, host, logger, messageProcessor, seed=-1):
     
     # Call messageprocessor preconnect callback if it exists
     try:
-        messageProcessor.preConnect(seed, host, fuzzerData.port) 
+        with stats.measure("processor"):
+            messageProcessor.preConnect(seed, host, port) 
     except AttributeError:
         pass
     
+    # Socket setup through to the TCP/TLS handshake
+    connectStartTime = time.time()
     # for TCP/UDP/RAW support
     if fuzzerData.proto == "tcp":
         connection = socket.socket(socket_family,socket.SOCK_STREAM)
@@ -210,62 +249,81 @@ def performRun(fuzzerData, host, logger, messageProcessor, seed=-1):
     if fuzzerData.proto == "tcp" or fuzzerData.proto == "tls":
         # Now that we've had a chance to bind as necessary, connect
         connection.connect(addr)
+    stats.record("connect", time.time() - connectStartTime)
 
     i = 0   
     for i in range(0, len(fuzzerData.messageCollection.messages)):
+        if monitor.crashQueue.isPending():
+            # Target's already down, no point carrying on
+            print "\tCrash event pending, ending run early"
+            break
         message = fuzzerData.messageCollection.messages[i]
         
         # Go ahead and revert any fuzzing or messageprocessor changes before proceeding
         message.resetAlteredMessage()
 
         if message.isOutbound():
+            if corpus:
+                corpus.applyBase(i, message)
+
             # Primarily used for deciding how to handle preFuzz/preSend callbacks
             doesMessageHaveSubcomponents = len(message.subcomponents) > 1
 
             # Get original subcomponents for outbound callback only once
             originalSubcomponents = map(lambda subcomponent: subcomponent.getOriginalByteArray(), message.subcomponents)
             
-            if doesMessageHaveSubcomponents:
-                # For message with subcomponents, call prefuzz on fuzzed subcomponents
-                for j in range(0, len(message.subcomponents)):
-                    subcomponent = message.subcomponents[j] 
-                    # Note: we WANT to fetch subcomponents every time on purpose
-                    # This way, if user alters subcomponent[0], it's reflected when
-                    # we call the function for subcomponent[1], etc
+            with stats.measure("processor"):
+                if doesMessageHaveSubcomponents:
+                    # For message with subcomponents, call prefuzz on fuzzed subcomponents
+                    for j in range(0, len(message.subcomponents)):
+                        subcomponent = message.subcomponents[j] 
+                        # Note: we WANT to fetch subcomponents every time on purpose
+                        # This way, if user alters subcomponent[0], it's reflected when
+                        # we call the function for subcomponent[1], etc
+                        actualSubcomponents = map(lambda subcomponent: subcomponent.getAlteredByteArray(), message.subcomponents)
+                        prefuzz = messageProcessor.preFuzzSubcomponentProcess(subcomponent.getAlteredByteArray(), MessageProcessorExtraParams(i, j, subcomponent.isFuzzed, originalSubcomponents, actualSubcomponents))
+                        subcomponent.setAlteredByteArray(prefuzz)
+                else:
+                    # If no subcomponents, call prefuzz on ENTIRE message
                     actualSubcomponents = map(lambda subcomponent: subcomponent.getAlteredByteArray(), message.subcomponents)
-                    prefuzz = messageProcessor.preFuzzSubcomponentProcess(subcomponent.getAlteredByteArray(), MessageProcessorExtraParams(i, j, subcomponent.isFuzzed, originalSubcomponents, actualSubcomponents))
-                    subcomponent.setAlteredByteArray(prefuzz)
-            else:
-                # If no subcomponents, call prefuzz on ENTIRE message
-                actualSubcomponents = map(lambda subcomponent: subcomponent.getAlteredByteArray(), message.subcomponents)
-                prefuzz = messageProcessor.preFuzzProcess(actualSubcomponents[0], MessageProcessorExtraParams(i, -1, message.isFuzzed, originalSubcomponents, actualSubcomponents))
-                message.subcomponents[0].setAlteredByteArray(prefuzz)
+                    prefuzz = messageProcessor.preFuzzProcess(actualSubcomponents[0], MessageProcessorExtraParams(i, -1, message.isFuzzed, originalSubcomponents, actualSubcomponents))
+                    message.subcomponents[0].setAlteredByteArray(prefuzz)
 
             # Skip fuzzing for seed == -1
             if seed > -1:
                 # Now run the fuzzer for each fuzzed subcomponent
-                for subcomponent in message.subcomponents:
-                    if subcomponent.isFuzzed:
-                        radamsa = subprocess.Popen([RADAMSA, "--seed", str(seed)], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                        byteArray = subcomponent.getAlteredByteArray()
-                        (fuzzedByteArray, error_output) = radamsa.communicate(input=byteArray)
+                for (j, subcomponent) in enumerate(message.subcomponents):
+                    # With fuzzPointsPerRun, only the ones picked for this run, each with its own seed
+                    subcomponentSeed = fuzzPointChooser.getSeed(i, j) if fuzzPointChooser else seed
+                    if subcomponent.isFuzzed and subcomponentSeed is not None:
+                        with stats.measure("mutation"):
+                            radamsa = subprocess.Popen([RADAMSA, "--seed", str(subcomponentSeed)], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                            byteArray = subcomponent.getAlteredByteArray()
+                            (fuzzedByteArray, error_output) = radamsa.communicate(input=byteArray)
                         fuzzedByteArray = bytearray(fuzzedByteArray)
                         subcomponent.setAlteredByteArray(fuzzedByteArray)
+                if corpus and message.isFuzzed:
+                    corpus.addFuzzed(i, message)
             
             # Fuzzing has now been done if this message is fuzzed
             # Always call preSend() regardless for subcomponents if there are any
-            if doesMessageHaveSubcomponents:
-                for j in range(0, len(message.subcomponents)):
-                    subcomponent = message.subcomponents[j] 
-                    # See preFuzz above - we ALWAYS regather this to catch any updates between
-                    # callbacks from the user
-                    actualSubcomponents = map(lambda subcomponent: subcomponent.getAlteredByteArray(), message.subcomponents)
-                    presend = messageProcessor.preSendSubcomponentProcess(subcomponent.getAlteredByteArray(), MessageProcessorExtraParams(i, j, subcomponent.isFuzzed, originalSubcomponents, actualSubcomponents))
-                    subcomponent.setAlteredByteArray(presend)
+            with stats.measure("processor"):
+                if doesMessageHaveSubcomponents:
+                    for j in range(0, len(message.subcomponents)):
+                        subcomponent = message.subcomponents[j] 
+                        # See preFuzz above - we ALWAYS regather this to catch any updates between
+                        # callbacks from the user
+                        actualSubcomponents = map(lambda subcomponent: subcomponent.getAlteredByteArray(), message.subcomponents)
+                        presend = messageProcessor.preSendSubcomponentProcess(subcomponent.getAlteredByteArray(), MessageProcessorExtraParams(i, j, subcomponent.isFuzzed, originalSubcomponents, actualSubcomponents))
+                        subcomponent.setAlteredByteArray(presend)
             
-            # Always let the user make any final modifications pre-send, fuzzed or not
-            actualSubcomponents = map(lambda subcomponent: subcomponent.getAlteredByteArray(), message.subcomponents)
-            byteArrayToSend = messageProcessor.preSendProcess(message.getAlteredMessage(), MessageProcessorExtraParams(i, -1, message.isFuzzed, originalSubcomponents, actualSubcomponents))
+                # Always let the user make any final modifications pre-send, fuzzed or not
+                actualSubcomponents = map(lambda subcomponent: subcomponent.getAlteredByteArray(), message.subcomponents)
+                byteArrayToSend = messageProcessor.preSendProcess(message.getAlteredMessage(), MessageProcessorExtraParams(i, -1, message.isFuzzed, originalSubcomponents, actualSubcomponents))
+
+            if duplicateFilter and duplicateFilter.addOutbound(i, byteArrayToSend):
+                connection.close()
+                raise DuplicateRunException("Seed %d would send the same as an earlier run" % (seed))
 
             if args.dumpraw:
                 loc = os.path.join(DUMPDIR,"%d-outbound-seed-%d"%(i,args.dumpraw))
@@ -274,17 +332,22 @@ def performRun(fuzzerData, host, logger, messageProcessor, seed=-1):
                 with open(loc,"wb") as f:
                     f.write(repr(str(byteArrayToSend))[1:-1])
 
-            sendPacket(connection, addr, byteArrayToSend)
+            with stats.measure("send"):
+                sendPacket(connection, addr, byteArrayToSend)
         else: 
             # Receiving packet from server
             messageByteArray = message.getAlteredMessage()
-            data = receivePacket(connection,addr,len(messageByteArray))
+            with stats.measure("recv"):
+                data = receivePacket(connection,addr,len(messageByteArray))
             if data == messageByteArray:
                 print "\tReceived expected response"
             if logger != None:
                 logger.setReceivedMessageData(i, data)
+            if corpus:
+                corpus.addResponse(i, data)
         
-            messageProcessor.postReceiveProcess(data, MessageProcessorExtraParams(i, -1, False, [messageByteArray], [data]))
+            with stats.measure("processor"):
+                messageProcessor.postReceiveProcess(data, MessageProcessorExtraParams(i, -1, False, [messageByteArray], [data]))
 
             if args.dumpraw:
                 loc = os.path.join(DUMPDIR,"%d-inbound-seed-%d"%(i,args.dumpraw))
@@ -293,12 +356,25 @@ def performRun(fuzzerData, host, logger, messageProcessor, seed=-1):
 
         if logger != None:  
             logger.setHighestMessageNumber(i)
+        if corpus:
+            corpus.setHighestMessageNumber(i)
         
 
         i += 1
     
     connection.close()
 
+# --resume SESSION_DIR carries on with the options the session was started
+# with, plus any given now (which win over the originals)
+resumeParser = argparse.ArgumentParser(add_help=False)
+resumeParser.add_argument("--resume")
+(resumeArgs, sessionArgv) = resumeParser.parse_known_args()
+resumeCheckpoint = None
+if resumeArgs.resume:
+    resumeCheckpoint = readCheckpoint(resumeArgs.resume)
+    sessionArgv = resumeCheckpoint["argv"] + sessionArgv
+    sys.argv = sys.argv[:1] + sessionArgv + ["--resume", resumeArgs.resume]
+
 # Usage case
 if len(sys.argv) < 3:
     sys.argv.append('-h')
@@ -315,10 +391,23 @@ seed_constraint = parser.add_mutually_exclusive_group()
 seed_constraint.add_argument("-r", "--range", help="Run only the specified cases. Acceptable arg formats: [ X | X- | X-Y ], for integers X,Y") 
 seed_constraint.add_argument("-l", "--loop", help="Loop/repeat the given finite number range. Acceptible arg format: [ X | X-Y | X,Y,Z-Q,R | ...]")
 seed_constraint.add_argument("-d", "--dumpraw", help="Test single seed, dump to 'dumpraw' folder",type=int)
+seed_constraint.add_argument("--coordinator", help="Fuzz whichever seeds the mutiny_coordinator.py listening on host:port (or a unix socket path) hands out, as one of many workers")
 
 verbosity = parser.add_mutually_exclusive_group()
 verbosity.add_argument("-q", "--quiet", help="Don't log the outputs",action="store_true")
 verbosity.add_argument("--logAll", help="Log all the outputs",action="store_true")
+parser.add_argument("--profile", help="Sample the stack during every run, writing flame graph input (profile*.collapsed) to the log directory", action="store_true")
+parser.add_argument("--profile-every", help="As --profile, but only sample one run in every N", type=int, metavar="N")
+parser.add_argument("--skip_duplicates", help="Skip runs that would send exactly what an earlier run did, remembering runs across sessions in <XYZ>.seen", action="store_true")
+parser.add_argument("--seen_file", help="Where --skip_duplicates remembers runs, instead of <XYZ>.seen", metavar="FILE")
+parser.add_argument("--corpus", help="Keep runs that get a new kind of response from the target in DIR (default <XYZ>_corpus) and mutate them further in later runs", nargs="?", const="", metavar="DIR")
+parser.add_argument("--coverage", help="Get edge coverage from a target built with SanitizerCoverage that a monitor launches (see sample_apps/coverage_server), keeping inputs that reach new code in the corpus", action="store_true")
+parser.add_argument("--resume", help="Carry on the session logged in SESSION_DIR (<XYZ>_logs/<date,time>) from its last checkpoint, with the options it was started with", metavar="SESSION_DIR")
+parser.add_argument("--metrics", help="Serve live stats in Prometheus format on [host:]port (localhost by default) or a unix socket path")
+target_pool = parser.add_mutually_exclusive_group()
+target_pool.add_argument("--pool", help="Fuzz several copies of the target that are already running, sending each run to the least busy, instead of target_host", metavar="HOST:PORT,HOST:PORT,...")
+target_pool.add_argument("--launch", help="Launch --instances copies of the target with COMMAND, {port} standing for each one's port (the .fuzzer's port upwards), and fuzz them as a pool, restarting any that crash", metavar="COMMAND")
+parser.add_argument("--instances", help="How many copies of the target --launch starts (default 2)", type=int, default=2)
 
 args = parser.parse_args()
 
@@ -326,18 +415,11 @@ args = parser.parse_args()
 # Set MIN_RUN_NUMBER and MAX_RUN_NUMBER when provided
 # by the user below
 def getRunNumbersFromArgs(strArgs):
-    if "-" in strArgs:
-        testNumbers = strArgs.split("-")
-        if len(testNumbers) == 2:
-            if len(testNumbers[1]): #e.g. strArgs="1-50"
-                return (int(testNumbers[0]), int(testNumbers[1]))
-            else:                   #e.g. strArgs="3-" (equiv. of --skip-to)
-                return (int(testNumbers[0]),-1)
-        else: #e.g. strArgs="1-2-3-5.." 
-            sys.exit("Invalid test range given: %s" % args)
-    else:
-        # If they pass a non-int, allow this to bomb out
-        return (int(strArgs),int(strArgs)) 
+    seedRange = SeedSet.parse(strArgs)
+    # One range only, e.g. 5, 3- or 1-50
+    if not seedRange or len(seedRange.getIntervals()) != 1:
+        sys.exit("Invalid test range given: %s" % strArgs)
+    return (seedRange.getFirst(), -1 if seedRange.isUnbounded() else seedRange.getLast())
 #----------------------------------------------------
 
 #Populate global arguments from parseargs
@@ -347,7 +429,9 @@ host = args.target_host
 if args.range:
     (MIN_RUN_NUMBER, MAX_RUN_NUMBER) = getRunNumbersFromArgs(args.range)
 elif args.loop:
-    SEED_LOOP = validateNumberRange(args.loop,True) 
+    SEED_LOOP = SeedSet.parse(args.loop)
+    if not SEED_LOOP or SEED_LOOP.isUnbounded():
+        sys.exit("Invalid seed loop given: %s" % args.loop)
 
 #Check for dependency binaries
 if not os.path.exists(RADAMSA):
@@ -364,6 +448,8 @@ elif args.logAll:
 
 
 outputDataFolderPath = os.path.join("%s_%s" % (os.path.splitext(fuzzerFilePath)[0], "logs"), datetime.datetime.now().strftime("%Y-%m-%d,%H%M%S"))
+if args.resume:
+    outputDataFolderPath = args.resume
 fuzzerFolder = os.path.abspath(os.path.dirname(fuzzerFilePath))
 
 ########## Declare variables for scoping, "None"s will be assigned below
@@ -398,17 +484,59 @@ else:
 #Create class director, which import/overrides processors as appropriate
 procDirector = ProcDirector(processorDirectory)
 
+# Has to exist before a monitor launches the target, so it inherits the environment
+coverage = None
+if args.coverage:
+    coverage = CoverageMap()
+    coverage.exportEnvironment()
+
 ########## Launch child monitor thread
-    ### monitor.task = spawned thread
-    ### monitor.crashEvent = threading.Event()
+    ### monitor.tasks = spawned threads
+    ### monitor.crashQueue = CrashEventQueue() the monitor reports crashes on
 monitor = procDirector.startMonitor(host,fuzzerData.port)
+# In case a monitor is launching the target
+monitor.waitForTarget()
+
+# Several instances of the target to share runs out between, if --pool/--launch
+targetPool = getTargetPoolFromArgs(args, host, fuzzerData)
+if targetPool:
+    targetPool.start(monitor)
 
 #! make it so logging message does not appear if reproducing (i.e. -r x-y cmdline arg is set)
 logger = None 
 
 if not isReproduce:
     print "Logging to %s" % (outputDataFolderPath)
-    logger = Logger(outputDataFolderPath)
+    logger = Logger(outputDataFolderPath, args.resume is not None)
+
+# Runs/sec, per-phase latencies and run outcomes, written to stats.json in the log folder
+stats = StatsCollector(STATS_INTERVAL, os.path.join(outputDataFolderPath, "stats.json") if logger else None, os.path.basename(fuzzerFilePath))
+atexit.register(stats.maybeReport, True)
+
+# Does nothing unless --profile/--profile-every was given
+profiler = RunProfiler(outputDataFolderPath if logger else "profile", args.profile_every or (1 if args.profile else 0), stats)
+
+duplicateFilter = None
+if args.skip_duplicates:
+    duplicateFilter = DuplicateRunFilter(args.seen_file or "%s.seen" % (os.path.splitext(fuzzerFilePath)[0]))
+
+corpus = None
+scheduler = None
+if args.corpus is not None or coverage:
+    # Decides which input each run mutates, from how productive each has been
+    scheduler = PowerScheduler()
+    corpus = Corpus(args.corpus or "%s_corpus" % (os.path.splitext(fuzzerFilePath)[0]), scheduler)
+
+# Only mutates some of the fuzzed subcomponents each run, if the .fuzzer says to
+fuzzPointChooser = None
+if fuzzerData.fuzzPointsPerRun:
+    fuzzPointChooser = FuzzPointChooser(fuzzerData.messageCollection, fuzzerData.fuzzPointsPerRun)
+
+if args.metrics:
+    metricsServer = MetricsServer(args.metrics)
+    metricsServer.addCollector(stats)
+    metricsServer.setMonitor(monitor)
+    metricsServer.start()
 
 if args.dumpraw:
     if not isReproduce:
@@ -425,63 +553,158 @@ if args.dumpraw:
 exceptionProcessor = procDirector.exceptionProcessor()
 messageProcessor = procDirector.messageProcessor()
 
-# Set up signal handler for CTRL+C and signals from child monitor thread
-# since this is the same signal, we use the monitor.crashEvent flag()
-# to differentiate between a CTRL+C and a interrupt_main() call from child 
+# Set up signal handler for CTRL+C
+# The monitor reports crashes on monitor.crashQueue, not with signals
 def sigint_handler(signal, frame):
-    if not monitor.crashEvent.isSet():
-        # No event = quit
-        # Quit on ctrl-c
-        print "\nSIGINT received, stopping\n"
-        sys.exit(0)
+    # Quit on ctrl-c
+    print "\nSIGINT received, stopping\n"
+    sys.exit(0)
 
 signal.signal(signal.SIGINT, sigint_handler)
 
 ########## Begin fuzzing
 i = MIN_RUN_NUMBER-1 if fuzzerData.shouldPerformTestRun else MIN_RUN_NUMBER
 failureCount = 0
-loop_len = len(SEED_LOOP) # if --loop
+loop_len = SEED_LOOP.getCount() # if --loop
+# Seeds whose runs are over, for checkpoints
+doneSeeds = SeedSet()
+# Recent runs, to match crash events from the monitor up with
+runHistory = RunHistory(window=CRASH_WINDOW)
+# Leases blocks of seeds and reports crashes and stats, if --coordinator
+coordinatorClient = None
+if args.coordinator:
+    coordinatorClient = CoordinatorClient(args.coordinator, stats)
+lastMessageCollection = deepcopy(fuzzerData.messageCollection)
+
+# Saves where the session is up to, and everything it's learnt, for --resume
+checkpointer = None
+if logger:
+    checkpointer = Checkpointer(outputDataFolderPath, lambda: {"runNumber": i, "failureCount": failureCount}, sessionArgv)
+    checkpointer.add("stats", stats)
+    checkpointer.add("scheduler", scheduler)
+    checkpointer.add("corpus", corpus)
+    checkpointer.add("coverage", coverage)
+    checkpointer.add("fuzzPoints", fuzzPointChooser)
+    checkpointer.add("duplicateFilter", duplicateFilter)
+    checkpointer.add("doneSeeds", doneSeeds)
+    if resumeCheckpoint:
+        runState = checkpointer.restore(resumeCheckpoint)
+        i = runState["runNumber"]
+        failureCount = runState["failureCount"]
+        print "Resuming from run %d, %d seeds done" % (i, doneSeeds.getCount())
+
+# Log any crashes the monitors have reported since we last looked
+# Only called between runs, so they never land in the middle of a send or a log write
+# lastMessageCollection - as sent in the run before the one that just finished
+# Returns whether there were any
+def checkCrashEvents(lastMessageCollection):
+    crashEvents = monitor.crashQueue.drain()
+    stats.recordCrash(len(crashEvents))
+    for crashEvent in crashEvents:
+        candidates = logCrashEvent(logger, runHistory, crashEvent, fuzzerData.messageCollection, lastMessageCollection)
+        if fuzzPointChooser and candidates:
+            fuzzPointChooser.recordCrash(candidates[0].seed)
+        if coordinatorClient:
+            coordinatorClient.reportCrash(crashEvent.getSummary(), candidates[0].seed if candidates else -1)
+    if crashEvents:
+        # Give anything restarting the target a chance to finish
+        monitor.waitForTarget()
+    return len(crashEvents) > 0
+
+# Keep the run as a corpus entry if the target responded in a new way or reached new code
+# Returns the new entry, if any
+def updateCorpus():
+    hasNewCoverage = coverage.endRun() if coverage else False
+    entry = corpus.endRun(hasNewCoverage)
+    if entry:
+        if hasNewCoverage:
+            print "New coverage (%d edges so far), added corpus entry %d" % (coverage.edgeCount, entry.entryId)
+        else:
+            print "New response signature %s, added corpus entry %d" % (entry.signature, entry.entryId)
+    return entry
+
+# Let the corpus and fuzz point chooser know how the run went
+def recordRunFeedback():
+    entry = updateCorpus() if corpus else None
+    if fuzzPointChooser:
+        fuzzPointChooser.endRun(entry is not None)
 
 while True:
-    lastMessageCollection = deepcopy(fuzzerData.messageCollection)
+    # Seeds are the run numbers here, so go on from the first one that isn't done,
+    # which after --resume can be past where the checkpoint's run number says
+    if not (args.dumpraw or loop_len or coordinatorClient) and i >= MIN_RUN_NUMBER:
+        i = doneSeeds.getNextMissing(i)
+    # Stop if we have a maximum and have hit it, before anything outside the range runs
+    if MAX_RUN_NUMBER >= 0 and i > MAX_RUN_NUMBER:
+        checkCrashEvents(lastMessageCollection)
+        exit()
+
     wasCrashDetected = False
+    # Set when a monitor has already waited for the target to come back
+    wasTargetRestarted = False
     print "\n** Sleeping for %.3f seconds **" % args.sleeptime
     time.sleep(args.sleeptime)
+    checkCrashEvents(lastMessageCollection)
+    # Only needed for logging the last run, so it counts as logging
+    with stats.measure("logging"):
+        lastMessageCollection = deepcopy(fuzzerData.messageCollection)
     
+    if args.dumpraw:
+        seed = args.dumpraw
+    elif i == MIN_RUN_NUMBER-1:
+        seed = -1
+    elif loop_len:
+        seed = SEED_LOOP.getSeed(i%loop_len)
+    elif coordinatorClient:
+        seed = coordinatorClient.getSeed()
+        if seed is None:
+            print "The coordinator has no seeds left, stopping"
+            checkCrashEvents(lastMessageCollection)
+            exit()
+    else:
+        seed = i
+    targetInstance = targetPool.acquire() if targetPool else None
+    runHistory.startRun(i, seed, targetName=targetInstance.name if targetInstance else None)
+    stats.currentSeed = seed
+
     try:
         try:
             if args.dumpraw:
                 print "\n\nPerforming single raw dump case: %d" % args.dumpraw
-                performRun(fuzzerData, host, logger, messageProcessor, seed=args.dumpraw)  
-            elif i == MIN_RUN_NUMBER-1:
+            elif seed == -1:
                 print "\n\nPerforming test run without fuzzing..."
-                performRun(fuzzerData, host, logger, messageProcessor, seed=-1) 
-            elif loop_len: 
-                print "\n\nFuzzing with seed %d" % (SEED_LOOP[i%loop_len])
-                performRun(fuzzerData, host, logger, messageProcessor, seed=SEED_LOOP[i%loop_len]) 
             else:
-                print "\n\nFuzzing with seed %d" % (i)
-                performRun(fuzzerData, host, logger, messageProcessor, seed=i) 
+                print "\n\nFuzzing with seed %d" % (seed)
+            with stats.measure("run"), profiler.profileRun():
+                if targetInstance:
+                    print "\tSending to %s" % (targetInstance.name)
+                    performRun(fuzzerData, targetInstance.host, logger, messageProcessor, seed=seed, port=targetInstance.port)
+                else:
+                    performRun(fuzzerData, host, logger, messageProcessor, seed=seed)
+            stats.recordOutcome(StatsCollector.OUTCOME_OK)
+            if duplicateFilter:
+                duplicateFilter.endRun()
+            recordRunFeedback()
             #if --quiet, (logger==None) => AttributeError
             if logAll:
                 try:
-                    logger.outputLog(i, fuzzerData.messageCollection, "LogAll ")
+                    with stats.measure("logging"):
+                        logger.outputLog(i, fuzzerData.messageCollection, "LogAll ")
                 except AttributeError:
                     pass
                  
-        except Exception as e:
-            if monitor.crashEvent.isSet():
-                print "Crash event detected"
-                try:
-                    logger.outputLog(i, fuzzerData.messageCollection, "Crash event detected")
-                    #exit()
-                except AttributeError: 
-                    pass
-                monitor.crashEvent.clear()
+        except DuplicateRunException as e:
+            stats.recordOutcome(StatsCollector.OUTCOME_SKIPPED)
+            print "Skipped: %s" % (str(e))
 
-            elif logAll:
+        except Exception as e:
+            stats.recordOutcome(e)
+            # How far it got before failing counts towards the signature too
+            recordRunFeedback()
+            if logAll:
                 try:
-                    logger.outputLog(i, fuzzerData.messageCollection, "LogAll ")
+                    with stats.measure("logging"):
+                        logger.outputLog(i, fuzzerData.messageCollection, "LogAll ")
                 except AttributeError:
                     pass
             
@@ -489,18 +712,48 @@ while True:
                 # If it's a MessageProcessorException, assume the MP raised it during the run
                 # Otherwise, let the MP know about the exception
                 raise e
+            elif monitor.hasEventMonitors() and monitor.crashQueue.waitRunFailure(e, CRASH_GRACE) and checkCrashEvents(lastMessageCollection):
+                # A target dying mid-run shows up here first, as a refused or reset
+                # connection, but a monitor saw the crash so it's already logged
+                print "Target crashed during run: %s" % (str(e))
+                failureCount = failureCount + 1
+                wasCrashDetected = True
+                wasTargetRestarted = True
+            elif targetInstance and targetPool.reportFailure(targetInstance, e) and checkCrashEvents(lastMessageCollection):
+                # The seed gets tried again on one of the other instances
+                print "Target went down during run: %s" % (str(e))
+                failureCount = failureCount + 1
+                wasCrashDetected = True
+                wasTargetRestarted = True
             else:
-                exceptionProcessor.processException(e)
+                try:
+                    exceptionProcessor.processException(e)
+                except AbortCurrentRunException:
+                    # The target turned the run away rather than crashing, no point sending it again
+                    if duplicateFilter:
+                        duplicateFilter.endRun()
+                    raise
                 # Will not get here if processException raises another exception
+                if duplicateFilter:
+                    duplicateFilter.endRun()
                 print "Exception ignored: %s" % (str(e))
+        finally:
+            runHistory.endRun()
+            if targetInstance:
+                targetPool.release(targetInstance)
         
     except LogCrashException as e:
         if failureCount == 0:
+            stats.recordCrash()
             try:
                 print "MessageProcessor detected a crash"
                 logger.outputLog(i, fuzzerData.messageCollection, str(e))
             except AttributeError:  
                 pass   
+            if fuzzPointChooser:
+                fuzzPointChooser.recordCrash(seed)
+            if coordinatorClient:
+                coordinatorClient.reportCrash("MessageProcessor: %s" % (str(e)), seed)
 
         if logAll:
             try:
@@ -553,18 +806,33 @@ while True:
     if wasCrashDetected:
         if failureCount < fuzzerData.failureThreshold:
             print "Failure %d of %d allowed for seed %d" % (failureCount, fuzzerData.failureThreshold, i)
-            print "The test run didn't complete, continuing after %d seconds..." % (fuzzerData.failureTimeout)
-            time.sleep(fuzzerData.failureTimeout)
+            if wasTargetRestarted:
+                print "The test run didn't complete, continuing now the target is back up..."
+            else:
+                print "The test run didn't complete, continuing after %d seconds..." % (fuzzerData.failureTimeout)
+                time.sleep(fuzzerData.failureTimeout)
         else:
             print "Failed %d times, moving to next test." % (failureCount)
             failureCount = 0
+            if seed >= 0:
+                doneSeeds.add(seed)
+                if coordinatorClient:
+                    coordinatorClient.finishSeed(seed)
             i += 1
     else:
+        if seed >= 0:
+            doneSeeds.add(seed)
+            if coordinatorClient:
+                coordinatorClient.finishSeed(seed)
         i += 1
-    
-    # Stop if we have a maximum and have hit it
-    if MAX_RUN_NUMBER >= 0 and i > MAX_RUN_NUMBER:
-        exit()
+
+    stats.maybeReport()
+    if duplicateFilter:
+        duplicateFilter.maybeSave()
+    if checkpointer:
+        checkpointer.maybeSave()
+    if coordinatorClient:
+        coordinatorClient.maybeRenew()
 
     if args.dumpraw:
         exit()
@@ -0,0 +1,571 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# Ready made monitors that can be listed in MONITORS in a processor
+# directory's monitor.py, e.g.
+#
+#   from mutiny_classes.builtin_monitors import ProcessMonitor, TcpProbeMonitor
+#   MONITORS = [ProcessMonitor("./server --port 2500"), TcpProbeMonitor(interval=0.5)]
+#
+# ProcessMonitor - launches/attaches to a local target and reports its death
+# LogTailMonitor - reports crash messages showing up in log files
+# TcpProbeMonitor - reports the target no longer accepting connections
+#
+# These all run on the shared monitor EventLoop, see
+# backend/monitor_loop.py for writing your own
+#
+#------------------------------------------------------------------
+
+import ctypes
+import errno
+import os
+import os.path
+import re
+import shlex
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from backend.coverage import COVERAGE_SHM_ENV, COVERAGE_SIZE_ENV
+from backend.monitor_loop import EventMonitor, Inotify
+
+# Works out the socket family and address to connect to, the same way
+# the fuzzer does: anything with a / in it is a unix socket
+def _resolve(host, port):
+    if host == "localhost":
+        host = "127.0.0.1"
+    if "/" in host:
+        return (socket.AF_UNIX, host)
+    (family, _, _, _, address) = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0]
+    return (family, address)
+
+# One non-blocking connect() on the loop
+# Calls callback(result) with 0 or an errno once it's connected, failed or timed out
+class _ConnectAttempt(object):
+    def __init__(self, loop, family, address, timeout, callback):
+        self._loop = loop
+        self._callback = callback
+        self._connection = socket.socket(family, socket.SOCK_STREAM)
+        self._connection.setblocking(0)
+        self._timeoutTimer = None
+        result = self._connection.connect_ex(address)
+        if result not in [0, errno.EINPROGRESS, errno.EAGAIN]:
+            # Don't call back before the caller has even got this object
+            self._timeoutTimer = loop.callLater(0, self._finish, result)
+            return
+        # Writable once connect() has succeeded or failed
+        loop.addWriter(self._connection, self._onConnected)
+        self._timeoutTimer = loop.callLater(timeout, self._finish, errno.ETIMEDOUT)
+
+    def _onConnected(self):
+        self._finish(self._connection.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR))
+
+    def _finish(self, result):
+        self.cancel()
+        self._callback(result)
+
+    def cancel(self):
+        if self._timeoutTimer:
+            self._timeoutTimer.cancel()
+            self._timeoutTimer = None
+        if self._connection:
+            self._loop.removeWriter(self._connection)
+            self._connection.close()
+            self._connection = None
+
+# Checks the target is still accepting connections every interval seconds
+# Reports a crash once failureThreshold probes in a row have failed, and
+# again only after the target has come back up
+# Note that each probe is a real connection, so don't use this on a target
+# that can only handle one client at a time
+class TcpProbeMonitor(EventMonitor):
+    # host/port - where to probe, defaults to the fuzzing target
+    def __init__(self, interval=1.0, timeout=1.0, failureThreshold=3, host=None, port=None):
+        self.interval = interval
+        self.timeout = timeout
+        self.failureThreshold = failureThreshold
+        self.host = host
+        self.port = port
+        self._failureCount = 0
+        self._isDown = False
+        self._attempt = None
+
+    def start(self, loop, targetIP, targetPort, signalMain):
+        self._loop = loop
+        self._signalMain = signalMain
+        (self._family, self._address) = _resolve(self.host or targetIP, self.port or targetPort)
+        self._probe()
+
+    def stop(self):
+        if self._attempt:
+            self._attempt.cancel()
+
+    def _probe(self):
+        self._attempt = _ConnectAttempt(self._loop, self._family, self._address, self.timeout, self._finishProbe)
+
+    def _finishProbe(self, result):
+        self._attempt = None
+        if result == 0:
+            if self._isDown:
+                print "%s: target is accepting connections again" % (self.name or self.__class__.__name__)
+            self._failureCount = 0
+            self._isDown = False
+        else:
+            self._failureCount += 1
+            if self._failureCount >= self.failureThreshold and not self._isDown:
+                self._isDown = True
+                self._signalMain("%d connection attempts failed: %s" % (self._failureCount, errno.errorcode.get(result, str(result))))
+        self._loop.callLater(self.interval, self._probe)
+
+# Same number on every architecture Linux has added it for
+SYS_pidfd_open = 434
+
+# Returns an fd that becomes readable when pid exits, or None if the
+# kernel (< 5.3) or platform can't do that
+def _pidfdOpen(pid):
+    if not sys.platform.startswith("linux"):
+        return None
+    if hasattr(os, "pidfd_open"):
+        try:
+            return os.pidfd_open(pid)
+        except OSError:
+            return None
+    libc = ctypes.CDLL(None, use_errno=True)
+    fd = libc.syscall(SYS_pidfd_open, ctypes.c_int(pid), ctypes.c_uint(0))
+    return fd if fd >= 0 else None
+
+SIGNAL_NAMES = dict((number, name) for (name, number) in signal.__dict__.items() if name.startswith("SIG") and not name.startswith("SIG_"))
+
+# Human readable version of a waitpid() status
+def describeExitStatus(status):
+    if os.WIFSIGNALED(status):
+        description = "killed by %s" % (SIGNAL_NAMES.get(os.WTERMSIG(status), "signal %d" % (os.WTERMSIG(status))))
+        if os.WCOREDUMP(status):
+            description += " (core dumped)"
+        return description
+    return "exited with code %d" % (os.WEXITSTATUS(status))
+
+# Launches the target (or attaches to one that's already running) and
+# reports a crash the moment it dies, with the signal and whether it
+# dumped core, using a pidfd so there's no polling delay
+# Can restart the target with the same command line, in which case the
+# fuzzer waits for it to come back up rather than sleeping failureTimeout
+class ProcessMonitor(EventMonitor):
+    # How often to check on the process when pidfds aren't available
+    POLL_INTERVAL = 0.05
+
+    # command - argv list, or a string to split like a shell would, to launch the target
+    # pid - attach to this running process instead of launching one
+    #   Attached processes can't be restarted, and as they aren't our children
+    #   their exit status can't be reported
+    # restart - launch the target again after it dies
+    # restartDelay - seconds to wait before relaunching
+    # waitForPort - after (re)launching, the target isn't counted as up until
+    #   it accepts a TCP connection on the fuzzing target's port
+    # startupTimeout - give up waiting for it to come up after this many seconds
+    # cwd/env - for the launched process, --coverage's bitmap is passed on
+    #   even if env is given
+    # outputPath - file to append the target's stdout/stderr to, otherwise they're ours
+    def __init__(self, command=None, pid=None, restart=True, restartDelay=0, waitForPort=True, startupTimeout=30, cwd=None, env=None, outputPath=None):
+        if (command is None) == (pid is None):
+            raise ValueError("ProcessMonitor needs one of command or pid")
+        self.command = shlex.split(command) if isinstance(command, basestring) else command
+        self.pid = pid
+        self.restart = restart and command is not None
+        self.restartDelay = restartDelay
+        self.waitForPort = waitForPort
+        self.startupTimeout = startupTimeout
+        self.cwd = cwd
+        self.env = env
+        self.outputPath = outputPath
+        # Number of times the target has been restarted
+        self.restartCount = 0
+        self._process = None
+        self._pidfd = None
+        self._attempt = None
+        self._isStopping = False
+        # Set while the target is believed to be up
+        self._ready = threading.Event()
+
+    def start(self, loop, targetIP, targetPort, signalMain):
+        self._loop = loop
+        self._signalMain = signalMain
+        (self._family, self._address) = _resolve(targetIP, targetPort)
+        if self.command:
+            self._launch()
+        else:
+            self._watch()
+            self._ready.set()
+
+    def stop(self):
+        self._isStopping = True
+        self._unwatch()
+        if self._attempt:
+            self._attempt.cancel()
+        # We started it, we clean it up
+        if self._process and self._process.returncode is None:
+            try:
+                self._process.kill()
+                os.waitpid(self._process.pid, 0)
+            except OSError:
+                pass
+
+    # Called on the main thread between runs
+    def waitForTarget(self):
+        self._ready.wait(self.restartDelay + self.startupTimeout + 1)
+
+    # Whether the target is up, without waiting for it
+    def isReady(self):
+        return self._ready.isSet()
+
+    def _launch(self):
+        env = self.env
+        if env is not None and COVERAGE_SHM_ENV in os.environ:
+            env = dict(env)
+            for name in (COVERAGE_SHM_ENV, COVERAGE_SIZE_ENV):
+                env.setdefault(name, os.environ[name])
+        output = open(self.outputPath, "a") if self.outputPath else None
+        try:
+            self._process = subprocess.Popen(self.command, cwd=self.cwd, env=env, stdout=output, stderr=subprocess.STDOUT if output else None, close_fds=True)
+        except OSError as e:
+            print "ProcessMonitor: unable to launch %s: %s" % (" ".join(self.command), str(e))
+            # Let the fuzzer carry on and find out for itself
+            self._ready.set()
+            return
+        finally:
+            if output:
+                output.close()
+        self.pid = self._process.pid
+        print "ProcessMonitor: launched %s as pid %d" % (" ".join(self.command), self.pid)
+        self._watch()
+        self._launchTime = time.time()
+        if self.waitForPort:
+            self._checkReady()
+        else:
+            self._ready.set()
+
+    # Keep trying to connect until the target is listening
+    def _checkReady(self):
+        self._attempt = _ConnectAttempt(self._loop, self._family, self._address, 1.0, self._onReadyCheck)
+
+    def _onReadyCheck(self, result):
+        self._attempt = None
+        if result == 0 or time.time() - self._launchTime > self.startupTimeout:
+            if result != 0:
+                print "ProcessMonitor: target didn't start listening within %d seconds" % (self.startupTimeout)
+            self._ready.set()
+        elif self._process.returncode is None:
+            self._loop.callLater(self.POLL_INTERVAL, self._checkReady)
+
+    def _watch(self):
+        self._pidfd = _pidfdOpen(self.pid)
+        if self._pidfd is not None:
+            self._loop.addReader(self._pidfd, self._onExit)
+        else:
+            self._pollTimer = self._loop.callLater(self.POLL_INTERVAL, self._poll)
+
+    def _unwatch(self):
+        if self._pidfd is not None:
+            self._loop.removeReader(self._pidfd)
+            os.close(self._pidfd)
+            self._pidfd = None
+        elif getattr(self, "_pollTimer", None):
+            self._pollTimer.cancel()
+
+    def _poll(self):
+        if self._process:
+            (pid, status) = os.waitpid(self.pid, os.WNOHANG)
+            if pid:
+                self._onExit(status)
+                return
+        else:
+            try:
+                os.kill(self.pid, 0)
+            except OSError as e:
+                if e.errno == errno.ESRCH:
+                    self._onExit()
+                    return
+        self._pollTimer = self._loop.callLater(self.POLL_INTERVAL, self._poll)
+
+    # status - from waitpid(), fetched here if None and the process is ours
+    def _onExit(self, status=None):
+        self._unwatch()
+        if self._attempt:
+            self._attempt.cancel()
+            self._attempt = None
+        if self._process:
+            if status is None:
+                status = os.waitpid(self.pid, 0)[1]
+            # So Popen doesn't go looking for it again
+            self._process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+            description = "pid %d %s" % (self.pid, describeExitStatus(status))
+        else:
+            description = "pid %d exited" % (self.pid)
+        if self._isStopping:
+            return
+
+        willRestart = self.restart
+        if willRestart:
+            self._ready.clear()
+        self._signalMain(description)
+        if willRestart:
+            self.restartCount += 1
+            self._loop.callLater(self.restartDelay, self._launch)
+
+# Longest piece of plain text every match of a regular expression must
+# contain, or None if that isn't obvious, so data can be ruled out with a
+# quick str.find() before bothering the regex engine
+def _getRequiredLiteral(pattern):
+    if pattern.startswith("(?") or len(re.findall(r"(?<!\\)[|()]", pattern)):
+        # Alternation/groups could make anything optional, don't try
+        return None
+    runs = [""]
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\" and i + 1 < len(pattern):
+            i += 1
+            if pattern[i].isalnum():
+                # \w, \d, \b, etc
+                runs.append("")
+            else:
+                runs[-1] += pattern[i]
+        elif char == "[":
+            # Skip the character class
+            i = pattern.find("]", i + 2)
+            if i == -1:
+                return None
+            runs.append("")
+        elif char in "?*{":
+            # Whatever came before is optional
+            runs[-1] = runs[-1][:-1]
+            runs.append("")
+            if char == "{":
+                i = pattern.find("}", i)
+                if i == -1:
+                    return None
+        elif char in "+.^$":
+            runs.append("")
+        else:
+            runs[-1] += char
+        i += 1
+    literal = max(runs, key=len)
+    return literal if len(literal) >= 3 else None
+
+# One file being followed by LogTailMonitor
+class _TailedFile(object):
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+        self.inode = None
+        self.position = 0
+        # Unfinished last line from the previous read
+        self.partialLine = ""
+
+    # Open path if it exists, starting at the end unless fromStart
+    # Returns whether it's open
+    def open(self, fromStart):
+        try:
+            self.fd = os.open(self.path, os.O_RDONLY)
+        except OSError:
+            return False
+        stat = os.fstat(self.fd)
+        self.inode = (stat.st_dev, stat.st_ino)
+        self.position = 0 if fromStart else stat.st_size
+        self.partialLine = ""
+        return True
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    # True if path now refers to a different file than the one open, i.e.
+    # the log was rotated, or has appeared since we started
+    def wasReplaced(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return self.fd is None or (stat.st_dev, stat.st_ino) != self.inode
+
+    # Everything written since last time, in readSize chunks
+    def readNew(self, readSize):
+        if self.fd is None:
+            return
+        if os.fstat(self.fd).st_size < self.position:
+            # Truncated in place (copytruncate rotation), start again
+            self.position = 0
+            self.partialLine = ""
+        os.lseek(self.fd, self.position, os.SEEK_SET)
+        while True:
+            data = os.read(self.fd, readSize)
+            if not data:
+                return
+            self.position += len(data)
+            yield data
+
+# Follows one or more log files, like tail -F, and reports a crash when a
+# line matches any of the patterns, e.g. sanitizer reports or assertion
+# failures the target writes before (or instead of) dying
+# All patterns are combined into one regular expression and new data is
+# scanned a whole chunk at a time, so it keeps up with very busy logs
+# Uses inotify to hear about new data, falling back to polling
+class LogTailMonitor(EventMonitor):
+    DEFAULT_PATTERNS = [
+        r"ERROR: \w+Sanitizer",
+        r"SUMMARY: \w+Sanitizer",
+        r"runtime error:",
+        r"[Ss]egmentation fault",
+        r"segfault at",
+        r"Assertion .* failed",
+        r"stack smashing detected",
+        r"double free or corruption",
+        r"\bcore dumped\b",
+    ]
+    # Bytes to read at a time
+    READ_SIZE = 1024 * 1024
+    # Lines longer than this are scanned in pieces
+    MAX_LINE_LENGTH = 64 * 1024
+    # How much of the matching line to report
+    MAX_EXCERPT_LENGTH = 300
+
+    # paths - log file path or list of paths, they don't have to exist yet
+    # patterns - regular expressions to look for, DEFAULT_PATTERNS if None
+    # fromStart - scan what's already in the files too, not just new data
+    # pollInterval - how often to check the files when inotify isn't available
+    def __init__(self, paths, patterns=None, fromStart=False, pollInterval=0.1):
+        self.paths = [paths] if isinstance(paths, basestring) else list(paths)
+        self.patterns = LogTailMonitor.DEFAULT_PATTERNS if patterns is None else list(patterns)
+        self.fromStart = fromStart
+        self.pollInterval = pollInterval
+        self.matchCount = 0
+        self._regex = re.compile("|".join("(?:%s)" % (pattern) for pattern in self.patterns))
+        # Nearly all data won't match, and str.find() is far quicker at
+        # showing that than the regex, so only run that if one of these is there
+        self._literals = [_getRequiredLiteral(pattern) for pattern in self.patterns]
+        if None in self._literals:
+            self._literals = None
+        self._files = {}
+        self._inotify = None
+        self._pollTimer = None
+
+    def start(self, loop, targetIP, targetPort, signalMain):
+        self._loop = loop
+        self._signalMain = signalMain
+        for path in self.paths:
+            tailedFile = _TailedFile(os.path.abspath(path))
+            tailedFile.open(self.fromStart)
+            self._files[tailedFile.path] = tailedFile
+
+        self._inotify = Inotify.create()
+        if self._inotify:
+            # Watching the directories rather than the files catches the
+            # files being created, moved and replaced as well as written to
+            mask = Inotify.IN_MODIFY | Inotify.IN_CREATE | Inotify.IN_MOVED_TO | Inotify.IN_MOVED_FROM | Inotify.IN_DELETE | Inotify.IN_CLOSE_WRITE
+            self._watches = {}
+            for directory in set(os.path.dirname(path) for path in self._files):
+                self._watches[self._inotify.addWatch(directory, mask)] = directory
+            loop.addReader(self._inotify, self._onInotify)
+        else:
+            self._pollTimer = loop.callLater(self.pollInterval, self._poll)
+        if self.fromStart:
+            self._checkFiles(self._files.values())
+
+    def stop(self):
+        if self._inotify:
+            self._loop.removeReader(self._inotify)
+            self._inotify.close()
+            self._inotify = None
+        if self._pollTimer:
+            self._pollTimer.cancel()
+        for tailedFile in self._files.values():
+            tailedFile.close()
+
+    def _onInotify(self):
+        changedFiles = set()
+        for (wd, mask, name) in self._inotify.read():
+            if mask & Inotify.IN_Q_OVERFLOW:
+                # Lost track, check the lot
+                changedFiles.update(self._files.values())
+            elif wd in self._watches:
+                tailedFile = self._files.get(os.path.join(self._watches[wd], name))
+                if tailedFile:
+                    changedFiles.add(tailedFile)
+        self._checkFiles(changedFiles)
+
+    def _poll(self):
+        self._checkFiles(self._files.values())
+        self._pollTimer = self._loop.callLater(self.pollInterval, self._poll)
+
+    def _checkFiles(self, tailedFiles):
+        for tailedFile in tailedFiles:
+            self._scan(tailedFile)
+            if tailedFile.wasReplaced():
+                # Rotated: finish off the old file (done above), then follow the new one from its start
+                tailedFile.close()
+                tailedFile.open(True)
+                self._scan(tailedFile)
+
+    def _scan(self, tailedFile):
+        for data in tailedFile.readNew(LogTailMonitor.READ_SIZE):
+            data = tailedFile.partialLine + data
+            lineEnd = data.rfind("\n") + 1
+            if lineEnd == 0 and len(data) < LogTailMonitor.MAX_LINE_LENGTH:
+                tailedFile.partialLine = data
+                continue
+            if lineEnd == 0:
+                lineEnd = len(data)
+            tailedFile.partialLine = data[lineEnd:]
+            self._match(tailedFile.path, data, lineEnd)
+
+    # Look for patterns in data[:end], one crash event per chunk however many lines match
+    def _match(self, path, data, end):
+        if self._literals and not any(data.find(literal, 0, end) != -1 for literal in self._literals):
+            return
+        match = self._regex.search(data, 0, end)
+        if not match:
+            return
+        matchCount = 1 + sum(1 for extraMatch in self._regex.finditer(data, match.end(), end))
+        self.matchCount += matchCount
+        lineStart = data.rfind("\n", 0, match.start()) + 1
+        lineEnd = data.find("\n", match.end(), end)
+        if lineEnd == -1:
+            lineEnd = end
+        excerpt = data[lineStart:min(lineEnd, lineStart + LogTailMonitor.MAX_EXCERPT_LENGTH)].strip()
+        description = "%s: %s" % (os.path.basename(path), excerpt)
+        if matchCount > 1:
+            description += " (and %d more matches)" % (matchCount - 1)
+        self._signalMain(description)
@@ -36,8 +36,17 @@
 # PIDs, etc in parallel while mutiny is operating
 # This parallel thread can signal Mutiny when it detects a crash
 #
+# Several monitors can also be run at once by listing instances in
+# MONITORS below, e.g. the ready made ones in builtin_monitors.py or
+# your own backend.monitor_loop.EventMonitor subclasses.  These share
+# one event loop thread instead of each polling on their own
+#
 #------------------------------------------------------------------
 
+# from mutiny_classes.builtin_monitors import TcpProbeMonitor
+# MONITORS = [TcpProbeMonitor(interval=0.5)]
+MONITORS = []
+
 class Monitor(object):
     # This function will run asynchronously in a different thread to monitor the host
     def monitorTarget(self, targetIP, targetPort, signalMain):
@@ -49,4 +58,6 @@ class Monitor(object):
         #
         # Calling signalMain() at any time will indicate to Mutiny
         # that the target has crashed and a crash should be logged
+        # Anything passed to it, e.g. signalMain("SIGSEGV"), is logged
+        # with the crash
         pass
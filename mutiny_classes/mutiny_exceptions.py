@@ -48,3 +48,7 @@ class MessageProcessorExceptions(object):
 class ConnectionClosedException(Exception):
     pass
 
+# This is raised by the fuzzer when a run would send exactly what an earlier
+# run did (see --skip_duplicates), the run is skipped
+class DuplicateRunException(Exception):
+    pass
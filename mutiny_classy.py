@@ -47,25 +47,56 @@ import sys
 import threading
 import time
 import argparse
+import atexit
 import ssl
 from copy import deepcopy
 from backend.proc_director import ProcDirector
+from backend.campaign import Campaign
+from backend.checkpoint import Checkpointer, findLatestSession, readCheckpoint
+from backend.corpus import Corpus
+from backend.coverage import CoverageMap
+from backend.crash_events import CrashTriage, RunHistory, describeCrashEvent, logCandidateRuns
+from backend.duplicate_filter import DuplicateRunFilter
+from backend.fuzz_points import FuzzPointChooser
 from backend.fuzzer_types import Message, MessageCollection, Logger
 from backend.packets import PROTO,IP
 from mutiny_classes.mutiny_exceptions import *
-from mutiny_classes.message_processor import MessageProcessorExtraParams
+from mutiny_classes.message_processor import MessageProcessor, MessageProcessorExtraParams
 from backend.fuzzerdata import FuzzerData
-from backend.menu_functions import validateNumberRange
+from backend.metrics import MetricsServer
+from backend.profiling import RunProfiler
+from backend.scheduler import PowerScheduler
+from backend.seed_set import SeedSet
+from backend.stats import StatsCollector
+from backend.target_pool import getTargetPoolFromArgs
 
 # Path to Radamsa binary
 RADAMSA=os.path.abspath( os.path.join(__file__, "../radamsa-v0.6/bin/radamsa") )
 # Whether to print debug info
 DEBUG_MODE=False
+# Seconds after a run ends that a crash reported by the monitor can still be blamed on it
+CRASH_WINDOW=1.0
+# Seconds to give event driven monitors to report a crash when a run fails
+# in a way that suggests the target died (connection refused, reset...)
+CRASH_GRACE=0.1
+# Seconds between stats status lines/stats.json updates
+STATS_INTERVAL=10
 
 # TODO, clean up monitor code
 # if there are multiple fuzzers, but want the same monitor for all of them
 global_monitor = None
 wantGlobalMonitor = True
+global_coverage = None
+# Every fuzzer's runs, so a crash the shared monitor reports can be pinned
+# on the right fuzzer (see triageCrashes())
+global_run_history = RunHistory(window=CRASH_WINDOW)
+global_crash_triage = CrashTriage(global_run_history)
+# fuzzerFilePath -> MutinyFuzzer
+global_fuzzers = {}
+# Runs the fuzzers, set in main
+global_campaign = None
+# Instances of the target the fuzzers share, with --pool/--launch
+global_target_pool = None
 
 class MutinyFuzzer():
 
@@ -76,7 +107,7 @@ class MutinyFuzzer():
         # Test number to go to, -1 is unlimited
         self.MAX_RUN_NUMBER=-1
         # For seed loop, finite range to repeat
-        self.SEED_LOOP = []
+        self.SEED_LOOP = SeedSet()
         # For dumpraw option, dump into log directory by default, else 'dumpraw'
         self.DUMPDIR = ""
 
@@ -88,7 +119,9 @@ class MutinyFuzzer():
         if args.range:
             (self.MIN_RUN_NUMBER, self.MAX_RUN_NUMBER) = getRunNumbersFromArgs(args, args.range)
         elif args.loop:
-            self.SEED_LOOP = validateNumberRange(args.loop,True)
+            self.SEED_LOOP = SeedSet.parse(args.loop)
+            if not self.SEED_LOOP or self.SEED_LOOP.isUnbounded():
+                sys.exit("Invalid seed loop given: %s" % args.loop)
 
         #Check for dependency binaries
         if not os.path.exists(RADAMSA):
@@ -104,6 +137,15 @@ class MutinyFuzzer():
             self.logAll = True
 
         self.outputDataFolderPath = os.path.join("%s_%s" % (os.path.splitext(self.fuzzerFilePath)[0], "logs"), datetime.datetime.now().strftime("%Y-%m-%d,%H%M%S"))
+        # --resume carries on this fuzzer's latest session that has a checkpoint
+        self.resumeCheckpoint = None
+        if args.resume:
+            sessionDirectory = findLatestSession("%s_%s" % (os.path.splitext(self.fuzzerFilePath)[0], "logs"))
+            if sessionDirectory:
+                self.resumeCheckpoint = readCheckpoint(sessionDirectory)
+                self.outputDataFolderPath = sessionDirectory
+            else:
+                print "No checkpoint to resume %s from, starting a new session" % (self.fuzzerFilePath)
         self.fuzzerFolder = os.path.abspath(os.path.dirname(self.fuzzerFilePath))
         
         ########## Declare variables for scoping, "None"s will be assigned below
@@ -147,14 +189,27 @@ class MutinyFuzzer():
         #Create class director, which import/overrides processors as appropriate
         self.procDirector = ProcDirector(self.processorDirectory)
 
-        global global_monitor
+        # One target, so one coverage map shared by every fuzzer
+        # Has to exist before the monitor launches the target, so it inherits the environment
+        global global_coverage
+        if args.coverage and global_coverage == None:
+            global_coverage = CoverageMap()
+            global_coverage.exportEnvironment()
+        self.coverage = global_coverage
+
+        global global_monitor, global_target_pool
         self.monitor = None
         ########## Launch child monitor thread
-            ### monitor.task = spawned thread
-            ### monitor.crashEvent = threading.Event()
+            ### monitor.tasks = spawned threads
+            ### monitor.crashQueue = CrashEventQueue() the monitor reports crashes on
         if wantGlobalMonitor==True and global_monitor == None:
             global_monitor = self.procDirector.startMonitor(self.host,self.fuzzerData.port)
+            # In case a monitor is launching the target
+            global_monitor.waitForTarget()
             print global_monitor
+            global_target_pool = getTargetPoolFromArgs(args, self.host, self.fuzzerData)
+            if global_target_pool:
+                global_target_pool.start(global_monitor)
             time.sleep(10) #clumsden added so pid_watcher has time to connect to monitor
 
         #! make it so logging message does not appear if reproducing (i.e. -r x-y cmdline arg is set)
@@ -162,7 +217,34 @@ class MutinyFuzzer():
         
         if not self.isReproduce:
             print "Logging to %s" % (self.outputDataFolderPath)
-            self.logger = Logger(self.outputDataFolderPath)
+            self.logger = Logger(self.outputDataFolderPath, self.resumeCheckpoint is not None)
+
+        # Runs/sec, per-phase latencies and run outcomes, written to stats.json in the log folder
+        statsFilePath = os.path.join(self.outputDataFolderPath, "stats.json") if self.logger else None
+        self.stats = StatsCollector(STATS_INTERVAL, statsFilePath, os.path.basename(self.fuzzerFilePath))
+        atexit.register(self.stats.maybeReport, True)
+
+        # Does nothing unless --profile/--profile-every was given
+        profileDirectory = self.outputDataFolderPath if self.logger else os.path.join("profile", os.path.basename(self.fuzzerFilePath))
+        self.profiler = RunProfiler(profileDirectory, args.profile_every or (1 if args.profile else 0), self.stats)
+
+        self.duplicateFilter = None
+        if args.skip_duplicates:
+            self.duplicateFilter = DuplicateRunFilter("%s.seen" % (os.path.splitext(self.fuzzerFilePath)[0]))
+
+        self.corpus = None
+        self.scheduler = None
+        if args.corpus or self.coverage:
+            # Decides which input each run mutates, from how productive each has been
+            self.scheduler = PowerScheduler()
+            self.corpus = Corpus("%s_corpus" % (os.path.splitext(self.fuzzerFilePath)[0]), self.scheduler)
+
+        # Only mutates some of the fuzzed subcomponents each run, if the .fuzzer says to
+        self.fuzzPointChooser = None
+        if self.fuzzerData.fuzzPointsPerRun:
+            self.fuzzPointChooser = FuzzPointChooser(self.fuzzerData.messageCollection, self.fuzzerData.fuzzPointsPerRun)
+        # Corpus entries added this session
+        self.newEntryCount = 0
         
         if self.args.dumpraw:
             if not isReproduce:
@@ -182,8 +264,97 @@ class MutinyFuzzer():
         ########## Begin fuzzing
         self.i = self.MIN_RUN_NUMBER-1 if self.fuzzerData.shouldPerformTestRun else self.MIN_RUN_NUMBER
         self.failureCount = 0
-        self.loop_len = len(self.SEED_LOOP) # if --loop
+        self.loop_len = self.SEED_LOOP.getCount() # if --loop
+        # Seeds whose runs are over, for checkpoints
+        self.doneSeeds = SeedSet()
+        # Recent runs, to match crash events from the monitor up with
+        self.runHistory = global_run_history
+        self.currentRun = None
+        # Set once a crash has been pinned on this fuzzer
+        self.isStopRequested = False
+        global_fuzzers[self.fuzzerFilePath] = self
+        self.lastMessageCollection = deepcopy(self.fuzzerData.messageCollection)
+
+        # Saves where the session is up to, and everything it's learnt, for --resume
+        self.checkpointer = None
+        if self.logger:
+            self.checkpointer = Checkpointer(self.outputDataFolderPath, lambda: {"runNumber": self.i, "failureCount": self.failureCount})
+            self.checkpointer.add("stats", self.stats)
+            self.checkpointer.add("scheduler", self.scheduler)
+            self.checkpointer.add("corpus", self.corpus)
+            self.checkpointer.add("coverage", self.coverage)
+            self.checkpointer.add("fuzzPoints", self.fuzzPointChooser)
+            self.checkpointer.add("duplicateFilter", self.duplicateFilter)
+            self.checkpointer.add("doneSeeds", self.doneSeeds)
+            if self.resumeCheckpoint:
+                runState = self.checkpointer.restore(self.resumeCheckpoint)
+                self.i = runState["runNumber"]
+                self.failureCount = runState["failureCount"]
+                print "Resuming %s from run %d, %d seeds done" % (self.fuzzerFilePath, self.i, self.doneSeeds.getCount())
+
+    # Hand any crashes the monitor has reported since we last looked over to
+    # triageCrashes(), which works out whose run caused them once every other
+    # fuzzer's run in flight is over
+    # Returns whether there were any
+    def checkCrashEvents(self):
+        crashEvents = global_monitor.crashQueue.drain()
+        for crashEvent in crashEvents:
+            global_crash_triage.addCrashEvent(crashEvent, self.fuzzerFilePath)
+        if crashEvents:
+            if global_campaign:
+                global_campaign.runExclusive(triageCrashes)
+            else:
+                triageCrashes()
+        if self.isStopRequested:
+            exit() #clumsden - have this commented out if you don't want to stop after a crash is detected
+        return len(crashEvents) > 0
+
+    # Sends exactly what run sent again, without fuzzing or the message
+    # processor, to see whether it crashes the target on its own
+    def replayRun(self, run):
+        replayData = deepcopy(self.fuzzerData)
+        # Up to the last message it got to send
+        del replayData.messageCollection.messages[max(run.outbound) + 1:]
+        for (messageNumber, byteArray) in run.outbound.items():
+            replayData.messageCollection.messages[messageNumber].setMessageFrom(Message.Format.Raw, bytearray(byteArray), False)
+        # performRun() keeps what it sends in the current run, which this isn't
+        currentRun = self.currentRun
+        self.currentRun = None
+        try:
+            # On the instance the run went to, once it's back up
+            instance = global_target_pool.getInstance(run.targetName) if global_target_pool else None
+            if instance:
+                if not global_target_pool.waitForInstance(instance):
+                    raise AbortCurrentRunException("%s isn't back up" % (instance.name))
+                self.performRun(replayData, instance.host, None, MessageProcessor(), seed=-1, port=instance.port)
+            else:
+                self.performRun(replayData, self.host, None, MessageProcessor(), seed=-1)
+        finally:
+            self.currentRun = currentRun
+
+    # Keep the run as a corpus entry if the target responded in a new way or reached new code
+    # Returns the new entry, if any
+    def updateCorpus(self):
+        hasNewCoverage = self.coverage.endRun() if self.coverage else False
+        entry = self.corpus.endRun(hasNewCoverage)
+        if entry:
+            if hasNewCoverage:
+                print "New coverage (%d edges so far), added corpus entry %d" % (self.coverage.edgeCount, entry.entryId)
+            else:
+                print "New response signature %s, added corpus entry %d" % (entry.signature, entry.entryId)
+        return entry
+
+    # Let the corpus and fuzz point chooser know how the run went
+    def recordRunFeedback(self):
+        entry = self.updateCorpus() if self.corpus else None
+        if entry:
+            self.newEntryCount += 1
+        if self.fuzzPointChooser:
+            self.fuzzPointChooser.endRun(entry is not None)
 
+    # Crashes and new corpus entries this session, for Campaign's --yield_weights
+    def getFindCount(self):
+        return self.stats.crashCount + self.newEntryCount
 
     #will run one seed of the current instance of MutinyFuzzer
     def fuzz(self):
@@ -194,53 +365,78 @@ class MutinyFuzzer():
 
         retryRun = True
         while retryRun:
+            # Seeds are the run numbers here, so go on from the first one that isn't done,
+            # which after --resume can be past where the checkpoint's run number says
+            if not (args.dumpraw or self.loop_len) and self.i >= self.MIN_RUN_NUMBER:
+                self.i = self.doneSeeds.getNextMissing(self.i)
+            # Stop if we have a maximum and have hit it, before anything outside the range runs
+            if self.MAX_RUN_NUMBER >= 0 and self.i > self.MAX_RUN_NUMBER:
+                self.checkCrashEvents()
+                exit()
+
             retryRun = False 
-            lastMessageCollection = deepcopy(fuzzerData.messageCollection)
             wasCrashDetected = False
             print "\n** Sleeping for %.3f seconds **" % args.sleeptime
             time.sleep(args.sleeptime)
+            # Leave the run until the crash has been pinned on someone
+            if self.checkCrashEvents():
+                return
+            # Only needed for logging the last run, so it counts as logging
+            with self.stats.measure("logging"):
+                self.lastMessageCollection = deepcopy(fuzzerData.messageCollection)
+            lastMessageCollection = self.lastMessageCollection
+    
+            if args.dumpraw:
+                seed = args.dumpraw
+            elif self.i == self.MIN_RUN_NUMBER-1:
+                seed = -1
+            elif self.loop_len:
+                seed = self.SEED_LOOP.getSeed(self.i%self.loop_len)
+            else:
+                seed = self.i
+            targetInstance = global_target_pool.acquire() if global_target_pool else None
+            self.currentRun = self.runHistory.startRun(self.i, seed, self.fuzzerFilePath, targetInstance.name if targetInstance else None)
+            self.stats.currentSeed = seed
     
             try:
                 try:
                     print "\n\n%s: " % (self.fuzzerFilePath)
                     if args.dumpraw:
                         print "Performing single raw dump case: %d" % args.dumpraw
-                        self.performRun(fuzzerData, host, self.logger, messageProcessor, seed=args.dumpraw)
-                    elif self.i == self.MIN_RUN_NUMBER-1:
+                    elif seed == -1:
                         print "Performing test run without fuzzing..."
-                        self.performRun(fuzzerData, host, self.logger, messageProcessor, seed=-1)
-                    elif self.loop_len:
-                        print "Fuzzing with seed %d" % (self.SEED_LOOP[self.i%loop_len])
-                        self.performRun(fuzzerData, host, self.logger, messageProcessor, seed=self.SEED_LOOP[self.i%loop_len])
                     else:
-                        print "Fuzzing with seed %d" % (self.i)
-                        self.performRun(fuzzerData, host, self.logger, messageProcessor, seed=self.i)
+                        print "Fuzzing with seed %d" % (seed)
+                    with self.stats.measure("run"), self.profiler.profileRun():
+                        if targetInstance:
+                            print "\tSending to %s" % (targetInstance.name)
+                            self.performRun(fuzzerData, targetInstance.host, self.logger, messageProcessor, seed=seed, port=targetInstance.port)
+                        else:
+                            self.performRun(fuzzerData, host, self.logger, messageProcessor, seed=seed)
+                    self.stats.recordOutcome(StatsCollector.OUTCOME_OK)
+                    if self.duplicateFilter:
+                        self.duplicateFilter.endRun()
+                    self.recordRunFeedback()
                     #if --quiet, (self.logger==None) => AttributeError
                     if self.logAll:
                         try:
-                            self.logger.outputLog(self.i, fuzzerData.messageCollection, "LogAll ")
+                            with self.stats.measure("logging"):
+                                self.logger.outputLog(self.i, fuzzerData.messageCollection, "LogAll ")
                         except AttributeError:
                             pass
     
-                    #clumsden - so a crash detected by monitor is registered
-                    if global_monitor.crashEvent.isSet():
-                        raise Exception()
-                    #clumsden end
-    
-    
+                except DuplicateRunException as e:
+                    self.stats.recordOutcome(StatsCollector.OUTCOME_SKIPPED)
+                    print "Skipped: %s" % (str(e))
+
                 except Exception as e:
-                    if global_monitor.crashEvent.isSet():
-                        print "Crash event detected"
-                        try:
-                            self.logger.outputLog(self.i, fuzzerData.messageCollection, "Crash event detected")
-                            exit() #clumsden - have this commented out if you don't want to stop after a crash is detected
-                        except AttributeError:
-                            pass
-                        global_monitor.crashEvent.clear()
-        
-                    elif self.logAll:
+                    self.stats.recordOutcome(e)
+                    # How far it got before failing counts towards the signature too
+                    self.recordRunFeedback()
+                    if self.logAll:
                         try:
-                            self.logger.outputLog(self.i, fuzzerData.messageCollection, "LogAll ")
+                            with self.stats.measure("logging"):
+                                self.logger.outputLog(self.i, fuzzerData.messageCollection, "LogAll ")
                         except AttributeError:
                             pass
         
@@ -249,17 +445,40 @@ class MutinyFuzzer():
                         # Otherwise, let the MP know about the exception
                         raise e
                     else:
-                        self.exceptionProcessor.processException(e)
+                        # A target dying mid-run shows up here first, as a refused or reset
+                        # connection, let the monitors report it if they saw the crash
+                        isTargetCrash = False
+                        if global_monitor.hasEventMonitors() and global_monitor.crashQueue.waitRunFailure(e, CRASH_GRACE):
+                            isTargetCrash = self.checkCrashEvents()
+                        elif targetInstance and global_target_pool.reportFailure(targetInstance, e):
+                            self.checkCrashEvents()
+                            raise RetryCurrentRunException("%s went down, trying another" % (targetInstance.name))
+                        try:
+                            self.exceptionProcessor.processException(e)
+                        except AbortCurrentRunException:
+                            # The target turned the run away rather than crashing, no point sending it again
+                            if not isTargetCrash and self.duplicateFilter:
+                                self.duplicateFilter.endRun()
+                            raise
                         # Will not get here if processException raises another exception
+                        if not isTargetCrash and self.duplicateFilter:
+                            self.duplicateFilter.endRun()
                         print "Exception ignored: %s" % (str(e))
+                finally:
+                    self.runHistory.endRun(self.currentRun)
+                    if targetInstance:
+                        global_target_pool.release(targetInstance)
     
             except LogCrashException as e:
                 if self.failureCount == 0:
+                    self.stats.recordCrash()
                     try:
                         print "MessageProcessor detected a crash"
                         self.logger.outputLog(self.i, fuzzerData.messageCollection, str(e))
                     except AttributeError:
                         pass
+                    if self.fuzzPointChooser:
+                        self.fuzzPointChooser.recordCrash(seed)
         
                 if self.logAll:
                     try:
@@ -309,7 +528,7 @@ class MutinyFuzzer():
             except HaltException as e:
                 print "Received HaltException halting"
                 exit()
-        
+
             if wasCrashDetected:
                 if self.failureCount < fuzzerData.failureThreshold:
                     print "Failure %d of %d allowed for seed %d" % (self.failureCount, fuzzerData.failureThreshold, self.i)
@@ -318,13 +537,19 @@ class MutinyFuzzer():
                 else:
                     print "Failed %d times, moving to next test." % (self.failureCount)
                     self.failureCount = 0
+                    if seed >= 0:
+                        self.doneSeeds.add(seed)
                     self.i += 1
             else:
+                if seed >= 0:
+                    self.doneSeeds.add(seed)
                 self.i += 1
-        
-            # Stop if we have a maximum and have hit it
-            if self.MAX_RUN_NUMBER >= 0 and self.i > self.MAX_RUN_NUMBER:
-                exit()
+
+            self.stats.maybeReport()
+            if self.duplicateFilter:
+                self.duplicateFilter.maybeSave()
+            if self.checkpointer:
+                self.checkpointer.maybeSave()
         
             if args.dumpraw:
                 exit()
@@ -333,11 +558,27 @@ class MutinyFuzzer():
 
     # Perform a fuzz run.
     # If seed is -1, don't perform fuzzing (test run)
-    def performRun(self,fuzzerData, host, logger, messageProcessor, seed=-1):
+    # port - where to connect to, if not the .fuzzer's port (e.g. a TargetPool instance)
+    def performRun(self,fuzzerData, host, logger, messageProcessor, seed=-1, port=None):
+        if port is None:
+            port = fuzzerData.port
         # Before doing anything, set up logger
         # Otherwise, if connection is refused, we'll log last, but it will be wrong
         if logger != None:
-            logger.resetForNewRun()
+            with self.stats.measure("logging"):
+                logger.resetForNewRun()
+        if self.duplicateFilter:
+            self.duplicateFilter.startRun(fuzzerData.messageCollection, seed)
+        if self.corpus:
+            base = self.corpus.startRun(seed)
+            if base:
+                print "\tMutating corpus entry %d" % (base.entryId)
+        if self.coverage:
+            self.coverage.startRun()
+        if self.fuzzPointChooser:
+            fuzzPoints = self.fuzzPointChooser.startRun(seed)
+            for (messageNumber, subcomponentNumber) in sorted(fuzzPoints):
+                print "\tFuzzing message %d subcomponent %d with seed %d" % (messageNumber, subcomponentNumber, fuzzPoints[(messageNumber, subcomponentNumber)])
     
         # We don't perform DNS resolution, but always automatically type "localhost"
         # ... really need to go ahead and add DNS resolution soon
@@ -349,10 +590,10 @@ class MutinyFuzzer():
         # will have to actively go out of their way to subvert this.
         if "." in host:
             socket_family = socket.AF_INET
-            addr = (host,fuzzerData.port)
+            addr = (host,port)
         elif ":" in host:
             socket_family = socket.AF_INET6
-            addr = (host,fuzzerData.port)
+            addr = (host,port)
         else:
             socket_family = socket.AF_UNIX
             addr = (host)
@@ -364,10 +605,14 @@ class MutinyFuzzer():
     
         # Call messageprocessor preconnect callback if it exists
         try:
-            messageProcessor.preConnect(seed, host, fuzzerData.port)
+            with self.stats.measure("processor"):
+                messageProcessor.preConnect(seed, host, port)
         except AttributeError:
             pass
 
+        # Socket setup through to the TCP/TLS handshake
+        connectStartTime = time.time()
+
         # for TCP/UDP/RAW support
         if fuzzerData.proto == "tcp":
             connection = socket.socket(socket_family,socket.SOCK_STREAM)
@@ -430,63 +675,86 @@ class MutinyFuzzer():
         if fuzzerData.proto == "tcp" or fuzzerData.proto == "tls":
             # Now that we've had a chance to bind as necessary, connect
             connection.connect(addr)
+        self.stats.record("connect", time.time() - connectStartTime)
 
         i=0
         for i in range(0, len(fuzzerData.messageCollection.messages)):
+            if global_monitor.crashQueue.isPending():
+                # Target's already down, no point carrying on
+                print "\tCrash event pending, ending run early"
+                break
             message = fuzzerData.messageCollection.messages[i]
     
             # Go ahead and revert any fuzzing or messageprocessor changes before proceeding
             message.resetAlteredMessage()
     
             if message.isOutbound():
+                if self.corpus:
+                    self.corpus.applyBase(i, message)
+
                 # Primarily used for deciding how to handle preFuzz/preSend callbacks
                 doesMessageHaveSubcomponents = len(message.subcomponents) > 1
     
                 # Get original subcomponents for outbound callback only once
                 originalSubcomponents = map(lambda subcomponent: subcomponent.getOriginalByteArray(), message.subcomponents)
     
-                if doesMessageHaveSubcomponents:
-                    # For message with subcomponents, call prefuzz on fuzzed subcomponents
-                    for j in range(0, len(message.subcomponents)):
-                        subcomponent = message.subcomponents[j]
-                        # Note: we WANT to fetch subcomponents every time on purpose
-                        # This way, if user alters subcomponent[0], it's reflected when
-                        # we call the function for subcomponent[1], etc
+                with self.stats.measure("processor"):
+                    if doesMessageHaveSubcomponents:
+                        # For message with subcomponents, call prefuzz on fuzzed subcomponents
+                        for j in range(0, len(message.subcomponents)):
+                            subcomponent = message.subcomponents[j]
+                            # Note: we WANT to fetch subcomponents every time on purpose
+                            # This way, if user alters subcomponent[0], it's reflected when
+                            # we call the function for subcomponent[1], etc
+                            actualSubcomponents = map(lambda subcomponent: subcomponent.getAlteredByteArray(), message.subcomponents)
+                            prefuzz = messageProcessor.preFuzzSubcomponentProcess(subcomponent.getAlteredByteArray(), MessageProcessorExtraParams(i, j, subcomponent.isFuzzed, originalSubcomponents, actualSubcomponents))
+                            subcomponent.setAlteredByteArray(prefuzz)
+                    else:
+                        # If no subcomponents, call prefuzz on ENTIRE message
                         actualSubcomponents = map(lambda subcomponent: subcomponent.getAlteredByteArray(), message.subcomponents)
-                        prefuzz = messageProcessor.preFuzzSubcomponentProcess(subcomponent.getAlteredByteArray(), MessageProcessorExtraParams(i, j, subcomponent.isFuzzed, originalSubcomponents, actualSubcomponents))
-                        subcomponent.setAlteredByteArray(prefuzz)
-                else:
-                    # If no subcomponents, call prefuzz on ENTIRE message
-                    actualSubcomponents = map(lambda subcomponent: subcomponent.getAlteredByteArray(), message.subcomponents)
-                    prefuzz = messageProcessor.preFuzzProcess(actualSubcomponents[0], MessageProcessorExtraParams(i, -1, message.isFuzzed, originalSubcomponents, actualSubcomponents))
-                    message.subcomponents[0].setAlteredByteArray(prefuzz)
+                        prefuzz = messageProcessor.preFuzzProcess(actualSubcomponents[0], MessageProcessorExtraParams(i, -1, message.isFuzzed, originalSubcomponents, actualSubcomponents))
+                        message.subcomponents[0].setAlteredByteArray(prefuzz)
     
                 # Skip fuzzing for seed == -1
                 if seed > -1:
                     # Now run the fuzzer for each fuzzed subcomponent
-                    for subcomponent in message.subcomponents:
-                        if subcomponent.isFuzzed:
-                            radamsa = subprocess.Popen([RADAMSA, "--seed", str(seed)], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                            byteArray = subcomponent.getAlteredByteArray()
-                            (fuzzedByteArray, error_output) = radamsa.communicate(input=byteArray)
+                    for (j, subcomponent) in enumerate(message.subcomponents):
+                        # With fuzzPointsPerRun, only the ones picked for this run, each with its own seed
+                        subcomponentSeed = self.fuzzPointChooser.getSeed(i, j) if self.fuzzPointChooser else seed
+                        if subcomponent.isFuzzed and subcomponentSeed is not None:
+                            with self.stats.measure("mutation"):
+                                radamsa = subprocess.Popen([RADAMSA, "--seed", str(subcomponentSeed)], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                                byteArray = subcomponent.getAlteredByteArray()
+                                (fuzzedByteArray, error_output) = radamsa.communicate(input=byteArray)
                             fuzzedByteArray = bytearray(fuzzedByteArray)
                             subcomponent.setAlteredByteArray(fuzzedByteArray)
+                    if self.corpus and message.isFuzzed:
+                        self.corpus.addFuzzed(i, message)
 
                 # Fuzzing has now been done if this message is fuzzed
                 # Always call preSend() regardless for subcomponents if there are any
-                if doesMessageHaveSubcomponents:
-                    for j in range(0, len(message.subcomponents)):
-                        subcomponent = message.subcomponents[j]
-                        # See preFuzz above - we ALWAYS regather this to catch any updates between
-                        # callbacks from the user
-                        actualSubcomponents = map(lambda subcomponent: subcomponent.getAlteredByteArray(), message.subcomponents)
-                        presend = messageProcessor.preSendSubcomponentProcess(subcomponent.getAlteredByteArray(), MessageProcessorExtraParams(i, j, subcomponent.isFuzzed, originalSubcomponents, actualSubcomponents))
-                        subcomponent.setAlteredByteArray(presend)
+                with self.stats.measure("processor"):
+                    if doesMessageHaveSubcomponents:
+                        for j in range(0, len(message.subcomponents)):
+                            subcomponent = message.subcomponents[j]
+                            # See preFuzz above - we ALWAYS regather this to catch any updates between
+                            # callbacks from the user
+                            actualSubcomponents = map(lambda subcomponent: subcomponent.getAlteredByteArray(), message.subcomponents)
+                            presend = messageProcessor.preSendSubcomponentProcess(subcomponent.getAlteredByteArray(), MessageProcessorExtraParams(i, j, subcomponent.isFuzzed, originalSubcomponents, actualSubcomponents))
+                            subcomponent.setAlteredByteArray(presend)
     
-                # Always let the user make any final modifications pre-send, fuzzed or not
-                actualSubcomponents = map(lambda subcomponent: subcomponent.getAlteredByteArray(), message.subcomponents)
-                byteArrayToSend = messageProcessor.preSendProcess(message.getAlteredMessage(), MessageProcessorExtraParams(i, -1, message.isFuzzed, originalSubcomponents, actualSubcomponents))
+                    # Always let the user make any final modifications pre-send, fuzzed or not
+                    actualSubcomponents = map(lambda subcomponent: subcomponent.getAlteredByteArray(), message.subcomponents)
+                    byteArrayToSend = messageProcessor.preSendProcess(message.getAlteredMessage(), MessageProcessorExtraParams(i, -1, message.isFuzzed, originalSubcomponents, actualSubcomponents))
     
+                if self.duplicateFilter and self.duplicateFilter.addOutbound(i, byteArrayToSend):
+                    connection.close()
+                    raise DuplicateRunException("Seed %d would send the same as an earlier run" % (seed))
+
+                # In case the run needs replaying to see if it crashed the target
+                if self.currentRun:
+                    self.currentRun.outbound[i] = bytearray(byteArrayToSend)
+
                 if self.args.dumpraw:
                     loc = os.path.join(DUMPDIR,"%d-outbound-seed-%d"%(i,self.args.dumpraw))
                     if message.isFuzzed:
@@ -494,17 +762,22 @@ class MutinyFuzzer():
                     with open(loc,"wb") as f:
                         f.write(repr(str(byteArrayToSend))[1:-1])
     
-                self.sendPacket(connection, addr, byteArrayToSend)
+                with self.stats.measure("send"):
+                    self.sendPacket(connection, addr, byteArrayToSend)
             else:
                 # Receiving packet from server
                 messageByteArray = message.getAlteredMessage()
-                data = self.receivePacket(connection,addr,len(messageByteArray))
+                with self.stats.measure("recv"):
+                    data = self.receivePacket(connection,addr,len(messageByteArray))
                 if data == messageByteArray:
                     print "\tReceived expected response"
                 if logger != None:
                     logger.setReceivedMessageData(i, data)
+                if self.corpus:
+                    self.corpus.addResponse(i, data)
     
-                messageProcessor.postReceiveProcess(data, MessageProcessorExtraParams(i, -1, False, [messageByteArray], [data]))
+                with self.stats.measure("processor"):
+                    messageProcessor.postReceiveProcess(data, MessageProcessorExtraParams(i, -1, False, [messageByteArray], [data]))
     
                 if self.args.dumpraw:
                     loc = os.path.join(DUMPDIR,"%d-inbound-seed-%d"%(i,self.args.dumpraw))
@@ -513,6 +786,8 @@ class MutinyFuzzer():
     
             if logger != None:
                 logger.setHighestMessageNumber(i)
+            if self.corpus:
+                self.corpus.setHighestMessageNumber(i)
     
     
             i += 1
@@ -569,15 +844,12 @@ class MutinyFuzzer():
 
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-# Set up signal handler for CTRL+C and signals from child monitor thread
-# since this is the same signal, we use the global_monitor.crashEvent flag()
-# to differentiate between a CTRL+C and a interrupt_main() call from child
+# Set up signal handler for CTRL+C
+# The monitor reports crashes on global_monitor.crashQueue, not with signals
 def sigint_handler(signal, frame):
-    if not global_monitor.crashEvent.isSet():
-        # No event = quit
-        # Quit on ctrl-c
-        print "\nSIGINT received, stopping\n"
-        sys.exit(0)
+    # Quit on ctrl-c
+    print "\nSIGINT received, stopping\n"
+    sys.exit(0)
 
 signal.signal(signal.SIGINT, sigint_handler)
 
@@ -585,21 +857,82 @@ signal.signal(signal.SIGINT, sigint_handler)
 # Set MIN_RUN_NUMBER and MAX_RUN_NUMBER when provided
 # by the user below
 def getRunNumbersFromArgs(args, strArgs):
-    if "-" in strArgs:
-        testNumbers = strArgs.split("-")
-        if len(testNumbers) == 2:
-            if len(testNumbers[1]): #e.g. strArgs="1-50"
-                return (int(testNumbers[0]), int(testNumbers[1]))
-            else:                   #e.g. strArgs="3-" (equiv. of --skip-to)
-                return (int(testNumbers[0]),-1)
-        else: #e.g. strArgs="1-2-3-5.."
-             sys.exit("Invalid test range given: %s" % args)
-    else:
-        # If they pass a non-int, allow this to bomb out
-        return (int(strArgs),int(strArgs))
+    seedRange = SeedSet.parse(strArgs)
+    # One range only, e.g. 5, 3- or 1-50
+    if not seedRange or len(seedRange.getIntervals()) != 1:
+        sys.exit("Invalid test range given: %s" % strArgs)
+    return (seedRange.getFirst(), -1 if seedRange.isUnbounded() else seedRange.getLast())
 #----------------------------------------------------
 
 
+# Works out whose run caused the crashes the shared monitor has reported.
+# The runs in flight around each crash are replayed one at a time to see
+# which crash the target again, and each fuzzer with one of those runs logs
+# it.  The crash is pinned on the fuzzers whose runs crashed it again (or
+# all of them if none did), and they stop
+# Only called with no runs in flight, see MutinyFuzzer.checkCrashEvents()
+def triageCrashes():
+    def replayRun(run):
+        fuzzer = global_fuzzers.get(run.ownerName)
+        if not fuzzer or not run.outbound:
+            return False
+        # The crash being triaged may well have taken the target down
+        global_monitor.waitForTarget()
+        global_monitor.crashQueue.drain()
+        print "\nReplaying %s" % (run)
+        try:
+            fuzzer.replayRun(run)
+        except Exception as e:
+            # e.g. the connection being reset as the target goes down
+            print "\tReplay ended early: %s" % (str(e))
+        isCrash = global_monitor.crashQueue.waitPending(CRASH_WINDOW)
+        global_monitor.crashQueue.drain()
+        print "\t%s" % ("Crashed the target again" if isCrash else "No crash")
+        return isCrash
+
+    for (crashEvent, reporterName, candidates, confirmedRuns) in global_crash_triage.triage(replayRun):
+        description = describeCrashEvent(crashEvent, candidates)
+        ownerNames = set(run.ownerName for run in candidates) or set([reporterName])
+        if confirmedRuns:
+            description += "; replaying %s crashed it again" % (", ".join(str(run) for run in confirmedRuns))
+            culpritNames = set(run.ownerName for run in confirmedRuns)
+        else:
+            if candidates:
+                description += "; replaying didn't crash it again"
+            culpritNames = ownerNames
+        print description
+        for ownerName in ownerNames:
+            fuzzer = global_fuzzers[ownerName]
+            logCandidateRuns(fuzzer.logger, fuzzer.runHistory, candidates, description, fuzzer.fuzzerData.messageCollection, fuzzer.lastMessageCollection, ownerName)
+        for ownerName in culpritNames:
+            fuzzer = global_fuzzers[ownerName]
+            fuzzer.stats.recordCrash()
+            fuzzer.isStopRequested = True
+            if fuzzer.fuzzPointChooser:
+                for run in (confirmedRuns or candidates):
+                    if run.ownerName == ownerName:
+                        fuzzer.fuzzPointChooser.recordCrash(run.seed)
+
+#----------------------------------------------------
+# Weights for Campaign from --weight NAME=W arguments
+def getWeightsFromArgs(fuzzers, weightArgs):
+    weights = {}
+    for weightArg in weightArgs:
+        (name, _, weight) = weightArg.partition("=")
+        try:
+            weight = float(weight)
+        except ValueError:
+            sys.exit("Invalid weight given: %s" % (weightArg))
+        if weight <= 0:
+            sys.exit("Invalid weight given: %s" % (weightArg))
+        matchingFuzzers = [fuzzer for fuzzer in fuzzers if os.path.basename(fuzzer.fuzzerFilePath) == name]
+        if not matchingFuzzers:
+            sys.exit("No .fuzzer file named %s to weight" % (name))
+        for fuzzer in matchingFuzzers:
+            weights[fuzzer] = weight
+    return weights
+#----------------------------------------------------
+
 #this is not in MutinyFuzzer class, called in main
 #returns instance of MutinyFuzzer
 def get_mutiny_with_args(prog_args):
@@ -619,6 +952,20 @@ def get_mutiny_with_args(prog_args):
     verbosity = parser.add_mutually_exclusive_group()
     verbosity.add_argument("-q", "--quiet", help="Don't log the outputs",action="store_true")
     verbosity.add_argument("--logAll", help="Log all the outputs",action="store_true")
+    parser.add_argument("--profile", help="Sample the stack during every run, writing flame graph input (profile*.collapsed) to each fuzzer's log directory", action="store_true")
+    parser.add_argument("--profile-every", help="As --profile, but only sample one run in every N", type=int, metavar="N")
+    parser.add_argument("--skip_duplicates", help="Skip runs that would send exactly what an earlier run did, remembering runs across sessions in <XYZ>.seen next to each .fuzzer", action="store_true")
+    parser.add_argument("--corpus", help="Keep runs that get a new kind of response from the target in <XYZ>_corpus next to each .fuzzer and mutate them further in later runs", action="store_true")
+    parser.add_argument("--coverage", help="Get edge coverage from a target built with SanitizerCoverage that the monitor launches (see sample_apps/coverage_server), keeping inputs that reach new code in each fuzzer's corpus", action="store_true")
+    parser.add_argument("--resume", help="Carry on each fuzzer's latest session from its last checkpoint, rather than starting new ones", action="store_true")
+    parser.add_argument("-j", "--jobs", help="How many fuzzers to run at once, each in its own thread (default all of them)", type=int)
+    parser.add_argument("--weight", help="Give the .fuzzer file NAME (e.g. server-0.fuzzer) W times the run time of the others when there are more fuzzers than --jobs; can be given more than once", action="append", default=[], metavar="NAME=W")
+    parser.add_argument("--yield_weights", help="Also weight fuzzers by how many crashes and new corpus entries their runs turn up", action="store_true")
+    parser.add_argument("--metrics", help="Serve live stats for every fuzzer in Prometheus format on [host:]port (localhost by default) or a unix socket path")
+    target_pool = parser.add_mutually_exclusive_group()
+    target_pool.add_argument("--pool", help="Fuzz several copies of the target that are already running, sending each run to the least busy, instead of target_host", metavar="HOST:PORT,HOST:PORT,...")
+    target_pool.add_argument("--launch", help="Launch --instances copies of the target with COMMAND, {port} standing for each one's port (the first .fuzzer's port upwards), and share them between the fuzzers, restarting any that crash", metavar="COMMAND")
+    parser.add_argument("--instances", help="How many copies of the target --launch starts (default 2)", type=int, default=2)
     
     args = parser.parse_args()
 
@@ -635,6 +982,14 @@ def get_mutiny_with_args(prog_args):
             fuzzers.append(MutinyFuzzer(args))
         except Exception as e:
             raise e
+
+    # One endpoint for all the fuzzers, told apart by the fuzzer label
+    if args.metrics:
+        metricsServer = MetricsServer(args.metrics)
+        for fuzzer in fuzzers:
+            metricsServer.addCollector(fuzzer.stats)
+        metricsServer.setMonitor(global_monitor)
+        metricsServer.start()
     return fuzzers
 
 if __name__ == "__main__":
@@ -645,12 +1000,15 @@ if __name__ == "__main__":
     #clumsden - wrapped original code to loop through the .fuzzer files
     fuzzers = get_mutiny_with_args(sys.argv[1:])
 
-    while True:
-        for fuzzer in fuzzers:
-            try:
-                fuzzer.fuzz()
-            except KeyboardInterrupt:
-                fuzzer.sigint_handler(1) 
+    # The fuzzers all share the same options
+    args = fuzzers[0].args
+    jobs = args.jobs
+    if args.coverage and jobs != 1:
+        # Runs at the same time would mix up each other's coverage
+        print "Running one fuzzer at a time, as --coverage needs the target to itself"
+        jobs = 1
+    global_campaign = Campaign(fuzzers, jobs, getWeightsFromArgs(fuzzers, args.weight), args.yield_weights)
+    global_campaign.run()
 
 
 
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# Coordinator for spreading one campaign over many machines: hands out
+# blocks of seeds to mutiny.py --coordinator workers, collects their crashes
+# and stats, and checkpoints the lot so it can be resumed
+#
+#------------------------------------------------------------------
+
+import argparse
+import os
+import signal
+import sys
+import time
+
+from backend.checkpoint import Checkpointer, readCheckpoint
+from backend.coordinator import Coordinator, CoordinatorServer
+from backend.seed_set import SeedSet
+
+# Seconds between status lines
+STATUS_INTERVAL = 10
+DEFAULT_BLOCK_SIZE = 1000
+DEFAULT_LEASE_TIMEOUT = 300
+
+def printCrashBuckets(coordinator):
+    for (bucket, crashBucket) in sorted(coordinator.crashBuckets.items(), key=lambda item: -item[1]["count"]):
+        print "\t%d crashes from %s, seeds %s: %s" % (crashBucket["count"], ", ".join(crashBucket["workers"]), crashBucket["seeds"] or "none", crashBucket["description"])
+
+if __name__ == "__main__":
+    if len(sys.argv) == 1:
+        sys.argv.append("-h")
+
+    parser = argparse.ArgumentParser(description="Hand out seed blocks to mutiny.py --coordinator workers and collect their crashes and stats")
+    parser.add_argument("address", help="Listen on host:port (0.0.0.0:port for workers on other machines), :port for localhost, or a unix socket path")
+    parser.add_argument("-r", "--range", help="Seeds for the whole campaign, e.g. 0-999999 or 0- to carry on until stopped", default="0-")
+    parser.add_argument("-b", "--block", help="Seeds per lease (default %d)" % (DEFAULT_BLOCK_SIZE), type=int)
+    parser.add_argument("-t", "--lease_timeout", help="Seconds a worker can go without renewing its lease before its seeds are handed out again (default %d)" % (DEFAULT_LEASE_TIMEOUT), type=float)
+    parser.add_argument("--state_dir", help="Where to write the coordinator's checkpoint", default="mutiny_coordinator")
+    parser.add_argument("--resume", help="Carry on from the checkpoint in --state_dir, with the same range (and block size and lease timeout, unless given again)", action="store_true")
+    args = parser.parse_args()
+
+    seeds = SeedSet.parse(args.range)
+    if not seeds:
+        sys.exit("Invalid seed range given: %s" % args.range)
+    if args.block is not None and args.block < 1:
+        sys.exit("Invalid block size given: %d" % args.block)
+
+    coordinator = Coordinator(seeds, DEFAULT_BLOCK_SIZE, DEFAULT_LEASE_TIMEOUT)
+    if args.resume:
+        checkpoint = readCheckpoint(args.state_dir)
+    elif not os.path.isdir(args.state_dir):
+        os.makedirs(args.state_dir)
+    # Seeds done, crash buckets and each worker's stats so far
+    checkpointer = Checkpointer(args.state_dir, lambda: {}, sys.argv[1:])
+    checkpointer.add("coordinator", coordinator)
+    if args.resume:
+        checkpointer.restore(checkpoint)
+        print "Resuming with %d seeds done, %d crash buckets" % (coordinator.doneSeeds.getCount(), len(coordinator.crashBuckets))
+    if args.block:
+        coordinator.blockSize = args.block
+    if args.lease_timeout:
+        coordinator.leaseTimeout = args.lease_timeout
+
+    server = CoordinatorServer(coordinator, args.address)
+    server.start()
+    print "Coordinating seeds %s in blocks of %d on %s" % (str(coordinator.seeds), coordinator.blockSize, str(server.getAddress()))
+
+    def sigint_handler(signal, frame):
+        print "\nSIGINT received, stopping\n"
+        sys.exit(0)
+    signal.signal(signal.SIGINT, sigint_handler)
+
+    lastStatusTime = time.time()
+    while not coordinator.isFinished():
+        time.sleep(1)
+        coordinator.expireLeases()
+        checkpointer.maybeSave()
+        if time.time() - lastStatusTime >= STATUS_INTERVAL:
+            print coordinator.getStatusLine()
+            lastStatusTime = time.time()
+
+    # Workers waiting on a lease that might have expired only find out it's
+    # all done when they next ask
+    time.sleep(Coordinator.WAIT_INTERVAL * 2)
+    print "All seeds done"
+    print coordinator.getStatusLine()
+    printCrashBuckets(coordinator)
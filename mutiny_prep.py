@@ -16,11 +16,15 @@
 import os
 import sys
 import argparse
+import itertools
 
 from backend.fuzzer_types import Message
 from backend.menu_functions import prompt, promptInt, promptString, validateNumberRange
 from backend.fuzzerdata import FuzzerData
-import scapy.all
+from backend.pcap_reader import PcapReader
+from backend.flows import FlowFuzzerSettings, splitCapture
+from backend.tcp_reassembly import TcpStreamReassembler
+from backend.batch_prep import batchPrep
 
 GREEN = "\033[92m"
 CLEAR = "\033[00m"
@@ -49,9 +53,60 @@ parser.add_argument("-f", "--force",
                     action = "store_true",  
                     default=False) 
 
+parser.add_argument("-b", "--blob_threshold",
+                    help="Write messages bigger than this many bytes raw into <file>.fuzzer.blob instead of escaping them inline",
+                    type=int,
+                    default=-1)
+
+parser.add_argument("-s", "--split",
+                    help="Write a .fuzzer for every TCP/UDP flow in the capture (flow), or one per distinct conversation shape (shape), without prompting",
+                    choices=["flow", "shape"])
+
+parser.add_argument("-j", "--jobs",
+                    help="Number of processes to write .fuzzer files with when using --split or --batch, defaults to CPU count",
+                    type=int,
+                    default=None)
+
+parser.add_argument("--tcp_overlap",
+                    help="When TCP segments overlap with different data, keep the first copy seen or the last",
+                    choices=[TcpStreamReassembler.OVERLAP_FIRST, TcpStreamReassembler.OVERLAP_LAST],
+                    default=TcpStreamReassembler.OVERLAP_FIRST)
+
+parser.add_argument("--tcp_gap",
+                    help="When TCP data is missing from the capture, skip over the hole or stop at it",
+                    choices=[TcpStreamReassembler.GAP_SKIP, TcpStreamReassembler.GAP_TRUNCATE],
+                    default=TcpStreamReassembler.GAP_SKIP)
+
+parser.add_argument("--batch",
+                    help="Prep every capture in the pcap_file directory unattended, using the answers in this INI (or YAML) profile, see backend/batch_prep.py",
+                    metavar="PROFILE")
+
+parser.add_argument("--manifest",
+                    help="Where --batch writes its JSON list of generated .fuzzer files, defaults to manifest.json in the output directory")
+
 args = parser.parse_args()
 inputFilePath = args.pcap_file
 
+if args.batch:
+    # Everything comes from the profile, nothing to ask
+    if not os.path.exists(inputFilePath):
+        print "Cannot read input %s" % (inputFilePath)
+        exit()
+    print "Prepping %s with profile %s..." % (inputFilePath, args.batch)
+    try:
+        manifest = batchPrep(inputFilePath, args.batch, processes=args.jobs, manifestPath=args.manifest)
+    except (RuntimeError, IOError, OSError) as e:
+        print "Unable to batch prep %s: %s" % (inputFilePath, str(e))
+        exit(1)
+    for entry in manifest["fuzzers"]:
+        print "\t%s: %s" % (entry["flow"], entry["fuzzer"])
+    for entry in manifest["errors"]:
+        print "\tError processing %s: %s" % (entry["capture"], entry["error"])
+    print GREEN
+    print "Wrote %d .fuzzer files" % (len(manifest["fuzzers"]))
+    print CLEAR
+    exit(1 if manifest["errors"] else 0)
+
 # This stores all the fuzzer data and will eventually write it to the .fuzzer file with comments
 fuzzerData = FuzzerData()
 fuzzerData.processorDirectory = args.processor_dir[0]
@@ -61,6 +116,24 @@ if not os.path.isfile(inputFilePath):
     print "Cannot read input %s" % (inputFilePath)
     exit()
 
+if args.split:
+    # Demultiplex every flow in one pass, all non-interactive
+    settings = FlowFuzzerSettings()
+    settings.processorDirectory = fuzzerData.processorDirectory
+    settings.blobThreshold = args.blob_threshold
+    print "Splitting %s by %s..." % (inputFilePath, args.split)
+    try:
+        results = splitCapture(inputFilePath, settings, splitBy=args.split, processes=args.jobs, overlapPolicy=args.tcp_overlap, gapPolicy=args.tcp_gap)
+    except RuntimeError as e:
+        print "Unable to split %s: %s" % (inputFilePath, str(e))
+        exit()
+    for (description, actualPath) in results:
+        print "\t%s: %s" % (description, actualPath)
+    print GREEN
+    print "Wrote %d .fuzzer files" % (len(results))
+    print CLEAR
+    exit()
+
 STATE_BETWEEN_MESSAGES = 0
 STATE_READING_MESSAGE = 2
 STATE_COMBINING_PACKETS = 3
@@ -84,30 +157,39 @@ with open(inputFilePath, 'r') as inputFile:
     
     try:
         # Process as Pcap preferentially
+        # Streamed a packet at a time so huge captures don't have to fit in memory
         clientPort = None
         serverPort = None
         
-        data = scapy.all.rdpcap(inputFilePath)
-
         j = -1
         
-        for i in range(0, len(data)):
-            try:
+        # TCP goes through reassembly per connection so retransmitted, out-of-order and
+        # overlapping segments don't end up duplicated or misordered in the messages
+        reassemblers = {}
+
+        # None on the end to flush out anything reassembly is still holding after the last packet
+        for packet in itertools.chain(PcapReader(inputFilePath), [None]):
+            if packet is None:
+                payloads = []
+                for reassembler in reassemblers.values():
+                    payloads += reassembler.flush()
+            else:
                 if not clientPort:
                     # First packet will usually but not always come from client
                     # Use port instead of ip/MAC in case we're fuzzing on the same machine as the daemon
                     # Guess at right port based, confirm to user
-                    port1 = data[i].sport
-                    port2 = data[i].dport
-                    
+                    port1 = packet.srcPort
+                    port2 = packet.dstPort
+                
                     # IF port1 == port2, then it can't be the same ip/MAC, so go based on that
+                    # (IP if there's no MAC, like on loopback captures)
                     useMacs = False
                     if port1 == port2:
                         print "Source and destination ports are the same, using MAC addresses to differentiate server and client."
                         useMacs = True
-                        mac1 = data[i].src
-                        mac2 = data[i].dst
-                
+                        mac1 = packet.srcMac if packet.srcMac else packet.srcIP
+                        mac2 = packet.dstMac if packet.dstMac else packet.dstIP
+            
                     serverPort = port2
                     if useMacs:
                         serverMac = mac2
@@ -121,24 +203,29 @@ with open(inputFilePath, 'r') as inputFile:
                     if useMacs:
                         clientMac = mac1 if serverMac == mac2 else mac2
                     defaultPort = serverPort
-                elif data[i].sport not in [clientPort, serverPort]:
-                    print "Error: unknown source port %d - is the capture filtered to a single stream?" % (data[i].sport)
-                elif data[i].dport not in [clientPort, serverPort]:
-                    print "Error: unknown destination port %d - is the capture filtered to a single stream?" % (data[i].dport)
-                
+                elif packet.srcPort not in [clientPort, serverPort]:
+                    print "Error: unknown source port %d - is the capture filtered to a single stream?" % (packet.srcPort)
+                elif packet.dstPort not in [clientPort, serverPort]:
+                    print "Error: unknown destination port %d - is the capture filtered to a single stream?" % (packet.dstPort)
+            
                 if not useMacs:
-                    newMessageDirection = Message.Direction.Outbound if data[i].sport == clientPort else Message.Direction.Inbound
+                    newMessageDirection = Message.Direction.Outbound if packet.srcPort == clientPort else Message.Direction.Inbound
                 else:
-                    newMessageDirection = Message.Direction.Outbound if data[i].src == clientMac else Message.Direction.Inbound
+                    packetMac = packet.srcMac if packet.srcMac else packet.srcIP
+                    newMessageDirection = Message.Direction.Outbound if packetMac == clientMac else Message.Direction.Inbound
+
+                if packet.proto == "tcp":
+                    flowKey = packet.getFlowKey()
+                    if flowKey not in reassemblers:
+                        reassemblers[flowKey] = TcpStreamReassembler(args.tcp_overlap, args.tcp_gap)
+                    payloads = reassemblers[flowKey].addSegment(newMessageDirection, packet.seq, packet.ack, packet.flags, packet.payload)
+                else:
+                    payloads = [(newMessageDirection, packet.payload)]
 
-                try:
-                    # This appear to work for UDP.  Go figure, thanks scapy.
-                    tempMessageData = str(data[i].payload.payload.payload)
-                except AttributeError:
-                    tempMessageData = ""
+            for (newMessageDirection, tempMessageData) in payloads:
                 if len(tempMessageData) == 0:
-                    # This appears to work for TCP
-                    tempMessageData = data[i].load
+                    # No payload (SYN/ACK/etc), keep going
+                    continue
 
                 if newMessageDirection == lastMessageDirection:
                     if args.force:
@@ -160,9 +247,6 @@ with open(inputFilePath, 'r') as inputFile:
                 fuzzerData.messageCollection.addMessage(message)
                 j += 1
                 print "\tMessage #%d - Processed %d bytes %s" % (j, len(message.getOriginalMessage()), message.direction)
-            except AttributeError:
-                # No payload, keep going (different from empty payload)
-                continue
     except Exception as rdpcap_e:
         print str(rdpcap_e)
         print "Processing as c_array..."
@@ -327,7 +411,7 @@ def promptAndOutput(outputMessageNum, autogenerateAllClient=False):
 
 
     outputFilePath = "{0}-{1}.fuzzer".format(os.path.splitext(inputFilePath)[0], outputFilenameEnd)
-    actualPath = fuzzerData.writeToFile(outputFilePath, defaultComments=True, finalMessageNum=finalMessageNum)
+    actualPath = fuzzerData.writeToFile(outputFilePath, defaultComments=True, finalMessageNum=finalMessageNum, blobThreshold=args.blob_threshold)
     print GREEN
     print "Wrote .fuzzer file: {0}".format(actualPath)
     print CLEAR
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# November 2014, created within ASIG
+# Author James Spadaro (jaspadar)
+# Co-Author Lilith Wyatt (liwyatt)
+#------------------------------------------------------------------
+# Copyright (c) 2014-2017 by Cisco Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Cisco Systems, Inc. nor the
+#    names of its contributors may be used to endorse or promote products
+#    derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#------------------------------------------------------------------
+#
+# Seed statistics: runs radamsa over a range of seeds for each fuzzed part
+# of a .fuzzer file (or for raw input files) and reports how many of the
+# outputs are duplicates, how long they are and which mutations made them,
+# for picking seed ranges that don't waste runs on repeats
+#
+#------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import sys
+
+from backend.seed_set import SeedSet
+from backend.seedstats import analyzeInputs, getInputsFromFile
+
+# Same radamsa as mutiny.py
+RADAMSA = os.path.abspath(os.path.join(__file__, "../radamsa-0.3/bin/radamsa"))
+
+def printReport(report):
+    print "%s (%d bytes)" % (report["input"], report["inputLength"])
+    print "\t%d runs, %d unique, %d duplicates (%.2f%%)" % (report["runs"], report["unique"], report["duplicates"], report["duplicateRate"] * 100)
+    outputLength = report["outputLength"]
+    print "\tOutput length: min %d, median %d, p99 %d, max %d, mean %.1f" % (outputLength["min"], outputLength["p50"], outputLength["p99"], outputLength["max"], outputLength["mean"])
+    for bucket in outputLength["distribution"]:
+        print "\t\t%12s bytes: %d" % (bucket["lengths"], bucket["count"])
+    if report["operators"] is not None:
+        operators = sorted(report["operators"].items(), key=lambda item: -item[1])
+        print "\tMutations: %s" % (", ".join("%s %d" % operator for operator in operators))
+    worst = sorted(report["duplicateRateBySeeds"], key=lambda bucket: -bucket["duplicateRate"])[:5]
+    print "\tMost duplicated seed ranges: %s" % (", ".join("%s %.2f%%" % (bucket["seeds"], bucket["duplicateRate"] * 100) for bucket in worst))
+
+if __name__ == "__main__":
+    if len(sys.argv) == 1:
+        sys.argv.append("-h")
+
+    parser = argparse.ArgumentParser(description="Report duplicate rate, output lengths and mutation mix of radamsa over a seed range")
+    parser.add_argument("inputs", help=".fuzzer files (their fuzzed subcomponents are used) or raw input files", nargs="+")
+    parser.add_argument("-r", "--range", help="Seeds to run, e.g. 0-99999 or 0-999,5000-5999", default="0-9999")
+    parser.add_argument("-j", "--jobs", help="Number of radamsa worker processes, defaults to CPU count", type=int, default=None)
+    parser.add_argument("--bloom", help="Track outputs in a Bloom filter with this false positive rate (e.g. 0.001) rather than exactly, to bound memory on huge ranges", type=float, default=None)
+    parser.add_argument("--operators", help="Ask radamsa (--meta) which mutations it used for each output", action="store_true")
+    parser.add_argument("--bucket", help="Seeds per range in the duplicate rate by seed range", type=int, default=1000)
+    parser.add_argument("--radamsa", help="radamsa binary to use", default=RADAMSA)
+    parser.add_argument("-o", "--output", help="Also write the full report as JSON here")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.radamsa):
+        sys.exit("Could not find radamsa in %s... did you build it?" % args.radamsa)
+    seeds = SeedSet.parse(args.range)
+    if not seeds or seeds.isUnbounded():
+        sys.exit("Invalid seed range given: %s" % args.range)
+
+    inputs = []
+    for inputPath in args.inputs:
+        inputs.extend(getInputsFromFile(inputPath))
+    if not inputs:
+        sys.exit("Nothing to mutate, no fuzzed messages in %s" % (", ".join(args.inputs)))
+
+    stats = analyzeInputs(inputs, seeds, args.radamsa, args.jobs, args.bloom, args.operators, args.bucket)
+    reports = [inputStats.getReport() for inputStats in stats]
+    for report in reports:
+        printReport(report)
+
+    if args.output:
+        with open(args.output, "w") as outputFile:
+            json.dump({"radamsa": args.radamsa, "seeds": args.range, "bloomErrorRate": args.bloom, "inputs": reports}, outputFile, indent=2, separators=(",", ": "), sort_keys=True)
+            outputFile.write("\n")
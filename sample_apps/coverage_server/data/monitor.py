@@ -0,0 +1,12 @@
+#------------------------------------------------------------------
+# Launches the coverage_server sample target (build it first with make in
+# ../source) so it inherits the coverage bitmap from mutiny.py --coverage,
+# and restarts it if it dies
+#------------------------------------------------------------------
+
+import os
+from mutiny_classes.builtin_monitors import ProcessMonitor
+
+SOURCE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "source")
+
+MONITORS = [ProcessMonitor(os.path.join(SOURCE_DIRECTORY, "server"), cwd=SOURCE_DIRECTORY)]
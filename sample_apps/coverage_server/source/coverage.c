@@ -0,0 +1,79 @@
+/*
+ * Minimal SanitizerCoverage runtime for Mutiny's --coverage mode
+ *
+ * Link this (built WITHOUT -fsanitize-coverage) into a target built with
+ * -fsanitize-coverage=trace-pc (gcc or clang) or trace-pc-guard (clang).
+ * Edge hit counts go into the shared memory bitmap Mutiny names in
+ * MUTINY_SHM_NAME/MUTINY_SHM_SIZE, or a private dummy bitmap if the target
+ * wasn't launched by Mutiny.
+ */
+
+#include <fcntl.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <sys/mman.h>
+#include <unistd.h>
+
+static uint8_t dummyMap[1 << 16];
+static uint8_t *coverageMap = dummyMap;
+static size_t coverageSize = sizeof(dummyMap);
+static __thread uintptr_t previousLocation;
+
+__attribute__((constructor)) static void mapCoverage(void)
+{
+	const char *name = getenv("MUTINY_SHM_NAME");
+	const char *sizeString = getenv("MUTINY_SHM_SIZE");
+	size_t size = sizeString ? strtoul(sizeString, NULL, 10) : sizeof(dummyMap);
+	void *map;
+	int fd;
+
+	if (!name || !size)
+		return;
+	fd = shm_open(name, O_RDWR, 0);
+	if (fd < 0) {
+		perror("coverage: shm_open");
+		return;
+	}
+	map = mmap(NULL, size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+	close(fd);
+	if (map == MAP_FAILED) {
+		perror("coverage: mmap");
+		return;
+	}
+	coverageSize = size;
+	coverageMap = map;
+}
+
+/* Like AFL, an edge is the previous location combined with this one */
+static inline void hitLocation(uintptr_t location)
+{
+	coverageMap[(location ^ previousLocation) % coverageSize]++;
+	previousLocation = location >> 1;
+}
+
+/* -fsanitize-coverage=trace-pc: called at every edge with nothing but the caller's address */
+void __sanitizer_cov_trace_pc(void)
+{
+	uintptr_t location = (uintptr_t)__builtin_return_address(0);
+
+	hitLocation((location >> 4) ^ (location << 8));
+}
+
+/* -fsanitize-coverage=trace-pc-guard: every edge gets its own guard, numbered here */
+void __sanitizer_cov_trace_pc_guard_init(uint32_t *start, uint32_t *stop)
+{
+	static uint32_t nextGuard = 1;
+	uint32_t *guard;
+
+	if (start == stop || *start)
+		return;
+	for (guard = start; guard < stop; guard++)
+		*guard = nextGuard++;
+}
+
+void __sanitizer_cov_trace_pc_guard(uint32_t *guard)
+{
+	if (*guard)
+		hitLocation(*guard * 2654435761u);
+}
@@ -0,0 +1,183 @@
+/*
+ * C stand-in for sample_apps/server, built with SanitizerCoverage so
+ * Mutiny's --coverage mode has something to measure
+ *
+ * Line based, one client at a time on 127.0.0.1:2500:
+ *   auth <user>         -> OK
+ *   set <key> <number>  -> OK (decimal, 0x hex or negative)
+ *   get <key>           -> VALUE <number> or NOTFOUND
+ *   quit                -> BYE
+ * Anything else, or anything but auth before authenticating, gets INVALID
+ */
+
+#include <arpa/inet.h>
+#include <ctype.h>
+#include <netinet/in.h>
+#include <signal.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/socket.h>
+#include <unistd.h>
+
+#define HOST "127.0.0.1"
+#define PORT 2500
+#define BUFFER_SIZE 1024
+#define MAX_KEYS 8
+#define MAX_KEY_LENGTH 32
+
+struct entry {
+	char key[MAX_KEY_LENGTH + 1];
+	long value;
+};
+
+struct session {
+	int isAuthenticated;
+	int keyCount;
+	struct entry entries[MAX_KEYS];
+};
+
+static int parseNumber(const char *string, long *value)
+{
+	int isNegative = 0;
+	int base = 10;
+	long result = 0;
+
+	if (*string == '-') {
+		isNegative = 1;
+		string++;
+	}
+	if (string[0] == '0' && (string[1] == 'x' || string[1] == 'X')) {
+		base = 16;
+		string += 2;
+	}
+	if (!*string)
+		return -1;
+	for (; *string; string++) {
+		int digit;
+
+		if (isdigit((unsigned char)*string))
+			digit = *string - '0';
+		else if (base == 16 && isxdigit((unsigned char)*string))
+			digit = tolower((unsigned char)*string) - 'a' + 10;
+		else
+			return -1;
+		result = result * base + digit;
+	}
+	*value = isNegative ? -result : result;
+	return 0;
+}
+
+static struct entry *findEntry(struct session *session, const char *key)
+{
+	int i;
+
+	for (i = 0; i < session->keyCount; i++) {
+		if (!strcmp(session->entries[i].key, key))
+			return &session->entries[i];
+	}
+	return NULL;
+}
+
+static const char *setValue(struct session *session, const char *key, const char *valueString)
+{
+	struct entry *entry;
+	long value;
+
+	if (strlen(key) > MAX_KEY_LENGTH || parseNumber(valueString, &value))
+		return "INVALID\n";
+	entry = findEntry(session, key);
+	if (!entry) {
+		if (session->keyCount == MAX_KEYS)
+			return "FULL\n";
+		entry = &session->entries[session->keyCount++];
+		strcpy(entry->key, key);
+	}
+	entry->value = value;
+	return "OK\n";
+}
+
+/* Returns the response, NULL when the client quit */
+static const char *handleLine(struct session *session, char *line, char *response)
+{
+	char *command = strtok(line, " ");
+	char *argument = strtok(NULL, " ");
+	char *extra = strtok(NULL, " ");
+	struct entry *entry;
+
+	if (!command)
+		return "INVALID\n";
+	if (!session->isAuthenticated) {
+		if (!strcmp(command, "auth") && argument && !extra && isalpha((unsigned char)argument[0])) {
+			session->isAuthenticated = 1;
+			return "OK\n";
+		}
+		return "INVALID\n";
+	}
+	if (!strcmp(command, "set") && argument && extra)
+		return setValue(session, argument, extra);
+	if (!strcmp(command, "get") && argument && !extra) {
+		entry = findEntry(session, argument);
+		if (!entry)
+			return "NOTFOUND\n";
+		snprintf(response, BUFFER_SIZE, "VALUE %ld\n", entry->value);
+		return response;
+	}
+	if (!strcmp(command, "quit") && !argument)
+		return NULL;
+	return "INVALID\n";
+}
+
+static void handleClient(int connection)
+{
+	struct session session;
+	char buffer[BUFFER_SIZE + 1];
+	char response[BUFFER_SIZE];
+	const char *reply;
+	ssize_t length;
+
+	memset(&session, 0, sizeof(session));
+	while ((length = recv(connection, buffer, BUFFER_SIZE, 0)) > 0) {
+		buffer[length] = '\0';
+		while (length > 0 && isspace((unsigned char)buffer[length - 1]))
+			buffer[--length] = '\0';
+		reply = handleLine(&session, buffer, response);
+		if (!reply) {
+			send(connection, "BYE\n", 4, 0);
+			break;
+		}
+		send(connection, reply, strlen(reply), 0);
+	}
+}
+
+int main(void)
+{
+	struct sockaddr_in address;
+	int listener;
+	int connection;
+	int enable = 1;
+
+	signal(SIGPIPE, SIG_IGN);
+	listener = socket(AF_INET, SOCK_STREAM, 0);
+	if (listener < 0) {
+		perror("socket");
+		return 1;
+	}
+	/* So it can be restarted straight away, e.g. by a ProcessMonitor */
+	setsockopt(listener, SOL_SOCKET, SO_REUSEADDR, &enable, sizeof(enable));
+	memset(&address, 0, sizeof(address));
+	address.sin_family = AF_INET;
+	address.sin_port = htons(PORT);
+	inet_pton(AF_INET, HOST, &address.sin_addr);
+	if (bind(listener, (struct sockaddr *)&address, sizeof(address)) || listen(listener, 1)) {
+		perror("bind/listen");
+		return 1;
+	}
+	for (;;) {
+		connection = accept(listener, NULL, NULL);
+		if (connection < 0)
+			continue;
+		handleClient(connection);
+		close(connection);
+	}
+}
@@ -12,6 +12,8 @@ STATES = ("Listening", "Authenticated", "Quit")
 STATE_COMMANDS = ("auth", "quit", "do_stuff")
 
 s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+# So it can be restarted straight away, e.g. by tests/benchmark/benchmark.py
+s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 s.bind((HOST, PORT))
 s.listen(1)
 
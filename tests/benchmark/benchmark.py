@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# Throughput benchmark: fuzzes the sample apps on loopback with a fixed
+# range of seeds through each engine mode, reporting runs/sec, run latency
+# and peak memory as JSON, so results can be compared between commits
+#
+# Needs radamsa built for each engine mode, see the readme
+#
+#------------------------------------------------------------------
+
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+REPO_DIR = os.path.abspath(os.path.join(__file__, "../../.."))
+sys.path.append(REPO_DIR)
+from microbenchmarks import runMicrobenchmarks
+
+# (name, server script, folder with the .fuzzer and its processors, .fuzzer file)
+APPS = [
+    ("server", "sample_apps/server/source/server.py", "sample_apps/server/data", "server-0.fuzzer"),
+    ("session_server", "sample_apps/session_server/source/server.py", "sample_apps/session_server/data", "session_server-3.fuzzer"),
+    ("subcomponent_server", "sample_apps/subcomponent_server/source/server.py", "sample_apps/subcomponent_server/data", "subcomponent-0.fuzzer"),
+]
+
+ENGINES = {
+    "mutiny": "mutiny.py",
+    "classy": "mutiny_classy.py",
+}
+
+# The sample apps all listen here
+TARGET_HOST = "127.0.0.1"
+TARGET_PORT = 2500
+
+def waitForPort(host, port, timeout):
+    endTime = time.time() + timeout
+    while time.time() < endTime:
+        try:
+            socket.create_connection((host, port), 0.5).close()
+            return True
+        except socket.error:
+            time.sleep(0.05)
+    return False
+
+def getCommit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, stderr=open(os.devnull, "w")).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Fuzz one app with one engine, returns the result for the JSON
+def benchmarkApp(app, engine, runs, timeout):
+    (name, serverScript, dataDirectory, fuzzerFileName) = app
+    result = {"app": name, "engine": engine, "runs": runs}
+    # Work on a copy so the logs (and the stats.json we want) don't end up in the repo
+    workDirectory = tempfile.mkdtemp(prefix="mutiny_benchmark_")
+    devNull = open(os.devnull, "w")
+    server = None
+    try:
+        shutil.copytree(os.path.join(REPO_DIR, dataDirectory), os.path.join(workDirectory, "data"))
+        fuzzerFilePath = os.path.join(workDirectory, "data", fuzzerFileName)
+
+        server = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, serverScript)], stdout=devNull, stderr=devNull)
+        if not waitForPort(TARGET_HOST, TARGET_PORT, 10):
+            result["error"] = "%s never started listening on port %d" % (name, TARGET_PORT)
+            return result
+
+        stderrPath = os.path.join(workDirectory, "stderr.txt")
+        with open(stderrPath, "w") as stderrFile:
+            startTime = time.time()
+            fuzzer = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, ENGINES[engine]), fuzzerFilePath, TARGET_HOST, "-r", "0-%d" % (runs - 1)], stdout=devNull, stderr=stderrFile, cwd=workDirectory)
+            killTimer = threading.Timer(timeout, fuzzer.kill)
+            killTimer.start()
+            # wait4() rather than wait() to get the fuzzer's own peak RSS (or
+            # that of its biggest child, e.g. radamsa)
+            (pid, status, usage) = os.wait4(fuzzer.pid, 0)
+            killTimer.cancel()
+            result["wallSeconds"] = time.time() - startTime
+        result["exitStatus"] = status
+        # Kilobytes on Linux
+        result["peakRssKb"] = usage.ru_maxrss
+
+        statsFilePaths = glob.glob(os.path.join(workDirectory, "data", "*_logs", "*", "stats.json"))
+        if not statsFilePaths:
+            with open(stderrPath) as stderrFile:
+                errorLines = stderrFile.read().strip().splitlines()
+            result["error"] = errorLines[-1] if errorLines else "No stats.json written, exit status %d" % (status)
+            return result
+        with open(statsFilePaths[0]) as statsFile:
+            stats = json.load(statsFile)
+        result["completedRuns"] = stats["runs"]
+        result["runsPerSecond"] = stats["runsPerSecond"]
+        result["p50"] = stats["phases"]["run"]["p50"]
+        result["p99"] = stats["phases"]["run"]["p99"]
+        result["outcomes"] = stats["outcomes"]
+        result["phases"] = dict((phase, {"p50": summary["p50"], "p99": summary["p99"], "share": summary["share"]}) for (phase, summary) in stats["phases"].items())
+        return result
+    finally:
+        if server:
+            server.kill()
+            server.wait()
+        devNull.close()
+        shutil.rmtree(workDirectory)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Mutiny against the sample apps, results as JSON")
+    parser.add_argument("--runs", help="Seeds to run against each app (0 to runs-1)", type=int, default=100)
+    parser.add_argument("--engines", help="Comma separated engine modes, from %s" % (", ".join(sorted(ENGINES))), default=",".join(sorted(ENGINES)))
+    parser.add_argument("--apps", help="Comma separated sample apps, from %s" % (", ".join(app[0] for app in APPS)), default=",".join(app[0] for app in APPS))
+    parser.add_argument("--timeout", help="Seconds to give each app/engine pair", type=float, default=600)
+    parser.add_argument("--mutator_iterations", help="Radamsa runs per engine mode in the mutator microbenchmark, 0 to skip", type=int, default=200)
+    parser.add_argument("--parser_iterations", help="Times to read/write each sample .fuzzer in the parser microbenchmark, 0 to skip", type=int, default=2000)
+    parser.add_argument("-o", "--output", help="Write the JSON here rather than stdout")
+    args = parser.parse_args()
+
+    engines = args.engines.split(",")
+    apps = [app for app in APPS if app[0] in args.apps.split(",")]
+    for engine in engines:
+        if engine not in ENGINES:
+            sys.exit("Unknown engine mode %s" % (engine))
+
+    results = {
+        "commit": getCommit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "apps": [],
+    }
+    for app in apps:
+        for engine in engines:
+            sys.stderr.write("Benchmarking %s with %s...\n" % (app[0], engine))
+            results["apps"].append(benchmarkApp(app, engine, args.runs, args.timeout))
+    if args.mutator_iterations or args.parser_iterations:
+        sys.stderr.write("Running microbenchmarks...\n")
+        results["microbenchmarks"] = runMicrobenchmarks(args.mutator_iterations, args.parser_iterations)
+
+    text = json.dumps(results, indent=2, separators=(",", ": "), sort_keys=True) + "\n"
+    if args.output:
+        with open(args.output, "w") as outputFile:
+            outputFile.write(text)
+    else:
+        sys.stdout.write(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# Mutator-only and parser-only benchmarks, without a target or network
+# Run on their own or as part of benchmark.py
+#
+#------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from StringIO import StringIO
+
+REPO_DIR = os.path.abspath(os.path.join(__file__, "../../.."))
+sys.path.append(REPO_DIR)
+from backend.fuzzerdata import FuzzerData
+from backend.stats import LatencyHistogram
+
+# Radamsa each engine mode uses, same paths as in mutiny.py/mutiny_classy.py
+RADAMSA = {
+    "mutiny": os.path.join(REPO_DIR, "radamsa-0.3/bin/radamsa"),
+    "classy": os.path.join(REPO_DIR, "radamsa-v0.6/bin/radamsa"),
+}
+
+SAMPLE_FUZZERS = [
+    os.path.join(REPO_DIR, "sample_apps/server/data/server-0.fuzzer"),
+    os.path.join(REPO_DIR, "sample_apps/session_server/data/session_server-3.fuzzer"),
+    os.path.join(REPO_DIR, "sample_apps/subcomponent_server/data/subcomponent-0.fuzzer"),
+]
+
+def summarize(histogram, elapsed):
+    return {
+        "count": histogram.count,
+        "perSecond": histogram.count / elapsed if elapsed > 0 else 0.0,
+        "mean": histogram.getMean(),
+        "p50": histogram.getPercentile(50),
+        "p99": histogram.getPercentile(99),
+    }
+
+# The subcomponents the sample .fuzzer files mark to be fuzzed
+def getFuzzedInputs():
+    inputs = []
+    for fuzzerFilePath in SAMPLE_FUZZERS:
+        fuzzerData = FuzzerData()
+        fuzzerData.readFromFile(fuzzerFilePath, quiet=True)
+        for message in fuzzerData.messageCollection.messages:
+            for subcomponent in message.subcomponents:
+                if subcomponent.isFuzzed:
+                    inputs.append(subcomponent.getOriginalByteArray())
+    return inputs
+
+# Runs radamsa the way performRun() does, one process per case
+def benchmarkMutator(radamsaPath, iterations):
+    inputs = getFuzzedInputs()
+    histogram = LatencyHistogram()
+    startTime = time.time()
+    for seed in range(iterations):
+        caseStartTime = time.time()
+        radamsa = subprocess.Popen([radamsaPath, "--seed", str(seed)], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        radamsa.communicate(input=inputs[seed % len(inputs)])
+        histogram.record(time.time() - caseStartTime)
+    return summarize(histogram, time.time() - startTime)
+
+# Reading and writing the sample .fuzzer files
+def benchmarkParser(iterations):
+    readHistogram = LatencyHistogram()
+    writeHistogram = LatencyHistogram()
+    readTime = 0.0
+    writeTime = 0.0
+    for i in range(iterations):
+        for fuzzerFilePath in SAMPLE_FUZZERS:
+            startTime = time.time()
+            fuzzerData = FuzzerData()
+            fuzzerData.readFromFile(fuzzerFilePath, quiet=True)
+            elapsed = time.time() - startTime
+            readHistogram.record(elapsed)
+            readTime += elapsed
+
+            startTime = time.time()
+            fuzzerData.writeToFD(StringIO())
+            elapsed = time.time() - startTime
+            writeHistogram.record(elapsed)
+            writeTime += elapsed
+    return {
+        "read": summarize(readHistogram, readTime),
+        "write": summarize(writeHistogram, writeTime),
+    }
+
+def runMicrobenchmarks(mutatorIterations, parserIterations):
+    results = {"mutator": {}, "parser": benchmarkParser(parserIterations)}
+    for (engine, radamsaPath) in sorted(RADAMSA.items()):
+        if os.path.exists(radamsaPath):
+            results["mutator"][engine] = benchmarkMutator(radamsaPath, mutatorIterations)
+        else:
+            results["mutator"][engine] = {"error": "Could not find radamsa in %s" % (radamsaPath)}
+    # Kilobytes on Linux
+    results["peakRssKb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mutator and parser microbenchmarks, results as JSON")
+    parser.add_argument("--mutator_iterations", help="Radamsa runs per engine mode", type=int, default=200)
+    parser.add_argument("--parser_iterations", help="Times to read/write each sample .fuzzer file", type=int, default=2000)
+    parser.add_argument("-o", "--output", help="Write the JSON here rather than stdout")
+    args = parser.parse_args()
+
+    results = runMicrobenchmarks(args.mutator_iterations, args.parser_iterations)
+    text = json.dumps(results, indent=2, separators=(",", ": "), sort_keys=True) + "\n"
+    if args.output:
+        with open(args.output, "w") as outputFile:
+            outputFile.write(text)
+    else:
+        sys.stdout.write(text)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# Test running several fuzzers at once with Campaign
+#
+#------------------------------------------------------------------
+
+import StringIO
+import sys
+import threading
+import time
+sys.path.append("../..")
+from backend.campaign import Campaign
+from backend.crash_events import CrashEvent, CrashTriage, RunHistory
+
+class Color:
+   GREEN = '\033[92m'
+   RED = '\033[91m'
+   END = '\033[0m'
+
+def printResult(message, isPass):
+    if isPass:
+        resultStr = "Pass"
+        resultColor = Color.GREEN
+    else:
+        resultStr = "Fail"
+        resultColor = Color.RED
+    
+    print("\n{}: {}{}{}\n".format(message, resultColor, resultStr, Color.END))
+
+# Stands in for MutinyFuzzer, each run taking runTime
+class FakeFuzzer(object):
+    def __init__(self, name, runTime, maxRuns, findEvery=0, failAt=None):
+        self.fuzzerFilePath = name
+        self.runTime = runTime
+        self.maxRuns = maxRuns
+        self.findEvery = findEvery
+        self.failAt = failAt
+        self.runCount = 0
+        self.activeRuns = 0
+        self.maxActiveRuns = 0
+        self.finishTime = None
+        # Other fuzzers, and how many runs they'd had when this one finished
+        self.peers = []
+        self.peerRunCounts = None
+        self._lock = threading.Lock()
+
+    def getFindCount(self):
+        return self.runCount // self.findEvery if self.findEvery else 0
+
+    def fuzz(self):
+        with self._lock:
+            self.activeRuns += 1
+            self.maxActiveRuns = max(self.maxActiveRuns, self.activeRuns)
+        time.sleep(self.runTime)
+        with self._lock:
+            self.activeRuns -= 1
+        self.runCount += 1
+        if self.runCount == self.failAt:
+            raise ValueError("Broken processor")
+        if self.runCount >= self.maxRuns:
+            self.finishTime = time.time()
+            self.peerRunCounts = [peer.runCount for peer in self.peers]
+            exit()
+
+def testConcurrency():
+    # A slow target doesn't hold the others up
+    slow = FakeFuzzer("slow.fuzzer", 0.5, 2)
+    fast = [FakeFuzzer("fast-%d.fuzzer" % (n), 0.01, 20) for n in range(3)]
+    startTime = time.time()
+    Campaign([slow] + fast).run()
+    isPass = all(fuzzer.runCount == 20 and fuzzer.finishTime - startTime < 0.6 for fuzzer in fast) and slow.runCount == 2
+    # ...and no fuzzer ever has two runs at once
+    isPass = isPass and all(fuzzer.maxActiveRuns == 1 for fuzzer in [slow] + fast)
+    printResult("Campaign Concurrency Test", isPass)
+
+def testIsolation():
+    # One fuzzer raising or exiting doesn't stop the rest
+    broken = FakeFuzzer("broken.fuzzer", 0.001, 100, failAt=3)
+    finished = FakeFuzzer("finished.fuzzer", 0.001, 5)
+    survivor = FakeFuzzer("survivor.fuzzer", 0.001, 50)
+    # The broken one's traceback gets printed
+    sys.stderr = StringIO.StringIO()
+    try:
+        Campaign([broken, finished, survivor], jobs=2).run()
+        errors = sys.stderr.getvalue()
+    finally:
+        sys.stderr = sys.__stderr__
+    isPass = broken.runCount == 3 and finished.runCount == 5 and survivor.runCount == 50
+    printResult("Campaign Isolation Test", isPass and "ValueError: Broken processor" in errors)
+
+def testWeights():
+    # With one job, run time is shared out by weight
+    light = FakeFuzzer("light.fuzzer", 0.002, 60)
+    heavy = FakeFuzzer("heavy.fuzzer", 0.002, 120)
+    heavy.peers = [light]
+    Campaign([light, heavy], jobs=1, weights={heavy: 3}).run()
+    print("\tlight had {0} runs when heavy finished 120".format(heavy.peerRunCounts[0]))
+    isPass = 30 <= heavy.peerRunCounts[0] <= 50
+
+    # ...and by finds per run, with useYield
+    barren = FakeFuzzer("barren.fuzzer", 0.002, 400)
+    fruitful = FakeFuzzer("fruitful.fuzzer", 0.002, 400, findEvery=2)
+    fruitful.peers = [barren]
+    Campaign([barren, fruitful], jobs=1, useYield=True).run()
+    print("\tbarren had {0} runs when fruitful finished 400".format(fruitful.peerRunCounts and fruitful.peerRunCounts[0]))
+    isPass = isPass and fruitful.peerRunCounts is not None and fruitful.peerRunCounts[0] < 200
+    printResult("Campaign Weights Test", isPass)
+
+def testExclusiveTasks():
+    fuzzers = [FakeFuzzer("fuzzer-%d.fuzzer" % (n), 0.005, 30) for n in range(3)]
+    campaign = Campaign(fuzzers)
+    activeRunCounts = []
+    def task():
+        activeRunCounts.append(sum(fuzzer.activeRuns for fuzzer in fuzzers))
+    # Queued from inside a run, as a fuzzer that's seen a crash would
+    fuzz = fuzzers[0].fuzz
+    def fuzzAndQueue():
+        if fuzzers[0].runCount in (5, 10):
+            campaign.runExclusive(task)
+        fuzz()
+    fuzzers[0].fuzz = fuzzAndQueue
+    campaign.run()
+    printResult("Campaign Exclusive Task Test", activeRunCounts == [0, 0] and all(fuzzer.runCount == 30 for fuzzer in fuzzers))
+
+def testCrashTriage():
+    runHistory = RunHistory(window=0.05)
+    triage = CrashTriage(runHistory)
+    # a's run 1 is the one that crashes the target, b's runs overlap it
+    runs = {}
+    for (ownerName, runNumber) in (("a.fuzzer", 0), ("b.fuzzer", 0), ("a.fuzzer", 1), ("b.fuzzer", 1)):
+        runs[(ownerName, runNumber)] = runHistory.startRun(runNumber, runNumber, ownerName)
+    # Long enough ago that a's run 0 isn't a candidate, though b's run 0 is still going
+    runHistory.endRun(runs[("a.fuzzer", 0)])
+    time.sleep(0.1)
+    runHistory.endRun(runs[("a.fuzzer", 1)])
+    crashEvent = CrashEvent("TestMonitor")
+    isPass = runHistory.getLastRuns(1, "b.fuzzer") == [runs[("b.fuzzer", 1)]]
+    isPass = isPass and "a.fuzzer run 1 (seed 1)" in str(runs[("a.fuzzer", 1)])
+
+    triage.addCrashEvent(crashEvent, "b.fuzzer")
+    replayed = []
+    def replayRun(run):
+        replayed.append(run)
+        return run is runs[("a.fuzzer", 1)]
+    results = triage.triage(replayRun)
+    (event, reporterName, candidates, confirmedRuns) = results[0]
+    isPass = isPass and event is crashEvent and reporterName == "b.fuzzer" and not triage.hasPending()
+    isPass = isPass and set(candidates) == set([runs[("b.fuzzer", 0)], runs[("a.fuzzer", 1)], runs[("b.fuzzer", 1)]])
+    # Replayed oldest first, each once, and only the guilty run confirmed
+    isPass = isPass and replayed == list(reversed(candidates)) and confirmedRuns == [runs[("a.fuzzer", 1)]]
+    isPass = isPass and triage.triage(replayRun) == []
+    printResult("Crash Triage Test", isPass)
+
+testConcurrency()
+testIsolation()
+testWeights()
+testExclusiveTasks()
+testCrashTriage()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# Test checkpoints and --resume: what's saved and restored, and that a
+# resumed session carries on with exactly the seeds that are left
+#
+#------------------------------------------------------------------
+
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+sys.path.append("../..")
+from backend.checkpoint import CHECKPOINT_FILE_NAME, Checkpointer, findLatestSession, readCheckpoint
+from backend.corpus import Corpus
+from backend.coverage import CoverageMap
+from backend.fuzzer_types import Message
+from backend.scheduler import PowerScheduler
+from backend.seed_set import SeedSet
+from backend.stats import StatsCollector
+
+class Color:
+   GREEN = '\033[92m'
+   RED = '\033[91m'
+   END = '\033[0m'
+
+def printResult(message, isPass):
+    if isPass:
+        resultStr = "Pass"
+        resultColor = Color.GREEN
+    else:
+        resultStr = "Fail"
+        resultColor = Color.RED
+    
+    print("\n{}: {}{}{}\n".format(message, resultColor, resultStr, Color.END))
+
+RADAMSA = os.path.abspath(os.path.join(__file__, "../../../radamsa-0.3/bin/radamsa"))
+
+def makeFuzzedMessage(data):
+    message = Message()
+    message.direction = Message.Direction.Outbound
+    message.setMessageFrom(Message.Format.Raw, bytearray("prefix"), False)
+    message.appendMessageFrom(Message.Format.Raw, bytearray(data), True)
+    return message
+
+# A run the way performRun() goes through it, returns the new entry if any
+def runThroughCorpus(corpus, seed, fuzzedData, response, hasNewCoverage=False):
+    message = makeFuzzedMessage("cmd")
+    base = corpus.startRun(seed)
+    message.resetAlteredMessage()
+    corpus.applyBase(0, message)
+    message.subcomponents[1].setAlteredByteArray(bytearray(fuzzedData))
+    corpus.addFuzzed(0, message)
+    corpus.setHighestMessageNumber(0)
+    corpus.addResponse(1, bytearray(response))
+    corpus.setHighestMessageNumber(1)
+    return corpus.endRun(hasNewCoverage)
+
+# Stands in for the target counting edges
+def runWithHits(coverageMap, hits):
+    coverageMap.startRun()
+    for (index, count) in hits.items():
+        coverageMap._map[index] = chr(count)
+    return coverageMap.endRun()
+
+def testCheckpoint():
+    tempDir = tempfile.mkdtemp()
+    try:
+        corpusDirectory = os.path.join(tempDir, "test_corpus")
+        sessionDirectory = os.path.join(tempDir, "test_logs", "2016-01-01,000000")
+        os.makedirs(sessionDirectory)
+        def makeComponents():
+            scheduler = PowerScheduler(baseEnergy=2)
+            return {"scheduler": scheduler, "corpus": Corpus(corpusDirectory, scheduler), "coverage": CoverageMap(size=64), "stats": StatsCollector(0), "doneSeeds": SeedSet()}
+        components = makeComponents()
+        runState = {"runNumber": 0, "failureCount": 0}
+        checkpointer = Checkpointer(sessionDirectory, lambda: runState, ["test.fuzzer", "localhost"])
+        for (name, component) in components.items():
+            checkpointer.add(name, component)
+        for seed in range(-1, 12):
+            hasNewCoverage = runWithHits(components["coverage"], {seed % 5: 1})
+            components["stats"].record("run", 0.001)
+            components["stats"].recordOutcome(StatsCollector.OUTCOME_OK)
+            runThroughCorpus(components["corpus"], seed, "cmd%d" % (seed % 3), "OK %d\n" % (seed % 4), hasNewCoverage)
+            if seed >= 0:
+                components["doneSeeds"].add(seed)
+            runState["runNumber"] = seed + 1
+        checkpointer.save()
+
+        # A new session picks everything up from the checkpoint
+        isPass = findLatestSession(os.path.join(tempDir, "test_logs")) == sessionDirectory
+        checkpoint = readCheckpoint(sessionDirectory)
+        restoredComponents = makeComponents()
+        restorer = Checkpointer(sessionDirectory, lambda: None)
+        for (name, component) in restoredComponents.items():
+            restorer.add(name, component)
+        isPass = isPass and restorer.restore(checkpoint) == {"runNumber": 12, "failureCount": 0} and checkpoint["argv"] == ["test.fuzzer", "localhost"]
+        for name in ("scheduler", "corpus", "coverage", "doneSeeds"):
+            isPass = isPass and restoredComponents[name].getState() == components[name].getState()
+        isPass = isPass and str(restoredComponents["doneSeeds"]) == "0-11"
+        isPass = isPass and restoredComponents["stats"].runCount == 13 and restoredComponents["stats"].phases["run"].count == 13
+        # ...and makes the same choices the old one would have
+        getEntryId = lambda entry: entry.entryId if entry else None
+        isPass = isPass and [getEntryId(restoredComponents["scheduler"].next()) for _ in range(10)] == [getEntryId(components["scheduler"].next()) for _ in range(10)]
+        print("\t{0} entries, {1} edges restored".format(len(restoredComponents["corpus"].entries), restoredComponents["coverage"].edgeCount))
+        for component in (components["coverage"], restoredComponents["coverage"]):
+            component.close()
+    finally:
+        shutil.rmtree(tempDir)
+    printResult("Checkpoint Test", isPass)
+
+# Accepts connections until told to stop, answering "auth\n" and hanging up on anything else
+def targetServer(listener, received):
+    while True:
+        (connection, address) = listener.accept()
+        data = connection.recv(1024)
+        if data == "stop":
+            connection.close()
+            return
+        if data:
+            received.append(data)
+        if data == "auth\n":
+            connection.sendall("OK\n")
+        connection.close()
+
+def runMutiny(arguments):
+    process = subprocess.Popen([sys.executable, "mutiny.py"] + arguments, cwd="../..", stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    return process.communicate()[0]
+
+# Fuzzed seeds, in the order they ran
+def getSeedsRun(output):
+    return [int(line.split()[-1]) for line in output.splitlines() if line.startswith("Fuzzing with seed ")]
+
+def testResume():
+    if not os.path.exists(RADAMSA):
+        print("\nradamsa isn't built in {0}, skipping the mutiny.py --resume test\n".format(RADAMSA))
+        return
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(5)
+    received = []
+    serverThread = threading.Thread(target=targetServer, args=(listener, received))
+    serverThread.daemon = True
+    serverThread.start()
+
+    tempDir = tempfile.mkdtemp()
+    try:
+        fuzzerPath = os.path.join(tempDir, "resume.fuzzer")
+        with open(fuzzerPath, "w") as fuzzerFile:
+            fuzzerFile.write("receiveTimeout 0.5\nproto tcp\nport %d\n\noutbound fuzz 'auth\\n'\ninbound 'OK\\n'\n" % (listener.getsockname()[1]))
+        output = runMutiny(["-r", "0-2", fuzzerPath, "127.0.0.1"])
+        sessionDirectory = findLatestSession(os.path.join(tempDir, "resume_logs"))
+        checkpoint = readCheckpoint(sessionDirectory)
+        print("\tFirst session ran seeds {0}, checkpoint {1} with {2} done".format(getSeedsRun(output), checkpoint["run"], checkpoint["components"]["doneSeeds"]))
+        isPass = getSeedsRun(output) == [0, 1, 2] and checkpoint["components"]["doneSeeds"] == "0-2"
+
+        # Resuming a session that finished its range has nothing left to run
+        sentCount = len(received)
+        output = runMutiny(["--resume", sessionDirectory])
+        print("\tResuming the finished session ran seeds {0}, sending {1} messages".format(getSeedsRun(output), len(received) - sentCount))
+        isPass = isPass and getSeedsRun(output) == [] and len(received) == sentCount
+
+        # The seeds done are what counts, not the run number the checkpoint was at
+        checkpoint["run"]["runNumber"] = 0
+        checkpoint["components"]["doneSeeds"] = "0,2"
+        with open(os.path.join(sessionDirectory, CHECKPOINT_FILE_NAME), "w") as checkpointFile:
+            json.dump(checkpoint, checkpointFile)
+        output = runMutiny(["--resume", sessionDirectory])
+        checkpoint = readCheckpoint(sessionDirectory)
+        print("\tResuming with seed 1 left ran seeds {0}, checkpoint {1} with {2} done".format(getSeedsRun(output), checkpoint["run"], checkpoint["components"]["doneSeeds"]))
+        isPass = isPass and getSeedsRun(output) == [1] and checkpoint["components"]["doneSeeds"] == "0-2"
+    finally:
+        shutil.rmtree(tempDir)
+        stopper = socket.create_connection(listener.getsockname())
+        stopper.sendall("stop")
+        stopper.close()
+        serverThread.join()
+        listener.close()
+    printResult("Resume Test", isPass)
+
+testCheckpoint()
+testResume()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# Test leasing seed blocks out to workers with the coordinator
+#
+#------------------------------------------------------------------
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+sys.path.append("../..")
+from backend.coordinator import Coordinator, CoordinatorClient, CoordinatorServer, getCrashBucket
+from backend.seed_set import SeedSet
+
+class Color:
+   GREEN = '\033[92m'
+   RED = '\033[91m'
+   END = '\033[0m'
+
+def printResult(message, isPass):
+    if isPass:
+        resultStr = "Pass"
+        resultColor = Color.GREEN
+    else:
+        resultStr = "Fail"
+        resultColor = Color.RED
+    
+    print("\n{}: {}{}{}\n".format(message, resultColor, resultStr, Color.END))
+
+# Stands in for a worker's StatsCollector
+class FakeStats(object):
+    def __init__(self):
+        self.runCount = 0
+
+    def getState(self):
+        return {"runs": self.runCount, "crashes": 0}
+
+def testLeases():
+    coordinator = Coordinator(SeedSet.parse("0-9,20-24"), blockSize=6, leaseTimeout=60)
+    first = coordinator.handle({"type": "lease", "worker": "a"})
+    second = coordinator.handle({"type": "lease", "worker": "b"})
+    third = coordinator.handle({"type": "lease", "worker": "c"})
+    isPass = (first["seeds"], second["seeds"], third["seeds"]) == ("0-5", "6-9,20-21", "22-24")
+    # Everything's out, but a lease might still come back
+    isPass = isPass and coordinator.handle({"type": "lease", "worker": "d"}) == {"wait": Coordinator.WAIT_INTERVAL}
+    isPass = isPass and coordinator.handle({"type": "renew", "leaseId": first["leaseId"], "done": "0-2"}) == {"ok": True}
+    # b stops part way, so the rest of its block goes out again
+    coordinator.handle({"type": "release", "leaseId": second["leaseId"], "done": "6-8"})
+    fourth = coordinator.handle({"type": "lease", "worker": "d"})
+    isPass = isPass and fourth["seeds"] == "9,20-21"
+    isPass = isPass and coordinator.handle({"type": "renew", "leaseId": second["leaseId"], "done": "6-9"}) == {"ok": False}
+    for (lease, done) in ((first, "0-5"), (third, "22-24"), (fourth, "9,20-21")):
+        coordinator.handle({"type": "release", "leaseId": lease["leaseId"], "done": done})
+    isPass = isPass and coordinator.isFinished() and str(coordinator.doneSeeds) == "0-9,20-24"
+    isPass = isPass and coordinator.handle({"type": "lease", "worker": "a"}) == {"finished": True}
+    isPass = isPass and "error" in coordinator.handle({"type": "bogus"})
+    printResult("Coordinator Lease Test", isPass)
+
+# Workers on their own threads and connections, over a unix socket, one of
+# which disappears part way through its lease
+def testLostLeases():
+    tempDirectory = tempfile.mkdtemp()
+    Coordinator.WAIT_INTERVAL = 0.1
+    coordinator = Coordinator(SeedSet.parse("0-199"), blockSize=10, leaseTimeout=0.5)
+    server = CoordinatorServer(coordinator, os.path.join(tempDirectory, "coordinator.sock"))
+    server.start()
+    address = os.path.join(tempDirectory, "coordinator.sock")
+
+    lostClient = CoordinatorClient(address, workerName="lost")
+    lostSeeds = []
+    for n in range(4):
+        lostSeeds.append(lostClient.getSeed())
+        lostClient.finishSeed(lostSeeds[-1])
+    # It gets as far as renewing once, with the seeds it's done, then never again
+    time.sleep(0.2)
+    lostClient.maybeRenew()
+
+    runSeeds = []
+    lock = threading.Lock()
+    def work(name):
+        stats = FakeStats()
+        client = CoordinatorClient(address, stats, name)
+        while True:
+            seed = client.getSeed()
+            if seed is None:
+                break
+            time.sleep(0.005)
+            with lock:
+                runSeeds.append(seed)
+            stats.runCount += 1
+            client.finishSeed(seed)
+            client.maybeRenew()
+    workers = [threading.Thread(target=work, args=("worker-%d" % (n),)) for n in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+    server.stop()
+    # Nothing to release into, the coordinator's gone
+    lostClient.leaseId = None
+    shutil.rmtree(tempDirectory)
+
+    # The lost worker's unfinished seeds were run by the others, and nothing was dropped
+    isPass = lostSeeds == [0, 1, 2, 3] and sorted(runSeeds) == range(4, 200)
+    isPass = isPass and coordinator.isFinished() and str(coordinator.doneSeeds) == "0-199"
+    isPass = isPass and coordinator.getTotals() == (196, 0)
+    printResult("Coordinator Lost Lease Test", isPass)
+
+def testCrashesAndState():
+    coordinator = Coordinator(SeedSet.parse("0-"), blockSize=100, leaseTimeout=60)
+    isPass = getCrashBucket("ProcessMonitor: pid 4242 killed by SIGSEGV at 0x7fff0010") == "ProcessMonitor: pid N killed by SIGSEGV at N"
+    lease = coordinator.handle({"type": "lease", "worker": "a"})
+    coordinator.handle({"type": "crash", "worker": "a", "seed": 17, "description": "ProcessMonitor: pid 4242 killed by SIGSEGV"})
+    coordinator.handle({"type": "crash", "worker": "b", "seed": 503, "description": "ProcessMonitor: pid 4300 killed by SIGSEGV"})
+    coordinator.handle({"type": "crash", "worker": "b", "seed": -1, "description": "ProcessMonitor: pid 4310 killed by SIGABRT"})
+    coordinator.handle({"type": "stats", "worker": "a", "stats": {"runs": 40, "crashes": 1}})
+    coordinator.handle({"type": "stats", "worker": "b", "stats": {"runs": 60, "crashes": 2}})
+    coordinator.handle({"type": "renew", "leaseId": lease["leaseId"], "done": "0-49"})
+    segfaults = coordinator.crashBuckets["ProcessMonitor: pid N killed by SIGSEGV"]
+    isPass = isPass and len(coordinator.crashBuckets) == 2 and segfaults["count"] == 2
+    isPass = isPass and segfaults["seeds"] == "17,503" and segfaults["workers"] == ["a", "b"]
+    isPass = isPass and coordinator.getTotals() == (100, 3)
+
+    # As a checkpoint, where the lease's worker won't be coming back
+    resumed = Coordinator(SeedSet(), blockSize=1, leaseTimeout=1)
+    resumed.setState(json.loads(json.dumps(coordinator.getState())))
+    isPass = isPass and resumed.blockSize == 100 and resumed.crashBuckets == coordinator.crashBuckets and resumed.getTotals() == (100, 3)
+    isPass = isPass and resumed.handle({"type": "lease", "worker": "c"})["seeds"] == "50-149"
+    printResult("Coordinator Crash and State Test", isPass)
+
+testLeases()
+testLostLeases()
+testCrashesAndState()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# Test the shared monitor event loop and the TCP probe monitor
+#
+#------------------------------------------------------------------
+
+import errno
+import os
+import shutil
+import tempfile
+import time
+import socket
+import subprocess
+import sys
+import threading
+sys.path.append("../..")
+from backend.crash_events import CrashEvent, CrashEventQueue
+from backend.monitor_loop import EventLoop
+from mutiny_classes.builtin_monitors import LogTailMonitor, ProcessMonitor, TcpProbeMonitor
+from mutiny_classes.mutiny_exceptions import ConnectionClosedException
+
+class Color:
+   GREEN = '\033[92m'
+   RED = '\033[91m'
+   END = '\033[0m'
+
+def printResult(message, isPass):
+    if isPass:
+        resultStr = "Pass"
+        resultColor = Color.GREEN
+    else:
+        resultStr = "Fail"
+        resultColor = Color.RED
+    
+    print("\n{}: {}{}{}\n".format(message, resultColor, resultStr, Color.END))
+
+def testTimersAndReaders():
+    loop = EventLoop()
+    calls = []
+    (readFd, writeFd) = os.pipe()
+
+    def onReadable():
+        calls.append(("read", os.read(readFd, 100)))
+        loop.removeReader(readFd)
+        loop.stop()
+
+    loop.callLater(0.2, calls.append, "second")
+    loop.callLater(0.1, calls.append, "first")
+    loop.callLater(0.15, calls.append, "cancelled").cancel()
+    loop.callLater(0.25, os.write, writeFd, "ping")
+    loop.addReader(readFd, onReadable)
+    loop.run()
+    loop.close()
+    print("\t{0}".format(calls))
+    printResult("Timer/Reader Test", calls == ["first", "second", ("read", "ping")])
+
+def testTcpProbe():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(5)
+    port = listener.getsockname()[1]
+
+    loop = EventLoop()
+    crashQueue = CrashEventQueue()
+    monitor = TcpProbeMonitor(interval=0.05, timeout=0.5, failureThreshold=2)
+    loop.callLater(0, monitor.start, loop, "127.0.0.1", port, lambda payload=None: crashQueue.put(payload))
+    task = threading.Thread(target=loop.run)
+    task.daemon = True
+    task.start()
+
+    # Nothing while the target is up
+    isPass = crashQueue.wait(0.3) is None
+    listener.close()
+    # ...then exactly one crash once it's gone
+    payload = crashQueue.wait(2)
+    print("\t{0}".format(payload))
+    isPass = isPass and payload is not None and "ECONNREFUSED" in payload and crashQueue.wait(0.3) is None
+    loop.stop()
+    task.join()
+    printResult("TCP Probe Test", isPass)
+
+def runMonitor(monitor, crashCount):
+    loop = EventLoop()
+    crashQueue = CrashEventQueue()
+    loop.callLater(0, monitor.start, loop, "127.0.0.1", 1, lambda payload=None: crashQueue.put(payload))
+    task = threading.Thread(target=loop.run)
+    task.daemon = True
+    task.start()
+    payloads = []
+    for i in range(crashCount):
+        payloads.append(crashQueue.wait(5))
+    loop.callSoonThreadsafe(monitor.stop)
+    loop.stop()
+    task.join()
+    return payloads
+
+def testProcessMonitor():
+    crashCommand = [sys.executable, "-c", "import os, signal; os.kill(os.getpid(), signal.SIGSEGV)"]
+    monitor = ProcessMonitor(crashCommand, restart=True, waitForPort=False)
+    payloads = runMonitor(monitor, 2)
+    print("\t{0}".format(payloads))
+    isPass = all(payload and "killed by SIGSEGV" in payload for payload in payloads) and monitor.restartCount >= 2
+    printResult("Process Monitor Launch/Restart Test", isPass)
+
+    sleeper = subprocess.Popen(["sleep", "30"])
+    threading.Timer(0.2, sleeper.kill).start()
+    payloads = runMonitor(ProcessMonitor(pid=sleeper.pid), 1)
+    print("\t{0}".format(payloads))
+    printResult("Process Monitor Attach Test", payloads == ["pid %d exited" % (sleeper.pid)])
+    sleeper.wait()
+
+def testLogTail():
+    logDirectory = tempfile.mkdtemp()
+    logPath = os.path.join(logDirectory, "target.log")
+    with open(logPath, "w") as logFile:
+        logFile.write("Segmentation fault from before we started\n")
+
+    loop = EventLoop()
+    crashQueue = CrashEventQueue()
+    monitor = LogTailMonitor(logPath)
+    loop.callLater(0, monitor.start, loop, "127.0.0.1", 1, lambda payload=None: crashQueue.put(payload))
+    task = threading.Thread(target=loop.run)
+    task.daemon = True
+    task.start()
+    time.sleep(0.1)
+
+    payloads = []
+    logFile = open(logPath, "a")
+    logFile.write("INFO all good\n" * 10000 + "==1==ERROR: AddressSanitizer: heap-use-after-free\n")
+    logFile.flush()
+    payloads.append(crashQueue.wait(2))
+    # Match split across writes
+    logFile.write("main: Assert")
+    logFile.flush()
+    time.sleep(0.1)
+    logFile.write("ion `len > 0' failed.\n")
+    logFile.flush()
+    payloads.append(crashQueue.wait(2))
+    # Rotated
+    logFile.close()
+    os.rename(logPath, logPath + ".1")
+    with open(logPath, "w") as logFile:
+        logFile.write("*** stack smashing detected ***\n")
+    payloads.append(crashQueue.wait(2))
+
+    loop.callSoonThreadsafe(monitor.stop)
+    loop.stop()
+    task.join()
+    shutil.rmtree(logDirectory)
+    for payload in payloads:
+        print("\t{0}".format(payload))
+    expected = [
+        "target.log: ==1==ERROR: AddressSanitizer: heap-use-after-free",
+        "target.log: main: Assertion `len > 0' failed.",
+        "target.log: *** stack smashing detected ***",
+    ]
+    printResult("Log Tail Test", payloads == expected and crashQueue.wait(0.1) is None)
+
+def testRunFailureGrace():
+    crashQueue = CrashEventQueue()
+    # Runs the target turned down don't wait for the monitors at all
+    startTime = time.time()
+    isPass = True
+    for exception in (socket.timeout("timed out"), ConnectionClosedException("closed"), socket.error(errno.ETIMEDOUT, "timed out"), ValueError()):
+        isPass = isPass and not crashQueue.waitRunFailure(exception, 1.0)
+    isPass = isPass and time.time() - startTime < 0.5
+    # A reset or refused connection waits for a monitor to report the crash...
+    reset = socket.error(errno.ECONNRESET, "Connection reset by peer")
+    timer = threading.Timer(0.1, crashQueue.put, [CrashEvent("TestMonitor")])
+    timer.start()
+    isPass = isPass and crashQueue.waitRunFailure(reset, 2.0)
+    timer.join()
+    crashQueue.drain()
+    startTime = time.time()
+    isPass = isPass and not crashQueue.waitRunFailure(socket.error(errno.ECONNREFUSED, "Connection refused"), 0.2)
+    isPass = isPass and time.time() - startTime >= 0.15
+    # ...and one already reported counts whatever the run failed with
+    crashQueue.put(CrashEvent("TestMonitor"))
+    isPass = isPass and crashQueue.waitRunFailure(socket.timeout("timed out"), 0)
+    printResult("Crash Grace Test", isPass)
+
+def main():
+    testTimersAndReaders()
+    testTcpProbe()
+    testProcessMonitor()
+    testLogTail()
+    testRunFailureGrace()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# Test sharing runs out between a pool of target instances
+#
+#------------------------------------------------------------------
+
+import errno
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+sys.path.append("../..")
+from backend.crash_events import CrashEvent, CrashEventQueue, RunHistory
+from backend.proc_director import ProcDirector
+from backend.target_pool import TargetPool
+
+class Color:
+   GREEN = '\033[92m'
+   RED = '\033[91m'
+   END = '\033[0m'
+
+def printResult(message, isPass):
+    if isPass:
+        resultStr = "Pass"
+        resultColor = Color.GREEN
+    else:
+        resultStr = "Fail"
+        resultColor = Color.RED
+    
+    print("\n{}: {}{}{}\n".format(message, resultColor, resultStr, Color.END))
+
+# Listens until it gets any data, then segfaults
+CRASHING_TARGET = """
+import os, signal, socket, sys
+listener = socket.socket()
+listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+listener.bind(("127.0.0.1", int(sys.argv[1])))
+listener.listen(5)
+while True:
+    connection = listener.accept()[0]
+    if connection.recv(16):
+        os.kill(os.getpid(), signal.SIGSEGV)
+    connection.close()
+"""
+
+# Returns the first of count free ports in a row
+def getFreePorts(count):
+    for firstPort in range(21000, 30000, count):
+        listeners = []
+        try:
+            for port in range(firstPort, firstPort + count):
+                listener = socket.socket()
+                listeners.append(listener)
+                listener.bind(("127.0.0.1", port))
+            return firstPort
+        except socket.error:
+            pass
+        finally:
+            for listener in listeners:
+                listener.close()
+
+def testBalancing():
+    pool = TargetPool.fromAddresses("10.0.0.1:2500, 10.0.0.2:2500,[::1]:2501")
+    isPass = [instance.name for instance in pool.instances] == ["10.0.0.1:2500", "10.0.0.2:2500", "[::1]:2501"]
+    isPass = isPass and (pool.instances[2].host, pool.instances[2].port) == ("::1", 2501)
+    first = pool.acquire()
+    second = pool.acquire()
+    third = pool.acquire()
+    isPass = isPass and len(set([first, second, third])) == 3
+    pool.release(second)
+    # Least busy, then fewest runs
+    isPass = isPass and pool.acquire() is second
+    for instance in (first, second, third):
+        pool.release(instance)
+    isPass = isPass and pool.acquire() is first and sum(instance.runCount for instance in pool.instances) == 5
+    for addresses in ("", "10.0.0.1", "10.0.0.1:port"):
+        try:
+            TargetPool.fromAddresses(addresses)
+            isPass = False
+        except ValueError:
+            pass
+    printResult("Target Pool Balancing Test", isPass)
+
+def testDownInstances():
+    TargetPool.PROBE_INTERVAL = 0.2
+    port = getFreePorts(2)
+    upListener = socket.socket()
+    upListener.bind(("127.0.0.1", port + 1))
+    upListener.listen(5)
+    monitorWrapper = ProcDirector.MonitorWrapper("127.0.0.1", port, [], CrashEventQueue())
+    pool = TargetPool.fromAddresses("127.0.0.1:%d,127.0.0.1:%d" % (port, port + 1))
+    pool.start(monitorWrapper)
+    (down, up) = pool.instances
+
+    refused = socket.error(errno.ECONNREFUSED, "Connection refused")
+    isPass = pool.reportFailure(down, refused)
+    crashEvent = monitorWrapper.crashQueue.wait(0)
+    isPass = isPass and crashEvent.targetName == down.name and "ECONNREFUSED" in crashEvent.payload
+    # Only reported once, and timeouts, resets and other errors aren't the instance going away
+    isPass = isPass and not pool.reportFailure(down, refused) and not pool.reportFailure(up, socket.timeout("timed out"))
+    isPass = isPass and not pool.reportFailure(up, socket.error(errno.ECONNRESET, "Connection reset by peer"))
+    isPass = isPass and not pool.reportFailure(up, ValueError())
+    # Nor is a refused connection if the instance answers when the pool checks
+    isPass = isPass and not pool.reportFailure(up, refused) and not up.isDown
+    isPass = isPass and monitorWrapper.crashQueue.wait(0) is None
+    acquired = []
+    for n in range(3):
+        acquired.append(pool.acquire())
+        pool.release(acquired[-1])
+    isPass = isPass and acquired == [up, up, up]
+
+    # Probes don't put it back until it's listening again
+    time.sleep(0.3)
+    isPass = isPass and pool.acquire() is up and down.isDown
+    downListener = socket.socket()
+    downListener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    downListener.bind(("127.0.0.1", port))
+    downListener.listen(5)
+    isPass = isPass and pool.waitForInstance(down, 2) and pool.acquire() is down
+    downListener.close()
+    upListener.close()
+    printResult("Target Pool Down Instance Test", isPass)
+
+def testLaunchedInstances():
+    tempDirectory = tempfile.mkdtemp()
+    targetPath = os.path.join(tempDirectory, "target.py")
+    with open(targetPath, "w") as targetFile:
+        targetFile.write(CRASHING_TARGET)
+    port = getFreePorts(2)
+    monitorWrapper = ProcDirector.MonitorWrapper("127.0.0.1", port, [], CrashEventQueue())
+    pool = TargetPool.launch("%s %s {port}" % (sys.executable, targetPath), 2, "127.0.0.1", port, restartDelay=0.2)
+    pool.start(monitorWrapper)
+    (crashed, other) = pool.instances
+    isPass = crashed.isReady() and other.isReady() and monitorWrapper.hasEventMonitors()
+
+    socket.create_connection((crashed.host, crashed.port)).sendall("crash\n")
+    crashEvent = monitorWrapper.crashQueue.wait(2)
+    isPass = isPass and crashEvent.targetName == crashed.name and "SIGSEGV" in crashEvent.payload
+    isPass = isPass and crashEvent.monitorName == "ProcessMonitor[%d]" % (port)
+    # The other instance takes the runs while it restarts
+    isPass = isPass and not crashed.isReady() and pool.acquire() is other
+    isPass = isPass and pool.waitForInstance(crashed, 10) and pool.acquire() is crashed
+    isPass = isPass and monitorWrapper.getRestartCount() == 1
+    monitorWrapper.stop()
+    shutil.rmtree(tempDirectory)
+    printResult("Target Pool Launched Instances Test", isPass)
+
+def testCandidatesByTarget():
+    runHistory = RunHistory(window=1.0)
+    runs = [runHistory.startRun(n, n, targetName="127.0.0.1:%d" % (2600 + n % 2)) for n in range(4)]
+    crashEvent = CrashEvent("ProcessMonitor[2601]", "pid 1 killed by SIGSEGV", targetName="127.0.0.1:2601")
+    candidates = runHistory.getCandidates(crashEvent.timestamp, crashEvent.targetName)
+    isPass = candidates == [runs[3], runs[1]] and str(runs[3]) == "run 3 (seed 3) on 127.0.0.1:2601"
+    isPass = isPass and len(runHistory.getCandidates(crashEvent.timestamp)) == 4
+    printResult("Crash Candidates By Target Test", isPass)
+
+testBalancing()
+testDownInstances()
+testLaunchedInstances()
+testCandidatesByTarget()
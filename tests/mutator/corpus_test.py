@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# Test response signatures, coverage bitmaps, the power scheduler and corpus
+# bookkeeping behind --corpus and --coverage, and fuzzPointsPerRun
+#
+#------------------------------------------------------------------
+
+import os
+import StringIO
+import shutil
+import sys
+import tempfile
+sys.path.append("../..")
+from backend.corpus import Corpus, ResponseSignature
+from backend.coverage import COUNT_CLASSES, COVERAGE_SHM_ENV, CoverageMap
+from backend.fuzz_points import FuzzPointChooser
+from backend.fuzzer_types import Message
+from backend.fuzzerdata import FuzzerData
+from backend.scheduler import PowerScheduler
+
+class Color:
+   GREEN = '\033[92m'
+   RED = '\033[91m'
+   END = '\033[0m'
+
+def printResult(message, isPass):
+    if isPass:
+        resultStr = "Pass"
+        resultColor = Color.GREEN
+    else:
+        resultStr = "Fail"
+        resultColor = Color.RED
+    
+    print("\n{}: {}{}{}\n".format(message, resultColor, resultStr, Color.END))
+
+def getSignature(responses, highestMessageNumber=3):
+    signature = ResponseSignature()
+    for (messageNumber, data) in responses:
+        signature.addResponse(messageNumber, bytearray(data))
+    signature.highestMessageNumber = highestMessageNumber
+    return signature.getDigest()
+
+def testResponseSignature():
+    isPass = [ResponseSignature.getLengthBucket(length) for length in (0, 1, 2, 3, 4, 1000)] == [0, 1, 2, 2, 3, 10]
+    base = getSignature([(1, "OK 1234\n"), (3, "OK\n")])
+    # Counters and timestamps don't count...
+    isPass = isPass and getSignature([(1, "OK 98765\n"), (3, "OK\n")]) == base
+    # ...nor does anything past the start of a long response, beyond its length
+    isPass = isPass and getSignature([(1, "ERR " + "A" * 100), (3, "OK\n")]) == getSignature([(1, "ERR " + "A" * 80 + "B" * 20), (3, "OK\n")])
+    # Different responses, lengths and how far the run got all do
+    isPass = isPass and getSignature([(1, "ERR 1\n"), (3, "OK\n")]) != base
+    isPass = isPass and getSignature([(1, "OK 1234\n"), (3, "OK" + "\n" * 10)]) != base
+    isPass = isPass and getSignature([(1, "OK 1234\n"), (3, "OK\n")], 2) != base
+    printResult("Response Signature Test", isPass)
+
+def makeFuzzedMessage(data):
+    message = Message()
+    message.direction = Message.Direction.Outbound
+    message.setMessageFrom(Message.Format.Raw, bytearray("prefix"), False)
+    message.appendMessageFrom(Message.Format.Raw, bytearray(data), True)
+    return message
+
+# A run the way performRun() goes through it, returns the new entry if any
+def runThroughCorpus(corpus, seed, fuzzedData, response, hasNewCoverage=False):
+    message = makeFuzzedMessage("cmd")
+    base = corpus.startRun(seed)
+    message.resetAlteredMessage()
+    corpus.applyBase(0, message)
+    startData = message.subcomponents[1].getAlteredByteArray()
+    message.subcomponents[1].setAlteredByteArray(bytearray(fuzzedData))
+    corpus.addFuzzed(0, message)
+    corpus.setHighestMessageNumber(0)
+    corpus.addResponse(1, bytearray(response))
+    corpus.setHighestMessageNumber(1)
+    return (base, startData, corpus.endRun(hasNewCoverage))
+
+def testCorpus():
+    tempDir = tempfile.mkdtemp()
+    try:
+        corpusDirectory = os.path.join(tempDir, "test_corpus")
+        corpus = Corpus(corpusDirectory)
+        # The test run's signature is remembered but it isn't an entry
+        (base, startData, entry) = runThroughCorpus(corpus, -1, "cmd", "OK\n")
+        isPass = base is None and entry is None and len(corpus.signatures) == 1
+        (base, startData, entry) = runThroughCorpus(corpus, 0, "cmd\xff", "OK\n")
+        isPass = isPass and entry is None
+        (base, startData, entry) = runThroughCorpus(corpus, 1, "cmd\x00\x00", "ERR\n")
+        isPass = isPass and entry is not None and entry.entryId == 0 and entry.data == {(0, 1): bytearray("cmd\x00\x00")}
+        isPass = isPass and os.listdir(corpusDirectory) == ["000000"]
+
+        # Seeds pick the same input every time, and runs from an entry start from its data
+        choices = [corpus.chooseBase(seed) for seed in range(100)]
+        isPass = isPass and choices == [corpus.chooseBase(seed) for seed in range(100)]
+        isPass = isPass and 25 < choices.count(None) < 75
+        seed = choices.index(corpus.entries[0])
+        (base, startData, entry) = runThroughCorpus(corpus, seed, "cmd\x00\x00\x00", "BAD\n")
+        isPass = isPass and base is corpus.entries[0] and startData == bytearray("cmd\x00\x00")
+        isPass = isPass and entry.entryId == 1 and entry.parentId == 0 and entry.seed == seed
+
+        # ...and the next session carries on where this one left off
+        corpus = Corpus(corpusDirectory)
+        isPass = isPass and [entry.entryId for entry in corpus.entries] == [0, 1]
+        isPass = isPass and corpus.entries[1].data == {(0, 1): bytearray("cmd\x00\x00\x00")} and corpus.entries[1].parentId == 0
+        (base, startData, entry) = runThroughCorpus(corpus, 1000, "cmd\x00\x00", "ERR\n")
+        isPass = isPass and entry is None
+        print("\t{0} entries, {1} signatures".format(len(corpus.entries), len(corpus.signatures)))
+    finally:
+        shutil.rmtree(tempDir)
+    printResult("Corpus Test", isPass)
+
+# Stands in for the target counting edges
+def runWithHits(coverageMap, hits):
+    coverageMap.startRun()
+    for (index, count) in hits.items():
+        coverageMap._map[index] = chr(count)
+    return coverageMap.endRun()
+
+def testCoverageMap():
+    isPass = [ord(COUNT_CLASSES[count]) for count in (0, 1, 2, 3, 4, 7, 8, 31, 32, 127, 128, 255)] == [0, 1, 2, 4, 8, 8, 16, 32, 64, 64, 128, 128]
+    coverageMap = CoverageMap("mutiny-test-%d" % (os.getpid()), 4096)
+    environment = {}
+    coverageMap.exportEnvironment(environment)
+    isPass = isPass and environment[COVERAGE_SHM_ENV] == "/" + coverageMap.name and os.path.exists(coverageMap.path)
+    isPass = isPass and runWithHits(coverageMap, {10: 1, 4000: 1}) and coverageMap.edgeCount == 2
+    # Same edges, or just a few more loops round, isn't new...
+    isPass = isPass and not runWithHits(coverageMap, {10: 1, 4000: 1})
+    isPass = isPass and not runWithHits(coverageMap, {10: 1})
+    isPass = isPass and runWithHits(coverageMap, {10: 4}) and not runWithHits(coverageMap, {10: 6})
+    # ...but a new edge is, and the bitmap's reset in between
+    isPass = isPass and runWithHits(coverageMap, {20: 1}) and coverageMap.edgeCount == 3 and coverageMap.runEdgeCount == 1
+    isPass = isPass and not runWithHits(coverageMap, {})
+    coverageMap.close()
+    isPass = isPass and not os.path.exists(coverageMap.path)
+    printResult("Coverage Map Test", isPass)
+
+def testCoverageCorpus():
+    tempDir = tempfile.mkdtemp()
+    try:
+        corpus = Corpus(os.path.join(tempDir, "test_corpus"))
+        runThroughCorpus(corpus, -1, "cmd", "OK\n")
+        # Same response, but it reached new code
+        (base, startData, entry) = runThroughCorpus(corpus, 0, "cmd\xff", "OK\n", True)
+        isPass = entry is not None and corpus.newSignatureCount == 0
+        (base, startData, entry) = runThroughCorpus(corpus, 1, "cmd\xfe", "OK\n")
+        isPass = isPass and entry is None
+    finally:
+        shutil.rmtree(tempDir)
+    printResult("Coverage Corpus Test", isPass)
+
+def testPowerScheduler():
+    scheduler = PowerScheduler()
+    # Fast and productive vs slow and unproductive
+    for key in ("original", "fast", "slow"):
+        scheduler.addCandidate(key)
+    for i in range(100):
+        scheduler.recordRun("original", 0.1, i % 20 == 0)
+        scheduler.recordRun("fast", 0.02, i % 5 == 0)
+        scheduler.recordRun("slow", 1.0, False)
+    # Each candidate gets its energy's worth of runs in a row, then a new cycle starts
+    runs = [scheduler.next()]
+    energies = dict((candidate.key, candidate.energy) for candidate in scheduler.candidates)
+    isPass = energies["fast"] > energies["original"] > energies["slow"] >= PowerScheduler.MIN_ENERGY
+    print("\tEnergies: {0}".format(energies))
+    runs += [scheduler.next() for i in range(sum(energies.values()) - 1)]
+    isPass = isPass and runs == ["original"] * energies["original"] + ["fast"] * energies["fast"] + ["slow"] * energies["slow"]
+    # Candidates added part way through join in the next cycle, with a boost for being new
+    scheduler.addCandidate("new")
+    isPass = isPass and scheduler.next() == "original" and scheduler.cycle == 2
+    newCandidate = scheduler.getCandidate("new")
+    isPass = isPass and newCandidate.energy == int(1.5 * PowerScheduler.BASE_ENERGY)
+    printResult("Power Scheduler Test", isPass)
+
+def testScheduledCorpus():
+    tempDir = tempfile.mkdtemp()
+    try:
+        scheduler = PowerScheduler(baseEnergy=2)
+        corpus = Corpus(os.path.join(tempDir, "test_corpus"), scheduler)
+        (base, startData, entry) = runThroughCorpus(corpus, -1, "cmd", "OK\n")
+        (base, startData, entry) = runThroughCorpus(corpus, 0, "cmd\x00", "ERR\n")
+        # The original and the new entry are both scheduled, and told how their runs went
+        isPass = base is None and entry is not None and [candidate.key for candidate in scheduler.candidates] == [None, entry]
+        bases = [runThroughCorpus(corpus, seed, "cmd%d" % (seed), "OK\n")[0] for seed in range(1, 10)]
+        isPass = isPass and entry in bases and None in bases
+        isPass = isPass and scheduler.getCandidate(None).findCount == 1 and scheduler.getCandidate(None).runCount + scheduler.getCandidate(entry).runCount == 10
+    finally:
+        shutil.rmtree(tempDir)
+    printResult("Scheduled Corpus Test", isPass)
+
+def testFuzzPointChooser():
+    # fuzzPointsPerRun survives writing out and reading back
+    fuzzerData = FuzzerData()
+    fuzzerData.fuzzPointsPerRun = 1
+    for data in ("a", "b", "c"):
+        fuzzerData.messageCollection.addMessage(makeFuzzedMessage(data))
+        inbound = Message()
+        inbound.direction = Message.Direction.Inbound
+        inbound.setMessageFrom(Message.Format.Raw, bytearray("OK\n"), True)
+        fuzzerData.messageCollection.addMessage(inbound)
+    output = StringIO.StringIO()
+    fuzzerData.writeToFD(output)
+    fuzzerData = FuzzerData()
+    fuzzerData.readFromFD(StringIO.StringIO(output.getvalue()), quiet=True)
+    isPass = fuzzerData.fuzzPointsPerRun == 1
+
+    # Only the fuzzed outbound subcomponents are points
+    chooser = FuzzPointChooser(fuzzerData.messageCollection, fuzzerData.fuzzPointsPerRun)
+    isPass = isPass and chooser.points == [(0, 1), (2, 1), (4, 1)]
+    # The test run mutates nothing, fuzz runs one point with its own seed
+    isPass = isPass and chooser.startRun(-1) == {} and chooser.getSeed(0, 1) is None
+    chosen = chooser.startRun(7)
+    isPass = isPass and len(chosen) == 1 and chosen == chooser.startRun(7)
+    (point, pointSeed) = chosen.items()[0]
+    isPass = isPass and chooser.getSeed(*point) == pointSeed == FuzzPointChooser.getPointSeed(7, *point) and pointSeed != 7
+    isPass = isPass and FuzzPointChooser.getPointSeed(7, 0, 1) != FuzzPointChooser.getPointSeed(7, 2, 1)
+
+    # Points whose runs find things get picked more
+    for seed in range(300):
+        chosen = chooser.startRun(seed)
+        chooser.endRun((4, 1) in chosen and seed % 2 == 0)
+    counts = dict((point, 0) for point in chooser.points)
+    for seed in range(300, 600):
+        for point in chooser.startRun(seed):
+            counts[point] += 1
+    print("\tPicked: {0}".format(counts))
+    isPass = isPass and counts[(4, 1)] > counts[(0, 1)] + counts[(2, 1)]
+
+    # Crashes count as finds, even though they're only known after the run's over
+    chooser = FuzzPointChooser(fuzzerData.messageCollection, fuzzerData.fuzzPointsPerRun)
+    for seed in range(300):
+        chosen = chooser.startRun(seed)
+        chooser.endRun()
+        if (2, 1) in chosen and seed % 2 == 0:
+            chooser.recordCrash(seed)
+            # Only once per run, and not for runs it doesn't know about
+            chooser.recordCrash(seed)
+            chooser.recordCrash(1000)
+    isPass = isPass and chooser.scheduler.getCandidate((2, 1)).findCount == chooser.scheduler.getState()["totalFindCount"] > 0
+    counts = dict((point, 0) for point in chooser.points)
+    for seed in range(300, 600):
+        for point in chooser.startRun(seed):
+            counts[point] += 1
+    print("\tPicked after crashes: {0}".format(counts))
+    isPass = isPass and counts[(2, 1)] > counts[(0, 1)] + counts[(4, 1)]
+    chooser.pointsPerRun = 5
+    isPass = isPass and sorted(chooser.startRun(1)) == chooser.points
+    printResult("Fuzz Point Chooser Test", isPass)
+
+testResponseSignature()
+testCorpus()
+testPowerScheduler()
+testScheduledCorpus()
+testCoverageMap()
+testCoverageCorpus()
+testFuzzPointChooser()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# Test --skip_duplicates, both the run fingerprints themselves and
+# which runs mutiny.py remembers
+#
+#------------------------------------------------------------------
+
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+sys.path.append("../..")
+from backend.duplicate_filter import DuplicateRunFilter
+from backend.fuzzer_types import Message, MessageCollection
+
+class Color:
+   GREEN = '\033[92m'
+   RED = '\033[91m'
+   END = '\033[0m'
+
+def printResult(message, isPass):
+    if isPass:
+        resultStr = "Pass"
+        resultColor = Color.GREEN
+    else:
+        resultStr = "Fail"
+        resultColor = Color.RED
+    
+    print("\n{}: {}{}{}\n".format(message, resultColor, resultStr, Color.END))
+
+RADAMSA = os.path.abspath(os.path.join(__file__, "../../../radamsa-0.3/bin/radamsa"))
+
+def makeMessage(direction, data, isFuzzed):
+    message = Message()
+    message.direction = direction
+    message.setMessageFrom(Message.Format.Raw, bytearray(data), isFuzzed)
+    return message
+
+# Sends outbound through the filter the way performRun() does, returns
+# whether the run was skipped
+def runThroughFilter(duplicateFilter, messageCollection, seed, outbound):
+    duplicateFilter.startRun(messageCollection, seed)
+    for (messageNumber, message) in enumerate(messageCollection.messages):
+        if message.isOutbound():
+            if duplicateFilter.addOutbound(messageNumber, bytearray(outbound[messageNumber])):
+                return True
+    duplicateFilter.endRun()
+    return False
+
+def testDuplicateRunFilter():
+    messageCollection = MessageCollection()
+    messageCollection.addMessage(makeMessage(Message.Direction.Outbound, "auth\n", False))
+    messageCollection.addMessage(makeMessage(Message.Direction.Inbound, "OK\n", False))
+    messageCollection.addMessage(makeMessage(Message.Direction.Outbound, "cmd\n", True))
+    messageCollection.addMessage(makeMessage(Message.Direction.Outbound, "quit\n", False))
+
+    tempDir = tempfile.mkdtemp()
+    try:
+        seenPath = os.path.join(tempDir, "test.seen")
+        duplicateFilter = DuplicateRunFilter(seenPath, initialCapacity=10)
+        # The test run is remembered but never skipped, even when repeated
+        isPass = not runThroughFilter(duplicateFilter, messageCollection, -1, {0: "auth\n", 2: "cmd\n", 3: "quit\n"})
+        isPass = isPass and not runThroughFilter(duplicateFilter, messageCollection, -1, {0: "auth\n", 2: "cmd\n", 3: "quit\n"})
+        # A fuzz case that didn't change anything repeats the test run
+        isPass = isPass and runThroughFilter(duplicateFilter, messageCollection, 0, {0: "auth\n", 2: "cmd\n", 3: "quit\n"})
+        isPass = isPass and not runThroughFilter(duplicateFilter, messageCollection, 1, {0: "auth\n", 2: "cmdX\n", 3: "quit\n"})
+        isPass = isPass and runThroughFilter(duplicateFilter, messageCollection, 2, {0: "auth\n", 2: "cmdX\n", 3: "quit\n"})
+        # Message boundaries count, not just the bytes
+        isPass = isPass and not runThroughFilter(duplicateFilter, messageCollection, 3, {0: "auth\nc", 2: "mdX\n", 3: "quit\n"})
+        # Runs that never finished (e.g. crashed the target) aren't remembered
+        duplicateFilter.startRun(messageCollection, 4)
+        duplicateFilter.addOutbound(0, bytearray("auth\n"))
+        duplicateFilter.addOutbound(2, bytearray("crash\n"))
+        isPass = isPass and not runThroughFilter(duplicateFilter, messageCollection, 4, {0: "auth\n", 2: "crash\n", 3: "quit\n"})
+        isPass = isPass and duplicateFilter.skippedCount == 2
+        print("\t{0} fingerprints, {1} skipped".format(len(duplicateFilter.seen), duplicateFilter.skippedCount))
+
+        # ...and the next session carries on where this one left off
+        duplicateFilter.save()
+        duplicateFilter = DuplicateRunFilter(seenPath, initialCapacity=10)
+        isPass = isPass and len(duplicateFilter.seen) == 4
+        isPass = isPass and runThroughFilter(duplicateFilter, messageCollection, 5, {0: "auth\n", 2: "cmdX\n", 3: "quit\n"})
+        isPass = isPass and not runThroughFilter(duplicateFilter, messageCollection, 6, {0: "auth\n", 2: "cmdY\n", 3: "quit\n"})
+        duplicateFilter.save()
+    finally:
+        shutil.rmtree(tempDir)
+    printResult("Duplicate Run Filter Test", isPass)
+
+def testRejectedRunFilter():
+    messageCollection = MessageCollection()
+    messageCollection.addMessage(makeMessage(Message.Direction.Outbound, "auth\n", True))
+    messageCollection.addMessage(makeMessage(Message.Direction.Inbound, "OK\n", False))
+    messageCollection.addMessage(makeMessage(Message.Direction.Outbound, "quit\n", False))
+
+    duplicateFilter = DuplicateRunFilter(None, initialCapacity=10)
+    # The target closes the connection on the fuzzed message, the run
+    # never gets to the end but mutiny.py remembers it all the same
+    duplicateFilter.startRun(messageCollection, 0)
+    isPass = not duplicateFilter.addOutbound(0, bytearray("bad\n"))
+    duplicateFilter.endRun()
+    isPass = isPass and runThroughFilter(duplicateFilter, messageCollection, 1, {0: "bad\n", 2: "quit\n"})
+    isPass = isPass and not runThroughFilter(duplicateFilter, messageCollection, 2, {0: "worse\n", 2: "quit\n"})
+    isPass = isPass and duplicateFilter.skippedCount == 1
+    printResult("Rejected Run Filter Test", isPass)
+
+# Accepts connections until told to stop, answering "auth\n" and hanging up on anything else
+def rejectingServer(listener, received):
+    while True:
+        (connection, address) = listener.accept()
+        data = connection.recv(1024)
+        if data == "stop":
+            connection.close()
+            return
+        # A skipped run has already connected, but hangs up without sending anything
+        if data:
+            received.append(data)
+        if data == "auth\n":
+            connection.sendall("OK\n")
+        connection.close()
+
+def runMutiny(fuzzerPath, seenPath):
+    process = subprocess.Popen([sys.executable, "mutiny.py", "-q", "-r", "0-4", "--skip_duplicates", "--seen_file", seenPath, fuzzerPath, "127.0.0.1"], cwd="../..", stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    return process.communicate()[0]
+
+# Runs the target hangs up on are the usual case against a target that
+# checks its input, a second session over the same seeds sends nothing new
+def testRejectedRunsSkipped():
+    if not os.path.exists(RADAMSA):
+        print("\nradamsa isn't built in {0}, skipping the mutiny.py --skip_duplicates test\n".format(RADAMSA))
+        return
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(5)
+    received = []
+    serverThread = threading.Thread(target=rejectingServer, args=(listener, received))
+    serverThread.daemon = True
+    serverThread.start()
+
+    tempDir = tempfile.mkdtemp()
+    try:
+        fuzzerPath = os.path.join(tempDir, "reject.fuzzer")
+        with open(fuzzerPath, "w") as fuzzerFile:
+            fuzzerFile.write("receiveTimeout 0.5\nproto tcp\nport %d\n\noutbound fuzz 'auth\\n'\ninbound 'OK\\n'\n" % (listener.getsockname()[1]))
+        seenPath = os.path.join(tempDir, "runs.seen")
+        output = runMutiny(fuzzerPath, seenPath)
+        firstCount = len(received)
+        isPass = output.count("Skipped:") == 0 and os.path.exists(seenPath)
+        output = runMutiny(fuzzerPath, seenPath)
+        secondCount = len(received) - firstCount
+        print("\t{0} runs reached the target, then {1} the second time".format(firstCount, secondCount))
+        # Only the test run, which is never skipped
+        isPass = isPass and firstCount == 6 and secondCount == 1 and output.count("Skipped:") == 5
+        if not isPass:
+            print(output)
+    finally:
+        shutil.rmtree(tempDir)
+        stopper = socket.create_connection(listener.getsockname())
+        stopper.sendall("stop")
+        stopper.close()
+        serverThread.join()
+        listener.close()
+    printResult("Rejected Runs Skipped Test", isPass)
+
+testDuplicateRunFilter()
+testRejectedRunFilter()
+testRejectedRunsSkipped()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# Test the Bloom filters and seed statistics bookkeeping behind
+# mutiny_seedstats.py (radamsa itself isn't needed)
+#
+#------------------------------------------------------------------
+
+import hashlib
+import os
+import random
+import shutil
+import sys
+import tempfile
+sys.path.append("../..")
+from backend.bloom_filter import BloomFilter, ScalableBloomFilter
+from backend.seed_set import SeedSet
+from backend.seedstats import InputStats, parseOperators
+
+class Color:
+   GREEN = '\033[92m'
+   RED = '\033[91m'
+   END = '\033[0m'
+
+def printResult(message, isPass):
+    if isPass:
+        resultStr = "Pass"
+        resultColor = Color.GREEN
+    else:
+        resultStr = "Fail"
+        resultColor = Color.RED
+    
+    print("\n{}: {}{}{}\n".format(message, resultColor, resultStr, Color.END))
+
+def testBloomFilters():
+    isPass = True
+    for bloomFilter in (BloomFilter(5000, 0.01), ScalableBloomFilter(100, 0.01)):
+        items = [os.urandom(16) for i in range(5000)]
+        falseAdds = sum(bloomFilter.add(item) for item in items)
+        # Never forgets anything...
+        isPass = isPass and all(item in bloomFilter for item in items) and all(bloomFilter.add(item) for item in items)
+        # ...and is rarely wrong about things it hasn't seen
+        falsePositives = sum(os.urandom(16) in bloomFilter for i in range(5000))
+        print("\t{0}: {1} false adds, {2} false positives".format(bloomFilter.__class__.__name__, falseAdds, falsePositives))
+        isPass = isPass and falseAdds < 150 and falsePositives < 150
+    printResult("Bloom Filter Test", isPass)
+
+def testParseOperators():
+    isPass = parseOperators("{nth: 1, mutations: {sr: 1, num: 2}, length: 9}") == ["sr", "num"]
+    isPass = isPass and parseOperators("((nth . 1) (mutations (bd . 1) (ab . 1)) (length . 4))") == ["bd", "ab"]
+    isPass = isPass and parseOperators("{nth: 1}") == []
+    printResult("Parse Operators Test", isPass)
+
+def testInputStats():
+    isPass = True
+    for errorRate in (None, 0.001):
+        stats = InputStats("test", "abc", 30, errorRate, bucketSize=10)
+        for seed in range(30):
+            # Seeds 20-29 repeat the outputs of 0-9
+            output = "out%d" % (seed % 20)
+            stats.add(seed, hashlib.md5(output).digest(), len(output), ["sr"])
+        report = stats.getReport()
+        isPass = isPass and report["runs"] == 30 and report["duplicates"] == 10 and report["unique"] == 20
+        isPass = isPass and [bucket["duplicateRate"] for bucket in report["duplicateRateBySeeds"]] == [0.0, 0.0, 1.0]
+        isPass = isPass and report["outputLength"]["distribution"] == [{"lengths": "4-7", "count": 30}]
+        isPass = isPass and report["operators"] == {"sr": 30}
+    printResult("Input Stats Test", isPass)
+
+def testScalableBloomFilterPersistence():
+    tempDir = tempfile.mkdtemp()
+    try:
+        bloomFilter = ScalableBloomFilter(50, 0.01)
+        items = [os.urandom(16) for i in range(500)]
+        for item in items:
+            bloomFilter.add(item)
+        path = os.path.join(tempDir, "filter")
+        bloomFilter.save(path)
+        loadedFilter = ScalableBloomFilter.load(path)
+        isPass = len(loadedFilter.filters) == len(bloomFilter.filters) and len(loadedFilter) == len(bloomFilter)
+        isPass = isPass and all(item in loadedFilter for item in items)
+        isPass = isPass and all(a.bits == b.bits for (a, b) in zip(loadedFilter.filters, bloomFilter.filters))
+    finally:
+        shutil.rmtree(tempDir)
+    printResult("Bloom Filter Persistence Test", isPass)
+def testSeedSet():
+    seeds = SeedSet.parse("10-19,0-4,5-9,30,40-")
+    isPass = seeds.getIntervals() == [(0, 19), (30, 30), (40, SeedSet.MAX_SEED)] and str(seeds) == "0-19,30,40-"
+    isPass = isPass and seeds.isUnbounded() and 19 in seeds and 20 not in seeds and SeedSet.MAX_SEED in seeds
+    isPass = isPass and seeds.getSeed(0) == 0 and seeds.getSeed(20) == 30 and seeds.getSeed(21) == 40
+    isPass = isPass and seeds.getNext(21) == 30 and seeds.getNextMissing(3) == 20 and seeds.getNextMissing(25) == 25
+    isPass = isPass and all(SeedSet.parse(bad) is None for bad in ("", "a", "5-3", "1-2-3"))
+
+    # Hundreds of millions of seeds cost no more than a few
+    huge = SeedSet.parse("0-499999999,600000000-999999999")
+    isPass = isPass and huge.getCount() == 900000000 and huge.getSeed(500000000) == 600000000
+    shards = huge.split(4)
+    isPass = isPass and [shard.getCount() for shard in shards] == [225000000] * 4
+    isPass = isPass and reduce(SeedSet.union, shards) == huge and shards[2].getIntervals() == [(450000000, 499999999), (600000000, 774999999)]
+    isPass = isPass and huge.subtract(shards[1]).union(shards[1]) == huge
+
+    # Compare against plain sets
+    random.seed(1)
+    done = SeedSet()
+    expected = set()
+    for _ in range(300):
+        start = random.randrange(3000)
+        end = start + random.randrange(5)
+        done.addRange(start, end)
+        expected.update(range(start, end + 1))
+        isPass = isPass and done.getCount() == len(expected)
+    other = SeedSet([(n, n + 3) for n in range(0, 3000, 7)])
+    isPass = isPass and list(done) == sorted(expected) and [done.getSeed(n) for n in range(done.getCount())] == sorted(expected)
+    isPass = isPass and list(done.subtract(other)) == sorted(expected - set(other)) and list(done.union(other)) == sorted(expected | set(other))
+    isPass = isPass and list(done.getSlice(10, 50)) == sorted(expected)[10:50]
+    isPass = isPass and all(done.getNextMissing(n) == min(m for m in range(n, 4000) if m not in expected) for n in range(0, 3010, 7))
+    restored = SeedSet()
+    restored.setState(done.getState())
+    isPass = isPass and restored == done
+    print("\t{0} intervals: {1}".format(len(done.getIntervals()), str(done)[:60]))
+    printResult("Seed Set Test", isPass)
+
+testBloomFilters()
+testScalableBloomFilterPersistence()
+testParseOperators()
+testInputStats()
+testSeedSet()
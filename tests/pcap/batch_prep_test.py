@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# Test mutiny_prep.py --batch: profile parsing, the manifest and
+# how a capture that can't be read is reported
+#
+#------------------------------------------------------------------
+
+import json
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+sys.path.append("../..")
+from backend.batch_prep import batchPrep, loadProfile, prepCapture, PrepProfile
+from backend.fuzzer_types import Message
+from backend.fuzzerdata import FuzzerData
+from backend.pcap_reader import TCP_SYN, TCP_ACK, TCP_FIN
+
+class Color:
+   GREEN = '\033[92m'
+   RED = '\033[91m'
+   BOLD = '\033[1m'
+   END = '\033[0m'
+
+def printResult(message, isPass):
+    if isPass:
+        resultStr = "Pass"
+        resultColor = Color.GREEN
+    else:
+        resultStr = "Fail"
+        resultColor = Color.RED
+    
+    print("\n{}: {}{}{}\n".format(message, resultColor, resultStr, Color.END))
+
+PROFILE = """[prep]
+proto = tcp
+server_port = 2500
+fuzz_messages = each
+receive_timeout = 0.5
+failure_threshold = 7
+output_dir = {0}
+"""
+
+def ipv4Frame(src, dst, proto, transport):
+    ip = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(transport), 1, 0, 64, proto, 0, socket.inet_aton(src), socket.inet_aton(dst)) + transport
+    return "\x66\x77\x88\x99\xaa\xbb\x00\x11\x22\x33\x44\x55" + struct.pack("!H", 0x0800) + ip
+
+# A login on port 2500 plus a UDP flow the profile should leave out
+# messages - (fromClient, payload) for the TCP conversation
+def writeCapture(path, user):
+    client = ("10.0.0.1", 40000)
+    server = ("10.0.0.9", 2500)
+    seq = {True: 100, False: 5000}
+    frames = []
+    def tcp(fromClient, payload, flags=TCP_ACK):
+        (src, dst) = (client, server) if fromClient else (server, client)
+        segment = struct.pack("!HHIIBBHHH", src[1], dst[1], seq[fromClient], seq[not fromClient], 5 << 4, flags, 8192, 0, 0) + payload
+        seq[fromClient] += len(payload) + (1 if flags & (TCP_SYN | TCP_FIN) else 0)
+        frames.append(ipv4Frame(src[0], dst[0], 6, segment))
+    tcp(True, "", TCP_SYN)
+    tcp(False, "", TCP_SYN | TCP_ACK)
+    tcp(True, "")
+    tcp(True, "USER %s\n" % (user))
+    tcp(False, "OK\n")
+    frames.append(ipv4Frame("10.0.0.1", "10.0.0.8", 17, struct.pack("!HHHH", 5353, 53, 13, 0) + "query"))
+    tcp(True, "QUIT\n")
+    with open(path, "wb") as pcapFile:
+        pcapFile.write(struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        for (i, frame) in enumerate(frames):
+            pcapFile.write(struct.pack("<IIII", 1000 + i, 0, len(frame), len(frame)))
+            pcapFile.write(frame)
+
+def testLoadProfile(directory):
+    print("\n{}Testing profile loading...{}".format(Color.BOLD, Color.END))
+    profilePath = os.path.join(directory, "profile.ini")
+    with open(profilePath, "w") as profileFile:
+        profileFile.write(PROFILE.format(os.path.join(directory, "out")))
+    profile = loadProfile(profilePath)
+    isPass = profile.proto == "tcp" and profile.serverPort == 2500 and profile.fuzzMessages == PrepProfile.FUZZ_EACH
+    isPass = isPass and profile.receiveTimeout == 0.5 and profile.failureThreshold == 7 and profile.combinePackets
+
+    # Bad values and unknown keys are errors rather than being ignored
+    for badLine in ["server_port = 70000", "fuzz_messages = sometimes", "combine_packet = yes"]:
+        with open(profilePath, "w") as profileFile:
+            profileFile.write("[prep]\n%s\n" % (badLine))
+        try:
+            loadProfile(profilePath)
+            print("\tAccepted {0}".format(badLine))
+            isPass = False
+        except RuntimeError as e:
+            print("\t{0}".format(str(e)))
+    printResult("Profile Loading Test", isPass)
+
+def testPrepCapture(directory):
+    print("\n{}Testing single capture prep...{}".format(Color.BOLD, Color.END))
+    capturePath = os.path.join(directory, "single.pcap")
+    writeCapture(capturePath, "alice")
+    profile = PrepProfile()
+    entries = prepCapture(capturePath, profile)
+    print("\t{0}".format(entries))
+    # Defaults: any protocol, so the UDP flow gets one too, fuzzing just the first client message
+    isPass = [entry["fuzzed_messages"] for entry in entries] == [[0], [0]]
+    isPass = isPass and [os.path.basename(entry["fuzzer"]) for entry in entries] == ["single-flow0-tcp-2500.fuzzer", "single-flow1-udp-53.fuzzer"]
+
+    brokenPath = os.path.join(directory, "broken.pcap")
+    with open(brokenPath, "w") as brokenFile:
+        brokenFile.write("not a capture\n")
+    entries = prepCapture(brokenPath, profile)
+    print("\t{0}".format(entries))
+    isPass = isPass and len(entries) == 1 and entries[0]["capture"] == brokenPath and "error" in entries[0]
+    printResult("Single Capture Prep Test", isPass)
+
+def checkManifest(manifest, directory, outputDirectory):
+    expected = []
+    for name in ["a", "b"]:
+        for fuzzedMessage in [0, 2]:
+            expected.append((os.path.join(directory, name + ".pcap"), os.path.join(outputDirectory, "%s-flow0-tcp-2500-%d.fuzzer" % (name, fuzzedMessage)), [fuzzedMessage]))
+    actual = [(entry["capture"], entry["fuzzer"], entry["fuzzed_messages"]) for entry in manifest["fuzzers"]]
+    isPass = True
+    for entry in actual:
+        print("\t{0}".format(entry))
+    if actual != expected:
+        print("\tExpected {0}".format(expected))
+        isPass = False
+    errors = manifest["errors"]
+    print("\t{0}".format(errors))
+    isPass = isPass and len(errors) == 1 and errors[0]["capture"] == os.path.join(directory, "c.pcap") and errors[0]["error"]
+    return isPass
+
+def testBatchPrep(directory):
+    print("\n{}Testing batch prep...{}".format(Color.BOLD, Color.END))
+    captureDirectory = os.path.join(directory, "captures")
+    outputDirectory = os.path.join(directory, "out")
+    os.mkdir(captureDirectory)
+    writeCapture(os.path.join(captureDirectory, "a.pcap"), "alice")
+    writeCapture(os.path.join(captureDirectory, "b.pcap"), "bob")
+    # Right name, but the header is junk
+    with open(os.path.join(captureDirectory, "c.pcap"), "wb") as corruptFile:
+        corruptFile.write("\x00" * 24 + struct.pack("<IIII", 0, 0, 4, 4) + "junk")
+    # Not matched by the default captures patterns
+    with open(os.path.join(captureDirectory, "notes.txt"), "w") as notesFile:
+        notesFile.write("ignore me\n")
+    profilePath = os.path.join(directory, "profile.ini")
+    with open(profilePath, "w") as profileFile:
+        profileFile.write(PROFILE.format(outputDirectory))
+
+    manifest = batchPrep(captureDirectory, profilePath, processes=2)
+    manifestPath = os.path.join(outputDirectory, "manifest.json")
+    with open(manifestPath, "r") as manifestFile:
+        isPass = json.load(manifestFile) == manifest
+    isPass = checkManifest(manifest, captureDirectory, outputDirectory) and isPass
+    isPass = isPass and manifest["profile"] == profilePath and not os.path.exists(manifestPath + ".tmp")
+
+    # Settings from the profile end up in the .fuzzer files
+    fuzzerData = FuzzerData()
+    fuzzerData.readFromFile(os.path.join(outputDirectory, "b-flow0-tcp-2500-2.fuzzer"), quiet=True)
+    messages = [(message.direction, str(message.getOriginalMessage()), message.isFuzzed) for message in fuzzerData.messageCollection.messages]
+    print("\t{0}".format(messages))
+    isPass = isPass and messages == [(Message.Direction.Outbound, "USER bob\n", False), (Message.Direction.Inbound, "OK\n", False), (Message.Direction.Outbound, "QUIT\n", True)]
+    isPass = isPass and fuzzerData.port == 2500 and fuzzerData.receiveTimeout == 0.5 and fuzzerData.failureThreshold == 7
+    printResult("Batch Prep Test", isPass)
+
+    print("\n{}Testing mutiny_prep.py --batch exit status...{}".format(Color.BOLD, Color.END))
+    shutil.rmtree(outputDirectory)
+    process = subprocess.Popen([sys.executable, "mutiny_prep.py", "--batch", profilePath, captureDirectory], cwd="../..", stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.communicate()[0]
+    print("\texit status {0}".format(process.returncode))
+    isPass = process.returncode == 1 and "Wrote 4 .fuzzer files" in output and os.path.isfile(manifestPath)
+    os.remove(os.path.join(captureDirectory, "c.pcap"))
+    shutil.rmtree(outputDirectory)
+    process = subprocess.Popen([sys.executable, "mutiny_prep.py", "--batch", profilePath, captureDirectory], cwd="../..", stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    process.communicate()
+    print("\texit status without the bad capture {0}".format(process.returncode))
+    isPass = isPass and process.returncode == 0
+    printResult("Batch Exit Status Test", isPass)
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        testLoadProfile(directory)
+        testPrepCapture(directory)
+        testBatchPrep(directory)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
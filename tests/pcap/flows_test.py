@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# Test splitting a capture into flows for mutiny_prep.py --split
+#
+# Builds a capture by hand with several interleaved TCP and UDP
+# conversations so scapy isn't needed to run this
+#
+#------------------------------------------------------------------
+
+import os
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+sys.path.append("../..")
+from backend.flows import FlowFuzzerSettings, FlowTable, splitCapture
+from backend.fuzzer_types import Message
+from backend.fuzzerdata import FuzzerData
+from backend.pcap_reader import PcapReader, TCP_SYN, TCP_ACK, TCP_FIN, TCP_RST
+
+class Color:
+   GREEN = '\033[92m'
+   RED = '\033[91m'
+   BOLD = '\033[1m'
+   END = '\033[0m'
+
+def printResult(message, isPass):
+    if isPass:
+        resultStr = "Pass"
+        resultColor = Color.GREEN
+    else:
+        resultStr = "Fail"
+        resultColor = Color.RED
+    
+    print("\n{}: {}{}{}\n".format(message, resultColor, resultStr, Color.END))
+
+OUT = Message.Direction.Outbound
+IN = Message.Direction.Inbound
+
+def ipv4Frame(src, dst, proto, transport):
+    ip = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(transport), 1, 0, 64, proto, 0, socket.inet_aton(src), socket.inet_aton(dst)) + transport
+    return "\x66\x77\x88\x99\xaa\xbb\x00\x11\x22\x33\x44\x55" + struct.pack("!H", 0x0800) + ip
+
+def udpFrame(src, dst, payload):
+    return ipv4Frame(src[0], dst[0], 17, struct.pack("!HHHH", src[1], dst[1], 8 + len(payload), 0) + payload)
+
+# Keeps track of sequence numbers for one side of a hand built TCP session
+class TcpSession(object):
+    def __init__(self, client, server, clientISN, serverISN):
+        self.ends = {True: client, False: server}
+        self.seq = {True: clientISN, False: serverISN}
+
+    def send(self, fromClient, payload, flags=TCP_ACK):
+        src = self.ends[fromClient]
+        dst = self.ends[not fromClient]
+        segment = struct.pack("!HHIIBBHHH", src[1], dst[1], self.seq[fromClient], self.seq[not fromClient], 5 << 4, flags, 8192, 0, 0) + payload
+        self.seq[fromClient] = (self.seq[fromClient] + len(payload) + (1 if flags & (TCP_SYN | TCP_FIN) else 0)) & 0xFFFFFFFF
+        return ipv4Frame(src[0], dst[0], 6, segment)
+
+    def handshake(self):
+        return [self.send(True, "", TCP_SYN), self.send(False, "", TCP_SYN | TCP_ACK), self.send(True, "")]
+
+def writePcap(path, frames):
+    with open(path, "wb") as pcapFile:
+        pcapFile.write(struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        for (i, frame) in enumerate(frames):
+            pcapFile.write(struct.pack("<IIII", 1000 + i, 0, len(frame), len(frame)))
+            pcapFile.write(frame)
+
+# Two logins that look alike, a DNS-ish UDP exchange, a request that's
+# never closed and a connection that's reset before any data
+# Returns frames, {server port: expected messages} for the flows with client data
+def sampleCapture():
+    alice = TcpSession(("10.0.0.1", 40000), ("10.0.0.9", 2500), 0xFFFFFFF0, 1000)
+    bobby = TcpSession(("10.0.0.2", 40001), ("10.0.0.9", 2500), 500, 2000)
+    get = TcpSession(("10.0.0.3", 40002), ("10.0.0.9", 2600), 700, 3000)
+    reset = TcpSession(("10.0.0.4", 40003), ("10.0.0.9", 2700), 900, 4000)
+    dnsClient = ("10.0.0.1", 5353)
+    dnsServer = ("10.0.0.8", 53)
+
+    frames = alice.handshake() + bobby.handshake()
+    frames += [
+        alice.send(True, "USER "),
+        udpFrame(dnsClient, dnsServer, "query1"),
+        bobby.send(True, "USER bobby\n"),
+        # Second half of alice's login, should be combined with the first
+        alice.send(True, "alice\n"),
+    ]
+    frames += get.handshake()
+    frames += [
+        udpFrame(dnsServer, dnsClient, "answer1"),
+        bobby.send(False, "OK\n"),
+        alice.send(False, "OK\n"),
+        get.send(True, "GET / HTTP/1.0\r\n\r\n"),
+        alice.send(True, "QUIT\n"),
+    ]
+    frames += reset.handshake()
+    frames += [
+        bobby.send(True, "QUIT\n"),
+        reset.send(False, "", TCP_RST),
+        alice.send(True, "", TCP_FIN | TCP_ACK),
+        alice.send(False, "", TCP_FIN | TCP_ACK),
+        bobby.send(True, "", TCP_FIN | TCP_ACK),
+        udpFrame(dnsClient, dnsServer, "query2"),
+        bobby.send(False, "", TCP_FIN | TCP_ACK),
+    ]
+    expected = [
+        [(OUT, "USER alice\n"), (IN, "OK\n"), (OUT, "QUIT\n")],
+        [(OUT, "USER bobby\n"), (IN, "OK\n"), (OUT, "QUIT\n")],
+        [(OUT, "query1"), (IN, "answer1"), (OUT, "query2")],
+        [(OUT, "GET / HTTP/1.0\r\n\r\n")],
+    ]
+    return (frames, expected)
+
+def checkMessages(description, actual, expected):
+    print("\t{0}: {1}".format(description, actual))
+    if actual != expected:
+        print("\tExpected {0}".format(expected))
+        return False
+    return True
+
+def testFlowTable(path, expected):
+    print("\n{}Testing flow table...{}".format(Color.BOLD, Color.END))
+    flowTable = FlowTable()
+    finished = []
+    for packetInfo in PcapReader(path):
+        flow = flowTable.addPacket(packetInfo)
+        if flow:
+            finished.append(flow)
+    # alice, reset and bobby close in the capture, the rest are only done at the end
+    isPass = [flow.index for flow in finished] == [4, 0, 1]
+    flows = sorted(finished + flowTable.drain(), key=lambda flow: flow.index)
+    isPass = isPass and len(flows) == 5 and len(flowTable.flows) == 0
+    flowsWithData = [flow for flow in flows if flow.hasClientData()]
+    isPass = isPass and [flow.server[1] for flow in flowsWithData] == [2500, 2500, 53, 2600]
+    for (flow, messages) in zip(flowsWithData, expected):
+        isPass = checkMessages(flow.getDescription(), [(direction, str(data)) for (direction, data) in flow.messages], messages) and isPass
+    isPass = isPass and flowsWithData[0].getShape() == flowsWithData[1].getShape()
+    isPass = isPass and flowsWithData[0].getShape() != flowsWithData[3].getShape()
+    printResult("Flow Table Test", isPass)
+
+def readMessages(fuzzerPath):
+    fuzzerData = FuzzerData()
+    fuzzerData.readFromFile(fuzzerPath, quiet=True)
+    return [(message.direction, str(message.getOriginalMessage())) for message in fuzzerData.messageCollection.messages]
+
+def testSplit(directory, path, splitBy, expected):
+    print("\n{}Testing --split {}...{}".format(Color.BOLD, splitBy, Color.END))
+    try:
+        results = splitCapture(path, FlowFuzzerSettings(), splitBy=splitBy, processes=2)
+        fuzzerFiles = sorted(name for name in os.listdir(directory) if name.endswith(".fuzzer"))
+        print("\t{0}".format(fuzzerFiles))
+        isPass = len(results) == len(expected) and len(fuzzerFiles) == len(expected)
+        for (fuzzerPath, messages) in zip(sorted(path for (description, path) in results), expected):
+            isPass = checkMessages(os.path.basename(fuzzerPath), readMessages(fuzzerPath), messages) and isPass
+    except Exception as e:
+        print("Caught exception running test: {}".format(str(e)))
+        isPass = False
+    finally:
+        for name in os.listdir(directory):
+            if name.endswith(".fuzzer") or name.endswith(".blob"):
+                os.remove(os.path.join(directory, name))
+    printResult("Split By {} Test".format(splitBy.capitalize()), isPass)
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "capture.pcap")
+        (frames, expected) = sampleCapture()
+        writePcap(path, frames)
+        testFlowTable(path, expected)
+        # Files sort by flow index: alice (0), bobby (1), dns (2), get (3)
+        testSplit(directory, path, "flow", expected)
+        # bobby's login has the same shape as alice's, so only alice's is kept
+        testSplit(directory, path, "shape", [expected[0], expected[2], expected[3]])
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# Test the streaming pcap/pcapng reader used by mutiny_prep.py
+#
+# Builds small captures by hand so scapy isn't needed to run this
+#
+#------------------------------------------------------------------
+
+import os
+import socket
+import struct
+import sys
+import tempfile
+sys.path.append("../..")
+from backend.pcap_reader import PcapReader, TCP_SYN, TCP_ACK
+
+class Color:
+   GREEN = '\033[92m'
+   RED = '\033[91m'
+   BOLD = '\033[1m'
+   END = '\033[0m'
+
+def printResult(message, isPass):
+    if isPass:
+        resultStr = "Pass"
+        resultColor = Color.GREEN
+    else:
+        resultStr = "Fail"
+        resultColor = Color.RED
+    
+    print("\n{}: {}{}{}\n".format(message, resultColor, resultStr, Color.END))
+
+CLIENT_MAC = "\x00\x11\x22\x33\x44\x55"
+SERVER_MAC = "\x66\x77\x88\x99\xaa\xbb"
+
+def tcpSegment(srcPort, dstPort, seq, flags, payload):
+    return struct.pack("!HHIIBBHHH", srcPort, dstPort, seq, 0, 5 << 4, flags, 8192, 0, 0) + payload
+
+def udpDatagram(srcPort, dstPort, payload):
+    return struct.pack("!HHHH", srcPort, dstPort, 8 + len(payload), 0) + payload
+
+def ipv4(src, dst, proto, transport):
+    return struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(transport), 1, 0, 64, proto, 0, socket.inet_aton(src), socket.inet_aton(dst)) + transport
+
+def ipv6(src, dst, proto, transport):
+    return struct.pack("!IHBB16s16s", 6 << 28, len(transport), proto, 64, socket.inet_pton(socket.AF_INET6, src), socket.inet_pton(socket.AF_INET6, dst)) + transport
+
+def ethernet(srcMac, dstMac, etherType, payload, vlan=False):
+    if vlan:
+        return dstMac + srcMac + struct.pack("!HHH", 0x8100, 5, etherType) + payload
+    # Pad to minimum frame size, reader has to trim this off using the IP length
+    frame = dstMac + srcMac + struct.pack("!H", etherType) + payload
+    return frame + "\x00" * max(0, 60 - len(frame))
+
+def sampleFrames():
+    return [
+        ethernet(CLIENT_MAC, SERVER_MAC, 0x0800, ipv4("10.0.0.1", "10.0.0.2", 6, tcpSegment(40000, 2500, 100, TCP_SYN, ""))),
+        ethernet(CLIENT_MAC, SERVER_MAC, 0x0800, ipv4("10.0.0.1", "10.0.0.2", 6, tcpSegment(40000, 2500, 101, TCP_ACK, "auth\n"))),
+        ethernet(SERVER_MAC, CLIENT_MAC, 0x0800, ipv4("10.0.0.2", "10.0.0.1", 6, tcpSegment(2500, 40000, 900, TCP_ACK, "OK\n")), vlan=True),
+        ethernet(CLIENT_MAC, SERVER_MAC, 0x86DD, ipv6("::1", "::2", 17, udpDatagram(5353, 53, "query"))),
+        # ARP, should be skipped
+        ethernet(CLIENT_MAC, SERVER_MAC, 0x0806, "\x00" * 28),
+    ]
+
+def writePcap(path, frames):
+    with open(path, "wb") as pcapFile:
+        pcapFile.write(struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        for (i, frame) in enumerate(frames):
+            pcapFile.write(struct.pack("<IIII", 1000 + i, 500000, len(frame), len(frame)))
+            pcapFile.write(frame)
+
+def pcapngBlock(blockType, body):
+    body += "\x00" * ((4 - len(body) % 4) % 4)
+    length = 12 + len(body)
+    return struct.pack("<II", blockType, length) + body + struct.pack("<I", length)
+
+def writePcapng(path, frames):
+    with open(path, "wb") as pcapFile:
+        pcapFile.write(pcapngBlock(0x0A0D0D0A, struct.pack("<IHHq", 0x1A2B3C4D, 1, 0, -1)))
+        # if_tsresol = 10^-3, so timestamps are in milliseconds
+        pcapFile.write(pcapngBlock(1, struct.pack("<HHI", 1, 0, 65535) + struct.pack("<HHB3x", 9, 1, 3) + struct.pack("<HH", 0, 0)))
+        for (i, frame) in enumerate(frames):
+            timestamp = (1000 + i) * 1000 + 500
+            pcapFile.write(pcapngBlock(6, struct.pack("<IIIII", 0, timestamp >> 32, timestamp & 0xFFFFFFFF, len(frame), len(frame)) + frame))
+
+def checkPackets(packets):
+    if len(packets) != 4:
+        print("\tExpected 4 TCP/UDP packets, got {0}".format(len(packets)))
+        return False
+    expected = [
+        ("tcp", "10.0.0.1", 40000, "10.0.0.2", 2500, ""),
+        ("tcp", "10.0.0.1", 40000, "10.0.0.2", 2500, "auth\n"),
+        ("tcp", "10.0.0.2", 2500, "10.0.0.1", 40000, "OK\n"),
+        ("udp", "::1", 5353, "::2", 53, "query"),
+    ]
+    isPass = True
+    for (packet, values) in zip(packets, expected):
+        actual = (packet.proto, packet.srcIP, packet.srcPort, packet.dstIP, packet.dstPort, packet.payload)
+        print("\t{0}".format(actual))
+        if actual != values:
+            print("\tExpected {0}".format(values))
+            isPass = False
+    isPass = isPass and packets[0].flags == TCP_SYN and packets[2].seq == 900
+    isPass = isPass and packets[0].srcMac == "00:11:22:33:44:55" and abs(packets[1].timestamp - 1001.5) < 0.001
+    isPass = isPass and packets[1].getFlowKey() == packets[2].getFlowKey()
+    return isPass
+
+def testFormat(name, writeFunction):
+    (handle, path) = tempfile.mkstemp()
+    os.close(handle)
+    try:
+        print("\n{}Testing {} reading...{}".format(Color.BOLD, name, Color.END))
+        writeFunction(path, sampleFrames())
+        isPass = checkPackets(list(PcapReader(path)))
+    except Exception as e:
+        print("Caught exception running test: {}".format(str(e)))
+        isPass = False
+    finally:
+        os.remove(path)
+    printResult("{} Reader Test".format(name), isPass)
+
+def testNotPcap():
+    (handle, path) = tempfile.mkstemp()
+    os.write(handle, "char peer0_0[] = {\n0x61 };\n")
+    os.close(handle)
+    try:
+        list(PcapReader(path))
+        isPass = False
+    except RuntimeError:
+        isPass = True
+    finally:
+        os.remove(path)
+    printResult("Non-pcap Rejection Test", isPass)
+
+def testBadHeaderLengths():
+    print("\n{}Testing header length checks...{}".format(Color.BOLD, Color.END))
+    goodIP = ipv4("10.0.0.1", "10.0.0.2", 6, tcpSegment(40000, 2500, 101, TCP_ACK, "hello0"))
+    # IHL of 0, the IP header would otherwise get parsed as TCP
+    zeroIHL = "\x40" + ipv4("10.0.0.1", "10.0.0.2", 6, tcpSegment(40000, 2500, 102, TCP_ACK, "hello1"))[1:]
+    # TCP data offset of 0
+    segment = tcpSegment(40000, 2500, 103, TCP_ACK, "hello2")
+    zeroOffset = ipv4("10.0.0.1", "10.0.0.2", 6, segment[:12] + "\x00" + segment[13:])
+    # TCP data offset pointing past the end of the packet
+    segment = tcpSegment(40000, 2500, 104, TCP_ACK, "")
+    pastEnd = ipv4("10.0.0.1", "10.0.0.2", 6, segment[:12] + "\xf0" + segment[13:])
+    frames = [ethernet(CLIENT_MAC, SERVER_MAC, 0x0800, payload) for payload in (zeroIHL, zeroOffset, pastEnd, goodIP)]
+    (handle, path) = tempfile.mkstemp()
+    os.close(handle)
+    try:
+        writePcap(path, frames)
+        packets = list(PcapReader(path))
+        for packet in packets:
+            print("\t{0}".format(repr(packet.payload)))
+        isPass = [packet.payload for packet in packets] == ["hello0"]
+    except Exception as e:
+        print("Caught exception running test: {}".format(str(e)))
+        isPass = False
+    finally:
+        os.remove(path)
+    printResult("Bad Header Length Test", isPass)
+
+def main():
+    testFormat("pcap", writePcap)
+    testFormat("pcapng", writePcapng)
+    testNotPcap()
+    testBadHeaderLengths()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# Test TCP reassembly with retransmitted, out of order, overlapping
+# and missing segments
+#
+#------------------------------------------------------------------
+
+import sys
+sys.path.append("../..")
+from backend.pcap_reader import TCP_SYN, TCP_ACK
+from backend.tcp_reassembly import TcpStreamReassembler
+
+class Color:
+   GREEN = '\033[92m'
+   RED = '\033[91m'
+   END = '\033[0m'
+
+def printResult(message, isPass):
+    if isPass:
+        resultStr = "Pass"
+        resultColor = Color.GREEN
+    else:
+        resultStr = "Fail"
+        resultColor = Color.RED
+    
+    print("\n{}: {}{}{}\n".format(message, resultColor, resultStr, Color.END))
+
+CLIENT_ISN = 0xFFFFFFF0
+SERVER_ISN = 5000
+
+# Run (direction, seq offset from ISN, ack, flags, payload) segments through a reassembler
+def reassemble(segments, overlapPolicy=TcpStreamReassembler.OVERLAP_FIRST, gapPolicy=TcpStreamReassembler.GAP_SKIP):
+    reassembler = TcpStreamReassembler(overlapPolicy, gapPolicy)
+    delivered = []
+    for (direction, relativeSeq, ack, flags, payload) in segments:
+        isn = CLIENT_ISN if direction == "c" else SERVER_ISN
+        delivered += reassembler.addSegment(direction, (isn + relativeSeq) & 0xFFFFFFFF, ack & 0xFFFFFFFF, flags, payload)
+    delivered += reassembler.flush()
+    # Merge back to back deliveries in the same direction, like prep combining packets
+    merged = []
+    for (direction, data) in delivered:
+        if merged and merged[-1][0] == direction:
+            merged[-1] = (direction, merged[-1][1] + data)
+        else:
+            merged.append((direction, data))
+    return (merged, reassembler)
+
+def check(name, actual, expected):
+    print("\t{0}: {1}".format(name, actual))
+    printResult(name, actual == expected)
+
+def main():
+    handshake = [
+        ("c", 0, 0, TCP_SYN, ""),
+        ("s", 0, CLIENT_ISN + 1, TCP_SYN | TCP_ACK, ""),
+    ]
+
+    # Client seq wraps past 2^32 partway through "hello world"
+    (merged, reassembler) = reassemble(handshake + [
+        ("c", 1, SERVER_ISN + 1, TCP_ACK, "hello "),
+        # Retransmission of the first segment
+        ("c", 1, SERVER_ISN + 1, TCP_ACK, "hello "),
+        # Out of order
+        ("c", 12, SERVER_ISN + 1, TCP_ACK, "!\n"),
+        ("c", 7, SERVER_ISN + 1, TCP_ACK, "world"),
+        ("s", 1, CLIENT_ISN + 15, TCP_ACK, "OK\n"),
+    ])
+    check("Retransmit/Out of Order Test", merged, [("c", "hello world!\n"), ("s", "OK\n")])
+    isPass = reassembler.retransmittedBytes == 6 and reassembler.outOfOrderSegments == 1
+    printResult("Retransmit Counter Test", isPass)
+
+    overlapping = handshake + [
+        ("c", 3, 0, 0, "XYZ"),
+        ("c", 1, 0, 0, "abcde"),
+    ]
+    check("Overlap First Test", reassemble(overlapping)[0], [("c", "abXYZ")])
+    check("Overlap Last Test", reassemble(overlapping, overlapPolicy=TcpStreamReassembler.OVERLAP_LAST)[0], [("c", "abcde")])
+
+    # "lo " never made it into the capture, but the server acks past it
+    missing = handshake + [
+        ("c", 1, SERVER_ISN + 1, TCP_ACK, "hel"),
+        ("c", 7, SERVER_ISN + 1, TCP_ACK, "world"),
+        ("s", 1, CLIENT_ISN + 12, TCP_ACK, "OK\n"),
+        ("c", 12, SERVER_ISN + 4, TCP_ACK, "bye"),
+    ]
+    check("Gap Skip Test", reassemble(missing)[0], [("c", "helworld"), ("s", "OK\n"), ("c", "bye")])
+    check("Gap Truncate Test", reassemble(missing, gapPolicy=TcpStreamReassembler.GAP_TRUNCATE)[0], [("c", "hel"), ("s", "OK\n")])
+
+    # The start of both sides is missing and nothing acks past it, so it's
+    # all still held up when the capture ends
+    unacked = handshake + [
+        ("c", 4, 0, 0, "/a\n"),
+        ("s", 4, 0, 0, "OK a\n"),
+        ("c", 7, 0, 0, "/b\n"),
+        ("s", 9, 0, 0, "OK b\n"),
+    ]
+    check("Flush Order Test", reassemble(unacked)[0], [("c", "/a\n"), ("s", "OK a\n"), ("c", "/b\n"), ("s", "OK b\n")])
+
+if __name__ == "__main__":
+    main()
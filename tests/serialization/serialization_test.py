@@ -11,9 +11,13 @@
 #
 #------------------------------------------------------------------
 
+import os
+import shutil
 import sys
+import tempfile
 sys.path.append("../..")
 from backend.fuzzer_types import Message
+from backend.fuzzerdata import FuzzerData
 
 class Color:
    PURPLE = '\033[95m'
@@ -69,6 +73,47 @@ def testString(inputValue):
         deserialized = ""
     printResult("Full Serialization Test", inputValue == deserialized)
 
+# Round trip a message through an external @file:offset:length blob
+def testBlobReference(inputValue):
+    tempDir = tempfile.mkdtemp()
+    try:
+        print("\n{}Testing blob reference serialization...{}".format(Color.BOLD, Color.END))
+        fuzzerData = FuzzerData()
+        message = Message()
+        message.direction = Message.Direction.Outbound
+        message.setMessageFrom(Message.Format.Raw, bytearray(inputValue), True)
+        fuzzerData.messageCollection.addMessage(message)
+        small = Message()
+        small.direction = Message.Direction.Inbound
+        small.setMessageFrom(Message.Format.Raw, bytearray("ok"), False)
+        fuzzerData.messageCollection.addMessage(small)
+
+        fuzzerPath = fuzzerData.writeToFile(os.path.join(tempDir, "blob.fuzzer"), blobThreshold=16)
+        with open(fuzzerPath, "r") as fuzzerFile:
+            serialized = fuzzerFile.read()
+        print("\tSerialized: {0}".format(serialized.split("\n\n")[-1].strip()))
+
+        readBack = FuzzerData()
+        readBack.readFromFile(fuzzerPath, quiet=True)
+        deserialized = readBack.messageCollection.messages[0].getOriginalMessage()
+        isPass = deserialized == inputValue and "outbound fuzz @blob.fuzzer.blob:0:{0}".format(len(inputValue)) in serialized \
+            and readBack.messageCollection.messages[0].isFuzzed \
+            and readBack.messageCollection.messages[1].getOriginalMessage() == "ok"
+
+        # Rewriting in place has to keep the blob data intact
+        readBack.writeToFile(fuzzerPath + "-copy", blobThreshold=-1)
+        copy = FuzzerData()
+        copy.readFromFile(fuzzerPath + "-copy", quiet=True)
+        isPass = isPass and copy.messageCollection.messages[0].getOriginalMessage() == inputValue
+        readBack.blobStore.close()
+        copy.blobStore.close()
+    except Exception as e:
+        print("Caught exception running test: {}".format(str(e)))
+        isPass = False
+    finally:
+        shutil.rmtree(tempDir)
+    printResult("Blob Reference Test", isPass)
+
 def main():
     # Try all possible ASCII characters
     allchars = bytearray('datadatadata unprintable chars:')
@@ -82,6 +127,8 @@ def main():
 
     # Found to be causing problems
     testString("<?xml version='1.0' ?><stream:stream to='testwebsite.com' xmlns='jabber:client' xmlns:stream='http://etherx.jabber.org/streams' version='1.0'>")
+
+    testBlobReference(allchars)
     
 if __name__ == "__main__":
     main()
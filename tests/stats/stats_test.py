@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------
+# Test the latency histograms and stats collector
+#
+#------------------------------------------------------------------
+
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import urllib2
+sys.path.append("../..")
+from backend.metrics import MetricsServer
+from backend.profiling import RunProfiler
+from backend.stats import LatencyHistogram, StatsCollector
+
+class Color:
+   GREEN = '\033[92m'
+   RED = '\033[91m'
+   END = '\033[0m'
+
+def printResult(message, isPass):
+    if isPass:
+        resultStr = "Pass"
+        resultColor = Color.GREEN
+    else:
+        resultStr = "Fail"
+        resultColor = Color.RED
+    
+    print("\n{}: {}{}{}\n".format(message, resultColor, resultStr, Color.END))
+
+def testHistogramBuckets():
+    isPass = True
+    # Every value should land in a bucket whose top is within the precision promised
+    for value in range(0, 5000) + [123456, 10 ** 9]:
+        index = LatencyHistogram._getIndex(value)
+        top = LatencyHistogram._getValue(index)
+        bottom = LatencyHistogram._getValue(index - 1) + 1 if index else 0
+        if not bottom <= value <= top or top - bottom > max(1, value // LatencyHistogram.SUB_BUCKET_COUNT):
+            print("\t{0} -> [{1}, {2}]".format(value, bottom, top))
+            isPass = False
+    printResult("Histogram Bucket Test", isPass)
+
+def testHistogramPercentiles():
+    random.seed(1)
+    values = [random.expovariate(1 / 0.005) for _ in range(20000)]
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+    values.sort()
+    isPass = histogram.count == len(values)
+    for percentile in (50, 90, 99):
+        exact = values[int(len(values) * percentile / 100.0) - 1]
+        estimate = histogram.getPercentile(percentile)
+        print("\tp{0}: {1:.6f} vs {2:.6f}".format(percentile, estimate, exact))
+        isPass = isPass and abs(estimate - exact) <= exact * 0.05
+    isPass = isPass and histogram.getPercentile(100) == int(values[-1] * 1000000) / 1000000.0
+    printResult("Histogram Percentile Test", isPass)
+
+def testCollector():
+    tempDir = tempfile.mkdtemp()
+    try:
+        statsFilePath = os.path.join(tempDir, "stats.json")
+        stats = StatsCollector(statsFilePath=statsFilePath, name="test")
+        for i in range(10):
+            with stats.measure("send"):
+                pass
+            stats.recordOutcome(StatsCollector.OUTCOME_OK)
+        try:
+            with stats.measure("recv"):
+                raise ValueError("timed out")
+        except ValueError as e:
+            stats.recordOutcome(e)
+        stats.maybeReport(force=True)
+        with open(statsFilePath) as statsFile:
+            summary = json.load(statsFile)
+        print("\t{0}".format(summary["outcomes"]))
+        isPass = summary["runs"] == 11 and summary["outcomes"] == {"ok": 10, "ValueError": 1}
+        isPass = isPass and summary["phases"]["send"]["count"] == 10 and summary["phases"]["recv"]["count"] == 1
+        isPass = isPass and not os.path.exists(statsFilePath + ".tmp")
+    finally:
+        shutil.rmtree(tempDir)
+    printResult("Stats Collector Test", isPass)
+
+def testMetricsServer():
+    stats = StatsCollector(name="a.fuzzer")
+    stats.currentSeed = 42
+    stats.recordCrash()
+    with stats.measure("send"):
+        pass
+    stats.recordOutcome(StatsCollector.OUTCOME_OK)
+    metricsServer = MetricsServer("127.0.0.1:0")
+    metricsServer.addCollector(stats)
+    metricsServer.start()
+    try:
+        text = urllib2.urlopen(metricsServer.getUrl(), timeout=5).read()
+    finally:
+        metricsServer.stop()
+    lines = text.splitlines()
+    isPass = 'mutiny_runs_total{fuzzer="a.fuzzer"} 1.0' in lines
+    isPass = isPass and 'mutiny_run_outcomes_total{fuzzer="a.fuzzer",outcome="ok"} 1.0' in lines
+    isPass = isPass and 'mutiny_crashes_total{fuzzer="a.fuzzer"} 1.0' in lines
+    isPass = isPass and 'mutiny_current_seed{fuzzer="a.fuzzer"} 42.0' in lines
+    isPass = isPass and 'mutiny_phase_seconds_count{fuzzer="a.fuzzer",phase="send"} 1.0' in lines
+    isPass = isPass and "# TYPE mutiny_phase_seconds summary" in lines
+    printResult("Metrics Server Test", isPass)
+
+def busyProcessorCallback():
+    total = 0
+    for i in range(3000000):
+        total += i
+    return total
+
+def testProfiler():
+    tempDir = tempfile.mkdtemp()
+    try:
+        stats = StatsCollector()
+        profiler = RunProfiler(tempDir, 2, stats)
+        for i in range(3):
+            with stats.measure("run"), profiler.profileRun():
+                with stats.measure("processor"):
+                    busyProcessorCallback()
+        profiler.writeCollapsed()
+        with open(os.path.join(tempDir, "profile-processor.collapsed")) as collapsedFile:
+            lines = collapsedFile.read().splitlines()
+        print("\t{0} processor stacks, {1} profiled runs".format(len(lines), profiler.profiledRunCount))
+        # Runs 0 and 2 were profiled, run 1 wasn't
+        isPass = profiler.profiledRunCount == 2 and len(lines) > 0
+        # Bar the odd sample landing in measure() itself
+        counts = [(line.rsplit(" ", 1)[0], int(line.rsplit(" ", 1)[1])) for line in lines]
+        busyCount = sum(count for (stack, count) in counts if stack.endswith("busyProcessorCallback (stats_test.py:{0})".format(busyProcessorCallback.func_code.co_firstlineno)))
+        isPass = isPass and busyCount >= 0.9 * sum(count for (stack, count) in counts)
+        isPass = isPass and os.path.exists(os.path.join(tempDir, "profile.collapsed"))
+    finally:
+        shutil.rmtree(tempDir)
+    printResult("Profiler Test", isPass)
+
+testHistogramBuckets()
+testHistogramPercentiles()
+testCollector()
+testMetricsServer()
+testProfiler()
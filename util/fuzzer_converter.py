@@ -19,7 +19,7 @@ import re
 # Kind of dirty, grab libs from one directory up
 sys.path.insert(0, os.path.abspath( os.path.join(__file__, "../..")))
 from backend.fuzzerdata import FuzzerData
-from backend.fuzzer_types import Message
+from backend.fuzzer_types import Message, BlobWriter
 
 epilog = """Actions: 
 fuzzer2bin - Pull binary message out of .fuzzer file
@@ -32,12 +32,17 @@ parser.add_argument("-i", "--infile", help="File to read input from, uses stdin
 parser.add_argument("-o", "--outfile", help="File to write results to, uses stdout otherwise")
 parser.add_argument("-f", "--fuzzerfile", help="File to get .fuzzer data from for bin2fuzzer, if it should differ from outfile or outfile is stdout")
 parser.add_argument("-m", "--messagenum", help="Message number to read/write (fuzzer2bin and bin2fuzzer)", type=int)
+parser.add_argument("-b", "--blobthreshold", help="For bin2fuzzer, write messages bigger than this many bytes raw into <outfile>.blob instead of inline (requires outfile)", type=int, default=-1)
 args = parser.parse_args()
 
 if args.action != "bin2fuzzer" and args.fuzzerfile:
     print("Use --fuzzerfile with only the bin2fuzzer option, to populate .fuzzer data")
     exit(1)
 
+if args.blobthreshold >= 0 and (args.action != "bin2fuzzer" or not args.outfile):
+    print("Use --blobthreshold with only the bin2fuzzer option and an outfile")
+    exit(1)
+
 # Default file descriptors
 inFileDesc = sys.stdin
 outFileDesc = sys.stdout 
@@ -49,6 +54,9 @@ if args.infile:
 
 if args.action == "list":
     fuzzerData = FuzzerData()
+    if args.infile:
+        # Any @file:offset:length messages are relative to the .fuzzer
+        fuzzerData.blobStore.baseDirectory = os.path.dirname(os.path.abspath(args.infile))
     # Allow a non-quiet read to list out messages
     fuzzerData.readFromFD(inFileDesc, quiet=False)
     
@@ -61,6 +69,8 @@ elif args.action in ["fuzzer2bin", "bin2fuzzer"]:
     
     if args.action == "fuzzer2bin":
         # Pull message out from .fuzzer file, output as binary
+        if args.infile:
+            fuzzerData.blobStore.baseDirectory = os.path.dirname(os.path.abspath(args.infile))
         fuzzerData.readFromFD(inFileDesc, quiet=True)
         
         messageCount = len(fuzzerData.messageCollection.messages)
@@ -95,9 +105,15 @@ elif args.action in ["fuzzer2bin", "bin2fuzzer"]:
             exit(1)
         message = fuzzerData.messageCollection.messages[args.messagenum]
         message.setMessageFrom(Message.Format.Raw, messageData, message.isFuzzed)
+        blobWriter = None
         if args.outfile:
             outFileDesc = open(args.outfile, "w")
-        fuzzerData.writeToFD(outFileDesc)
+            # Keeps existing @file references valid relative to outfile, and moves
+            # anything over --blobthreshold out of line
+            blobWriter = BlobWriter("{0}.blob".format(args.outfile), args.blobthreshold)
+        fuzzerData.writeToFD(outFileDesc, blobWriter=blobWriter)
+        if blobWriter:
+            blobWriter.close()
 
 # Clean up file descriptors
 if args.infile: